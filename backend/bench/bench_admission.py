@@ -0,0 +1,118 @@
+# backend/bench/bench_admission.py
+"""
+Benchmark de control de admisión: latencia de /triage y /next_step mientras
+un rastreador inunda /search y /protocols.
+
+Uso (desde backend/):
+    python bench/bench_admission.py                  # con y sin admisión
+    python bench/bench_admission.py --flood 400 --requests 200
+
+Cada modo arranca uvicorn (un proceso, un bucle de eventos) con
+ADMISSION_CONTROL=1/0; la inundación corre en otro proceso para que el
+cliente medido no compita por su bucle de eventos.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+API = "/api/conrumbo"
+
+
+def start_server(enabled: bool, port: int) -> subprocess.Popen:
+    env = {**os.environ, "ADMISSION_CONTROL": "1" if enabled else "0", "SESSION_JOURNAL": "0"}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}{API}/ready", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("uvicorn no llegó a /ready")
+
+
+_FLOODER = r"""
+import asyncio, json, sys, time
+import httpx
+FLOOD, SECONDS, BASE = int(sys.argv[1]), float(sys.argv[2]), sys.argv[3]
+
+async def run():
+    codes = {}
+    limits = httpx.Limits(max_connections=FLOOD, max_keepalive_connections=FLOOD)
+    async with httpx.AsyncClient(base_url=BASE, limits=limits, timeout=60) as c:
+        end = time.time() + SECONDS
+
+        async def crawler(i):
+            while time.time() < end:
+                if i % 2:
+                    r = await c.post("/api/conrumbo/search", json={"query": "compresiones"})
+                else:
+                    r = await c.get("/api/conrumbo/protocols")
+                codes[r.status_code] = codes.get(r.status_code, 0) + 1
+                if r.status_code == 503:
+                    await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(crawler(i) for i in range(FLOOD)))
+    print(json.dumps(codes))
+
+asyncio.run(run())
+"""
+
+
+def measure(port: int, flood: int, requests: int, seconds: float) -> Dict[str, object]:
+    """El rastreador corre en otro proceso; aquí sólo se miden las peticiones de emergencia."""
+    base = f"http://127.0.0.1:{port}"
+    flooder = subprocess.Popen([sys.executable, "-c", _FLOODER, str(flood), str(seconds), base],
+                               stdout=subprocess.PIPE, text=True)
+    time.sleep(1.0)
+    lat = []
+    with httpx.Client(base_url=base, timeout=60) as c:
+        for i in range(requests):
+            t0 = time.perf_counter()
+            if i % 2:
+                r = c.post(f"{API}/next_step", json={"protocol_id": "pa_rcp_adulto_v1", "current_step": 1})
+            else:
+                r = c.post(f"{API}/triage", json={"query": "no respira y está inconsciente"})
+            r.raise_for_status()
+            lat.append((time.perf_counter() - t0) * 1000.0)
+    out, _ = flooder.communicate()
+    lat.sort()
+    return {"p50_ms": statistics.median(lat), "p99_ms": lat[max(0, int(len(lat) * 0.99) - 1)],
+            "max_ms": lat[-1], "browse_codes": json.loads(out.strip().splitlines()[-1])}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--flood", type=int, default=200, help="clientes concurrentes de navegación")
+    ap.add_argument("--requests", type=int, default=100, help="peticiones de emergencia medidas")
+    ap.add_argument("--seconds", type=float, default=10.0, help="duración de la inundación")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+    for enabled in (False, True):
+        proc = start_server(enabled, args.port)
+        try:
+            r = measure(args.port, args.flood, args.requests, args.seconds)
+        finally:
+            proc.terminate()
+            proc.wait()
+        print(f"admisión={'sí' if enabled else 'no':<3} emergencia p50={r['p50_ms']:7.2f} ms  "
+              f"p99={r['p99_ms']:7.2f} ms  max={r['max_ms']:7.2f} ms  navegación={r['browse_codes']}")
+
+
+if __name__ == "__main__":
+    main()
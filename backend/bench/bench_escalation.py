@@ -0,0 +1,88 @@
+# backend/bench/bench_escalation.py
+"""
+Escaladas de /next_step: casos de regresión del grafo de pasos y su latencia.
+
+Cada caso es (protocolo, current_step, respuesta) -> (protocolo servido, paso
+servido, alerta de emergencia). Sin rama para la señal se sirve el paso
+siguiente normal con la alerta: una respuesta de emergencia nunca devuelve al
+usuario al paso que acaba de responder (RCP paso 1 "no respira" -> "Llame al 112").
+
+Sale con código 1 si algún caso no da lo esperado.
+
+Uso (desde backend/):
+    python bench/bench_escalation.py
+    python bench/bench_escalation.py --requests 2000
+"""
+from __future__ import annotations
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("SESSION_JOURNAL", "0")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+API = "/api/conrumbo"
+
+# (protocolo, current_step, respuesta, protocolo servido, step_number, alerta)
+CASES = (
+    ("pa_rcp_adulto_v1", 1, "no respira", "pa_rcp_adulto_v1", 2, True),
+    ("pa_rcp_adulto_v1", 1, "sí", "pa_rcp_adulto_v1", 2, False),
+    ("pa_rcp_adulto_v1", 3, "no respira", "pa_rcp_adulto_v1", 4, True),
+    ("pa_rcp_adulto_v1", 7, "sigue sin pulso", "pa_rcp_adulto_v1", 7, True),
+    ("pa_asfixia_adulto_v1", 1, "se ha puesto inconsciente", "pa_rcp_adulto_v1", 1, True),
+    ("pa_hemorragias_v1", 1, "sangrado abundante", "pa_hemorragias_v1", 3, True),
+    ("pa_quemaduras_v1", 5, "ahora no respira", "pa_quemaduras_v1", 6, True),
+)
+
+
+def check(client: TestClient) -> int:
+    failures = 0
+    for pid, current, response, want_pid, want_step, want_alert in CASES:
+        r = client.post(f"{API}/next_step",
+                        json={"protocol_id": pid, "current_step": current, "user_response": response})
+        result = r.json().get("result") or {}
+        got = (result.get("protocol_id", pid), result.get("step_number"), bool(result.get("escalate_to_emergency")))
+        ok = r.status_code == 200 and got == (want_pid, want_step, want_alert)
+        failures += not ok
+        print(f"  {'ok ' if ok else 'MAL'} {pid} paso {current} {response!r} -> {got[0]} paso {got[1]}"
+              f"{' (alerta)' if got[2] else ''}{'' if ok else f'  esperado {want_pid} paso {want_step}'}")
+    return failures
+
+
+def run() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=500, help="peticiones medidas por caso")
+    args = ap.parse_args()
+
+    with TestClient(main.app) as client:
+        deadline = time.time() + 60
+        while client.get(f"{API}/ready").status_code != 200:
+            if time.time() > deadline:
+                raise RuntimeError("los motores no llegaron a ready")
+            time.sleep(0.1)
+
+        print("casos:")
+        failures = check(client)
+
+        print(f"latencia ({args.requests} peticiones por caso):")
+        for pid, current, response, *_ in CASES:
+            body = {"protocol_id": pid, "current_step": current, "user_response": response}
+            samples = []
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                client.post(f"{API}/next_step", json=body)
+                samples.append(time.perf_counter() - t0)
+            print(f"  {pid:<22} {response!r:<30} mediana={statistics.median(samples) * 1e6:8.1f} us")
+    print("OK" if not failures else f"{failures} casos fallidos")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
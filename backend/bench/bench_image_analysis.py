@@ -0,0 +1,84 @@
+# backend/bench/bench_image_analysis.py
+"""
+Pipeline de /analyze_image: una imagen por llamada al modelo vs micro-lotes.
+
+Lanza --concurrency clientes que envían fotos sintéticas (PPM de --width x
+--height con una mancha de color) contra ImageAnalyzer con el modelo de
+referencia en NumPy y mide imágenes/s, latencia p50/p95 y tamaño medio de lote.
+
+Uso (desde backend/):
+    python bench/bench_image_analysis.py --images 400 --concurrency 8
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import base64
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.image_analysis import ColorModel, ImageAnalyzer, MicroBatcher  # noqa: E402
+
+
+def _photos(n: int, width: int, height: int) -> List[str]:
+    rng = np.random.default_rng(0)
+    colors = ((140, 20, 20), (240, 130, 120), (90, 50, 110), (200, 190, 180))
+    out = []
+    for i in range(n):
+        img = rng.integers(150, 220, size=(height, width, 3), dtype=np.uint8)
+        y, x = rng.integers(0, height // 2), rng.integers(0, width // 2)
+        img[y:y + height // 4, x:x + width // 4] = colors[i % len(colors)]
+        out.append(base64.b64encode(b"P6\n%d %d\n255\n" % (width, height) + img.tobytes()).decode())
+    return out
+
+
+async def _run(photos: List[str], concurrency: int, max_batch: int, size: int) -> dict:
+    model = ColorModel(size)
+    analyzer = ImageAnalyzer(model, max_inflight=concurrency)
+    analyzer._batcher = MicroBatcher(model, max_batch=max_batch)
+    latencies: List[float] = []
+    queue = list(photos)
+
+    async def client() -> None:
+        while queue:
+            image = queue.pop()
+            t0 = time.perf_counter()
+            await analyzer.analyze(image, {})
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    lat = sorted(latencies)
+    stats = analyzer.stats()
+    return {
+        "ips": len(lat) / elapsed, "p50": statistics.median(lat) * 1000,
+        "p95": lat[int(0.95 * (len(lat) - 1))] * 1000, "batch": stats["images"] / max(1, stats["batches"]),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--width", type=int, default=1280)
+    ap.add_argument("--height", type=int, default=960)
+    ap.add_argument("--size", type=int, default=128, help="lado de la entrada del modelo")
+    args = ap.parse_args()
+
+    photos = _photos(args.images, args.width, args.height)
+    print(f"imágenes={args.images}  {args.width}x{args.height} -> {args.size}px  clientes={args.concurrency}")
+    for label, max_batch in (("sin lotes", 1), ("micro-lotes", args.concurrency)):
+        r = asyncio.run(_run(photos, args.concurrency, max_batch, args.size))
+        print(f"  {label:<12} {r['ips']:8.1f} img/s   p50 {r['p50']:7.1f} ms   p95 {r['p95']:7.1f} ms"
+              f"   lote medio {r['batch']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
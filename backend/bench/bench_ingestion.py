@@ -0,0 +1,90 @@
+# backend/bench/bench_ingestion.py
+"""
+Tiempo de ingesta del corpus: cargador anterior vs ingesta en streaming.
+
+  legacy    : yaml.safe_load (Python puro) + Protocol.model_validate, fichero a fichero
+  stream/1  : parse_yaml (CSafeLoader si hay libyaml) + esquema + pydantic, en línea
+  stream/N  : lo mismo repartido en un pool de N procesos
+
+Genera N ficheros sintéticos (clones de rag/protocols con ids distintos) en un
+directorio temporal.
+
+Uso (desde backend/):
+    python bench/bench_ingestion.py --sizes 1000 10000 --workers 4
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.protocol import HAVE_LIBYAML, Protocol, stream_protocols  # noqa: E402
+
+PROTOCOLS_DIR = Path(__file__).resolve().parents[1] / "rag" / "protocols"
+
+
+def _write_corpus(target: Path, n: int) -> None:
+    templates = [p.read_text(encoding="utf-8") for p in sorted(PROTOCOLS_DIR.glob("*.yaml"))]
+    ids = [yaml.safe_load(t)["id"] for t in templates]
+    for i in range(n):
+        k = i % len(templates)
+        text = templates[k].replace(f"id: {ids[k]}", f"id: pa_synth{i}_adulto_v1", 1)
+        (target / f"p{i:06d}.yaml").write_text(text, encoding="utf-8")
+
+
+def _legacy_load(dirpath: Path) -> Dict[str, Protocol]:
+    out: Dict[str, Protocol] = {}
+    for yf in sorted(dirpath.glob("*.yaml")):
+        try:
+            proto = Protocol.model_validate(yaml.safe_load(yf.read_text(encoding="utf-8")))
+            out[proto.id] = proto
+        except Exception as e:
+            print(f"[protocol] Error en {yf.name}: {e}")
+    return out
+
+
+def _stream_load(dirpath: Path, workers: int, schema_mode: str) -> int:
+    registry: Dict[str, Protocol] = {}
+    loaded, _errors = stream_protocols(dirpath, lambda p: registry.__setitem__(p.id, p), schema_mode, workers)
+    return loaded
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    print(f"libyaml={HAVE_LIBYAML} cpus={os.cpu_count()} workers={args.workers}")
+    rows: List[dict] = []
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory(prefix="conrumbo-ingest-") as tmp:
+            corpus = Path(tmp)
+            _write_corpus(corpus, n)
+            runs = [
+                ("legacy", lambda: len(_legacy_load(corpus))),
+                ("stream/1 sin esquema", lambda: _stream_load(corpus, 1, "off")),
+                ("stream/1 con esquema", lambda: _stream_load(corpus, 1, "strict")),
+                (f"stream/{args.workers} con esquema", lambda: _stream_load(corpus, args.workers, "strict")),
+            ]
+            for label, fn in runs:
+                t0 = time.perf_counter()
+                loaded = fn()
+                dt = time.perf_counter() - t0
+                rows.append({"files": n, "loader": label, "loaded": loaded, "seconds": round(dt, 3)})
+                print(f"  n={n:<6} {label:<24} {dt:7.2f}s  ({dt * 1e3 / n:5.2f} ms/fichero, {loaded} cargados)")
+    if args.json:
+        print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# backend/bench/bench_protocol_store.py
+"""
+Registro en memoria (dicts + STEP_CACHE + índice léxico) vs registro SQLite/FTS5.
+
+Genera un corpus sintético clonando los YAML reales, construye ambos registros
+y mide la memoria retenida por proceso (tracemalloc) y la latencia de las
+consultas de /protocol, /next_step y /search léxico.
+
+Uso (desde backend/):
+    python bench/bench_protocol_store.py --n 20000
+"""
+from __future__ import annotations
+import argparse
+import gc
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_runtime_protocols import _synthetic_raw, _templates  # noqa: E402
+from core.protocol import Protocol  # noqa: E402
+from core.protocol_store import ProtocolStore, build_store  # noqa: E402
+from core.runtime_protocol import StringPool, compile_protocol, step_payloads  # noqa: E402
+from core.shards import LanguageShard  # noqa: E402
+
+QUERIES = ("compresiones", "quemadura", "presión directa", "heimlich", "variante 4240", "no existe nada")
+
+
+def _retained(build: Callable[[], Any]) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+
+def _per_call_us(fn: Callable[[Any], Any], args: List[Any]) -> float:
+    t0 = time.perf_counter()
+    for a in args:
+        fn(a)
+    return (time.perf_counter() - t0) * 1e6 / len(args)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=20000, help="número de protocolos sintéticos")
+    ap.add_argument("--lookups", type=int, default=20000)
+    args = ap.parse_args()
+
+    pool = StringPool()
+    protocols = {}
+    for d in _synthetic_raw(_templates(), args.n):
+        rt = compile_protocol(Protocol.model_validate(d), pool)
+        protocols[rt.id] = rt
+    ids = list(protocols)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "protocols.sqlite3"
+        meta = build_store(protocols, db)
+
+        def build_memory():
+            # Lo que cada worker mantiene hoy: pasos renderizados + índice léxico
+            steps = {pid: step_payloads(p) for pid, p in protocols.items()}
+            return steps, LanguageShard("es", protocols)
+
+        (steps, shard), mem_bytes = _retained(build_memory)
+        store, store_bytes = _retained(lambda: ProtocolStore(db))
+        print(f"protocolos={len(protocols)}  fichero={meta['bytes'] / 1e6:.1f} MB  construcción={meta['seconds']:.2f}s")
+        print(f"  memoria por worker  dicts+índice {mem_bytes / 1e6:8.1f} MB   sqlite {store_bytes / 1e6:8.3f} MB"
+              f"  (+ protocolos compilados en ambos)")
+
+        rng = random.Random(0)
+        lookups = [(rng.choice(ids), rng.randrange(8)) for _ in range(args.lookups)]
+        pids = [pid for pid, _ in lookups]
+        rows = [
+            ("/protocol", lambda pid: protocols[pid].to_dict(), store.protocol_doc, pids),
+            ("/next_step", lambda a: steps[a[0]][a[1]] if a[1] < len(steps[a[0]]) else None,
+             lambda a: store.step(a[0], a[1]), lookups),
+        ]
+        for label, f_mem, f_store, data in rows:
+            print(f"  {label:<22} memoria {_per_call_us(f_mem, data):8.2f} µs   sqlite {_per_call_us(f_store, data):8.2f} µs")
+        for q in QUERIES:
+            t_mem = _per_call_us(shard.lexical_search, [q] * 5)
+            t_sql = _per_call_us(lambda x: store.lexical_search(x, "es"), [q] * 5)
+            n_hits = len(store.lexical_search(q, "es"))
+            assert n_hits == len(shard.lexical_search(q)), q
+            print(f"  /search {q!r:<22} memoria {t_mem:8.1f} µs   sqlite {t_sql:8.1f} µs   ({n_hits} resultados)")
+
+
+if __name__ == "__main__":
+    main()
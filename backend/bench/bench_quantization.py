@@ -0,0 +1,97 @@
+# backend/bench/bench_quantization.py
+"""
+Memoria y recall@k del índice cuantizado frente al índice exacto float32.
+
+Genera un corpus sintético con estructura de clusters (como los embeddings de
+pasos de un mismo protocolo), normalizado L2, con la dimensión de
+text-embedding-3-small. Las consultas son vectores del corpus con ruido.
+
+  exact          : producto punto float32 sobre la matriz completa (referencia)
+  int8 / pq-S    : sólo la primera pasada con códigos
+  ... +rescore   : candidatos (RESCORE_FACTOR * k) re-puntuados en float32 (mmap)
+
+Uso (desde backend/):
+    python bench/bench_quantization.py --n 20000 --dim 1536 --k 10
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.quantize import QuantizedIndex  # noqa: E402
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _corpus(n: int, dim: int, clusters: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = _normalize(rng.normal(size=(clusters, dim)))
+    assign = rng.integers(0, clusters, size=n)
+    return _normalize(centers[assign] + noise * rng.normal(size=(n, dim)) / np.sqrt(dim))
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return len(set(found.tolist()) & set(truth.tolist())) / len(truth)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--clusters", type=int, default=500)
+    ap.add_argument("--noise", type=float, default=1.0)
+    ap.add_argument("--pq-subdims", type=int, nargs="+", default=[8, 16])
+    ap.add_argument("--rescore-factor", type=int, default=4)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    emb = _corpus(args.n, args.dim, args.clusters, args.noise, seed=0)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, args.n, size=args.queries)
+    queries = _normalize(emb[picks] + 0.5 * rng.normal(size=(args.queries, args.dim)) / np.sqrt(args.dim))
+    truth = [np.argsort(-(emb @ q))[:args.k] for q in queries]
+
+    t0 = time.perf_counter()
+    for q in queries:
+        np.argsort(-(emb @ q))[:args.k]
+    exact_ms = (time.perf_counter() - t0) * 1e3 / args.queries
+    print(f"n={args.n} dim={args.dim} k={args.k} queries={args.queries}")
+    print(f"  {'exact float32':<22} {emb.nbytes / 2**20:8.1f} MiB  recall@{args.k}=1.000  {exact_ms:6.2f} ms/q")
+
+    configs = [("int8", {})] + [("pq", {"subdim": s}) for s in args.pq_subdims]
+    rows: List[dict] = [{"index": "exact", "bytes": emb.nbytes, "recall": 1.0, "ms_per_query": round(exact_ms, 3)}]
+    for method, opts in configs:
+        label = method if method == "int8" else f"pq-{opts['subdim']}"
+        t0 = time.perf_counter()
+        index = QuantizedIndex(emb, method, rescore="mmap", rescore_factor=args.rescore_factor, **opts)
+        build_s = time.perf_counter() - t0
+        mem = index.memory()
+        for rescore in (False, True):
+            t0 = time.perf_counter()
+            found = [index.search(q, args.k, rescore=rescore)[0] for q in queries]
+            ms = (time.perf_counter() - t0) * 1e3 / args.queries
+            recall = float(np.mean([_recall(f, t) for f, t in zip(found, truth)]))
+            name = label + (" +rescore" if rescore else "")
+            ratio = mem["float32_bytes"] / mem["codes_bytes"]
+            print(f"  {name:<22} {mem['codes_bytes'] / 2**20:8.1f} MiB  recall@{args.k}={recall:.3f}  "
+                  f"{ms:6.2f} ms/q  ({ratio:.1f}x menos; build {build_s:.1f}s)")
+            rows.append({"index": name, "bytes": mem["codes_bytes"], "recall": round(recall, 4),
+                         "ms_per_query": round(ms, 3), "build_s": round(build_s, 2),
+                         "rescore_mapped_bytes": mem["rescore_mapped_bytes"] if rescore else 0})
+    if args.json:
+        print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
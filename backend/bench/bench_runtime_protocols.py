@@ -0,0 +1,127 @@
+# backend/bench/bench_runtime_protocols.py
+"""
+Memoria por protocolo y latencia de acceso: modelos pydantic vs RuntimeProtocol.
+
+Genera un corpus sintético clonando los YAML reales (ids/títulos distintos,
+~10% de pasos con texto propio) y mide con tracemalloc la memoria retenida
+de cada representación, más el coste de los accesos típicos de la API.
+
+Uso (desde backend/):
+    python bench/bench_runtime_protocols.py --n 10000
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.protocol import Protocol  # noqa: E402
+from core.runtime_protocol import compile_protocols, step_payloads  # noqa: E402
+
+PROTOCOLS_DIR = Path(__file__).resolve().parents[1] / "rag" / "protocols"
+
+
+def _templates() -> List[Dict[str, Any]]:
+    return [yaml.safe_load(p.read_text(encoding="utf-8")) for p in sorted(PROTOCOLS_DIR.glob("*.yaml"))]
+
+
+def _synthetic_raw(templates: List[Dict[str, Any]], n: int) -> List[Dict[str, Any]]:
+    """Dicts 'recién parseados' (cadenas nuevas por protocolo, como al leer cada fichero)."""
+    blobs = [json.dumps(t) for t in templates]
+    out = []
+    for i in range(n):
+        d = json.loads(blobs[i % len(blobs)])
+        d["id"] = f"pa_synth{i}_adulto_v1"
+        d["title"] = f"{d['title']} #{i}"
+        if i % 10 == 0 and d.get("steps"):
+            d["steps"][0]["instruction"] = f"{d['steps'][0]['instruction']} (variante {i})"
+        out.append(d)
+    return out
+
+
+def _measure(build: Callable[[], Any]) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+
+def _pydantic_payload(p: Any):
+    steps = []
+    for i, s in enumerate(p.steps):
+        steps.append({
+            "id": getattr(s, "id", i),
+            "instruction": getattr(s, "instruction", None) or getattr(s, "action", "") or "",
+            "voice_cue": getattr(s, "voice_cue", None),
+            "ui": (s.ui.model_dump() if getattr(s, "ui", None) else {}),
+        })
+    return steps
+
+
+def _timeit(fn: Callable[[], Any], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=10000, help="número de protocolos sintéticos")
+    args = ap.parse_args()
+    templates = _templates()
+
+    def build_pydantic():
+        return {d["id"]: Protocol.model_validate(d) for d in _synthetic_raw(templates, args.n)}
+
+    def build_runtime():
+        return compile_protocols(build_pydantic())
+
+    pyd, pyd_bytes = _measure(build_pydantic)
+    rt, rt_bytes = _measure(build_runtime)
+    n = len(pyd)
+
+    print(f"protocolos={n}")
+    print(f"  memoria pydantic : {pyd_bytes / 1e6:8.1f} MB  ({pyd_bytes / n:8.0f} B/protocolo)")
+    print(f"  memoria runtime  : {rt_bytes / 1e6:8.1f} MB  ({rt_bytes / n:8.0f} B/protocolo)"
+          f"  ahorro {100.0 * (1 - rt_bytes / pyd_bytes):.0f}%")
+
+    pyd_list, rt_list = list(pyd.values()), list(rt.values())
+
+    def read_pyd():
+        for p in pyd_list:
+            for s in p.steps:
+                _ = (s.instruction, s.voice_cue, s.ui.timer, s.ui.metronome_bpm)
+
+    def read_rt():
+        for p in rt_list:
+            for s in p.steps:
+                _ = (s.instruction, s.voice_cue, s.ui.timer, s.ui.metronome_bpm)
+
+    steps_total = sum(len(p.steps) for p in rt_list)
+    for label, f_pyd, f_rt in (
+        ("lectura de campos", read_pyd, read_rt),
+        ("payload de pasos", lambda: [_pydantic_payload(p) for p in pyd_list],
+         lambda: [step_payloads(p) for p in rt_list]),
+        ("to_dict/model_dump", lambda: [p.model_dump() for p in pyd_list], lambda: [p.to_dict() for p in rt_list]),
+    ):
+        t_pyd, t_rt = _timeit(f_pyd), _timeit(f_rt)
+        print(f"  {label:<20} pydantic {t_pyd * 1e9 / steps_total:7.0f} ns/paso   "
+              f"runtime {t_rt * 1e9 / steps_total:7.0f} ns/paso   x{t_pyd / t_rt:4.1f}")
+
+
+if __name__ == "__main__":
+    main()
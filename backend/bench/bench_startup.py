@@ -0,0 +1,72 @@
+# backend/bench/bench_startup.py
+"""
+Benchmark de arranque: tiempo de import de core.conrumbo y tiempo hasta la
+primera respuesta (/live, /triage degradado) y hasta /ready.
+
+Uso (desde backend/):
+    python bench/bench_startup.py            # arranque perezoso (actual)
+    python bench/bench_startup.py --eager    # simula el arranque antiguo (todo antes de servir)
+    python bench/bench_startup.py --runs 5
+
+Cada ejecución corre en un subproceso limpio para medir imports en frío.
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import core.conrumbo as cr
+t_import = time.perf_counter() - t0
+heavy = sorted(m for m in ("numpy", "faiss", "openai") if m in sys.modules)
+EAGER = {eager}
+if EAGER:
+    cr.load_protocols()
+    cr._warm_up()
+import main
+from fastapi.testclient import TestClient
+out = {{"import_s": t_import, "heavy_modules_after_import": heavy}}
+with TestClient(main.app) as c:
+    c.get("/api/conrumbo/live")
+    out["first_live_s"] = time.perf_counter() - t0
+    r = c.post("/api/conrumbo/triage", json={{"intent": "rcp"}})
+    out["first_triage_s"] = time.perf_counter() - t0
+    out["first_triage_protocol"] = r.json()["result"]["protocol_id"]
+    while c.get("/api/conrumbo/ready").status_code != 200:
+        time.sleep(0.002)
+    out["ready_s"] = time.perf_counter() - t0
+print(json.dumps(out))
+"""
+
+
+def run_once(eager: bool) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", _CHILD.format(eager=eager)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--eager", action="store_true", help="cargar protocolos y motores antes de servir")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    runs = [run_once(args.eager) for _ in range(args.runs)]
+    mode = "eager" if args.eager else "lazy"
+    print(f"modo={mode} runs={args.runs} heavy_after_import={runs[0]['heavy_modules_after_import']}")
+    for key in ("import_s", "first_live_s", "first_triage_s", "ready_s"):
+        vals = [r[key] * 1000.0 for r in runs]
+        print(f"  {key:<16} mediana={statistics.median(vals):8.1f} ms  min={min(vals):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# backend/core/admission.py
+"""
+Control de admisión por prioridad (middleware ASGI).
+
+Toda la API comparte un bucle de eventos: sin prioridades, un rastreador
+pidiendo /protocols y /search en bucle añade latencia al /triage de quien
+está ante una parada. Cada petición se clasifica:
+
+    emergency   /triage, /triage/stream, /next_step y cualquier petición cuyo
+                texto marque SafetyGuardrails como should_escalate
+    standard    el resto de la API (protocolo concreto, sesión, recarga,
+                /analyze_image, que además acota sus imágenes en curso)
+    browse      /protocols, /search, /offline/*
+    (exenta)    /live, /ready, /health, /metrics, /debug/*: nunca esperan
+
+Cada clase tiene su concurrencia máxima, su cola y su espera máxima; además
+hay un límite global de peticiones en curso y de peticiones en cola. Al
+liberarse un hueco se admite primero la clase más prioritaria. Con la cola
+global llena, una petición prioritaria expulsa a la espera más reciente de
+una clase inferior; lo que no cabe o espera demasiado recibe 503 con
+Retry-After (antes browse que standard, y emergency sólo en último caso).
+
+Configuración por entorno:
+    ADMISSION_CONTROL=0                      desactiva el middleware
+    ADMISSION_MAX_INFLIGHT / ADMISSION_MAX_QUEUED
+    ADMISSION_<CLASE>_CONCURRENCY / _QUEUE / _TIMEOUT_S / _RETRY_AFTER_S
+"""
+from __future__ import annotations
+import asyncio
+import collections
+import json
+import os
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .metrics import ADMISSION_INFLIGHT, ADMISSION_QUEUE, ADMISSION_TOTAL, ADMISSION_WAIT
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL", "1") == "1"
+MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "256"))
+API_PREFIX = os.getenv("ADMISSION_API_PREFIX", "/api/conrumbo")
+# Cuerpo máximo que se inspecciona para promover una petición a emergency
+PEEK_MAX_BYTES = int(os.getenv("ADMISSION_PEEK_MAX_BYTES", "16384"))
+
+EMERGENCY = "emergency"
+STANDARD = "standard"
+BROWSE = "browse"
+
+EMERGENCY_ROUTES = ("/triage", "/triage/stream", "/next_step")
+BROWSE_ROUTES = ("/protocols", "/search")
+BROWSE_PREFIXES = ("/offline/",)
+EXEMPT_ROUTES = ("/live", "/ready", "/health", "/metrics")
+EXEMPT_PREFIXES = ("/debug/",)
+# Campos del cuerpo JSON que se pasan a SafetyGuardrails
+_TEXT_FIELDS = ("query", "user_response", "intent", "text")
+
+# (prioridad, concurrencia, cola, espera máxima s, Retry-After s); 0 = más prioritaria
+_DEFAULTS: Dict[str, Tuple[int, int, int, float, int]] = {
+    EMERGENCY: (0, 48, 256, 10.0, 1),
+    STANDARD: (1, 16, 64, 5.0, 2),
+    BROWSE: (2, 4, 32, 2.0, 5),
+}
+
+
+def _env(name: str, cls: str, default: Any) -> Any:
+    return type(default)(os.getenv(f"ADMISSION_{cls.upper()}_{name}", str(default)))
+
+
+class PriorityClass:
+    """Límites y estado (en curso, cola de futuros) de una clase de prioridad."""
+
+    __slots__ = ("name", "priority", "concurrency", "queue_limit", "timeout_s", "retry_after_s",
+                 "inflight", "waiters")
+
+    def __init__(self, name: str, priority: int, concurrency: int, queue_limit: int,
+                 timeout_s: float, retry_after_s: int):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.timeout_s = timeout_s
+        self.retry_after_s = retry_after_s
+        self.inflight = 0
+        self.waiters: Deque["asyncio.Future[bool]"] = collections.deque()
+
+    @classmethod
+    def from_env(cls, name: str) -> "PriorityClass":
+        prio, conc, queue, timeout, retry = _DEFAULTS[name]
+        return cls(name, prio, _env("CONCURRENCY", name, conc), _env("QUEUE", name, queue),
+                   _env("TIMEOUT_S", name, timeout), _env("RETRY_AFTER_S", name, retry))
+
+
+class Rejected(Exception):
+    """La petición no se admite (cola llena, expulsada o espera agotada)."""
+
+    def __init__(self, reason: str, retry_after_s: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    """
+    Planificador de un solo bucle de eventos (sin locks: todo ocurre en el bucle).
+    Un futuro en cola se resuelve con True (admitido, el hueco ya está contado)
+    o False (expulsado por una clase más prioritaria).
+    """
+
+    def __init__(self, classes: Optional[List[PriorityClass]] = None,
+                 max_inflight: int = MAX_INFLIGHT, max_queued: int = MAX_QUEUED):
+        classes = classes or [PriorityClass.from_env(n) for n in (EMERGENCY, STANDARD, BROWSE)]
+        self.classes: Dict[str, PriorityClass] = {c.name: c for c in classes}
+        self._order = sorted(classes, key=lambda c: c.priority)
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.inflight = 0
+
+    def queued(self) -> int:
+        return sum(len(c.waiters) for c in self._order)
+
+    def _can_run(self, cls: PriorityClass) -> bool:
+        return cls.inflight < cls.concurrency and self.inflight < self.max_inflight
+
+    def _take(self, cls: PriorityClass) -> None:
+        cls.inflight += 1
+        self.inflight += 1
+
+    def _evict_lower(self, cls: PriorityClass) -> bool:
+        """Expulsa la espera más reciente de la clase menos prioritaria por debajo de `cls`."""
+        for victim in reversed(self._order):
+            if victim.priority <= cls.priority:
+                return False
+            while victim.waiters:
+                fut = victim.waiters.pop()
+                if not fut.done():
+                    fut.set_result(False)
+                    return True
+        return False
+
+    async def acquire(self, name: str) -> float:
+        """Espera turno; devuelve los segundos de espera o lanza Rejected."""
+        cls = self.classes[name]
+        if not cls.waiters and self._can_run(cls):
+            self._take(cls)
+            ADMISSION_TOTAL.labels(name, "admitted").inc()
+            ADMISSION_WAIT.labels(name).observe(0.0)
+            return 0.0
+        if len(cls.waiters) >= cls.queue_limit or (self.queued() >= self.max_queued and not self._evict_lower(cls)):
+            ADMISSION_TOTAL.labels(name, "shed").inc()
+            raise Rejected("cola de admisión llena", cls.retry_after_s)
+
+        fut: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+        cls.waiters.append(fut)
+        t0 = time.perf_counter()
+        try:
+            admitted = await asyncio.wait_for(asyncio.shield(fut), cls.timeout_s)
+        except asyncio.TimeoutError:
+            admitted = None
+        except asyncio.CancelledError:
+            # Cliente desconectado: si ya se le había dado hueco, se devuelve
+            self._abandon(cls, fut)
+            raise
+        waited = time.perf_counter() - t0
+        ADMISSION_WAIT.labels(name).observe(waited)
+        if admitted is None:
+            self._abandon(cls, fut)
+            ADMISSION_TOTAL.labels(name, "timeout").inc()
+            raise Rejected("tiempo de espera de admisión agotado", cls.retry_after_s)
+        if not admitted:
+            ADMISSION_TOTAL.labels(name, "shed").inc()
+            raise Rejected("expulsada por tráfico prioritario", cls.retry_after_s)
+        ADMISSION_TOTAL.labels(name, "admitted").inc()
+        return waited
+
+    def _abandon(self, cls: PriorityClass, fut: "asyncio.Future[bool]") -> None:
+        if fut.done():
+            if fut.result():
+                self.release(cls.name)
+            return
+        fut.cancel()
+        try:
+            cls.waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self, name: str) -> None:
+        cls = self.classes[name]
+        cls.inflight -= 1
+        self.inflight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Da los huecos libres a las colas por orden de prioridad."""
+        for cls in self._order:
+            while cls.waiters and self._can_run(cls):
+                fut = cls.waiters.popleft()
+                if fut.done():
+                    continue
+                self._take(cls)
+                fut.set_result(True)
+            if self.inflight >= self.max_inflight:
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": self.inflight, "queued": self.queued(),
+            "classes": {c.name: {"inflight": c.inflight, "queued": len(c.waiters), "concurrency": c.concurrency,
+                                 "queue_limit": c.queue_limit, "timeout_s": c.timeout_s} for c in self._order},
+        }
+
+
+def classify(path: str, prefix: str = API_PREFIX) -> Optional[str]:
+    """Clase de prioridad de una ruta; None = exenta."""
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):] or "/"
+    path = path.rstrip("/") or "/"
+    if path in EXEMPT_ROUTES or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path in EMERGENCY_ROUTES:
+        return EMERGENCY
+    if path in BROWSE_ROUTES or path.startswith(BROWSE_PREFIXES):
+        return BROWSE
+    return STANDARD
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI puro: clasifica, espera turno en AdmissionController y libera al terminar."""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None, enabled: bool = ADMISSION_ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.controller = controller or CONTROLLER
+        self._safety: Any = None
+
+    def _should_escalate(self, body: bytes) -> bool:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return False
+        if not isinstance(payload, dict):
+            return False
+        texts = {k: payload[k] for k in _TEXT_FIELDS if isinstance(payload.get(k), str)}
+        if not texts:
+            return False
+        if self._safety is None:
+            from .safety import SafetyGuardrails
+            self._safety = SafetyGuardrails()
+        return bool(self._safety.check(texts).get("should_escalate"))
+
+    async def _peek_body(self, receive) -> Tuple[List[Dict[str, Any]], bytes]:
+        """Lee el cuerpo (hasta PEEK_MAX_BYTES) y devuelve los mensajes para reenviarlos a la app."""
+        messages: List[Dict[str, Any]] = []
+        body = b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body", False) or len(body) > PEEK_MAX_BYTES:
+                break
+        return messages, body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope.get("path", ""))
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        if name != EMERGENCY and scope.get("method") == "POST":
+            messages, body = await self._peek_body(receive)
+            if len(body) <= PEEK_MAX_BYTES and self._should_escalate(body):
+                ADMISSION_TOTAL.labels(name, "promoted").inc()
+                name = EMERGENCY
+            pending = collections.deque(messages)
+
+            async def replay():
+                if pending:
+                    return pending.popleft()
+                return await receive()
+
+            app_receive = replay
+        else:
+            app_receive = receive
+
+        try:
+            await self.controller.acquire(name)
+        except Rejected as e:
+            await _reject(send, e)
+            return
+        try:
+            await self.app(scope, app_receive, send)
+        finally:
+            self.controller.release(name)
+
+
+async def _reject(send, e: Rejected) -> None:
+    body = json.dumps({"detail": f"Servicio saturado: {e.reason}"}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start", "status": 503,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(e.retry_after_s).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+CONTROLLER = AdmissionController()
+for _cls in CONTROLLER.classes.values():
+    ADMISSION_QUEUE.labels(_cls.name).set_function(lambda c=_cls: len(c.waiters))
+    ADMISSION_INFLIGHT.labels(_cls.name).set_function(lambda c=_cls: c.inflight)
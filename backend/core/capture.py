@@ -0,0 +1,148 @@
+# backend/core/capture.py
+"""
+Captura de tráfico real (opcional) para reproducirlo con core/replay.py.
+
+Con TRAFFIC_CAPTURE=1 un middleware ASGI muestrea peticiones a /api/conrumbo
+(TRAFFIC_CAPTURE_SAMPLE, 0..1) y encola una línea por petición en segmentos
+JSON Lines comprimidos al cerrarse (misma cola y escritor que el diario):
+
+    [ts, method, path, query_string, body, status, latency_ms, headers]
+
+Anonimización antes de escribir:
+  - session_id: HMAC-SHA256 con TRAFFIC_CAPTURE_SALT (estable dentro de la
+    captura, no reversible); el mismo id sigue agrupando sus pasos,
+  - textos libres (query, user_response, text, ...): correos, teléfonos y
+    secuencias largas de dígitos se sustituyen por marcadores,
+  - cabeceras: sólo accept-language y x-region.
+
+No se capturan /metrics, /debug, /live, /ready ni /health.
+"""
+from __future__ import annotations
+import json
+import os
+import random
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .journal import SegmentLog, pseudonym as _pseudonym
+from .metrics import CAPTURE_EVENTS
+
+CAPTURE_ENABLED = os.getenv("TRAFFIC_CAPTURE", "0") == "1"
+CAPTURE_DIR = Path(os.getenv("TRAFFIC_CAPTURE_DIR", str(Path(__file__).resolve().parents[1] / "var" / "capture")))
+SAMPLE_RATE = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE", "0.1"))
+MAX_BODY_BYTES = int(os.getenv("TRAFFIC_CAPTURE_MAX_BODY", "16384"))
+# Sin sal configurada se genera una por proceso (los ids no se cruzan entre reinicios)
+SALT = os.getenv("TRAFFIC_CAPTURE_SALT") or secrets.token_hex(16)
+API_PREFIX = "/api/conrumbo"
+SKIP_ROUTES = ("/metrics", "/live", "/ready", "/health")
+SKIP_PREFIXES = ("/debug/",)
+KEEP_HEADERS = (b"accept-language", b"x-region")
+
+_ID_FIELDS = ("session_id",)
+_TEXT_FIELDS = ("query", "user_response", "text", "intent", "lugar")
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE_RE = re.compile(r"\+?\d[\d\s().-]{7,}\d")
+_DIGITS_RE = re.compile(r"\d{5,}")
+
+
+def pseudonym(value: str, salt: str = SALT) -> str:
+    return _pseudonym(value, salt)
+
+
+def scrub_text(text: str) -> str:
+    """Quita datos de contacto e identificadores numéricos de un texto libre."""
+    text = _EMAIL_RE.sub("<email>", text)
+    text = _PHONE_RE.sub("<tel>", text)
+    return _DIGITS_RE.sub("<num>", text)
+
+
+def anonymize(payload: Any, salt: str = SALT) -> Any:
+    """Copia del cuerpo JSON con ids seudonimizados y textos depurados (recursivo)."""
+    if isinstance(payload, dict):
+        out: Dict[str, Any] = {}
+        for k, v in payload.items():
+            if k in _ID_FIELDS and isinstance(v, str) and v:
+                out[k] = pseudonym(v, salt)
+            elif k in _TEXT_FIELDS and isinstance(v, str):
+                out[k] = scrub_text(v)
+            else:
+                out[k] = anonymize(v, salt)
+        return out
+    if isinstance(payload, list):
+        return [anonymize(v, salt) for v in payload]
+    return payload
+
+
+def _anonymize_body(body: bytes) -> Optional[str]:
+    if not body:
+        return None
+    try:
+        return json.dumps(anonymize(json.loads(body)), ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        return None  # cuerpo no JSON: no se guarda
+
+
+def _anonymize_path(path: str) -> str:
+    # /triage/stream/{session_id}
+    head, sep, tail = path.rpartition("/triage/stream/")
+    return f"{head}{sep}{pseudonym(tail)}" if sep and tail else path
+
+
+def should_capture(path: str) -> bool:
+    if not path.startswith(API_PREFIX):
+        return False
+    route = path[len(API_PREFIX):].rstrip("/") or "/"
+    return route not in SKIP_ROUTES and not route.startswith(SKIP_PREFIXES)
+
+
+CAPTURE = SegmentLog(CAPTURE_DIR, CAPTURE_ENABLED, prefix="capture", counter=CAPTURE_EVENTS, compress=True)
+
+
+class CaptureMiddleware:
+    """Middleware ASGI puro: copia el cuerpo de la petición mientras la app lo lee."""
+
+    def __init__(self, app, log: SegmentLog = CAPTURE, sample_rate: float = SAMPLE_RATE):
+        self.app = app
+        self.log = log
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not self.log.enabled or not should_capture(scope.get("path", ""))
+                or random.random() >= self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        ts = time.time()
+        t0 = time.perf_counter()
+        chunks: List[bytes] = []
+        size = 0
+        status = {"code": 500}
+
+        async def receive_wrapper():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request" and size <= MAX_BODY_BYTES:
+                chunk = message.get("body", b"")
+                chunks.append(chunk)
+                size += len(chunk)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            latency_ms = (time.perf_counter() - t0) * 1000.0
+            body = b"".join(chunks) if size <= MAX_BODY_BYTES else b""
+            headers = {k.decode(): v.decode("latin-1") for k, v in scope.get("headers", ()) if k in KEEP_HEADERS}
+            self.log.append((
+                round(ts, 6), scope.get("method", ""), _anonymize_path(scope.get("path", "")),
+                scope.get("query_string", b"").decode("latin-1"), _anonymize_body(body),
+                status["code"], round(latency_ms, 3), headers,
+            ))
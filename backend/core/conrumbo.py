@@ -1,41 +1,46 @@
 # backend/core/conrumbo.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 from pathlib import Path
+import asyncio
+import importlib
+import json
+import os
+import threading
 import yaml
 import time
 
+from .language import protocol_language, resolve_language
+from .capture import scrub_text
+from .journal import COMPLETE, FEEDBACK, JOURNAL, STEP
+from .regions import RegionRegistry, resolve_region
+from .response_cache import ResponseCache
+from .step_graph import HANDOFF, classify_signal
+from .voice_audio import MEDIA_TYPES, VoiceCatalog
+from .metrics import (
+    ACTIVE_SESSIONS, CONTENT_TYPE_LATEST, ENGINE_READY, IMAGE_INFLIGHT, PROTOCOLS_LOADED, REGISTRY, RELOAD_LATENCY,
+    RESPONSE_CACHE_STATE, STEP_ESCALATIONS, TRANSCRIPT_SESSIONS, TRIAGE_MEMO, WARMUP_SECONDS, stage,
+)
+from .timing import TimedRoute
+from .transcript import TranscriptTriage
+from .triage_pipeline import TriagePipeline
+
 # --------- Protocol models (opcional) ---------
 try:
-    from .protocol import Protocol, load_all_protocols  # tu module pro
+    from .protocol import Protocol, stream_protocols  # tu module pro
+    from .runtime_protocol import StringPool, compile_protocol, step_payloads
+    from .protocol_store import PROTOCOL_BACKEND, PROTOCOL_DB, ProtocolStore, build_store, read_meta, source_fingerprint
+    from .protocol_tiers import summaries_of
     HAVE_PROTOCOL_MODELS = True
 except Exception:
     HAVE_PROTOCOL_MODELS = False
     Protocol = Any  # type: ignore
 
-# --------- Motores (opcionales) ---------
-try:
-    from .triage import TriageEngine
-except Exception:
-    TriageEngine = None  # type: ignore
-
-try:
-    from .steps_player import StepsPlayer
-except Exception:
-    StepsPlayer = None  # type: ignore
-
-try:
-    from .safety import SafetyGuardrails
-except Exception:
-    SafetyGuardrails = None  # type: ignore
-
-try:
-    from .search import RAGSearchEngine
-except Exception:
-    RAGSearchEngine = None  # type: ignore
+# Los motores (triage, steps, search) se importan en el calentamiento: arrastran
+# numpy/faiss/openai y no deben retrasar el arranque de uvicorn.
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 # ---------- Modelos de petición ----------
 class TriageRequest(BaseModel):
@@ -49,21 +54,58 @@ class TriageRequest(BaseModel):
     hay_ayuda: Optional[bool] = None
     dispone_DEA: Optional[bool] = None
     context: Optional[Dict[str, Any]] = None
+    # Idioma (es/en/fr/de); también vale context.language. Elige la partición de búsqueda
+    language: Optional[str] = None
+    # Presupuesto de latencia (ms); por defecto TRIAGE_BUDGET_MS
+    budget_ms: Optional[int] = None
+
+class TranscriptChunk(BaseModel):
+    session_id: str
+    text: str = ""
+    # Resultado final del reconocedor (los parciales se reescriben y no se confirman)
+    is_final: bool = False
+    seq: Optional[int] = None
+    edad: Optional[str] = None
+    language: Optional[str] = None
+    context: Optional[Dict[str, Any]] = None
+    budget_ms: Optional[int] = None
 
 class NextStepRequest(BaseModel):
     protocol_id: str
     current_step: int
     user_response: Optional[str] = None
     context: Optional[Dict[str, Any]] = None
+    # Para el diario de sesión (tiempos por paso, abandono); también vale context.session_id
+    session_id: Optional[str] = None
+
+class ImageAnalysisRequest(BaseModel):
+    # JPEG/PNG en base64 (admite el prefijo data:image/...;base64,)
+    image: str
+    context: Optional[Dict[str, Any]] = None
+    min_confidence: Optional[float] = None
+    top_k: int = 3
 
 class SearchRequest(BaseModel):
     query: str
     context: Optional[Dict[str, Any]] = None
+    # Máximo de resultados (por defecto todos)
+    top_k: Optional[int] = None
 
 # ---------- Carga de protocolos ----------
 PROTOCOLS_DIR = Path(__file__).resolve().parents[1] / "rag" / "protocols"
+# dict id -> RuntimeProtocol, o TieredProtocols con PROTOCOL_BACKEND=sqlite
 PROTOCOLS: Dict[str, Any] = {}
+# Pasos ya normalizados por protocolo (ver _get_steps_and_meta); se rehace en cada carga
+STEP_CACHE: Dict[str, Any] = {}
+# Registro SQLite (PROTOCOL_BACKEND=sqlite): /protocol, /next_step, /protocols y
+# /search léxico se sirven con consultas indexadas en vez de los dicts
+STORE: Optional[Any] = None
 _last_load_time = 0.0
+# Cargas completadas; versión del registro en memoria (el SQLite usa su snapshot)
+_generation = 0
+_load_lock = threading.Lock()
+# Retry-After del 503 que se devuelve mientras el calentamiento carga el registro
+PROTOCOLS_RETRY_AFTER_S = int(os.getenv("PROTOCOLS_RETRY_AFTER_S", "1"))
 
 def _simple_load_protocols() -> Dict[str, Dict[str, Any]]:
     protocols: Dict[str, Dict[str, Any]] = {}
@@ -78,50 +120,250 @@ def _simple_load_protocols() -> Dict[str, Dict[str, Any]]:
     return protocols
 
 def load_protocols(force: bool = False) -> Dict[str, Any]:
-    global PROTOCOLS, _last_load_time
-    if force or not PROTOCOLS:
-        if not PROTOCOLS_DIR.exists():
-            print(f"[WARN] Carpeta de protocolos no encontrada: {PROTOCOLS_DIR}")
-            PROTOCOLS = {}
-            return PROTOCOLS
-        if HAVE_PROTOCOL_MODELS:
-            PROTOCOLS = load_all_protocols(PROTOCOLS_DIR)  # dict[str, Protocol]
-            print(f"[INFO] Protocol models ON. {len(PROTOCOLS)} cargados.")
-        else:
-            PROTOCOLS = _simple_load_protocols()
-            print(f"[INFO] Protocol models OFF. {len(PROTOCOLS)} cargados.")
-        _last_load_time = time.time()
+    global PROTOCOLS, STEP_CACHE, _last_load_time, _generation
+    with _load_lock:
+        if force or not PROTOCOLS:
+            t0 = time.perf_counter()
+            if not PROTOCOLS_DIR.exists():
+                print(f"[WARN] Carpeta de protocolos no encontrada: {PROTOCOLS_DIR}")
+                protocols, steps = {}, {}
+            elif HAVE_PROTOCOL_MODELS and PROTOCOL_BACKEND == "sqlite":
+                protocols = _load_from_store(force)
+                # Los pasos renderizados están en el fichero (tabla steps)
+                steps = {}
+            elif HAVE_PROTOCOL_MODELS:
+                # Pydantic sólo valida; cada protocolo se compila a la forma compacta
+                # (RuntimeProtocol) en cuanto llega del pool, sin dict intermedio
+                protocols: Dict[str, Any] = {}
+                steps: Dict[str, Any] = {}
+                pool = StringPool()
+
+                def _ingest(proto: Any) -> None:
+                    rt = compile_protocol(proto, pool)
+                    protocols[rt.id] = rt
+                    steps[rt.id] = _get_steps_and_meta(rt)
+
+                _, errors = stream_protocols(PROTOCOLS_DIR, _ingest)
+                print(f"[INFO] Protocol models ON. {len(protocols)} cargados, {errors} con errores.")
+            else:
+                protocols = _simple_load_protocols()
+                steps = {pid: _get_steps_and_meta(p) for pid, p in protocols.items()}
+                print(f"[INFO] Protocol models OFF. {len(protocols)} cargados.")
+            STEP_CACHE = steps
+            PROTOCOLS = protocols
+            _generation += 1
+            _last_load_time = time.time()
+            RELOAD_LATENCY.observe(time.perf_counter() - t0)
     return PROTOCOLS
 
-# Carga inicial
-load_protocols()
+def _load_from_store(force: bool) -> Any:
+    """
+    Reconstruye el registro SQLite sólo si falta, cambiaron los YAML o force.
+    Devuelve el registro por niveles (core/protocol_tiers.py): resúmenes en
+    memoria y cuerpos bajo demanda, sin reparsear ni revalidar YAML.
+    """
+    global STORE
+    from .protocol_tiers import TieredProtocols, pinned_protocols
+    fingerprint = source_fingerprint(PROTOCOLS_DIR)
+    if force or read_meta(PROTOCOL_DB).get("fingerprint") != fingerprint:
+        protocols: Dict[str, Any] = {}
+        pool = StringPool()
+
+        def _ingest(proto: Any) -> None:
+            rt = compile_protocol(proto, pool)
+            protocols[rt.id] = rt
+
+        _, errors = stream_protocols(PROTOCOLS_DIR, _ingest)
+        meta = build_store(protocols, PROTOCOL_DB, fingerprint)
+        print(f"[INFO] Registro SQLite publicado: {len(protocols)} protocolos, {errors} con errores "
+              f"({meta['bytes'] / 1024:.1f} KiB, snapshot {meta['snapshot']}).")
+        del protocols
+    if STORE is None:
+        STORE = ProtocolStore(PROTOCOL_DB)
+    else:
+        STORE.reopen()
+    tiered = TieredProtocols(STORE, pinned_protocols())
+    print(f"[INFO] Registro SQLite {STORE.snapshot}: {len(tiered)} resúmenes, "
+          f"fijados {sorted(tiered.stats()['pinned'])}.")
+    return tiered
+
+def _protocols() -> Dict[str, Any]:
+    """
+    Protocolos cargados. Si aún no hay ninguna carga completa no se cargan aquí
+    (parsear los YAML pararía el bucle de eventos): se lanza el calentamiento y 503.
+    """
+    if _generation:
+        return PROTOCOLS
+    start_warmup(force=ENGINES.phase == "failed")
+    raise HTTPException(status_code=503, detail="Protocolos cargándose",
+                        headers={"Retry-After": str(PROTOCOLS_RETRY_AFTER_S)})
+
+def _registry_snapshot() -> str:
+    """Versión de lo que sirve /search: snapshot SQLite (o generación de carga) + overlays de región."""
+    base = getattr(_protocols(), "snapshot", None) or f"g{_generation}"
+    return f"{base}.r{REGIONS.generation}"
+
+def _store():
+    """Registro SQLite o None (backend en memoria); se abre con la primera carga."""
+    if STORE is None and HAVE_PROTOCOL_MODELS and PROTOCOL_BACKEND == "sqlite":
+        _protocols()
+    return STORE
+
+# ---------- Motores (perezosos, calentados en segundo plano) ----------
+class _Engines:
+    """
+    Estado de los motores. Fases:
+      cold -> loading -> lexical (intents exactos, índice semántico construyéndose) -> ready
+    En cualquier fase anterior a 'ready' el triaje sirve la ruta degradada.
+    """
 
-# ---------- Instancias opcionales ----------
-rag_engine = RAGSearchEngine() if RAGSearchEngine else None
-triage_engine = TriageEngine(rag_engine) if TriageEngine else None
-steps_player = StepsPlayer(rag_engine) if StepsPlayer else None
-safety_guardrails = SafetyGuardrails() if SafetyGuardrails else None
+    def __init__(self):
+        self.phase = "cold"
+        self.error: Optional[str] = None
+        self.rag_engine = None
+        self.triage_engine = None
+        self.steps_player = None
+        self.safety_guardrails = None
+        self._thread: Optional[threading.Thread] = None
+        # Recarga pedida con un calentamiento en curso: se repite al terminar
+        self._pending = False
+        self._lock = threading.Lock()
+
+ENGINES = _Engines()
+
+def _optional_engine(module: str, name: str):
+    try:
+        return getattr(importlib.import_module(f".{module}", __package__), name)
+    except Exception as e:
+        print(f"[WARN] Motor {name} no disponible: {e}")
+        return None
+
+def _set_phase(phase: str) -> None:
+    ENGINES.phase = phase
+    ENGINE_READY.set(1 if phase == "ready" else 0)
+
+def _warm_up() -> None:
+    t0 = time.perf_counter()
+    rebuilding = ENGINES.rag_engine is not None
+    try:
+        if not rebuilding:
+            _set_phase("loading")
+        protocols = load_protocols()
+        # Overlays leídos y vistas creadas aquí, no en la primera petición con región
+        REGIONS.warm(protocols, STEP_CACHE)
+        WARMUP_SECONDS.labels("protocols").set(time.perf_counter() - t0)
+
+        if ENGINES.safety_guardrails is None:
+            SafetyGuardrails = _optional_engine("safety", "SafetyGuardrails")
+            ENGINES.safety_guardrails = SafetyGuardrails() if SafetyGuardrails else None
+
+        RAGSearchEngine = _optional_engine("search", "RAGSearchEngine")
+        TriageEngine = _optional_engine("triage", "TriageEngine")
+        StepsPlayer = _optional_engine("steps_player", "StepsPlayer")
+        rag = RAGSearchEngine(protocols=protocols, build_index=False) if RAGSearchEngine else None
+        triage = TriageEngine(rag) if (TriageEngine and rag) else None
+        player = StepsPlayer(rag) if (StepsPlayer and rag) else None
+        WARMUP_SECONDS.labels("engines").set(time.perf_counter() - t0)
+
+        if not rebuilding:
+            # Publicar ya los motores léxicos; el índice se construye después
+            ENGINES.rag_engine, ENGINES.triage_engine, ENGINES.steps_player = rag, triage, player
+            _set_phase("lexical")
+        if rag:
+            rag.build_index()
+        if rebuilding:
+            # Recarga: los motores antiguos siguen sirviendo hasta tener el nuevo índice
+            if player and ENGINES.steps_player is not None:
+                player.active_sessions = ENGINES.steps_player.active_sessions
+            ENGINES.rag_engine, ENGINES.triage_engine, ENGINES.steps_player = rag, triage, player
+        ENGINES.error = None
+        _set_phase("ready")
+        WARMUP_SECONDS.labels("ready").set(time.perf_counter() - t0)
+        print(f"[INFO] Motores listos en {time.perf_counter() - t0:.2f}s")
+    except Exception as e:
+        ENGINES.error = str(e)
+        if not rebuilding:
+            _set_phase("failed")
+        print(f"[ERR] Calentamiento de motores: {e}")
+
+def _warm_up_loop() -> None:
+    while True:
+        _warm_up()
+        with ENGINES._lock:
+            if not ENGINES._pending:
+                ENGINES._thread = None
+                return
+            ENGINES._pending = False
+        print("[INFO] Recarga pedida durante el calentamiento: reconstruyendo motores")
+
+def start_warmup(force: bool = False) -> None:
+    """
+    Lanza el calentamiento en un hilo de fondo (idempotente salvo force=True).
+    Con force y un calentamiento en curso, éste se repite al terminar: lo que
+    está construyendo puede ser anterior a la recarga.
+    """
+    with ENGINES._lock:
+        if ENGINES._thread is not None:
+            ENGINES._pending = ENGINES._pending or force
+            return
+        if ENGINES.phase != "cold" and not force:
+            return
+        ENGINES._thread = threading.Thread(
+            target=_warm_up_loop, name="conrumbo-warmup", daemon=True,
+        )
+        ENGINES._thread.start()
+
+def _engines() -> _Engines:
+    if ENGINES.phase == "cold":
+        start_warmup()
+    return ENGINES
+
+def _safety():
+    if ENGINES.safety_guardrails is None:
+        SafetyGuardrails = _optional_engine("safety", "SafetyGuardrails")
+        ENGINES.safety_guardrails = SafetyGuardrails() if SafetyGuardrails else None
+    return ENGINES.safety_guardrails
+
+TRIAGE_PIPELINE = TriagePipeline()
+REGIONS = RegionRegistry()
+# Audio pre-renderizado de voice_cue/instruction (core/voice_audio.py); vacío si no se ha construido
+VOICE = VoiceCatalog()
+_voice_base: Optional[str] = None
+
+def _region_view(context: Optional[Dict[str, Any]] = None, request: Optional[Request] = None):
+    """Vista de la región de la petición (context.region / X-Region) o None para el corpus base."""
+    region = resolve_region(context, request.headers.get("x-region") if request is not None else None)
+    if not region or not HAVE_PROTOCOL_MODELS:
+        return None
+    view = REGIONS.view(region, _protocols(), STEP_CACHE)
+    return view if view.overlay is not None else None
+
+PROTOCOLS_LOADED.set_function(lambda: len(PROTOCOLS))
+TRIAGE_MEMO.labels("hits").set_function(lambda: getattr(ENGINES.triage_engine, "memo_hits", 0))
+TRIAGE_MEMO.labels("misses").set_function(lambda: getattr(ENGINES.triage_engine, "memo_misses", 0))
+TRIAGE_MEMO.labels("entries").set_function(lambda: len(getattr(ENGINES.triage_engine, "_memo", ())))
+TRANSCRIPTS = TranscriptTriage()
+# Respuestas de /search serializadas, por (consulta, idioma, región, top_k) y versión del registro
+SEARCH_CACHE = ResponseCache("search")
+RESPONSE_CACHE_STATE.labels("search", "bytes").set_function(lambda: SEARCH_CACHE.bytes)
+RESPONSE_CACHE_STATE.labels("search", "entries").set_function(lambda: len(SEARCH_CACHE))
+RESPONSE_CACHE_STATE.labels("search", "hit_ratio").set_function(lambda: SEARCH_CACHE.hit_ratio)
+# Se crea con la primera imagen: core.image_analysis importa numpy y no debe pesar en el arranque
+IMAGES = None
+IMAGE_INFLIGHT.set_function(lambda: IMAGES.inflight if IMAGES is not None else 0)
+TRANSCRIPT_SESSIONS.set_function(lambda: len(TRANSCRIPTS))
+ACTIVE_SESSIONS.set_function(lambda: len(ENGINES.steps_player.active_sessions) if ENGINES.steps_player else 0)
 
 # ---------- Helpers ----------
 def _get_steps_and_meta(proto: Any):
     """
     Devuelve (steps_normalizados, ui_top_level_dict, voice_cues_list)
-    - Si hay modelos pydantic, convierte a dicts serializables.
+    - Si hay modelos, convierte el RuntimeProtocol compacto a dicts serializables.
     - Normaliza steps simples a objetos con 'instruction'.
     """
     if HAVE_PROTOCOL_MODELS and not isinstance(proto, dict):
-        # pydantic Protocol
-        steps = []
-        for i, s in enumerate(proto.steps):
-            steps.append({
-                "id": getattr(s, "id", i),
-                "instruction": getattr(s, "instruction", None) or getattr(s, "action", "") or "",
-                "voice_cue": getattr(s, "voice_cue", None),
-                "ui": (s.ui.model_dump() if getattr(s, "ui", None) else {}),
-            })
-        top_ui = proto.ui.model_dump() if getattr(proto, "ui", None) else {}
-        voice_cues = list(getattr(proto, "voice_cues", []) or [])
-        return steps, top_ui, voice_cues
+        top_ui = proto.ui.to_dict() if proto.ui else {}
+        return step_payloads(proto), top_ui, list(proto.voice_cues or [])
 
     # dict plano
     steps_raw = proto.get("steps", [])
@@ -152,25 +394,61 @@ async def health_check():
         "version": "1.0.0",
         "protocols_loaded": len(PROTOCOLS),
         "protocol_models": HAVE_PROTOCOL_MODELS,
+        "engines": ENGINES.phase,
+    }
+
+@router.get("/live")
+async def liveness():
+    """Liveness: el proceso atiende peticiones (no depende de los motores)."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness(response: Response):
+    """Readiness: 200 sólo con el índice semántico construido; 503 mientras se calienta."""
+    eng = _engines()
+    ready = eng.phase == "ready"
+    if not ready:
+        response.status_code = 503
+    return {
+        "ready": ready,
+        "phase": eng.phase,
+        "degraded": eng.phase in {"loading", "lexical"},
+        "protocols_loaded": len(PROTOCOLS),
+        "error": eng.error,
     }
 
+@router.get("/metrics")
+async def metrics():
+    """Métricas en formato texto de Prometheus."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
 @router.post("/triage")
-async def submit_triage(req: TriageRequest):
+async def submit_triage(req: TriageRequest, request: Request):
     try:
         # Safety (si tienes guardarraíles)
+        eng = _engines()
+        payload = req.model_dump()
+        view = _region_view(req.context, request)
+        safety_guardrails = view.safety if view else _safety()
         safety = {"allowed": True, "message": "Consulta permitida"}
         if safety_guardrails:
-            safety = safety_guardrails.check(req.model_dump())
+            with stage("safety"):
+                safety = safety_guardrails.check(payload)
 
-        # Usa tu motor si existe; si no, mapping básico
-        if triage_engine:
-            result = triage_engine.run(req.model_dump())
+        # Usa tu motor si existe; si no (o aún calentando), mapping básico
+        if eng.triage_engine:
+            with stage("triage"):
+                result, pipeline = await TRIAGE_PIPELINE.run(eng.triage_engine, payload, req.budget_ms)
         else:
+            pipeline = {"served_by": "basic", "degraded": True}
             mapping = {
                 "rcp": "pa_rcp_adulto_v1",
                 "parada_cardiorespiratoria": "pa_rcp_adulto_v1",
                 "atragantamiento": "pa_asfixia_adulto_v1",
                 "asfixia": "pa_asfixia_adulto_v1",
+                "hemorragia": "pa_hemorragias_v1",
+                "sangrado": "pa_hemorragias_v1",
+                "quemadura": "pa_quemaduras_v1",
             }
             flow = None
             if req.intent and req.intent in mapping:
@@ -182,6 +460,7 @@ async def submit_triage(req: TriageRequest):
                         flow = v
                         break
             if not flow:
+                # Sin esperar a la carga: la ruta degradada responde igual
                 flow = next(iter(PROTOCOLS.keys()), None)
 
             risk = "alto" if (req.intent == "rcp" or req.respiracion in {"anormal", "ausente"}) else "medio"
@@ -193,21 +472,150 @@ async def submit_triage(req: TriageRequest):
                 "escalate_to_emergency": (risk == "alto"),
             }
 
-        return {"success": True, "result": result, "safety_check": safety}
+        if view:
+            result = view.localize_result(result)
+            return {"success": True, "result": result, "safety_check": safety, "pipeline": pipeline,
+                    "region": view.region}
+        return {"success": True, "result": result, "safety_check": safety, "pipeline": pipeline}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/next_step")
-async def get_next_step(req: NextStepRequest):
+@router.post("/triage/stream")
+async def triage_stream(chunk: TranscriptChunk, request: Request):
+    """
+    Triaje incremental: un trozo (parcial o final) de la transcripción de voz.
+    Devuelve el protocolo más probable y la escalada a 112 en cuanto hay palabras suficientes.
+    """
     try:
-        if req.protocol_id not in PROTOCOLS:
-            raise HTTPException(status_code=404, detail="Protocolo no encontrado")
+        eng = _engines()
+        ctx = dict(chunk.context or {})
+        if chunk.language:
+            ctx["language"] = chunk.language
+        language = resolve_language(ctx, request.headers.get("accept-language"))
+        view = _region_view(ctx, request)
+        safety_guardrails = view.safety if view else _safety()
+        with stage("transcript"):
+            result = TRANSCRIPTS.feed(
+                eng.rag_engine, eng.triage_engine, safety_guardrails, chunk.session_id, chunk.text,
+                is_final=chunk.is_final, seq=chunk.seq, language=language, edad=chunk.edad or "",
+            )
+        result["served_by"] = "transcript"
+
+        # Frase final sin ninguna frase reconocida: triaje léxico/fuzzy de ese trozo (sin
+        # embeddings: sobre un fragmento suelto la semántica sólo aporta ruido). Lo aceptado
+        # queda en la sesión para que el siguiente trozo no lo pierda.
+        if chunk.is_final and not result["protocol_id"] and eng.triage_engine and chunk.text.strip():
+            with stage("triage"):
+                full = eng.triage_engine.run(
+                    {"query": chunk.text, "edad": chunk.edad or "adulto", "language": language}, semantic=False,
+                )
+            if full.get("matched_by") != "default" and full.get("protocol_id"):
+                TRANSCRIPTS.accept(chunk.session_id, full["protocol_id"])
+                result.update(protocol_id=full["protocol_id"], immediate_action=full.get("immediate_action"),
+                              ready=True, served_by=full["matched_by"])
+        if result["escalate_to_emergency"] and safety_guardrails:
+            result["escalation_message"] = (
+                f"EMERGENCIA DETECTADA: Llamar al {safety_guardrails.emergency_number} inmediatamente"
+            )
+        if view:
+            result = view.localize_result(result)
+        return {"success": True, "result": result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/triage/stream/{session_id}")
+async def triage_stream_reset(session_id: str):
+    return {"success": True, "reset": TRANSCRIPTS.reset(session_id)}
+
+def _voice_url(request: Request, filename: str) -> str:
+    global _voice_base
+    if _voice_base is None:
+        _voice_base = request.url_for("voice_audio", filename="x").path[:-1]
+    return _voice_base + filename
 
-        proto = PROTOCOLS[req.protocol_id]
-        steps, top_ui, voice_cues = _get_steps_and_meta(proto)
-        total = len(steps)
+def _escalation(req: NextStepRequest, view: Any) -> Optional[Dict[str, Any]]:
+    """
+    Si la respuesta al paso anterior trae una señal de emergencia, el destino
+    precalculado en el grafo de pasos para esa señal (core/step_graph.py): sin
+    búsqueda en la petición. La alerta de emergencia se da siempre; el flujo no se corta.
+    Sin rama para la señal se sirve el paso siguiente normal (sin pasar del último):
+    sólo una rama explícita o una derivación cambian el destino.
+    """
+    if not req.user_response or not HAVE_PROTOCOL_MODELS:
+        return None
+    safety = view.safety if view else _safety()
+    hits = safety.emergency_matches(req.user_response) if safety else []
+    if not hits:
+        return None
+    protocols = view.protocols if view else _protocols()
+    proto = protocols.get(req.protocol_id)
+    graph = getattr(proto, "graph", None)
+    came_from = req.current_step - 1
+    if graph is None or not 0 <= came_from < len(graph):
+        return None
+    signal = classify_signal(fragment for _, fragment in hits)
+    to, key, label = graph.escalate(came_from, signal)
+    following = min(req.current_step, len(graph) - 1)
+    jump = {"from": came_from, "to": following if to is None else to, "protocol_id": req.protocol_id,
+            "trigger": hits[0][1], "signal": signal, "branch": key or None, "safety": safety}
+    if to == HANDOFF:
+        target = _handoff_protocol(label, protocols, proto)
+        if target is not None:
+            jump.update(to=0, protocol_id=target, handoff=label)
+        else:
+            to = None
+            jump["to"] = following
+    STEP_ESCALATIONS.labels("next" if to is None else "handoff" if to == HANDOFF else "step").inc()
+    return jump
+
+def _handoff_protocol(label: str, protocols: Any, source: Any) -> Optional[str]:
+    """Derivación de una rama ('rcp_protocol') -> id del protocolo cargado que la cubre, del mismo idioma si hay varios."""
+    name = label.lower()
+    name = name[:-len("_protocol")] if name.endswith("_protocol") else name
+    found = [pid for pid in protocols if name in pid.lower().split("_")]
+    same = [pid for pid in found if protocol_language(protocols[pid]) == protocol_language(source)]
+    return (same or found or [None])[0]
 
-        if req.current_step < 0 or req.current_step >= total:
+@router.post("/next_step")
+async def get_next_step(req: NextStepRequest, request: Request):
+    try:
+        view = _region_view(req.context, request)
+        store = None if view else _store()
+        session_id = req.session_id or (req.context or {}).get("session_id")
+        jump = _escalation(req, view)
+        current = jump["to"] if jump is not None else req.current_step
+        protocol_id = jump["protocol_id"] if jump is not None else req.protocol_id
+
+        if store is not None:
+            with stage("store"):
+                row = store.step(protocol_id, current)
+            if row is None:
+                raise HTTPException(status_code=404, detail="Protocolo no encontrado")
+            step, total, top_ui, voice_cues = row
+        else:
+            protocols = view.protocols if view else _protocols()
+            if protocol_id not in protocols:
+                raise HTTPException(status_code=404, detail="Protocolo no encontrado")
+            cached = view.steps_and_meta(protocol_id) if view else STEP_CACHE.get(protocol_id)
+            steps, top_ui, voice_cues = cached or _get_steps_and_meta(protocols[protocol_id])
+            total = len(steps)
+            step = steps[current] if 0 <= current < total else None
+
+        # Diario: sólo encola (la escritura es diferida); id seudonimizado y texto depurado
+        if session_id:
+            journal_id = JOURNAL.pseudonym(session_id)
+            if req.user_response:
+                JOURNAL.record(journal_id, req.protocol_id, req.current_step - 1, FEEDBACK,
+                               scrub_text(req.user_response)[:200])
+            in_range = 0 <= current < total
+            JOURNAL.record(journal_id, protocol_id, current if in_range else total, STEP if in_range else COMPLETE,
+                           f"escalation:{jump['signal']}" if jump is not None else "")
+
+        if step is None:
             return {"success": True, "result": {
                 "step": None,
                 "step_number": total,
@@ -216,7 +624,6 @@ async def get_next_step(req: NextStepRequest):
                 "message": "Protocolo completado",
             }}
 
-        step = steps[req.current_step]
         say_text = step.get("instruction", "") or step.get("action", "")
         ui = {**(top_ui or {}), **(step.get("ui") or {})}
         vcu: List[str] = []
@@ -225,35 +632,89 @@ async def get_next_step(req: NextStepRequest):
         if voice_cues:
             vcu.extend(voice_cues)
 
-        return {"success": True, "result": {
+        result = {
             "step": say_text,
-            "step_number": req.current_step + 1,
+            "step_number": current + 1,
             "total_steps": total,
-            "is_final": (req.current_step + 1) >= total,
+            "is_final": (current + 1) >= total,
             "ui": ui,
             "voice_cues": vcu,
-        }}
+        }
+        if len(VOICE):
+            audio = VOICE.step_audio(step)
+            if audio:
+                result["audio"] = {field: _voice_url(request, f) for field, f in audio.items()}
+        if jump is not None:
+            # El cliente sigue desde step_number (current_step = step_number en la siguiente petición);
+            # con derivación, en protocol_id
+            safety = jump["safety"]
+            result["escalate_to_emergency"] = True
+            result["escalation_message"] = f"EMERGENCIA DETECTADA: Llamar al {safety.emergency_number} inmediatamente"
+            result["escalation"] = {"from_step": jump["from"] + 1, "to_step": current + 1, "trigger": jump["trigger"],
+                                    "signal": jump["signal"], "branch": jump["branch"]}
+            if protocol_id != req.protocol_id:
+                result["protocol_id"] = protocol_id
+                result["escalation"]["handoff"] = jump["handoff"]
+        return {"success": True, "result": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/analyze_image")
+async def analyze_image(req: ImageAnalysisRequest, request: Request):
+    """Lesiones visibles en una foto -> protocolos del registro (core/image_analysis.py)."""
+    global IMAGES
+    from . import image_analysis as ia
+    if IMAGES is None:
+        # Sin lock: sólo se toca desde el bucle de eventos
+        IMAGES = ia.ImageAnalyzer()
+    view = _region_view(req.context, request)
+    try:
+        result = await IMAGES.analyze(req.image, view.protocols if view else _protocols(),
+                                      req.min_confidence, req.top_k)
+    except ia.ImageBusy as e:
+        raise HTTPException(status_code=503, detail=f"Análisis de imagen saturado: {e}",
+                            headers={"Retry-After": str(ia.IMAGE_RETRY_AFTER_S)})
+    except ia.ImageError as e:
+        raise HTTPException(status_code=e.status, detail=str(e))
+    if view:
+        return {"success": True, "result": result, "region": view.region}
+    return {"success": True, "result": result}
+
 @router.get("/protocol/{protocol_id}")
-async def get_protocol(protocol_id: str):
-    if protocol_id not in PROTOCOLS:
+async def get_protocol(protocol_id: str, request: Request, region: Optional[str] = None):
+    view = _region_view({"region": region}, request)
+    store = None if view else _store()
+    if store is not None:
+        with stage("store"):
+            doc = store.protocol_doc(protocol_id)
+        if doc is None:
+            raise HTTPException(status_code=404, detail="Protocolo no encontrado")
+        return {"success": True, "protocol": doc}
+    protocols = view.protocols if view else _protocols()
+    if protocol_id not in protocols:
         raise HTTPException(status_code=404, detail="Protocolo no encontrado")
-    proto = PROTOCOLS[protocol_id]
+    proto = protocols[protocol_id]
     if HAVE_PROTOCOL_MODELS and not isinstance(proto, dict):
-        return {"success": True, "protocol": proto.model_dump()}
+        return {"success": True, "protocol": proto.to_dict()}
     return {"success": True, "protocol": proto}
 
 @router.get("/protocols")
-async def list_protocols():
+async def list_protocols(request: Request, region: Optional[str] = None):
+    view = _region_view({"region": region}, request)
+    store = None if view else _store()
+    if store is not None:
+        with stage("store"):
+            return {"success": True, "protocols": store.listing()}
     items = []
-    for pid, proto in PROTOCOLS.items():
+    # Con región, los títulos se localizan sobre el registro base sin parchear cada protocolo
+    for pid, proto in (summaries_of(_protocols()) if view else _protocols()).items():
         if HAVE_PROTOCOL_MODELS and not isinstance(proto, dict):
-            title = proto.title
-            category = getattr(proto, "category", "")
-            priority = getattr(getattr(proto, "metadata", None), "riesgo", "") if getattr(proto, "metadata", None) else ""
-            target = ""
+            title = view.title(pid, proto.title) if view else proto.title
+            category = proto.category
+            priority = proto.priority or proto.metadata.riesgo or ""
+            target = proto.target_audience or ""
         else:
             title = proto.get("title", "")
             category = proto.get("category", "")
@@ -266,33 +727,188 @@ async def list_protocols():
     return {"success": True, "protocols": items}
 
 @router.post("/search")
-async def search_knowledge(req: SearchRequest):
+async def search_knowledge(req: SearchRequest, request: Request):
     try:
         q = (req.query or "").lower().strip()
-        results: List[Dict[str, Any]] = []
+        accept_language = request.headers.get("accept-language")
+        language = resolve_language(req.context, accept_language)
         if not q:
-            return {"success": True, "results": results}
-
-        for pid, proto in PROTOCOLS.items():
-            # Título
-            title = proto.title if HAVE_PROTOCOL_MODELS and not isinstance(proto, dict) else proto.get("title", "")
-            haystack = (title or "").lower()
-
-            # Texto de pasos
-            steps, _, _ = _get_steps_and_meta(proto)
-            for s in steps:
-                txt = s.get("instruction") or s.get("action") or ""
-                if txt:
-                    haystack += " " + txt.lower()
-
-            if q in haystack:
-                results.append({"protocol_id": pid, "title": title, "relevance": 1.0})
-
-        results.sort(key=lambda x: x["relevance"], reverse=True)
-        return {"success": True, "results": results}
+            return {"success": True, "language": language, "results": []}
+
+        # Misma consulta, idioma, región, top_k y versión del registro -> mismos bytes
+        top_k = req.top_k if req.top_k and req.top_k > 0 else None
+        key = (q, language, resolve_region(req.context, request.headers.get("x-region")), top_k)
+        snapshot = _registry_snapshot()
+        body = SEARCH_CACHE.get(snapshot, key)
+        if body is None:
+            language, results, cacheable = _search_results(q, language, accept_language, req.context, request)
+            body = _json_bytes({"success": True, "language": language, "results": results[:top_k]})
+            if cacheable:
+                SEARCH_CACHE.put(snapshot, key, body)
+        return Response(content=body, media_type="application/json")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _json_bytes(payload: Dict[str, Any]) -> bytes:
+    """Como JSONResponse.render: es lo que se guarda en SEARCH_CACHE y se envía tal cual."""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def _search_results(q: str, language: str, accept_language: Optional[str], context: Optional[Dict[str, Any]],
+                    request: Request):
+    """
+    (idioma, resultados, cacheable); no es cacheable lo servido con motores de una carga anterior o sin motores.
+    Sin coincidencias literales se repite con las erratas corregidas (DeletionIndex de la partición).
+    """
+    results: List[Dict[str, Any]] = []
+    view = _region_view(context, request)
+    store = None if view else _store()
+    rag = ENGINES.rag_engine
+    if store is not None:
+        # FTS5 (trigramas) sobre el fichero; no depende de que los motores estén listos
+        language = store.language_for(language)
+        with stage("store"):
+            rows = store.lexical_search(q, language)
+        cacheable = True
+        if not rows:
+            # La corrección necesita el léxico de los motores: sin ellos (o de otra carga) no se cachea
+            cacheable = rag is not None and rag.protocols is _protocols()
+            corrected = rag.correct_query(q, {"language": language}) if rag is not None else None
+            if corrected:
+                with stage("store"):
+                    rows = store.lexical_search(corrected, language)
+        results = [{"protocol_id": pid, "title": title, "relevance": 1.0} for pid, title in rows]
+        return language, results, cacheable
+
+    if rag is not None:
+        # Índice léxico de la partición del idioma (trigramas + caché propia)
+        language, pids = rag.lexical_search(q, context, accept_language)
+        if not pids:
+            corrected = rag.correct_query(q, context, accept_language)
+            if corrected:
+                q = corrected
+                language, pids = rag.lexical_search(q, context, accept_language)
+        protocols = _protocols()
+        # Tras /reload los motores antiguos sirven hasta que el nuevo índice está listo
+        current = rag.protocols is protocols
+        if view:
+            # Índice base compartido; sólo se re-evalúan los candidatos con el texto de la región
+            base_q = view.base_query(q)
+            extra = rag.lexical_search(base_q, {**(context or {}), "language": language})[1] if base_q != q else ()
+            pids = view.lexical_filter(pids, q, language, extra)
+            protocols = view.protocols
+        for pid in pids:
+            proto = protocols.get(pid) or rag.get_protocol(pid)
+            if proto is not None:
+                results.append({"protocol_id": pid, "title": proto.title, "relevance": 1.0})
+        return language, results, current
+
+    # Motores aún no listos: recorrido lineal filtrado por idioma
+    for pid, proto in (view.protocols if view else _protocols()).items():
+        if protocol_language(proto) != language:
+            continue
+        # Título
+        title = proto.title if HAVE_PROTOCOL_MODELS and not isinstance(proto, dict) else proto.get("title", "")
+        haystack = (title or "").lower()
+
+        # Texto de pasos
+        cached = view.steps_and_meta(pid) if view else STEP_CACHE.get(pid)
+        steps, _, _ = cached or _get_steps_and_meta(proto)
+        for s in steps:
+            txt = s.get("instruction") or s.get("action") or ""
+            if txt:
+                haystack += " " + txt.lower()
+
+        if q in haystack:
+            results.append({"protocol_id": pid, "title": title, "relevance": 1.0})
+
+    results.sort(key=lambda x: x["relevance"], reverse=True)
+    return language, results, False
+
+# ---------- Índice offline ----------
+# Artefacto de core/offline_bundle.py construido a partir de los protocolos
+# cargados; se rehace sólo cuando cambia el registro (recarga). Uno por región
+_OFFLINE: Dict[str, Dict[str, Any]] = {}
+_offline_lock = threading.Lock()
+OFFLINE_IMMUTABLE = "public, max-age=31536000, immutable"
+
+def _offline_artifact(request: Request, region: Optional[str] = None):
+    if not HAVE_PROTOCOL_MODELS:
+        raise HTTPException(status_code=503, detail="Índice offline no disponible sin modelos de protocolo")
+    view = _region_view({"region": region}, request)
+    protocols = view.protocols if view else _protocols()
+    key = view.region if view else ""
+    with _offline_lock:
+        entry = _OFFLINE.setdefault(key, {"source": None, "voice": None, "artifact": None})
+        if entry["source"] is not protocols or entry["voice"] != VOICE.version:
+            from .offline_bundle import build_artifact
+            with stage("offline_bundle"):
+                entry["artifact"] = build_artifact(protocols, view=view, voice=VOICE,
+                                                   voice_base=_voice_url(request, ""))
+            entry["source"], entry["voice"] = protocols, VOICE.version
+        return entry["artifact"]
+
+@router.get("/offline/manifest")
+async def offline_manifest(request: Request, region: Optional[str] = None):
+    artifact = _offline_artifact(request, region)
+    return Response(
+        content=json.dumps(artifact.manifest), media_type="application/json",
+        headers={"Cache-Control": "no-cache", "ETag": f'"{artifact.version}"'},
+    )
+
+@router.get("/offline/{filename}")
+async def offline_index(filename: str, request: Request, region: Optional[str] = None):
+    artifact = _offline_artifact(request, region)
+    if filename != artifact.filename:
+        # Versión anterior: el cliente debe releer el manifiesto
+        raise HTTPException(status_code=404, detail="Versión del índice offline no disponible")
+    etag = f'"{artifact.version}"'
+    headers = {"Cache-Control": OFFLINE_IMMUTABLE, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=artifact.data, media_type="application/json", headers=headers)
+
+def _byte_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """Range: bytes=a-b | a- | -n (un solo rango) -> (inicio, fin incluido); None = fichero entero."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), (int(last) if last else size - 1)
+        else:
+            start, end = size - int(last), size - 1
+    except ValueError:
+        return None
+    start, end = max(0, start), min(end, size - 1)
+    if start > end:
+        raise HTTPException(status_code=416, detail="Rango no satisfacible",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+@router.get("/voice/{filename}", name="voice_audio")
+async def voice_audio(filename: str, request: Request):
+    """Audio de una indicación por hash de contenido: inmutable y con peticiones de rango."""
+    path = VOICE.path(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Audio no disponible")
+    etag = f'"{filename.split(".")[0]}"'
+    headers = {"Cache-Control": OFFLINE_IMMUTABLE, "ETag": etag, "Accept-Ranges": "bytes"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    size = path.stat().st_size
+    media_type = MEDIA_TYPES[filename.rsplit(".", 1)[1]]
+    rng = _byte_range(request.headers.get("range"), size)
+    if rng is None:
+        return Response(content=path.read_bytes(), media_type=media_type, headers=headers)
+    start, end = rng
+    with path.open("rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=data, status_code=206, media_type=media_type, headers=headers)
+
 @router.post("/session/reset")
 async def reset_session():
     return {"success": True, "message": "Sesión reiniciada"}
@@ -303,5 +919,9 @@ async def get_session_status():
 
 @router.post("/reload")
 async def reload_protocols():
-    load_protocols(force=True)
+    await asyncio.to_thread(load_protocols, True)
+    await asyncio.to_thread(REGIONS.reload)
+    VOICE.reload()
+    # Reconstruye motores e índice en segundo plano; los actuales siguen sirviendo
+    start_warmup(force=True)
     return {"success": True, "reloaded": True, "protocols_loaded": len(PROTOCOLS)}
@@ -0,0 +1,183 @@
+# backend/core/debug.py
+from __future__ import annotations
+import asyncio
+import hmac
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from . import memory, profiler
+
+router = APIRouter()
+
+
+def _require_token(x_conrumbo_profile: Optional[str]) -> None:
+    """
+    Los endpoints de depuración sólo existen si hay token configurado y coincide.
+    Sólo en la cabecera X-ConRumbo-Profile: un ?token= acabaría en los logs de acceso.
+    """
+    expected = profiler.profile_token()
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # Comparación en tiempo constante: no revela cuántos caracteres coinciden
+    if not hmac.compare_digest((x_conrumbo_profile or "").encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Token de depuración inválido")
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile_window(
+    seconds: float = Query(5.0, gt=0),
+    interval_ms: float = Query(profiler.DEFAULT_INTERVAL * 1000.0, gt=0),
+    x_conrumbo_profile: Optional[str] = Header(None),
+):
+    """Muestrea todos los hilos durante una ventana de tiempo y devuelve pilas folded."""
+    _require_token(x_conrumbo_profile)
+    seconds = min(seconds, profiler.MAX_WINDOW_SECONDS)
+    if not profiler.try_acquire():
+        raise HTTPException(status_code=409, detail="Ya hay un perfil en curso")
+    try:
+        prof = profiler.SamplingProfiler(interval=interval_ms / 1000.0).start()
+        await asyncio.sleep(seconds)
+        prof.stop()
+    finally:
+        profiler.release()
+    pid = profiler.PROFILES.add(prof, f"window {seconds:g}s")
+    return PlainTextResponse(prof.folded(), headers={"X-ConRumbo-Profile-Id": pid})
+
+
+@router.get("/profiles")
+async def list_profiles(x_conrumbo_profile: Optional[str] = Header(None)):
+    _require_token(x_conrumbo_profile)
+    return {"success": True, "profiles": profiler.PROFILES.list()}
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, x_conrumbo_profile: Optional[str] = Header(None)):
+    _require_token(x_conrumbo_profile)
+    item = profiler.PROFILES.get(profile_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return PlainTextResponse(str(item["folded"]))
+
+
+# -----------------------
+# Memoria
+# -----------------------
+
+def _memory_roots() -> List[Tuple[str, Any]]:
+    """Estructuras principales, en orden: lo compartido se atribuye a la primera que lo alcanza."""
+    from . import conrumbo as cr
+    roots: List[Tuple[str, Any]] = [("PROTOCOLS", cr.PROTOCOLS), ("STEP_CACHE", cr.STEP_CACHE)]
+    eng = cr.ENGINES
+    rag = eng.rag_engine
+    if rag is not None:
+        roots.append(("rag_engine.protocols", rag.protocols))
+        for lang, shard in sorted(rag.shards.items()):
+            roots.append((f"shard[{lang}].lexical", (shard.intents, shard.fuzzy, shard.known_words,
+                                                      shard.haystacks, shard.postings)))
+            roots.append((f"shard[{lang}].vectors", (shard.protocol_ids, shard._embeddings, shard._quantized)))
+            roots.append((f"shard[{lang}].cache", shard._cache))
+    if eng.triage_engine is not None:
+        roots.append(("triage_engine.memo", eng.triage_engine._memo))
+    if eng.steps_player is not None:
+        roots.append(("steps_player.active_sessions", eng.steps_player.active_sessions))
+    roots.append(("transcripts", cr.TRANSCRIPTS))
+    roots.append(("regions", cr.REGIONS._views))
+    roots.append(("offline_artifacts", cr._OFFLINE))
+    roots.append(("search_cache", cr.SEARCH_CACHE._entries))
+    return roots
+
+
+def _tier_stats() -> Optional[Dict[str, Any]]:
+    """Registro por niveles (PROTOCOL_BACKEND=sqlite): fijados, LRU de cuerpos y aciertos."""
+    from . import conrumbo as cr
+    stats = getattr(cr.PROTOCOLS, "stats", None)
+    return stats() if callable(stats) else None
+
+
+def _faiss_bytes() -> Dict[str, int]:
+    """Índices FAISS (objetos SWIG: getsizeof no ve sus vectores); estimado por ntotal x d."""
+    from . import conrumbo as cr
+    rag = cr.ENGINES.rag_engine
+    out: Dict[str, int] = {}
+    for lang, shard in sorted((rag.shards if rag is not None else {}).items()):
+        index = shard.index
+        if index is not None and hasattr(index, "ntotal"):
+            out[lang] = int(index.ntotal) * int(index.d) * 4
+    return out
+
+
+@router.get("/memory")
+async def memory_report(max_objects: int = Query(memory.MAX_OBJECTS, gt=0),
+                        x_conrumbo_profile: Optional[str] = Header(None)):
+    """Tamaño de las estructuras principales, RSS del proceso y estado de tracemalloc."""
+    _require_token(x_conrumbo_profile)
+    # Recorre millones de objetos: en un hilo, para no parar el bucle de eventos
+    return await asyncio.to_thread(_memory_report, max_objects)
+
+
+def _memory_report(max_objects: int) -> Dict[str, Any]:
+    from . import conrumbo as cr
+    return {
+        "success": True,
+        "process": memory.process_memory(),
+        "structures": memory.size_report(_memory_roots(), max_objects),
+        "faiss_bytes": _faiss_bytes(),
+        "protocol_tiers": _tier_stats(),
+        "search_cache": cr.SEARCH_CACHE.stats(),
+        "tracemalloc": memory.TRACEMALLOC.status(),
+    }
+
+
+@router.post("/memory/tracemalloc/start")
+async def tracemalloc_start(frames: int = Query(1, ge=1, le=64), x_conrumbo_profile: Optional[str] = Header(None)):
+    _require_token(x_conrumbo_profile)
+    return {"success": True, "tracemalloc": memory.TRACEMALLOC.start(frames)}
+
+
+@router.post("/memory/tracemalloc/stop")
+async def tracemalloc_stop(x_conrumbo_profile: Optional[str] = Header(None)):
+    _require_token(x_conrumbo_profile)
+    return {"success": True, "tracemalloc": memory.TRACEMALLOC.stop()}
+
+
+@router.post("/memory/snapshots")
+async def take_snapshot(label: str = "", x_conrumbo_profile: Optional[str] = Header(None)):
+    _require_token(x_conrumbo_profile)
+    try:
+        sid = await asyncio.to_thread(memory.TRACEMALLOC.snapshot, label)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "id": sid, "snapshots": memory.TRACEMALLOC.list()}
+
+
+@router.get("/memory/snapshots")
+async def list_snapshots(x_conrumbo_profile: Optional[str] = Header(None)):
+    _require_token(x_conrumbo_profile)
+    return {"success": True, "snapshots": memory.TRACEMALLOC.list()}
+
+
+@router.get("/memory/snapshots/{snapshot_id}/top")
+async def snapshot_top(snapshot_id: str, key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+                       limit: int = Query(25, gt=0, le=500), x_conrumbo_profile: Optional[str] = Header(None)):
+    """Sitios de asignación con más memoria viva en la instantánea."""
+    _require_token(x_conrumbo_profile)
+    try:
+        top = await asyncio.to_thread(memory.TRACEMALLOC.top, snapshot_id, key_type, limit)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Instantánea no encontrada")
+    return {"success": True, "top": top}
+
+
+@router.get("/memory/diff")
+async def snapshot_diff(base: str, current: str,
+                        key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+                        limit: int = Query(25, gt=0, le=500), x_conrumbo_profile: Optional[str] = Header(None)):
+    """Crecimiento por sitio de asignación entre dos instantáneas (fugas)."""
+    _require_token(x_conrumbo_profile)
+    try:
+        diff = await asyncio.to_thread(memory.TRACEMALLOC.diff, base, current, key_type, limit)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Instantánea no encontrada: {e.args[0]}")
+    return {"success": True, "diff": diff}
@@ -1,18 +1,32 @@
 # backend/core/embeddings.py
 from __future__ import annotations
-import os, hashlib
+import os, hashlib, importlib.util
 from typing import List, Sequence, Optional
 import numpy as np
 
-try:
+from .metrics import EMBEDDING_BREAKER_OPEN, EMBEDDING_ERRORS, EMBEDDING_MODE
+from .resilience import CircuitBreaker, CircuitOpenError
+
+# El SDK de OpenAI tarda en importarse: sólo se comprueba que existe y se
+# importa al crear un cliente (y sólo si hay clave).
+HAVE_OPENAI = importlib.util.find_spec("openai") is not None
+
+
+def _openai_client_class():
     from openai import OpenAI
-    HAVE_OPENAI = True
-except Exception:
-    OpenAI = None  # type: ignore
-    HAVE_OPENAI = False
+    return OpenAI
 
 DEFAULT_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")  # 1536 dims en OpenAI
 LOCAL_DIM = int(os.getenv("EMBED_LOCAL_DIM", "384"))  # dimensión fallback local
+# Sin timeout el SDK puede esperar minutos: en una emergencia preferimos fallar rápido
+REQUEST_TIMEOUT = float(os.getenv("EMBED_TIMEOUT_S", "3.0"))
+MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "0"))
+BREAKER_THRESHOLD = int(os.getenv("EMBED_BREAKER_THRESHOLD", "3"))
+BREAKER_RESET_S = float(os.getenv("EMBED_BREAKER_RESET_S", "30"))
+
+
+class EmbeddingUnavailable(CircuitOpenError):
+    """El backend remoto de embeddings está cortocircuitado."""
 
 
 class EmbeddingGenerator:
@@ -26,15 +40,21 @@ class EmbeddingGenerator:
         self.model = model or DEFAULT_MODEL
         self.client = None
         self.mode = "local"  # "openai" | "local"
+        # Consultas respondidas con el embedding local por un fallo de OpenAI (en modo "openai")
+        self.fallbacks = 0
+        self.breaker = CircuitBreaker(
+            "embeddings", failure_threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET_S,
+            on_state_change=lambda _n, st: EMBEDDING_BREAKER_OPEN.set(1 if st == "open" else 0),
+        )
 
         # Intentar modo OpenAI si hay SDK y key
         key = api_key or os.getenv("OPENAI_API_KEY")
         if HAVE_OPENAI and key:
-            kwargs = {"api_key": key}
+            kwargs = {"api_key": key, "timeout": REQUEST_TIMEOUT, "max_retries": MAX_RETRIES}
             if base_url or os.getenv("OPENAI_API_BASE"):
                 kwargs["base_url"] = base_url or os.getenv("OPENAI_API_BASE")
             try:
-                self.client = OpenAI(**kwargs)  # type: ignore
+                self.client = _openai_client_class()(**kwargs)
                 self.mode = "openai"
                 print("[embeddings] Modo OpenAI activado.")
             except Exception as e:
@@ -44,6 +64,9 @@ class EmbeddingGenerator:
         else:
             print("[embeddings] OPENAI_API_KEY ausente o SDK no disponible. Usando modo LOCAL.")
 
+        for m in ("openai", "local"):
+            EMBEDDING_MODE.labels(m).set(1 if m == self.mode else 0)
+
     @staticmethod
     def _clean_text(text: str) -> str:
         if text is None:
@@ -68,12 +91,22 @@ class EmbeddingGenerator:
 
     # ---------- API pública ----------
     def generate_embedding(self, text: str) -> List[float]:
+        """
+        Embedding de una consulta. En modo OpenAI pasa por el circuit breaker:
+        con el circuito abierto lanza EmbeddingUnavailable sin llamar a la red.
+        """
         t = self._clean_text(text)
         if self.mode == "openai" and self.client:
+            if not self.breaker.allow():
+                raise EmbeddingUnavailable("Backend de embeddings cortocircuitado")
             try:
                 resp = self.client.embeddings.create(model=self.model, input=t)
+                self.breaker.record_success()
                 return list(resp.data[0].embedding)
             except Exception as e:
+                self.breaker.record_failure()
+                self.fallbacks += 1
+                EMBEDDING_ERRORS.labels("single").inc()
                 print(f"[embeddings] Error OpenAI, usando local: {e}")
         return self._local_embed(t)
 
@@ -93,6 +126,7 @@ class EmbeddingGenerator:
                     out.extend([list(d.embedding) for d in resp.data])
                 return out
             except Exception as e:
+                EMBEDDING_ERRORS.labels("batch").inc()
                 print(f"[embeddings] Error batch OpenAI, usando local: {e}")
         return self._local_batch(texts)
 
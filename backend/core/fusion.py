@@ -0,0 +1,158 @@
+# backend/core/fusion.py
+"""
+Fusión de rankings de /search y del fallback RAG del triaje.
+
+Retrievers, del más barato al más caro:
+  intent    léxico de intents de la partición (exacto = 1.0, con erratas FUZZY_SCORE)
+  lexical   BM25 sobre las palabras del protocolo (core/shards.py)
+  vector    embedding de la consulta + índice vectorial (red o modelo local)
+
+Métodos (SEARCH_FUSION):
+  rrf       reciprocal rank fusion: suma de w / (k + rango) por retriever; sólo
+            cuenta el orden, no la escala de cada puntuación
+  weighted  suma ponderada de puntuaciones divididas por el máximo de cada retriever
+  cascade   comportamiento anterior: intents y, si faltan, semántica para completar
+
+Cortocircuito: tras cada retriever se cuentan los aciertos seguros (intent
+exacto, léxico con cobertura >= lex_conf). Con sc=fill, si ya llenan top_k
+no se ejecutan los siguientes; con sc=N basta con N; con sc=off se ejecutan
+todos. Lo que se ahorra es sobre todo la llamada de embeddings.
+
+Las puntuaciones fusionadas se escalan a [0, 1] (1 = primero en todos los
+retrievers con peso), como el relevance_score de siempre.
+
+Especificación compacta (SEARCH_FUSION y core/search_eval.py):
+    rrf
+    rrf:k=20,sc=off
+    weighted:w=intent:1|lexical:0.5|vector:1,retrievers=intent+lexical
+"""
+from __future__ import annotations
+import os
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+METHODS = ("rrf", "weighted", "cascade")
+RETRIEVERS = ("intent", "lexical", "vector")
+DEFAULT_WEIGHTS = {"intent": 1.0, "lexical": 0.5, "vector": 1.0}
+
+# (id, puntuación) en orden de relevancia
+Ranking = List[Tuple[str, float]]
+
+
+class FusionConfig:
+    """Método, pesos, retrievers y cortocircuito de una búsqueda (inmutable, hashable)."""
+
+    __slots__ = ("method", "k", "weights", "retrievers", "short_circuit", "depth", "lexical_confident")
+
+    def __init__(self, method: str = "rrf", k: int = 60, weights: Optional[Mapping[str, float]] = None,
+                 retrievers: Sequence[str] = RETRIEVERS, short_circuit: str = "fill", depth: int = 10,
+                 lexical_confident: float = 1.0):
+        if method not in METHODS:
+            raise ValueError(f"método de fusión desconocido: {method!r} ({', '.join(METHODS)})")
+        unknown = [r for r in retrievers if r not in RETRIEVERS]
+        if unknown or not retrievers:
+            raise ValueError(f"retrievers desconocidos: {unknown or 'ninguno'} ({', '.join(RETRIEVERS)})")
+        if short_circuit not in ("fill", "off") and not short_circuit.isdigit():
+            raise ValueError(f"sc={short_circuit!r}: se espera fill, off o un entero")
+        w = dict(DEFAULT_WEIGHTS)
+        w.update(weights or {})
+        values = (method, int(k), tuple(sorted(w.items())), tuple(r for r in RETRIEVERS if r in retrievers),
+                  short_circuit, int(depth), float(lexical_confident))
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        raise AttributeError("FusionConfig es inmutable")
+
+    @property
+    def key(self) -> Tuple:
+        return tuple(getattr(self, n) for n in self.__slots__)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, FusionConfig) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def weight(self, retriever: str) -> float:
+        return dict(self.weights).get(retriever, 0.0)
+
+    def stop_hits(self, top_k: int) -> Optional[int]:
+        """Aciertos seguros con los que se deja de consultar retrievers (None = nunca)."""
+        if self.short_circuit == "off":
+            return None
+        return top_k if self.short_circuit == "fill" else max(1, int(self.short_circuit))
+
+    @classmethod
+    def parse(cls, spec: str) -> "FusionConfig":
+        """'rrf:k=20,sc=off,w=intent:1|vector:0.5,retrievers=intent+vector' -> FusionConfig."""
+        method, _, rest = spec.strip().partition(":")
+        kwargs: Dict[str, object] = {}
+        for item in filter(None, (x.strip() for x in rest.split(","))):
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError(f"opción sin valor en {spec!r}: {item!r}")
+            if name == "k":
+                kwargs["k"] = int(value)
+            elif name == "sc":
+                kwargs["short_circuit"] = value
+            elif name == "depth":
+                kwargs["depth"] = int(value)
+            elif name == "lex_conf":
+                kwargs["lexical_confident"] = float(value)
+            elif name == "w":
+                kwargs["weights"] = {r: float(x) for r, _, x in (p.partition(":") for p in value.split("|"))}
+            elif name == "retrievers":
+                kwargs["retrievers"] = tuple(value.split("+"))
+            else:
+                raise ValueError(f"opción desconocida en {spec!r}: {name!r}")
+        return cls(method or "rrf", **kwargs)  # type: ignore[arg-type]
+
+    @classmethod
+    def from_env(cls) -> "FusionConfig":
+        return cls.parse(os.getenv("SEARCH_FUSION", "rrf"))
+
+    def __str__(self) -> str:
+        opts = [f"k={self.k}"] if self.method == "rrf" and self.k != 60 else []
+        if self.weights != tuple(sorted(DEFAULT_WEIGHTS.items())):
+            opts.append("w=" + "|".join(f"{r}:{w:g}" for r, w in self.weights))
+        if self.retrievers != RETRIEVERS:
+            opts.append("retrievers=" + "+".join(self.retrievers))
+        if self.short_circuit != "fill":
+            opts.append(f"sc={self.short_circuit}")
+        return self.method + (":" + ",".join(opts) if opts else "")
+
+    def __repr__(self) -> str:
+        return f"FusionConfig({str(self)!r})"
+
+
+def rrf(rankings: Mapping[str, Ranking], config: FusionConfig) -> Ranking:
+    scores: Dict[str, float] = {}
+    for retriever, ranking in rankings.items():
+        w = config.weight(retriever)
+        for rank, (pid, _) in enumerate(ranking, 1):
+            scores[pid] = scores.get(pid, 0.0) + w / (config.k + rank)
+    best = sum(config.weight(r) for r in rankings) / (config.k + 1)
+    return _sorted(scores, best)
+
+
+def weighted(rankings: Mapping[str, Ranking], config: FusionConfig) -> Ranking:
+    scores: Dict[str, float] = {}
+    for retriever, ranking in rankings.items():
+        top = max((s for _, s in ranking), default=0.0)
+        if top <= 0.0:
+            continue
+        w = config.weight(retriever)
+        for pid, score in ranking:
+            scores[pid] = scores.get(pid, 0.0) + w * max(0.0, score) / top
+    return _sorted(scores, sum(config.weight(r) for r in rankings))
+
+
+def _sorted(scores: Dict[str, float], best: float) -> Ranking:
+    scale = 1.0 / best if best > 0.0 else 1.0
+    # Empates: orden de aparición (el retriever más barato primero)
+    return sorted(((pid, min(1.0, s * scale)) for pid, s in scores.items()), key=lambda kv: -kv[1])
+
+
+def fuse(rankings: Mapping[str, Ranking], config: FusionConfig) -> Ranking:
+    """Rankings por retriever -> ranking fusionado (rrf o weighted)."""
+    return weighted(rankings, config) if config.method == "weighted" else rrf(rankings, config)
@@ -0,0 +1,182 @@
+# backend/core/fuzzy.py
+"""
+Corrección de erratas estilo SymSpell para intents ("atragantamineto",
+"hemoragia", "quemadra").
+
+Al construir se precalculan, para cada término del vocabulario, todas sus
+variantes con 1..N borrados. Una consulta genera sólo las variantes por borrado
+de la palabra tecleada y las busca en ese diccionario; la distancia de edición
+real sólo se calcula para los pocos candidatos que comparten variante, nunca
+contra todo el vocabulario.
+
+Guarda contra palabras reales: en palabras de menos de STRICT_LENGTH letras
+("se ha quedado" frente a "quemado", "sagrado" frente a "sangrado") sólo se
+acepta una edición típica de tecleo: transposición, tecla vecina o letra
+doble de más o de menos. A partir de STRICT_LENGTH, cualquier edición dentro
+de la distancia permitida.
+"""
+from __future__ import annotations
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+STRICT_LENGTH = 8
+_KEYBOARD_ROWS = ("qwertyuiop", "asdfghjkl", "zxcvbnm")
+
+
+def _key_neighbours() -> Dict[str, FrozenSet[str]]:
+    """Teclas contiguas en QWERTY: misma fila ±1 y las dos más cercanas de las filas de arriba y abajo."""
+    out: Dict[str, FrozenSet[str]] = {}
+    for r, row in enumerate(_KEYBOARD_ROWS):
+        for j, ch in enumerate(row):
+            near = {row[k] for k in (j - 1, j + 1) if 0 <= k < len(row)}
+            for rr, cols in ((r - 1, (j, j + 1)), (r + 1, (j - 1, j))):
+                if 0 <= rr < len(_KEYBOARD_ROWS):
+                    near.update(_KEYBOARD_ROWS[rr][k] for k in cols if 0 <= k < len(_KEYBOARD_ROWS[rr]))
+            out[ch] = frozenset(near)
+    return out
+
+
+_NEIGHBOURS = _key_neighbours()
+
+
+def fold(text: str) -> str:
+    """Minúsculas sin tildes: 'Convulsión' -> 'convulsion'."""
+    decomposed = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def max_distance_for(word: str, max_distance: int = 2) -> int:
+    """Palabras cortas no se corrigen (demasiados falsos positivos)."""
+    n = len(word)
+    if n < 6:
+        return 0
+    if n < 9:
+        return min(1, max_distance)
+    return max_distance
+
+
+def typing_slip(typed: str, term: str) -> bool:
+    """True si `typed` sale de `term` con una sola edición típica de tecleo (ver el docstring del módulo)."""
+    if len(typed) == len(term):
+        diff = [i for i, (a, b) in enumerate(zip(typed, term)) if a != b]
+        if len(diff) == 1:
+            return typed[diff[0]] in _NEIGHBOURS.get(term[diff[0]], ())
+        return (len(diff) == 2 and diff[1] == diff[0] + 1
+                and typed[diff[0]] == term[diff[1]] and typed[diff[1]] == term[diff[0]])
+    longer, shorter = (typed, term) if len(typed) > len(term) else (term, typed)
+    if len(longer) - len(shorter) != 1:
+        return False
+    i = next((k for k, (a, b) in enumerate(zip(longer, shorter)) if a != b), len(shorter))
+    if longer[:i] + longer[i + 1:] != shorter:
+        return False
+    # La letra sobrante o que falta duplica a una vecina ("herrida", "hemoragia")
+    c = longer[i]
+    return (i > 0 and longer[i - 1] == c) or (i + 1 < len(longer) and longer[i + 1] == c)
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    out: Set[str] = set()
+    frontier = {word}
+    for _ in range(distance):
+        nxt = set()
+        for w in frontier:
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (OSA) acotada: devuelve limit + 1 si se supera."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = cur[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                v = min(v, prev2[j - 2] + 1)
+            cur[j] = v
+            row_min = min(row_min, v)
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= limit else limit + 1
+
+
+class DeletionIndex:
+    """Vocabulario con vecindario de borrados precalculado (distancia <= max_distance)."""
+
+    def __init__(self, terms: Iterable[str] = (), max_distance: int = 2):
+        self.max_distance = max_distance
+        # término plegado (sin tildes) -> forma original del vocabulario
+        self.terms: Dict[str, str] = {}
+        # variante por borrado -> términos plegados que la generan
+        self._deletes: Dict[str, Tuple[str, ...]] = {}
+        for t in terms:
+            self.add(t)
+
+    def add(self, term: str) -> None:
+        key = fold(term)
+        if not key or key in self.terms:
+            return
+        self.terms[key] = term
+        for variant in _deletes(key, max_distance_for(key, self.max_distance)) | {key}:
+            self._deletes[variant] = self._deletes.get(variant, ()) + (key,)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def lookup(self, word: str) -> Optional[Tuple[str, int]]:
+        """(término original, distancia) más cercano a `word`, o None."""
+        key = fold(word)
+        if key in self.terms:
+            return self.terms[key], 0
+        limit = max_distance_for(key, self.max_distance)
+        if limit == 0:
+            return None
+        best: Optional[Tuple[int, str]] = None
+        seen: Set[str] = set()
+        for variant in _deletes(key, limit) | {key}:
+            for cand in self._deletes.get(variant, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                d = edit_distance(key, cand, limit)
+                if d > limit or (len(key) < STRICT_LENGTH and not typing_slip(key, cand)):
+                    continue
+                if best is None or (d, cand) < best:
+                    best = (d, cand)
+        if best is None:
+            return None
+        return self.terms[best[1]], best[0]
+
+    def correct(self, text: str, known: FrozenSet[str] = frozenset()) -> Optional[str]:
+        """
+        Reescribe `text` sustituyendo cada palabra por su término del vocabulario
+        más cercano; None si no cambia nada (no hay erratas que corregir).
+        Las palabras de `known` (plegadas) se dan por bien escritas y no se tocan.
+        """
+        changed = False
+        parts: List[str] = []
+        pos = 0
+        for m in _WORD_RE.finditer(text):
+            parts.append(text[pos:m.start()])
+            word = m.group(0)
+            hit = None if fold(word) in known else self.lookup(word)
+            if hit is not None and hit[0] != word:
+                parts.append(hit[0])
+                changed = True
+            else:
+                parts.append(word)
+            pos = m.end()
+        parts.append(text[pos:])
+        return "".join(parts) if changed else None
@@ -0,0 +1,243 @@
+# backend/core/journal.py
+"""
+Diario de eventos de sesión (solo-añadir) con escritura diferida.
+
+La ruta de emergencia sólo hace `record(...)`: encola una tupla en una cola
+acotada y vuelve (sin E/S; si la cola está llena el evento se descarta y se
+cuenta, nunca se bloquea). Un hilo escritor vacía la cola por lotes en
+segmentos JSON Lines y los rota por tamaño o antigüedad:
+
+    events-<inicio>-<n>.jsonl.open   segmento activo
+    events-<inicio>-<n>.jsonl        segmento cerrado (inmutable)
+
+Cada línea es [ts, session_id, protocol_id, step, kind, detail]. Quien llama
+pasa el session_id ya seudonimizado (JOURNAL.pseudonym) y el detalle depurado
+(core/capture.py: scrub_text). El análisis (tiempos por paso, abandono) está
+en core/journal_export.py. La cola y el escritor (SegmentLog) los reutiliza la
+captura de tráfico (core/capture.py).
+
+Sal del seudónimo: SESSION_JOURNAL_SALT o, si no está, una generada la primera
+vez y guardada en <SESSION_JOURNAL_DIR>/.salt (0600). Es la misma en todos los
+workers y entre reinicios, así una sesión conserva su id en journal_export.
+Sin ninguna de las dos (directorio no escribible) el diario no se activa.
+"""
+from __future__ import annotations
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import queue
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from .metrics import JOURNAL_EVENTS, JOURNAL_QUEUE, Counter
+
+JOURNAL_ENABLED = os.getenv("SESSION_JOURNAL", "1") == "1"
+JOURNAL_DIR = Path(os.getenv("SESSION_JOURNAL_DIR", str(Path(__file__).resolve().parents[1] / "var" / "journal")))
+QUEUE_SIZE = int(os.getenv("SESSION_JOURNAL_QUEUE", "10000"))
+BATCH_SIZE = int(os.getenv("SESSION_JOURNAL_BATCH", "512"))
+FLUSH_INTERVAL_S = float(os.getenv("SESSION_JOURNAL_FLUSH_S", "1.0"))
+SEGMENT_BYTES = int(os.getenv("SESSION_JOURNAL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+SEGMENT_MAX_AGE_S = float(os.getenv("SESSION_JOURNAL_SEGMENT_AGE_S", "3600"))
+SALT_FILE = ".salt"
+
+# Tipos de evento
+STEP = "step"                   # paso mostrado
+FEEDBACK = "feedback"           # respuesta del usuario en un paso
+COMPLETE = "complete"           # protocolo terminado
+EMERGENCY_EXIT = "emergency_exit"
+RESET = "reset"
+
+SEGMENT_SUFFIX = ".jsonl"
+OPEN_SUFFIX = ".jsonl.open"
+GZIP_SUFFIX = ".jsonl.gz"
+
+Event = Tuple[float, str, str, int, str, str]
+_STOP = object()
+
+
+def pseudonym(value: str, salt: str) -> str:
+    """Id estable y no reversible: HMAC-SHA256 con la sal (lo usa también core/capture.py)."""
+    return "s_" + hmac.new(salt.encode(), value.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def journal_salt(directory: Path) -> Optional[str]:
+    """SESSION_JOURNAL_SALT, o la sal guardada en el directorio (se crea la primera vez); None si no hay forma."""
+    salt = os.getenv("SESSION_JOURNAL_SALT")
+    if salt:
+        return salt
+    path = Path(directory) / SALT_FILE
+    try:
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            # Otro worker la creó: se lee la suya
+            salt = path.read_text(encoding="ascii").strip()
+            return salt or None
+        with os.fdopen(fd, "w", encoding="ascii") as fh:
+            salt = secrets.token_hex(16)
+            fh.write(salt)
+        return salt
+    except OSError as e:
+        print(f"[journal] No se pudo leer ni crear {path}: {e}")
+        return None
+
+
+class SegmentLog:
+    """Cola acotada + hilo escritor de segmentos JSON Lines rotados (solo-añadir)."""
+
+    def __init__(self, directory: Path, enabled: bool = True, prefix: str = "events",
+                 counter: Counter = JOURNAL_EVENTS, compress: bool = False,
+                 queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL_S, segment_bytes: int = SEGMENT_BYTES,
+                 segment_max_age: float = SEGMENT_MAX_AGE_S):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self.prefix = prefix
+        self.counter = counter
+        # Comprime cada segmento al cerrarlo (.jsonl.gz)
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_max_age = segment_max_age
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._fh: Any = None
+        self._segment: Optional[Path] = None
+        self._segment_opened = 0.0
+        self._segment_seq = 0
+        self.dropped = 0
+        self.written = 0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    # ---------- Ruta caliente ----------
+    def append(self, item: Any) -> bool:
+        """Encola una línea (serializable a JSON) sin bloquear; False si se descartó."""
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            self.counter.labels("dropped").inc()
+            return False
+        self.counter.labels("queued").inc()
+        return True
+
+    # ---------- Escritor ----------
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"segment-log-{self.prefix}", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Any] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                while len(batch) < self.batch_size and not stopping:
+                    item = self._queue.get_nowait()
+                    if item is _STOP:
+                        stopping = True
+                    else:
+                        batch.append(item)
+            except queue.Empty:
+                pass
+            try:
+                if batch:
+                    self._write(batch)
+                elif self._fh is not None and time.time() - self._segment_opened >= self.segment_max_age:
+                    self._rotate()
+            except Exception as e:
+                # El diario nunca debe tumbar el servicio: se pierde el lote y se avisa
+                self.counter.labels("failed").inc(len(batch))
+                print(f"[{self.prefix}] Error escribiendo {len(batch)} eventos: {e}")
+        self._rotate()
+
+    def _open_segment(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segment_seq += 1
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self._segment = self.directory / f"{self.prefix}-{stamp}-{os.getpid()}-{self._segment_seq:04d}{OPEN_SUFFIX}"
+        self._fh = open(self._segment, "a", encoding="utf-8")
+        self._segment_opened = time.time()
+
+    def _write(self, batch: List[Any]) -> None:
+        if self._fh is None:
+            self._open_segment()
+        self._fh.write("".join(json.dumps(ev, ensure_ascii=False, separators=(",", ":")) + "\n" for ev in batch))
+        self._fh.flush()
+        self.written += len(batch)
+        self.counter.labels("written").inc(len(batch))
+        if (self._fh.tell() >= self.segment_bytes
+                or time.time() - self._segment_opened >= self.segment_max_age):
+            self._rotate()
+
+    def _rotate(self) -> None:
+        """Cierra el segmento activo y lo publica (quita .open)."""
+        if self._fh is None:
+            return
+        self._fh.close()
+        self._fh = None
+        if self._segment is not None:
+            closed = self._segment.with_name(self._segment.name[:-len(".open")])
+            if self.compress:
+                with open(self._segment, "rb") as src, gzip.open(f"{closed}.gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                self._segment.unlink()
+            else:
+                self._segment.rename(closed)
+            self._segment = None
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Vacía la cola, cierra el segmento activo y detiene el escritor."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print(f"[{self.prefix}] Cola llena al cerrar: el escritor no terminó a tiempo")
+        self._thread.join(timeout)
+        self._thread = None
+
+
+class SessionJournal(SegmentLog):
+    """Diario de sesión: eventos [ts, session_id, protocol_id, step, kind, detail]."""
+
+    def __init__(self, directory: Path = JOURNAL_DIR, enabled: bool = JOURNAL_ENABLED, **options: Any):
+        self.salt = journal_salt(directory) if enabled else None
+        if enabled and self.salt is None:
+            print("[journal] Sin SESSION_JOURNAL_SALT ni sal persistente: diario de sesión desactivado")
+            enabled = False
+        super().__init__(directory, enabled, prefix="events", counter=JOURNAL_EVENTS, **options)
+
+    def pseudonym(self, session_id: str) -> str:
+        """Id de sesión tal como se guarda en el diario (misma sal en todos los procesos)."""
+        return pseudonym(session_id, self.salt) if self.salt else ""
+
+    def record(self, session_id: Optional[str], protocol_id: Optional[str], step: int, kind: str,
+               detail: str = "") -> bool:
+        """Encola un evento sin bloquear; False si se descartó (desactivado o cola llena)."""
+        return self.append((time.time(), session_id or "", protocol_id or "", int(step), kind, detail or ""))
+
+
+JOURNAL = SessionJournal()
+JOURNAL_QUEUE.set_function(lambda: len(JOURNAL))
@@ -0,0 +1,211 @@
+# backend/core/journal_export.py
+"""
+Exportación columnar del diario de sesión (core/journal.py) y agregados.
+
+Los segmentos JSON Lines se convierten en columnas NumPy (ts float64, step
+int32 y session/protocol/kind como códigos int32 sobre un vocabulario, al
+estilo de las columnas diccionario de Parquet). Sobre esas columnas:
+  - tiempo en paso (dwell): desde que se muestra un paso hasta el siguiente
+    evento de frontera de la misma sesión (paso, fin, emergencia, reinicio),
+  - abandono: sesiones cuyo último evento es un paso y llevan más de --idle
+    segundos sin actividad, por protocolo y por último paso visto.
+
+Uso (desde backend/):
+    python -m core.journal_export
+    python -m core.journal_export --dir var/journal --out eventos.npz --json
+    python -m core.journal_export --out eventos.parquet        # requiere pyarrow
+"""
+from __future__ import annotations
+import argparse
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .journal import COMPLETE, EMERGENCY_EXIT, JOURNAL_DIR, OPEN_SUFFIX, RESET, SEGMENT_SUFFIX, STEP
+
+HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Eventos que cierran el paso en curso (el feedback ocurre dentro del paso)
+BOUNDARY_KINDS = (STEP, COMPLETE, EMERGENCY_EXIT, RESET)
+DEFAULT_IDLE_S = 900.0
+
+
+class EventTable:
+    """Columnas del diario; session/protocol/kind son códigos sobre *_vocab."""
+
+    COLUMNS = ("ts", "session", "protocol", "step", "kind")
+
+    def __init__(self, ts: np.ndarray, session: np.ndarray, protocol: np.ndarray, step: np.ndarray,
+                 kind: np.ndarray, session_vocab: np.ndarray, protocol_vocab: np.ndarray, kind_vocab: np.ndarray):
+        self.ts, self.session, self.protocol, self.step, self.kind = ts, session, protocol, step, kind
+        self.session_vocab, self.protocol_vocab, self.kind_vocab = session_vocab, protocol_vocab, kind_vocab
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def kind_code(self, kind: str) -> int:
+        hits = np.flatnonzero(self.kind_vocab == kind)
+        return int(hits[0]) if len(hits) else -1
+
+    # ---------- Construcción ----------
+    @classmethod
+    def from_segments(cls, directory: Path = JOURNAL_DIR, include_open: bool = False) -> "EventTable":
+        paths = sorted(directory.glob(f"*{SEGMENT_SUFFIX}"))
+        if include_open:
+            paths += sorted(directory.glob(f"*{OPEN_SUFFIX}"))
+        ts: List[float] = []
+        sessions: List[str] = []
+        protocols: List[str] = []
+        steps: List[int] = []
+        kinds: List[str] = []
+        for path in paths:
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        t, sid, pid, step, kind, _detail = json.loads(line)
+                    except ValueError:
+                        continue  # línea truncada (segmento abierto durante una caída)
+                    ts.append(t)
+                    sessions.append(sid)
+                    protocols.append(pid)
+                    steps.append(step)
+                    kinds.append(kind)
+        s_vocab, s_codes = np.unique(np.asarray(sessions, dtype=str), return_inverse=True)
+        p_vocab, p_codes = np.unique(np.asarray(protocols, dtype=str), return_inverse=True)
+        k_vocab, k_codes = np.unique(np.asarray(kinds, dtype=str), return_inverse=True)
+        return cls(np.asarray(ts, dtype=np.float64), s_codes.astype(np.int32), p_codes.astype(np.int32),
+                   np.asarray(steps, dtype=np.int32), k_codes.astype(np.int32), s_vocab, p_vocab, k_vocab)
+
+    # ---------- Persistencia ----------
+    def save(self, path: Path) -> None:
+        if path.suffix == ".parquet":
+            if not HAVE_PYARROW:
+                raise RuntimeError("pyarrow no está instalado: usa .npz")
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            def _dict(codes: np.ndarray, vocab: np.ndarray) -> Any:
+                return pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(vocab.tolist()))
+
+            pq.write_table(pa.table({
+                "ts": self.ts, "session": _dict(self.session, self.session_vocab),
+                "protocol": _dict(self.protocol, self.protocol_vocab), "step": self.step,
+                "kind": _dict(self.kind, self.kind_vocab),
+            }), path)
+            return
+        np.savez_compressed(
+            path, ts=self.ts, session=self.session, protocol=self.protocol, step=self.step, kind=self.kind,
+            session_vocab=self.session_vocab, protocol_vocab=self.protocol_vocab, kind_vocab=self.kind_vocab,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "EventTable":
+        with np.load(path) as z:
+            return cls(z["ts"], z["session"], z["protocol"], z["step"], z["kind"],
+                       z["session_vocab"], z["protocol_vocab"], z["kind_vocab"])
+
+
+def _by_session(table: EventTable) -> np.ndarray:
+    """Orden (sesión, ts) de los eventos de frontera."""
+    codes = [table.kind_code(k) for k in BOUNDARY_KINDS]
+    idx = np.flatnonzero(np.isin(table.kind, codes))
+    return idx[np.lexsort((table.ts[idx], table.session[idx]))]
+
+
+def step_dwell(table: EventTable) -> List[Dict[str, Any]]:
+    """Tiempo en cada (protocolo, paso): n, media, p50 y p90 en segundos."""
+    order = _by_session(table)
+    if len(order) < 2:
+        return []
+    cur, nxt = order[:-1], order[1:]
+    valid = (table.session[cur] == table.session[nxt]) & (table.kind[cur] == table.kind_code(STEP))
+    cur, nxt = cur[valid], nxt[valid]
+    dwell = table.ts[nxt] - table.ts[cur]
+    keys = table.protocol[cur].astype(np.int64) * 100000 + table.step[cur]
+    out: List[Dict[str, Any]] = []
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    grouped = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[grouped], np.arange(len(uniq) + 1))
+    for g, key in enumerate(uniq):
+        d = dwell[grouped[bounds[g]:bounds[g + 1]]]
+        out.append({
+            "protocol_id": str(table.protocol_vocab[key // 100000]), "step": int(key % 100000),
+            "n": int(len(d)), "mean_s": round(float(d.mean()), 3),
+            "p50_s": round(float(np.percentile(d, 50)), 3), "p90_s": round(float(np.percentile(d, 90)), 3),
+        })
+    return out
+
+
+def abandonment(table: EventTable, idle_s: float = DEFAULT_IDLE_S, now: Optional[float] = None) -> Dict[str, Any]:
+    """Desenlace por sesión (completed, emergency_exit, reset, abandoned, active) agregado por protocolo."""
+    now = time.time() if now is None else now
+    order = _by_session(table)
+    if not len(order):
+        return {"protocols": [], "abandoned_at_step": []}
+    # Último evento de frontera de cada sesión
+    sess = table.session[order]
+    last = order[np.r_[np.flatnonzero(sess[1:] != sess[:-1]), len(order) - 1]]
+    kind = table.kind[last]
+    outcome = np.full(len(last), "active", dtype=object)
+    outcome[kind == table.kind_code(COMPLETE)] = "completed"
+    outcome[kind == table.kind_code(EMERGENCY_EXIT)] = "emergency_exit"
+    outcome[kind == table.kind_code(RESET)] = "reset"
+    idle = (kind == table.kind_code(STEP)) & (now - table.ts[last] > idle_s)
+    outcome[idle] = "abandoned"
+
+    protocols: List[Dict[str, Any]] = []
+    proto = table.protocol[last]
+    for code in np.unique(proto):
+        mask = proto == code
+        counts = {k: int((outcome[mask] == k).sum()) for k in ("completed", "emergency_exit", "reset", "abandoned", "active")}
+        finished = int(mask.sum()) - counts["active"]
+        protocols.append({
+            "protocol_id": str(table.protocol_vocab[code]), "sessions": int(mask.sum()), **counts,
+            "abandonment_rate": round(counts["abandoned"] / finished, 4) if finished else 0.0,
+        })
+    at_step: List[Dict[str, Any]] = []
+    ab = last[idle]
+    if len(ab):
+        pairs, counts = np.unique(np.stack([table.protocol[ab], table.step[ab]], axis=1), axis=0, return_counts=True)
+        at_step = [{"protocol_id": str(table.protocol_vocab[p]), "step": int(s), "abandoned": int(c)}
+                   for (p, s), c in zip(pairs, counts)]
+    return {"protocols": protocols, "abandoned_at_step": at_step}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dir", type=Path, default=JOURNAL_DIR)
+    ap.add_argument("--include-open", action="store_true", help="incluir el segmento activo")
+    ap.add_argument("--out", type=Path, help="guardar las columnas (.npz o .parquet)")
+    ap.add_argument("--idle", type=float, default=DEFAULT_IDLE_S, help="segundos sin actividad = abandono")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    table = EventTable.from_segments(args.dir, args.include_open)
+    load_s = time.perf_counter() - t0
+    if args.out:
+        table.save(args.out)
+    dwell = step_dwell(table)
+    aband = abandonment(table, args.idle)
+    if args.json:
+        print(json.dumps({"events": len(table), "sessions": len(table.session_vocab), "dwell": dwell, **aband},
+                         ensure_ascii=False, indent=2))
+        return 0
+    print(f"[journal] {len(table)} eventos, {len(table.session_vocab)} sesiones ({load_s:.2f}s)")
+    for row in dwell:
+        print(f"  {row['protocol_id']:<28} paso {row['step']:>2}  n={row['n']:<6} media={row['mean_s']:7.1f}s "
+              f"p50={row['p50_s']:7.1f}s p90={row['p90_s']:7.1f}s")
+    for row in aband["protocols"]:
+        print(f"  {row['protocol_id']:<28} sesiones={row['sessions']:<6} completadas={row['completed']:<5} "
+              f"abandonadas={row['abandoned']:<5} tasa={row['abandonment_rate']:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
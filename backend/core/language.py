@@ -0,0 +1,55 @@
+# backend/core/language.py
+"""
+Idioma de protocolos y peticiones (metadata.language: es | en | fr | de).
+
+Sin dependencias pesadas: lo usan tanto los endpoints (antes de que existan
+los motores) como las particiones de búsqueda de core/shards.py.
+"""
+from __future__ import annotations
+import os
+from typing import Any, Dict, Optional, Tuple
+
+SUPPORTED_LANGUAGES: Tuple[str, ...] = ("es", "en", "fr", "de")
+DEFAULT_LANGUAGE = os.getenv("CONRUMBO_DEFAULT_LANGUAGE", "es")
+
+# Palabras vacías (ya sin tildes) que el ranking BM25 de core/shards.py ignora
+LEXICAL_STOPWORDS: Dict[str, Tuple[str, ...]] = {
+    "es": ("a", "al", "con", "de", "del", "el", "ella", "en", "es", "esta", "este", "ha", "hay", "he", "la", "las",
+           "le", "lo", "los", "me", "mi", "muy", "no", "o", "para", "por", "que", "se", "si", "su", "sus", "un",
+           "una", "y", "ya"),
+    "en": ("a", "an", "and", "at", "for", "has", "he", "her", "his", "in", "is", "it", "my", "of", "on", "or",
+           "she", "the", "to", "with"),
+}
+
+
+def normalize_language(value: Optional[str]) -> Optional[str]:
+    """'es-ES', 'EN_us', 'fr;q=0.8' -> 'es', 'en', 'fr'; None si no es un idioma soportado."""
+    code = (value or "").split(";")[0].strip().lower().replace("_", "-").split("-")[0]
+    return code if code in SUPPORTED_LANGUAGES else None
+
+
+def resolve_language(context: Optional[Dict[str, Any]] = None, accept_language: Optional[str] = None) -> str:
+    """Idioma de la petición: context.language/idioma/lang -> Accept-Language -> DEFAULT_LANGUAGE."""
+    if context:
+        for key in ("language", "idioma", "lang"):
+            code = normalize_language(context.get(key))
+            if code:
+                return code
+    for part in (accept_language or "").split(","):
+        code = normalize_language(part)
+        if code:
+            return code
+    return DEFAULT_LANGUAGE
+
+
+def protocol_language(p: Any) -> str:
+    md = p.get("metadata") if isinstance(p, dict) else getattr(p, "metadata", None)
+    lang = md.get("language") if isinstance(md, dict) else getattr(md, "language", None)
+    return normalize_language(lang) or DEFAULT_LANGUAGE
+
+
+def group_by_language(protocols: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for pid, p in protocols.items():
+        out.setdefault(protocol_language(p), {})[pid] = p
+    return out
@@ -0,0 +1,222 @@
+# backend/core/memory.py
+"""
+Introspección de memoria en caliente (expuesta en core/debug.py).
+
+- `deep_sizeof`: tamaño recursivo de una estructura (dicts, listas, tuplas,
+  objetos con __slots__/__dict__, arrays NumPy por nbytes). Cada objeto se
+  cuenta una vez: midiendo varias raíces en orden con el mismo `seen`, el
+  tamaño "propio" de una raíz excluye lo que ya compartía con las anteriores
+  (p. ej. RAGSearchEngine.protocols frente a PROTOCOLS).
+- `TraceMallocControl`: arranca/para tracemalloc, guarda instantáneas en un
+  anillo acotado y devuelve los sitios de asignación principales y el diff
+  entre dos instantáneas.
+"""
+from __future__ import annotations
+import collections
+import gc
+import itertools
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+# Tope de objetos visitados por raíz: acota el coste de medir algo enorme
+MAX_OBJECTS = 2_000_000
+
+# Tipos atómicos (sin hijos que recorrer)
+_ATOMIC = (str, bytes, bytearray, int, float, bool, complex, type(None))
+# Código, módulos, clases, hilos y locks no son datos de la estructura
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType,
+           threading.Thread, type(threading.Lock()), type(threading.RLock()), threading.Condition)
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _children(obj: Any) -> Iterable[Any]:
+    if isinstance(obj, dict):
+        for k, v in list(obj.items()):
+            yield k
+            yield v
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        yield from list(obj)
+    elif isinstance(obj, collections.ChainMap):
+        yield from obj.maps
+    else:
+        d = getattr(obj, "__dict__", None)
+        if isinstance(d, dict):
+            yield d
+        for cls in type(obj).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name not in ("__dict__", "__weakref__") and hasattr(obj, name):
+                    yield getattr(obj, name)
+
+
+def deep_sizeof(root: Any, seen: Optional[Set[int]] = None, max_objects: int = MAX_OBJECTS) -> Dict[str, Any]:
+    """Bytes (sys.getsizeof + buffers NumPy) alcanzables desde `root` y no vistos antes."""
+    seen = set() if seen is None else seen
+    # Sin numpy cargado no puede haber arrays: no se importa sólo para medir
+    np = sys.modules.get("numpy")
+    ndarray = np.ndarray if np is not None else ()
+    total = objects = array_bytes = 0
+    truncated = False
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        oid = id(obj)
+        if oid in seen:
+            continue
+        seen.add(oid)
+        objects += 1
+        if objects > max_objects:
+            truncated = True
+            break
+        if isinstance(obj, _OPAQUE):
+            continue
+        if isinstance(obj, ndarray):
+            # getsizeof incluye el buffer sólo si el array es su dueño; una
+            # vista lleva a su base (que puede ser un mmap: no se cuenta)
+            total += sys.getsizeof(obj)
+            if obj.base is None:
+                array_bytes += obj.nbytes
+            elif isinstance(obj.base, ndarray):
+                stack.append(obj.base)
+            continue
+        try:
+            total += sys.getsizeof(obj)
+        except TypeError:
+            continue
+        if isinstance(obj, _ATOMIC):
+            continue
+        stack.extend(_children(obj))
+    return {"bytes": total, "objects": objects, "array_bytes": array_bytes, "truncated": truncated}
+
+
+def size_report(roots: List[Tuple[str, Any]], max_objects: int = MAX_OBJECTS) -> List[Dict[str, Any]]:
+    """
+    Tamaño de cada raíz: `bytes` (todo lo alcanzable) y `own_bytes` (sin lo ya
+    contado en raíces anteriores; lo compartido se atribuye a la primera).
+    """
+    shared: Set[int] = set()
+    out: List[Dict[str, Any]] = []
+    for name, obj in roots:
+        t0 = time.perf_counter()
+        full = deep_sizeof(obj, None, max_objects)
+        own = deep_sizeof(obj, shared, max_objects)
+        out.append({
+            "name": name, "type": type(obj).__name__,
+            "len": len(obj) if isinstance(obj, (dict, list, tuple, set, collections.ChainMap)) else None,
+            "bytes": full["bytes"], "own_bytes": own["bytes"], "array_bytes": full["array_bytes"],
+            "objects": full["objects"], "truncated": full["truncated"],
+            "ms": round((time.perf_counter() - t0) * 1000.0, 2),
+        })
+    return out
+
+
+def process_memory() -> Dict[str, Any]:
+    """RSS actual/pico (Linux /proc; si no, getrusage) y contadores del GC."""
+    out: Dict[str, Any] = {"gc_counts": gc.get_count(), "gc_objects": len(gc.get_objects())}
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rss_bytes" if line.startswith("VmRSS") else "peak_rss_bytes"
+                    out[key] = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        out["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return out
+
+
+# -----------------------
+# tracemalloc
+# -----------------------
+
+def _stat_row(stat: Any) -> Dict[str, Any]:
+    frame = stat.traceback[0]
+    site = f"{frame.filename}:{frame.lineno}" if frame.lineno else frame.filename
+    row = {"site": site, "size_bytes": stat.size, "count": stat.count}
+    if len(stat.traceback) > 1:
+        row["traceback"] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+    return row
+
+
+def _diff_row(stat: Any) -> Dict[str, Any]:
+    row = _stat_row(stat)
+    row.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+    return row
+
+
+class TraceMallocControl:
+    """tracemalloc bajo demanda + anillo de instantáneas (id -> Snapshot)."""
+
+    def __init__(self, maxlen: int = 8):
+        self._snapshots: Deque[Tuple[str, Dict[str, Any]]] = collections.deque(maxlen=maxlen)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing, "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+            "traced_bytes": current, "traced_peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+            "snapshots": self.list(),
+        }
+
+    def start(self, frames: int = 1) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, int(frames)))
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        # Las instantáneas ya tomadas siguen disponibles
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.status()
+
+    def snapshot(self, label: str = "") -> str:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc no está activo")
+        snap = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+        sid = f"s{next(self._ids)}"
+        with self._lock:
+            self._snapshots.append((sid, {
+                "label": label, "taken_at": time.time(), "snapshot": snap,
+                "traced_bytes": sum(t.size for t in snap.traces),
+            }))
+        return sid
+
+    def get(self, sid: str) -> Optional[Any]:
+        with self._lock:
+            for k, v in self._snapshots:
+                if k == sid:
+                    return v["snapshot"]
+        return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"id": k, "label": v["label"], "taken_at": v["taken_at"], "traced_bytes": v["traced_bytes"]}
+                    for k, v in self._snapshots]
+
+    def top(self, sid: str, key_type: str = "lineno", limit: int = 25) -> List[Dict[str, Any]]:
+        snap = self.get(sid)
+        if snap is None:
+            raise KeyError(sid)
+        return [_stat_row(s) for s in snap.statistics(key_type)[:limit]]
+
+    def diff(self, base: str, current: str, key_type: str = "lineno", limit: int = 25) -> List[Dict[str, Any]]:
+        old, new = self.get(base), self.get(current)
+        if old is None or new is None:
+            raise KeyError(base if old is None else current)
+        return [_diff_row(s) for s in new.compare_to(old, key_type)[:limit]]
+
+
+TRACEMALLOC = TraceMallocControl()
@@ -0,0 +1,423 @@
+# backend/core/metrics.py
+from __future__ import annotations
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import timing
+
+# Buckets (segundos) pensados para el presupuesto de latencia de emergencia:
+# resolución fina por debajo de 100 ms, gruesa por encima.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+# -----------------------
+# Tipos de métrica
+# -----------------------
+
+class _Metric:
+    """Base: una métrica con nombre, ayuda y (opcionalmente) etiquetas."""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str, **kwvalues: str):
+        """Devuelve el hijo asociado a los valores de etiqueta (se crea si no existe)."""
+        if kwvalues:
+            values = tuple(str(kwvalues[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban etiquetas {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _render_samples(self) -> List[str]:
+        return [
+            f"{self.name}{_fmt_labels(self.labelnames, vals)} {_fmt_value(child.value)}"
+            for vals, child in self._items()
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "fn")
+
+    def __init__(self):
+        self.value = 0.0
+        self.fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        """El valor se calcula al exportar (útil para tamaños de contenedores)."""
+        self.fn = fn
+
+    def get(self) -> float:
+        if self.fn is not None:
+            try:
+                return float(self.fn())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        self._default().set_function(fn)
+
+    def _render_samples(self) -> List[str]:
+        return [
+            f"{self.name}{_fmt_labels(self.labelnames, vals)} {_fmt_value(child.get())}"
+            for vals, child in self._items()
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        # Sin lock: bajo el GIL la pérdida ocasional de una muestra es aceptable
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets: Tuple[float, ...] = tuple(sorted(float(b) for b in buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_samples(self) -> List[str]:
+        lines: List[str] = []
+        for vals, child in self._items():
+            cumulative = 0
+            for bound, c in zip(child.bounds + (float("inf"),), child.counts):
+                cumulative += c
+                le = f'le="{_fmt_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, vals, le)} {cumulative}")
+            lbl = _fmt_labels(self.labelnames, vals)
+            lines.append(f"{self.name}_sum{lbl} {_fmt_value(child.sum)}")
+            lines.append(f"{self.name}_count{lbl} {child.count}")
+        return lines
+
+
+# -----------------------
+# Registro
+# -----------------------
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        """Exporta todas las métricas en formato texto de Prometheus (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# -----------------------
+# Métricas de ConRumbo
+# -----------------------
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "conrumbo_http_request_duration_seconds", "Latencia de peticiones HTTP por ruta",
+    ("method", "route", "status"),
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "conrumbo_http_requests_total", "Peticiones HTTP por ruta", ("method", "route", "status"),
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    "conrumbo_stage_duration_seconds",
+    "Latencia por etapa (safety, triage, intent_match, embedding, vector_search)",
+    ("stage",),
+)
+EMBEDDING_MODE = REGISTRY.gauge(
+    "conrumbo_embedding_backend_mode", "Modo activo del backend de embeddings (1 = activo)", ("mode",),
+)
+EMBEDDING_ERRORS = REGISTRY.counter(
+    "conrumbo_embedding_errors_total", "Errores del backend de embeddings (con caída a local)", ("call",),
+)
+EMBEDDING_BREAKER_OPEN = REGISTRY.gauge(
+    "conrumbo_embedding_breaker_open", "1 si el circuit breaker del backend de embeddings está abierto",
+)
+TRIAGE_SERVED = REGISTRY.counter(
+    "conrumbo_triage_served_total", "Respuestas de triaje por ruta de servicio (full, lexical, degraded_*)",
+    ("path",),
+)
+TRIAGE_MEMO = REGISTRY.gauge(
+    "conrumbo_triage_memo", "Tabla memo de resolución de triaje (hits, misses, entries)", ("stat",),
+)
+INDEX_SIZE = REGISTRY.gauge(
+    "conrumbo_index_vectors", "Número de vectores en el índice semántico por idioma", ("language",),
+)
+INDEX_DIMS = REGISTRY.gauge("conrumbo_index_dims", "Dimensión de los vectores del índice semántico")
+INDEX_BUILD_SECONDS = REGISTRY.gauge(
+    "conrumbo_index_build_seconds", "Duración de la última construcción del índice por idioma", ("language",),
+)
+INDEX_BYTES = REGISTRY.gauge(
+    "conrumbo_index_bytes", "Bytes residentes del índice vectorial (códigos cuantizados o float32)", ("language", "kind"),
+)
+SHARD_CACHE = REGISTRY.counter(
+    "conrumbo_search_shard_cache_total", "Caché de búsqueda por partición de idioma (hit, miss)",
+    ("language", "result"),
+)
+RESPONSE_CACHE = REGISTRY.counter(
+    "conrumbo_response_cache_total", "Caché de respuestas serializadas (hit, miss, evicted, expired, invalidated)",
+    ("cache", "result"),
+)
+RESPONSE_CACHE_STATE = REGISTRY.gauge(
+    "conrumbo_response_cache", "Estado de la caché de respuestas (bytes, entries, hit_ratio)", ("cache", "stat"),
+)
+PROTOCOLS_LOADED = REGISTRY.gauge("conrumbo_protocols_loaded", "Protocolos cargados en memoria")
+PROTOCOL_BODIES = REGISTRY.counter(
+    "conrumbo_protocol_body_total", "Cuerpos de protocolo pedidos al registro por niveles (pinned, hit, miss, evicted)",
+    ("result",),
+)
+PROTOCOL_BODY_BYTES = REGISTRY.gauge(
+    "conrumbo_protocol_body_bytes", "Bytes de cuerpos de protocolo residentes por nivel (pinned, lru)", ("tier",),
+)
+STEP_ESCALATIONS = REGISTRY.counter(
+    "conrumbo_step_escalations_total", "Señales de escalada en /next_step según el grafo de pasos (step, handoff, next)",
+    ("target",),
+)
+IMAGE_REQUESTS = REGISTRY.counter(
+    "conrumbo_image_requests_total", "Imágenes en /analyze_image (ok, invalid, busy, error)", ("result",),
+)
+IMAGE_INFLIGHT = REGISTRY.gauge("conrumbo_image_inflight", "Imágenes en análisis (decodificación, lote o inferencia)")
+IMAGE_BATCH_SIZE = REGISTRY.histogram(
+    "conrumbo_image_batch_size", "Imágenes por llamada al modelo de lesiones",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+ACTIVE_SESSIONS = REGISTRY.gauge("conrumbo_active_sessions", "Sesiones activas en StepsPlayer")
+TRANSCRIPT_SESSIONS = REGISTRY.gauge(
+    "conrumbo_transcript_sessions", "Sesiones de triaje incremental por voz en memoria",
+)
+JOURNAL_EVENTS = REGISTRY.counter(
+    "conrumbo_journal_events_total", "Eventos del diario de sesión (queued, written, dropped, failed)", ("result",),
+)
+CAPTURE_EVENTS = REGISTRY.counter(
+    "conrumbo_capture_events_total", "Peticiones capturadas para replay (queued, written, dropped, failed)", ("result",),
+)
+JOURNAL_QUEUE = REGISTRY.gauge("conrumbo_journal_queue", "Eventos del diario pendientes de escribir")
+ADMISSION_QUEUE = REGISTRY.gauge(
+    "conrumbo_admission_queue", "Peticiones en cola de admisión por clase de prioridad", ("class",),
+)
+ADMISSION_INFLIGHT = REGISTRY.gauge(
+    "conrumbo_admission_inflight", "Peticiones admitidas en curso por clase de prioridad", ("class",),
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "conrumbo_admission_wait_seconds", "Espera en cola de admisión por clase de prioridad", ("class",),
+)
+ADMISSION_TOTAL = REGISTRY.counter(
+    "conrumbo_admission_total", "Decisiones de admisión (admitted, promoted, shed, timeout)", ("class", "result"),
+)
+ENGINE_READY = REGISTRY.gauge("conrumbo_engines_ready", "1 cuando los motores y el índice semántico están listos")
+WARMUP_SECONDS = REGISTRY.gauge(
+    "conrumbo_warmup_seconds", "Segundos desde el inicio del calentamiento hasta cada fase", ("phase",),
+)
+RELOAD_LATENCY = REGISTRY.histogram(
+    "conrumbo_reload_duration_seconds", "Duración de la recarga de protocolos",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Cronometra una etapa del pipeline: `with stage("safety"): ...`.
+    Alimenta el histograma y la cabecera Server-Timing de la petición en curso.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Etapa medida fuera de la corrutina de la petición (p.ej. en un hilo del pool)."""
+    STAGE_LATENCY.labels(name).observe(seconds)
+    timing.record(name, seconds)
+
+
+# -----------------------
+# Middleware ASGI
+# -----------------------
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware) que registra latencia por ruta.
+    Usa la plantilla de ruta (`/protocol/{protocol_id}`) para no disparar la cardinalidad.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            route = scope.get("route")
+            path = getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+            labels = (scope.get("method", ""), path, str(status_holder["status"]))
+            REQUEST_LATENCY.labels(*labels).observe(elapsed)
+            REQUESTS_TOTAL.labels(*labels).inc()
@@ -0,0 +1,269 @@
+# backend/core/offline_bundle.py
+"""
+Índice estático para búsqueda y triaje sin conexión (PWA y app móvil).
+
+Compila el corpus a un único JSON:
+  - protocolos con los pasos ya renderizados (mismo formato que /next_step),
+  - índice invertido por idioma: palabra plegada -> protocolos,
+  - léxico de intents por idioma y familias por edad,
+  - patrones de seguridad (emergencia / diagnóstico) y número de emergencias,
+  - con --region, los textos y el número del overlay regional (core/regions.py),
+  - opcionalmente, vectores cuantizados a int8 (core/quantize.py, base64),
+  - si hay audio pre-renderizado (core/voice_audio.py), el fichero de cada
+    voice_cue/instruction; el build copia el audio junto al índice (voice/).
+
+El contenido es determinista (claves ordenadas, sin marcas de tiempo): el
+nombre del fichero lleva su hash y puede cachearse como inmutable. El
+manifiesto (sin hash, no cacheable) indica qué fichero es el vigente.
+
+Uso (desde backend/):
+    python -m core.offline_bundle build
+    python -m core.offline_bundle build --out ../web/public/offline --vectors
+    python -m core.offline_bundle build --region mx --out ../web/public/offline/mx
+"""
+from __future__ import annotations
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ARTIFACT_FORMAT = 1
+ARTIFACT_PREFIX = "conrumbo-index"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_OUT_DIR = Path(__file__).resolve().parents[2] / "web" / "public" / "offline"
+# Vectores en el artefacto que sirve la API (deben coincidir con el del build)
+WITH_VECTORS = os.getenv("OFFLINE_BUNDLE_VECTORS", "0") == "1"
+
+_WORD_RE = re.compile(r"\w+")
+_ARTIFACT_RE = re.compile(rf"^{ARTIFACT_PREFIX}\.[0-9a-f]+\.json$")
+
+
+class OfflineArtifact:
+    """Bytes del artefacto y su manifiesto."""
+
+    __slots__ = ("data", "sha256", "version", "filename", "manifest")
+
+    def __init__(self, data: bytes, manifest_extra: Dict[str, Any]):
+        self.data = data
+        self.sha256 = hashlib.sha256(data).hexdigest()
+        self.version = self.sha256[:16]
+        self.filename = f"{ARTIFACT_PREFIX}.{self.version}.json"
+        self.manifest = {
+            "format": ARTIFACT_FORMAT, "version": self.version, "sha256": self.sha256,
+            "file": self.filename, "bytes": len(data), **manifest_extra,
+        }
+
+
+def _tokens(text: str) -> List[str]:
+    from .fuzzy import fold
+    return [w for w in _WORD_RE.findall(fold(text)) if len(w) > 1]
+
+
+def _vectors(protocols: Dict[str, Any], ids: List[str]) -> Dict[str, Any]:
+    import numpy as np
+    from .embeddings import EmbeddingGenerator
+    from .quantize import Int8Codes
+    from .shards import protocol_text
+    gen = EmbeddingGenerator()
+    emb = np.asarray(gen.generate_embeddings_batch([protocol_text(protocols[pid]) for pid in ids]), dtype=np.float32)
+    norms = np.linalg.norm(emb, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    # Misma cuantización por fila que el índice int8 del servidor (v ~= scale * q)
+    q = Int8Codes(emb / norms)
+    return {
+        "model": gen.model, "mode": gen.mode, "dim": int(emb.shape[1]), "dtype": "int8",
+        "scales": [round(float(x), 8) for x in q.scales],
+        "data": base64.b64encode(q.codes.tobytes()).decode("ascii"),
+    }
+
+
+def build_bundle(protocols: Dict[str, Any], with_vectors: bool = False, view: Any = None,
+                 voice: Any = None, voice_base: str = "voice/") -> Dict[str, Any]:
+    """Estructura del artefacto a partir de protocolos compilados (RuntimeProtocol).
+
+    `view` (RegionView) aporta los guardarraíles de la región; `protocols` debe
+    ser entonces view.protocols. `voice` (VoiceCatalog) añade el audio de cada
+    paso, servido bajo `voice_base`.
+    """
+    from .language import group_by_language, protocol_language
+    from .runtime_protocol import step_payloads
+    from .safety import SafetyGuardrails
+    from .shards import INTENT_LEXICONS, protocol_text
+    from .triage import build_age_variant_index, immediate_action_for
+
+    ids = sorted(protocols)
+    pos = {pid: i for i, pid in enumerate(ids)}
+    items: List[Dict[str, Any]] = []
+    audio_files: Dict[str, int] = {}
+    for pid in ids:
+        p = protocols[pid]
+        steps = step_payloads(p)
+        if voice is not None and len(voice):
+            for step in steps:
+                audio = voice.step_audio(step)
+                if audio:
+                    step["audio"] = audio
+                    audio_files.update((f, voice.sizes[f]) for f in audio.values())
+        items.append({
+            "id": pid,
+            "title": p.title,
+            "language": protocol_language(p),
+            "category": p.category,
+            "priority": p.priority or p.metadata.riesgo or "",
+            "target_audience": p.target_audience or "",
+            "immediate_action": immediate_action_for(pid, p),
+            "red_flags": list(p.triage.red_flags) if p.triage else [],
+            "emergency_action": p.emergency_action,
+            "medical_disclaimer": p.metadata.medical_disclaimer,
+            "steps": steps,
+            "ui": p.ui.to_dict() if p.ui else {},
+            "voice_cues": list(p.voice_cues or []),
+        })
+
+    shards: Dict[str, Any] = {}
+    for lang, members in sorted(group_by_language(protocols).items()):
+        postings: Dict[str, List[int]] = {}
+        for pid in sorted(members):
+            for tok in sorted(set(_tokens(protocol_text(members[pid])))):
+                postings.setdefault(tok, []).append(pos[pid])
+        lexicon: Dict[str, List[int]] = {}
+        for phrase, pids in INTENT_LEXICONS.get(lang, {}).items():
+            lexicon.setdefault(phrase, []).extend(pos[x] for x in pids if x in members)
+        for pid in sorted(members):
+            p = members[pid]
+            for intent in (p.triggers.intents if p.triggers else ()):
+                phrase = intent.replace("_", " ").strip().lower()
+                if phrase and pos[pid] not in lexicon.setdefault(phrase, []):
+                    lexicon[phrase].append(pos[pid])
+        shards[lang] = {
+            "protocols": sorted(pos[pid] for pid in members),
+            "index": postings,
+            "intents": {k: list(dict.fromkeys(v)) for k, v in lexicon.items() if v},
+        }
+
+    safety = view.safety if view is not None else SafetyGuardrails()
+    bundle: Dict[str, Any] = {
+        "format": ARTIFACT_FORMAT,
+        "emergency_number": safety.emergency_number,
+        "safety_patterns": safety.pattern_sources(),
+        "protocols": items,
+        "age_variants": {base: {age: pos[pid] for age, pid in v.items()}
+                         for base, v in build_age_variant_index(protocols).items()},
+        "languages": shards,
+    }
+    if view is not None:
+        bundle["region"] = view.region
+    if audio_files:
+        bundle["voice"] = {"base": voice_base, "codec": voice.codec, "media_type": voice.media_type,
+                           "files": dict(sorted(audio_files.items()))}
+    if with_vectors and ids:
+        bundle["vectors"] = _vectors(protocols, ids)
+    return bundle
+
+
+def encode_bundle(bundle: Dict[str, Any]) -> OfflineArtifact:
+    data = json.dumps(bundle, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    extra = {
+        "protocols": len(bundle["protocols"]),
+        "languages": sorted(bundle["languages"]),
+        "vectors": "vectors" in bundle,
+    }
+    if "voice" in bundle:
+        extra["voice_files"] = len(bundle["voice"]["files"])
+        extra["voice_bytes"] = sum(bundle["voice"]["files"].values())
+    return OfflineArtifact(data, extra)
+
+
+def build_artifact(protocols: Dict[str, Any], with_vectors: bool = WITH_VECTORS, view: Any = None,
+                   voice: Any = None, voice_base: str = "voice/") -> OfflineArtifact:
+    return encode_bundle(build_bundle(protocols, with_vectors, view, voice, voice_base))
+
+
+def copy_voice(artifact: OfflineArtifact, voice: Any, out_dir: Path) -> int:
+    """Copia a out_dir/voice el audio que referencia el artefacto y borra el que ya no; devuelve copiados."""
+    files = json.loads(artifact.data).get("voice", {}).get("files", {})
+    target = out_dir / "voice"
+    if not files and not target.exists():
+        return 0
+    target.mkdir(parents=True, exist_ok=True)
+    copied = 0
+    for name in files:
+        dst = target / name
+        if not dst.exists():
+            shutil.copyfile(voice.path(name), dst)
+            copied += 1
+    for path in target.iterdir():
+        if path.name not in files:
+            path.unlink()
+    return copied
+
+
+def write_artifact(artifact: OfflineArtifact, out_dir: Path, keep: int = 1) -> Path:
+    """Escribe el artefacto y el manifiesto; conserva `keep` artefactos anteriores."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    target = out_dir / artifact.filename
+    target.write_bytes(artifact.data)
+    (out_dir / MANIFEST_NAME).write_text(json.dumps(artifact.manifest, indent=2) + "\n", encoding="utf-8")
+    old = sorted((p for p in out_dir.iterdir() if _ARTIFACT_RE.match(p.name) and p != target),
+                 key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in old[keep:]:
+        stale.unlink()
+    return target
+
+
+def _load_runtime(protocols_dir: Path) -> Dict[str, Any]:
+    from .protocol import stream_protocols
+    from .runtime_protocol import StringPool, compile_protocol
+    pool = StringPool()
+    out: Dict[str, Any] = {}
+    stream_protocols(protocols_dir, lambda p: out.__setitem__(p.id, compile_protocol(p, pool)))
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="compila el corpus al artefacto offline")
+    b.add_argument("--protocols", type=Path, default=Path(__file__).resolve().parents[1] / "rag" / "protocols")
+    b.add_argument("--out", type=Path, default=DEFAULT_OUT_DIR)
+    b.add_argument("--vectors", action="store_true", default=WITH_VECTORS, help="incluir vectores int8")
+    b.add_argument("--keep", type=int, default=1, help="artefactos anteriores que se conservan")
+    b.add_argument("--region", default="", help="overlay regional (rag/regions/<region>.yaml)")
+    b.add_argument("--voice", type=Path, default=None,
+                   help="catálogo de audio (core/voice_audio.py; por defecto VOICE_AUDIO_DIR si existe)")
+    b.add_argument("--no-voice", action="store_true", help="sin audio pre-renderizado")
+    args = ap.parse_args(argv)
+
+    protocols = _load_runtime(args.protocols)
+    if not protocols:
+        print(f"[offline] Sin protocolos en {args.protocols}")
+        return 1
+    view = None
+    if args.region:
+        from .regions import RegionRegistry
+        view = RegionRegistry().view(args.region, protocols)
+        if view.overlay is None:
+            print(f"[offline] Región desconocida: {args.region}")
+            return 1
+        protocols = view.protocols
+    voice = None
+    if not args.no_voice:
+        from .voice_audio import VOICE_DIR, VoiceCatalog
+        voice = VoiceCatalog(args.voice or VOICE_DIR)
+    artifact = build_artifact(protocols, args.vectors, view, voice)
+    target = write_artifact(artifact, args.out, args.keep)
+    copied = copy_voice(artifact, voice, args.out) if voice is not None else 0
+    print(f"[offline] {target} ({len(artifact.data) / 1024:.1f} KiB, {len(protocols)} protocolos, "
+          f"vectores={'sí' if args.vectors else 'no'}, audio={artifact.manifest.get('voice_files', 0)} "
+          f"ficheros, {copied} nuevos)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# backend/core/profiler.py
+from __future__ import annotations
+import collections
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+from typing import Counter, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Intervalo de muestreo por defecto (s). 5 ms ≈ 200 muestras/s: suficiente para
+# una petición de decenas de ms y despreciable fuera de la ventana de perfilado.
+DEFAULT_INTERVAL = float(os.getenv("CONRUMBO_PROFILE_INTERVAL", "0.005"))
+MAX_WINDOW_SECONDS = float(os.getenv("CONRUMBO_PROFILE_MAX_WINDOW", "30"))
+PROFILE_HEADER = b"x-conrumbo-profile"
+PROFILE_ID_HEADER = b"x-conrumbo-profile-id"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo de pilas (sys._current_frames) en un hilo aparte.
+    No instrumenta el código: fuera de start()/stop() su coste es cero.
+    Produce pilas "folded" (raíz;...;hoja N) listas para flamegraph.pl / speedscope.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_ids: Optional[Iterable[int]] = None):
+        self.interval = max(0.0005, float(interval))
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.samples: Counter[str] = collections.Counter()
+        self.sample_count = 0
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="conrumbo-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own or (self.thread_ids is not None and tid not in self.thread_ids):
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(f"thread:{names.get(tid, tid)}")
+                stack.reverse()
+                self.samples[";".join(stack)] += 1
+            self.sample_count += 1
+
+    def folded(self) -> str:
+        """Formato colapsado de Brendan Gregg: una pila por línea + número de muestras."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+
+# -----------------------
+# Almacén de perfiles recientes
+# -----------------------
+
+class ProfileStore:
+    """Anillo acotado con los últimos perfiles capturados (id -> metadatos + folded)."""
+
+    def __init__(self, maxlen: int = 16):
+        self._items: Deque[Tuple[str, Dict[str, object]]] = collections.deque(maxlen=maxlen)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profiler: SamplingProfiler, label: str) -> str:
+        pid = f"p{next(self._ids)}"
+        with self._lock:
+            self._items.append((pid, {
+                "label": label,
+                "duration_ms": round(profiler.duration * 1000.0, 3),
+                "samples": profiler.sample_count,
+                "interval_ms": profiler.interval * 1000.0,
+                "folded": profiler.folded(),
+            }))
+        return pid
+
+    def get(self, pid: str) -> Optional[Dict[str, object]]:
+        with self._lock:
+            for k, v in self._items:
+                if k == pid:
+                    return v
+        return None
+
+    def list(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [{"id": k, **{f: v[f] for f in ("label", "duration_ms", "samples")}} for k, v in self._items]
+
+
+PROFILES = ProfileStore()
+
+# Un único perfil activo a la vez: acota el coste aunque lleguen muchas peticiones marcadas
+_active_lock = threading.Lock()
+
+
+def try_acquire() -> bool:
+    return _active_lock.acquire(blocking=False)
+
+
+def release() -> None:
+    _active_lock.release()
+
+
+def profile_token() -> Optional[str]:
+    """Token que habilita el perfilado; sin token configurado el perfilador queda desactivado."""
+    return os.getenv("CONRUMBO_PROFILE_TOKEN") or os.getenv("CONRUMBO_DEBUG_TOKEN") or None
+
+
+# -----------------------
+# Middleware ASGI
+# -----------------------
+
+class ProfilerMiddleware:
+    """
+    Perfila una petición concreta si trae `X-ConRumbo-Profile: <token>`.
+    Devuelve `X-ConRumbo-Profile-Id`; el perfil se descarga en /debug/profiles/{id}.
+    Sin la cabecera el único coste es buscarla entre las cabeceras.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = None
+        for k, v in scope.get("headers") or ():
+            if k == PROFILE_HEADER:
+                requested = v.decode("latin-1")
+                break
+
+        token = profile_token() if requested is not None else None
+        # Comparación en tiempo constante, como en core/debug.py
+        if not token or not hmac.compare_digest(requested.encode("latin-1"), token.encode()) or not try_acquire():
+            await self.app(scope, receive, send)
+            return
+
+        prof = SamplingProfiler().start()
+        pid_holder: Dict[str, str] = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                prof.stop()
+                pid_holder["id"] = PROFILES.add(prof, f"{scope.get('method', '')} {scope.get('path', '')}")
+                headers = list(message.get("headers") or [])
+                headers.append((PROFILE_ID_HEADER, pid_holder["id"].encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if "id" not in pid_holder:
+                prof.stop()
+                PROFILES.add(prof, f"{scope.get('method', '')} {scope.get('path', '')} (sin respuesta)")
+            release()
@@ -1,10 +1,19 @@
 # backend/core/protocol.py
 from __future__ import annotations
-from typing import List, Dict, Optional, Any, Sequence, Union
-from pydantic import BaseModel, Field, ConfigDict, field_validator
+from typing import List, Dict, Optional, Any, Sequence, Union, Callable, Iterator, Tuple
+from pydantic import BaseModel, Field, ConfigDict, PrivateAttr, field_validator, model_validator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 import yaml
 from pathlib import Path
 
+from .schema_validator import validate_protocol_dict
+from .step_graph import StepGraph, compile_step_graph
+
+# Validación contra rag/schema.yaml al cargar: "strict" descarta el fichero,
+# "warn" sólo avisa, "off" la desactiva
+SCHEMA_MODE = os.getenv("PROTOCOL_SCHEMA_MODE", "strict").lower()
+
 # -----------------------
 # Modelos base (Pydantic)
 # -----------------------
@@ -34,6 +43,15 @@ class ProtocolStep(BaseModel):
     next_step: Optional[int] = None
     loop_condition: Optional[str] = None
     exit_conditions: Optional[List[str]] = None
+    # Paso crítico (requiere safety_alerts/safety_notes) y saltos if_continue/if_exit/if_emergency/...
+    critical: bool = False
+    safety_notes: Optional[List[str]] = None
+    next_step_logic: Optional[Dict[str, Union[int, str]]] = None
+    model_config = ConfigDict(extra="ignore")
+
+class ProtocolTriggers(BaseModel):
+    intents: List[str] = []
+    conditions: Dict[str, List[str]] = {}
     model_config = ConfigDict(extra="ignore")
 
 class TriageData(BaseModel):
@@ -52,14 +70,22 @@ class ProtocolMetadata(BaseModel):
     materiales: List[str] = []
     riesgo: Optional[str] = "medio"
     tiempo_estimado: Optional[str] = None
+    language: Optional[str] = "es"
+    medical_disclaimer: Optional[str] = None
     model_config = ConfigDict(extra="ignore")
 
 class Protocol(BaseModel):
     id: str
     title: str
     version: Optional[str] = "v1"
+    category: Optional[str] = None
+    priority: Optional[str] = None
+    # Población objetivo ("adulto" | "pediatrico" | "neonatal" | "todas_edades")
+    target_audience: Optional[str] = None
     sources: List[str] = []
     metadata: ProtocolMetadata = Field(default_factory=ProtocolMetadata)
+    triggers: Optional[ProtocolTriggers] = None
+    safety_alerts: List[str] = []
     triage: Optional[TriageData] = None
 
     # Acepta pasos simples (strings) o ricos (objetos)
@@ -77,6 +103,21 @@ class Protocol(BaseModel):
 
     model_config = ConfigDict(extra="ignore")
 
+    # Grafo de pasos (core/step_graph.py): se compila al validar; un grafo
+    # inválido invalida el protocolo entero
+    _step_graph: Optional[StepGraph] = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def check_step_graph(self) -> "Protocol":
+        self._step_graph = compile_step_graph(self.steps)
+        return self
+
+    @property
+    def step_graph(self) -> StepGraph:
+        if self._step_graph is None:
+            self._step_graph = compile_step_graph(self.steps)
+        return self._step_graph
+
     @field_validator("steps", mode="before")
     @classmethod
     def coerce_steps(cls, v: Any) -> Any:
@@ -145,22 +186,105 @@ class SearchResponse(BaseModel):
 # Helpers de carga YAML
 # -----------------------
 
+# libyaml (C) si PyYAML se compiló con él: ~10x más rápido que el parser puro Python
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+HAVE_LIBYAML = YAML_LOADER is not yaml.SafeLoader
+
+# Ingesta en paralelo: por debajo de LOAD_PARALLEL_MIN ficheros no compensa arrancar procesos
+LOAD_WORKERS = int(os.getenv("PROTOCOL_LOAD_WORKERS", str(min(os.cpu_count() or 1, 8))))
+LOAD_PARALLEL_MIN = int(os.getenv("PROTOCOL_LOAD_PARALLEL_MIN", "256"))
+LOAD_BATCH = int(os.getenv("PROTOCOL_LOAD_BATCH", "64"))
+
+def parse_yaml(text: Union[str, bytes]) -> Any:
+    return yaml.load(text, Loader=YAML_LOADER)
+
 def protocol_from_yaml_text(text: str) -> Protocol:
-    data = yaml.safe_load(text)
-    return Protocol.model_validate(data)
+    return Protocol.model_validate(parse_yaml(text))
 
 def protocol_from_yaml_file(path: Path) -> Protocol:
     return protocol_from_yaml_text(path.read_text(encoding="utf-8"))
 
-def load_all_protocols(dirpath: Path) -> Dict[str, Protocol]:
+class ProtocolSchemaError(ValueError):
+    """El YAML no cumple rag/schema.yaml; `violations` trae todas las infracciones."""
+
+    def __init__(self, violations: List[str]):
+        self.violations = violations
+        super().__init__(f"{len(violations)} violaciones de esquema: " + "; ".join(violations[:5]))
+
+def protocol_from_dict(data: Any, schema_mode: Optional[str] = None, name: str = "") -> Protocol:
+    mode = (schema_mode or SCHEMA_MODE).lower()
+    if mode != "off":
+        violations = validate_protocol_dict(data)
+        if violations:
+            if mode == "strict":
+                raise ProtocolSchemaError(violations)
+            for v in violations:
+                print(f"[protocol] Aviso de esquema en {name}: {v}")
+    return Protocol.model_validate(data)
+
+# (nombre de fichero, protocolo validado o None, error o None)
+LoadResult = Tuple[str, Optional[Protocol], Optional[str]]
+
+def _load_file(path: str, schema_mode: Optional[str]) -> LoadResult:
+    name = os.path.basename(path)
+    try:
+        with open(path, "rb") as fh:
+            data = parse_yaml(fh.read())
+        return name, protocol_from_dict(data, schema_mode, name), None
+    except Exception as e:
+        # Aislamiento por fichero: un YAML roto no tumba la ingesta
+        return name, None, str(e)
+
+def _load_batch(paths: List[str], schema_mode: Optional[str]) -> List[LoadResult]:
+    return [_load_file(p, schema_mode) for p in paths]
+
+def iter_protocols(dirpath: Path, schema_mode: Optional[str] = None,
+                   workers: Optional[int] = None) -> Iterator[LoadResult]:
+    """
+    Parsea y valida los *.yaml de `dirpath` y va entregando cada resultado en
+    cuanto está listo. Con muchos ficheros reparte lotes en un pool de procesos
+    (el orden de llegada no es el alfabético); con pocos, lo hace en línea.
+    """
     dirpath = Path(dirpath)
-    out: Dict[str, Protocol] = {}
     if not dirpath.exists():
-        return out
-    for yf in sorted(dirpath.glob("*.yaml")):
-        try:
-            proto = protocol_from_yaml_file(yf)
-            out[proto.id] = proto
-        except Exception as e:
-            print(f"[protocol] Error en {yf.name}: {e}")
+        return
+    paths = sorted(str(p) for p in dirpath.glob("*.yaml"))
+    workers = LOAD_WORKERS if workers is None else workers
+    if workers <= 1 or len(paths) < LOAD_PARALLEL_MIN:
+        for path in paths:
+            yield _load_file(path, schema_mode)
+        return
+    batches = [paths[i:i + LOAD_BATCH] for i in range(0, len(paths), LOAD_BATCH)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_load_batch, b, schema_mode) for b in batches]
+        for fut in as_completed(futures):
+            yield from fut.result()
+
+def stream_protocols(dirpath: Path, sink: Callable[[Protocol], None], schema_mode: Optional[str] = None,
+                     workers: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Entrega cada protocolo válido a `sink` según termina. Ids duplicados: gana
+    el fichero posterior en orden alfabético (como la carga secuencial).
+    Devuelve (cargados, errores).
+    """
+    source: Dict[str, str] = {}
+    errors = 0
+    for name, proto, err in iter_protocols(dirpath, schema_mode, workers):
+        if proto is None:
+            errors += 1
+            print(f"[protocol] Error en {name}: {err}")
+            continue
+        prev = source.get(proto.id)
+        if prev is not None:
+            print(f"[protocol] Id duplicado {proto.id} en {prev} y {name}")
+            if prev > name:
+                continue
+        source[proto.id] = name
+        sink(proto)
+    return len(source), errors
+
+def load_all_protocols(dirpath: Path, schema_mode: Optional[str] = None,
+                       workers: Optional[int] = None) -> Dict[str, Protocol]:
+    out: Dict[str, Protocol] = {}
+    stream_protocols(dirpath, lambda p: out.__setitem__(p.id, p), schema_mode, workers)
     return out
@@ -0,0 +1,113 @@
+# backend/core/protocol_lint.py
+"""
+Lint del corpus de protocolos contra rag/schema.yaml.
+
+Cada worker del pool compila el validador una sola vez y procesa lotes de
+ficheros; se informan TODAS las violaciones (esquema, reglas cruzadas, modelo
+pydantic e ids duplicados), no sólo la primera.
+
+Uso (desde backend/):
+    python -m core.protocol_lint rag/protocols
+    python -m core.protocol_lint /ruta/corpus --workers 8 --json
+Código de salida 1 si hay violaciones.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .protocol import Protocol, parse_yaml
+from .schema_validator import SCHEMA_PATH, get_validator
+
+# (fichero, id o None, violaciones)
+FileReport = Tuple[str, Optional[str], List[str]]
+
+_validator: Any = None
+
+
+def _init_worker(schema_path: str) -> None:
+    global _validator
+    _validator = get_validator(Path(schema_path)) if schema_path != str(SCHEMA_PATH) else get_validator()
+
+
+def lint_file(path: str) -> FileReport:
+    try:
+        with open(path, "rb") as fh:
+            doc = parse_yaml(fh.read())
+    except Exception as e:
+        return path, None, [f"YAML inválido: {e}"]
+    violations = list(_validator(doc))
+    pid = doc.get("id") if isinstance(doc, dict) else None
+    if not violations:
+        # Lo que el esquema no cubre pero rechazaría la carga
+        try:
+            Protocol.model_validate(doc)
+        except Exception as e:
+            violations.append(f"modelo: {e}")
+    return path, pid, violations
+
+
+def _lint_batch(paths: List[str]) -> List[FileReport]:
+    return [lint_file(p) for p in paths]
+
+
+def lint_paths(paths: List[str], workers: int = 0, schema_path: Path = SCHEMA_PATH,
+               batch_size: int = 64) -> List[FileReport]:
+    """Lint en paralelo; workers <= 1 ejecuta en el proceso actual."""
+    if workers <= 1 or len(paths) <= batch_size:
+        _init_worker(str(schema_path))
+        reports = _lint_batch(paths)
+    else:
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(str(schema_path),)) as pool:
+            reports = [r for chunk in pool.map(_lint_batch, batches) for r in chunk]
+
+    # Regla de corpus: ids únicos
+    seen: Dict[str, str] = {}
+    for path, pid, violations in reports:
+        if pid is None:
+            continue
+        if pid in seen:
+            violations.append(f"id: '{pid}' duplicado (también en {Path(seen[pid]).name})")
+        else:
+            seen[pid] = path
+    return reports
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("directory", type=Path, help="directorio con *.yaml (se recorre recursivamente)")
+    ap.add_argument("--schema", type=Path, default=SCHEMA_PATH)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--json", action="store_true", help="salida JSON")
+    args = ap.parse_args(argv)
+
+    paths = sorted(str(p) for p in args.directory.rglob("*.yaml"))
+    t0 = time.perf_counter()
+    reports = lint_paths(paths, args.workers, args.schema)
+    elapsed = time.perf_counter() - t0
+    bad = [(path, v) for path, _pid, v in reports if v]
+    total = sum(len(v) for _p, v in bad)
+
+    if args.json:
+        print(json.dumps({
+            "files": len(reports), "invalid_files": len(bad), "violations": total,
+            "elapsed_s": round(elapsed, 3), "errors": {path: v for path, v in bad},
+        }, ensure_ascii=False, indent=2))
+    else:
+        for path, violations in bad:
+            for v in violations:
+                print(f"{path}: {v}")
+        print(f"[lint] {len(reports)} ficheros, {len(bad)} inválidos, {total} violaciones "
+              f"en {elapsed:.2f}s ({args.workers} workers)")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
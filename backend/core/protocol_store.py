@@ -0,0 +1,331 @@
+# backend/core/protocol_store.py
+"""
+Registro de protocolos en SQLite (PROTOCOL_BACKEND=sqlite).
+
+Un único fichero con los protocolos ya validados y compilados:
+  protocols     una fila por protocolo: metadatos indexados (idioma,
+                categoría, prioridad), resumen (ProtocolSummary), documento
+                JSON completo (/protocol), UI y voice_cues de nivel superior
+                y texto léxico de /search
+  steps         pasos ya renderizados para /next_step (clave protocolo, índice)
+  protocol_fts  FTS5 con tokenizador trigram sobre el texto léxico: la
+                subcadena de /search se resuelve con el índice y se verifica
+                con instr() (mismo criterio que LanguageShard.lexical_search)
+  meta          versión de esquema, huella de los YAML y hash del contenido
+
+El fichero nunca se modifica en sitio: se construye aparte y se publica con
+os.replace. Los workers lo abren en sólo lectura (immutable=1, sin bloqueos)
+con mmap, así que las páginas se comparten a través de la caché del sistema
+operativo; una conexión abierta sigue viendo su versión hasta reopen().
+
+Uso (desde backend/):
+    python -m core.protocol_store build
+    python -m core.protocol_store info
+    python -m core.protocol_store search "compresiones" --language es
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from .language import DEFAULT_LANGUAGE, protocol_language
+from .runtime_protocol import (
+    ProtocolSummary, RuntimeProtocol, StringPool, compile_protocol, compile_summary, step_payloads, summarize,
+)
+
+SCHEMA_VERSION = 3
+PROTOCOL_BACKEND = os.getenv("PROTOCOL_BACKEND", "memory").lower()
+PROTOCOL_DB = Path(os.getenv("PROTOCOL_DB", str(Path(__file__).resolve().parents[1] / "var" / "protocols.sqlite3")))
+MMAP_BYTES = int(os.getenv("PROTOCOL_DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE protocols (
+    rid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    language TEXT NOT NULL,
+    category TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    target_audience TEXT NOT NULL,
+    total_steps INTEGER NOT NULL,
+    top_ui TEXT NOT NULL,
+    voice_cues TEXT NOT NULL,
+    haystack TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX protocols_language ON protocols (language, rid);
+CREATE INDEX protocols_category ON protocols (category);
+CREATE INDEX protocols_priority ON protocols (priority);
+CREATE TABLE steps (
+    protocol_rid INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (protocol_rid, idx)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE protocol_fts USING fts5(
+    haystack, content='protocols', content_rowid='rid', tokenize='trigram'
+);
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def source_fingerprint(directory: Path) -> str:
+    """Huella barata de los YAML (nombre, tamaño, mtime): decide si hay que reconstruir."""
+    h = hashlib.sha256(f"schema={SCHEMA_VERSION}".encode())
+    for path in sorted(Path(directory).glob("*.yaml")):
+        st = path.stat()
+        h.update(f"{path.name}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def build_store(protocols: Mapping[str, RuntimeProtocol], path: Path = PROTOCOL_DB,
+                fingerprint: str = "") -> Dict[str, Any]:
+    """Escribe el registro en un fichero temporal y lo publica atómicamente en `path`."""
+    from .shards import lexical_text  # arrastra numpy: sólo al construir
+    t0 = time.perf_counter()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    content = hashlib.sha256()
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + _SCHEMA)
+        for rid, (pid, p) in enumerate(protocols.items(), start=1):
+            doc = _dumps(p.to_dict())
+            content.update(doc.encode("utf-8"))
+            payloads = step_payloads(p)
+            conn.execute(
+                "INSERT INTO protocols VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                (rid, pid, p.title or "", protocol_language(p), p.category or "",
+                 p.priority or p.metadata.riesgo or "", p.target_audience or "", len(payloads),
+                 _dumps(p.ui.to_dict() if p.ui else {}), _dumps(list(p.voice_cues or [])), lexical_text(p),
+                 _dumps(summarize(p).to_dict()), doc),
+            )
+            conn.executemany("INSERT INTO steps VALUES (?,?,?)",
+                             ((rid, i, _dumps(s)) for i, s in enumerate(payloads)))
+        conn.execute("INSERT INTO protocol_fts (rowid, haystack) SELECT rid, haystack FROM protocols")
+        conn.execute("INSERT INTO protocol_fts (protocol_fts) VALUES ('optimize')")
+        meta = {"schema_version": str(SCHEMA_VERSION), "fingerprint": fingerprint,
+                "snapshot": content.hexdigest()[:16], "protocols": str(len(protocols)),
+                "built_at": str(int(time.time()))}
+        conn.executemany("INSERT INTO meta VALUES (?,?)", meta.items())
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    conn.close()
+    os.replace(tmp, path)
+    meta["seconds"] = round(time.perf_counter() - t0, 3)
+    meta["bytes"] = path.stat().st_size
+    return meta
+
+
+def read_meta(path: Path = PROTOCOL_DB) -> Dict[str, str]:
+    """Metadatos del fichero ({} si no existe o no es un registro válido)."""
+    if not Path(path).exists():
+        return {}
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}
+
+
+class ProtocolStore:
+    """Lectura del registro SQLite: una conexión de sólo lectura por hilo."""
+
+    def __init__(self, path: Path = PROTOCOL_DB, mmap_bytes: int = MMAP_BYTES):
+        self.path = Path(path)
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        self._generation = 0
+        self.meta: Dict[str, str] = {}
+        self.languages: Tuple[str, ...] = ()
+        self.reopen()
+
+    def reopen(self) -> None:
+        """Tras publicar un fichero nuevo: cada hilo reabre su conexión en la siguiente consulta."""
+        self._generation += 1
+        conn = self._conn()
+        self.meta = dict(conn.execute("SELECT key, value FROM meta"))
+        if int(self.meta.get("schema_version", 0)) != SCHEMA_VERSION:
+            raise RuntimeError(f"{self.path}: esquema {self.meta.get('schema_version')} != {SCHEMA_VERSION}")
+        self.languages = tuple(r[0] for r in conn.execute("SELECT DISTINCT language FROM protocols ORDER BY 1"))
+
+    def _conn(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            old = getattr(local, "conn", None)
+            if old is not None:
+                old.close()
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            conn.execute("PRAGMA query_only=1")
+            local.conn, local.generation = conn, self._generation
+        return local.conn
+
+    @property
+    def snapshot(self) -> str:
+        return self.meta.get("snapshot", "")
+
+    def __len__(self) -> int:
+        return int(self.meta.get("protocols", 0))
+
+    def __contains__(self, pid: object) -> bool:
+        return self._conn().execute("SELECT 1 FROM protocols WHERE id = ?", (pid,)).fetchone() is not None
+
+    def language_for(self, language: str) -> str:
+        """Idioma sin protocolos -> el idioma por defecto (como RAGSearchEngine._shard_language)."""
+        if language in self.languages:
+            return language
+        if DEFAULT_LANGUAGE in self.languages or not self.languages:
+            return DEFAULT_LANGUAGE
+        return self.languages[0]
+
+    # ---------- Consultas de los endpoints ----------
+    def protocol_doc(self, pid: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT doc FROM protocols WHERE id = ?", (pid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def step(self, pid: str, idx: int) -> Optional[Tuple[Optional[Dict[str, Any]], int, Dict[str, Any], List[str]]]:
+        """(paso renderizado o None si idx está fuera de rango, total, ui, voice_cues); None si no existe."""
+        row = self._conn().execute(
+            "SELECT p.total_steps, p.top_ui, p.voice_cues, s.payload FROM protocols p "
+            "LEFT JOIN steps s ON s.protocol_rid = p.rid AND s.idx = ? WHERE p.id = ?",
+            (idx, pid),
+        ).fetchone()
+        if row is None:
+            return None
+        total, top_ui, voice_cues, payload = row
+        return (json.loads(payload) if payload else None), total, json.loads(top_ui), json.loads(voice_cues)
+
+    def listing(self) -> List[Dict[str, Any]]:
+        """Filas de /protocols en orden de carga."""
+        cur = self._conn().execute(
+            "SELECT id, title, category, priority, target_audience FROM protocols ORDER BY rid")
+        return [{"id": r[0], "title": r[1], "category": r[2], "priority": r[3], "target_audience": r[4]}
+                for r in cur]
+
+    def lexical_search(self, query_lower: str, language: str) -> List[Tuple[str, str]]:
+        """(id, título) cuyo título/pasos contienen la consulta literal, en orden de carga."""
+        if len(query_lower) < 3:
+            # El tokenizador trigram no indexa consultas de menos de 3 caracteres
+            cur = self._conn().execute(
+                "SELECT id, title FROM protocols WHERE language = ? AND instr(haystack, ?) > 0 ORDER BY rid",
+                (language, query_lower))
+        else:
+            cur = self._conn().execute(
+                "SELECT p.id, p.title FROM protocol_fts f JOIN protocols p ON p.rid = f.rowid "
+                "WHERE protocol_fts MATCH ? AND p.language = ? AND instr(p.haystack, ?) > 0 ORDER BY p.rid",
+                ('"' + query_lower.replace('"', '""') + '"', language, query_lower))
+        return cur.fetchall()
+
+    # ---------- Carga de los motores ----------
+    def iter_protocols(self, pool: Optional[StringPool] = None,
+                       language: Optional[str] = None) -> Iterator[RuntimeProtocol]:
+        """RuntimeProtocol de cada documento (o de un idioma), sin releer ni revalidar los YAML."""
+        from .protocol import Protocol
+        pool = pool if pool is not None else StringPool()
+        if language is None:
+            cur = self._conn().execute("SELECT doc FROM protocols ORDER BY rid")
+        else:
+            cur = self._conn().execute("SELECT doc FROM protocols WHERE language = ? ORDER BY rid", (language,))
+        for (doc,) in cur:
+            yield compile_protocol(Protocol.model_validate_json(doc), pool)
+
+    def iter_summaries(self, pool: Optional[StringPool] = None) -> Iterator[ProtocolSummary]:
+        """Nivel residente (core/protocol_tiers.py): sin pydantic ni documentos completos."""
+        pool = pool if pool is not None else StringPool()
+        for (summary,) in self._conn().execute("SELECT summary FROM protocols ORDER BY rid"):
+            yield compile_summary(json.loads(summary), pool)
+
+    def load_body(self, pid: str, pool: Optional[StringPool] = None) -> Optional[RuntimeProtocol]:
+        from .protocol import Protocol
+        row = self._conn().execute("SELECT doc FROM protocols WHERE id = ?", (pid,)).fetchone()
+        return compile_protocol(Protocol.model_validate_json(row[0]), pool) if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        return {
+            "path": str(self.path), "snapshot": self.snapshot, "protocols": len(self),
+            "steps": conn.execute("SELECT count(*) FROM steps").fetchone()[0],
+            "languages": list(self.languages), "bytes": page_size * pages, "mmap_bytes": self.mmap_bytes,
+            "fingerprint": self.meta.get("fingerprint", ""), "built_at": int(self.meta.get("built_at", 0)),
+        }
+
+
+# -----------------------
+# CLI
+# -----------------------
+
+def _build_from_yaml(protocols_dir: Path, out: Path) -> Dict[str, Any]:
+    from .protocol import stream_protocols
+    protocols: Dict[str, RuntimeProtocol] = {}
+    pool = StringPool()
+
+    def _ingest(proto: Any) -> None:
+        rt = compile_protocol(proto, pool)
+        protocols[rt.id] = rt
+
+    _, errors = stream_protocols(protocols_dir, _ingest)
+    meta = build_store(protocols, out, source_fingerprint(protocols_dir))
+    meta["errors"] = errors
+    return meta
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", type=Path, default=PROTOCOL_DB)
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="valida los YAML y publica el registro")
+    b.add_argument("--protocols-dir", type=Path, default=Path(__file__).resolve().parents[1] / "rag" / "protocols")
+    sub.add_parser("info", help="metadatos y tamaño del registro")
+    s = sub.add_parser("search", help="búsqueda léxica (como /search)")
+    s.add_argument("query")
+    s.add_argument("--language", default=DEFAULT_LANGUAGE)
+    args = ap.parse_args(argv)
+
+    if args.command == "build":
+        meta = _build_from_yaml(args.protocols_dir, args.db)
+        print(f"[store] {meta['protocols']} protocolos ({meta['errors']} con errores) -> {args.db} "
+              f"({meta['bytes'] / 1024:.1f} KiB, snapshot {meta['snapshot']}, {meta['seconds']:.2f}s)")
+        return 0
+    if not args.db.exists():
+        print(f"[store] No existe {args.db}; ejecuta primero `build`")
+        return 1
+    store = ProtocolStore(args.db)
+    if args.command == "info":
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+        return 0
+    t0 = time.perf_counter()
+    language = store.language_for(args.language)
+    rows = store.lexical_search(args.query.lower().strip(), language)
+    print(f"[store] {len(rows)} resultados [{language}] en {(time.perf_counter() - t0) * 1000:.2f} ms")
+    for pid, title in rows:
+        print(f"  {pid:<32} {title}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
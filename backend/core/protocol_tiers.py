@@ -0,0 +1,223 @@
+# backend/core/protocol_tiers.py
+"""
+Registro por niveles sobre el fichero SQLite (PROTOCOL_BACKEND=sqlite).
+
+  resumen   ProtocolSummary de todos los protocolos (id, título, categoría,
+            prioridad, metadata, intents, acción inmediata): siempre en
+            memoria; es lo que usan /protocols, el triaje y la búsqueda
+  cuerpo    RuntimeProtocol completo (pasos, notas de seguridad, UI): se
+            lee del fichero la primera vez que se pide y entra en una LRU
+            acotada en bytes (PROTOCOL_BODY_CACHE_BYTES)
+  fijados   cuerpos que nunca se expulsan: por defecto los CRITICAL_PROTOCOLS
+            que la PWA precarga en web/public/sw.js (o PROTOCOL_PINNED=id,id)
+  derivados protocolos parcheados de una región (core/regions.py): misma LRU
+            y mismo presupuesto que los cuerpos
+
+Con la cola larga de protocolos poco usados la memoria residente crece sólo
+con los resúmenes. TieredProtocols es un Mapping id -> RuntimeProtocol, así
+que los motores lo usan como el dict de siempre; items()/values() recorren el
+fichero en streaming sin pasar por la LRU (índices, bundle offline).
+"""
+from __future__ import annotations
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+from .memory import deep_sizeof
+from .metrics import PROTOCOL_BODIES, PROTOCOL_BODY_BYTES
+from .runtime_protocol import ProtocolSummary, RuntimeProtocol, StringPool
+
+BODY_CACHE_BYTES = int(os.getenv("PROTOCOL_BODY_CACHE_BYTES", str(32 * 1024 * 1024)))
+SW_JS = Path(__file__).resolve().parents[2] / "web" / "public" / "sw.js"
+
+_SW_CRITICAL_RE = re.compile(r"CRITICAL_PROTOCOLS\s*=\s*\[(.*?)\]", re.S)
+_SW_PROTOCOL_RE = re.compile(r"/protocol/([\w.-]+)")
+
+
+def pinned_protocols(sw_js: Path = SW_JS) -> Tuple[str, ...]:
+    """PROTOCOL_PINNED (ids separados por comas) o los CRITICAL_PROTOCOLS de sw.js."""
+    env = os.getenv("PROTOCOL_PINNED")
+    if env is not None:
+        return tuple(p.strip() for p in env.split(",") if p.strip())
+    try:
+        m = _SW_CRITICAL_RE.search(sw_js.read_text(encoding="utf-8"))
+    except OSError:
+        return ()
+    return tuple(_SW_PROTOCOL_RE.findall(m.group(1))) if m else ()
+
+
+def _sizeof(body: RuntimeProtocol) -> int:
+    return deep_sizeof(body)["bytes"]
+
+
+class TieredProtocols(Mapping):
+    """Resúmenes residentes + cuerpos bajo demanda (LRU en bytes) + cuerpos fijados."""
+
+    def __init__(self, store: Any, pinned: Iterable[str] = (), max_bytes: int = BODY_CACHE_BYTES):
+        self.store = store
+        self.snapshot = store.snapshot
+        pool = StringPool()
+        self.summaries: Dict[str, ProtocolSummary] = {s.id: s for s in store.iter_summaries(pool)}
+        self.max_bytes = max_bytes
+        # id -> cuerpo; (clave, id) -> derivado de un cuerpo (ver derived)
+        self._lru: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self._lru_bytes = 0
+        self._lock = threading.Lock()
+        self._pinned: Dict[str, RuntimeProtocol] = {}
+        self._pinned_bytes = 0
+        for pid in pinned:
+            body = store.load_body(pid) if pid in self.summaries else None
+            if body is None:
+                print(f"[tiers] Protocolo fijado no encontrado: {pid}")
+                continue
+            self._pinned[pid] = body
+            self._pinned_bytes += _sizeof(body)
+        self.hits = self.misses = self.evictions = 0
+        PROTOCOL_BODY_BYTES.labels("pinned").set(self._pinned_bytes)
+        PROTOCOL_BODY_BYTES.labels("lru").set(0)
+
+    # ---------- Mapping ----------
+    def __getitem__(self, pid: str) -> RuntimeProtocol:
+        body = self._pinned.get(pid)
+        if body is not None:
+            PROTOCOL_BODIES.labels("pinned").inc()
+            return body
+        with self._lock:
+            entry = self._lru.get(pid)
+            if entry is not None:
+                self._lru.move_to_end(pid)
+                self.hits += 1
+                PROTOCOL_BODIES.labels("hit").inc()
+                return entry[0]
+        if pid not in self.summaries:
+            raise KeyError(pid)
+        # Fuera del lock: lectura + compilación (dos hilos pueden cargar el mismo; gana el primero)
+        body = self.store.load_body(pid)
+        if body is None:
+            raise KeyError(pid)
+        self.misses += 1
+        PROTOCOL_BODIES.labels("miss").inc()
+        return self._insert(pid, body)
+
+    def _insert(self, key: Any, value: Any) -> Any:
+        size = _sizeof(value)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                return entry[0]
+            self._lru[key] = (value, size)
+            self._lru_bytes += size
+            # Siempre cabe al menos el último cargado
+            while self._lru_bytes > self.max_bytes and len(self._lru) > 1:
+                _, (_, old) = self._lru.popitem(last=False)
+                self._lru_bytes -= old
+                self.evictions += 1
+                PROTOCOL_BODIES.labels("evicted").inc()
+            PROTOCOL_BODY_BYTES.labels("lru").set(self._lru_bytes)
+        return value
+
+    def derived(self, key: str, pid: str, build: Callable[[RuntimeProtocol], Any]) -> Any:
+        """
+        build(cuerpo) cacheado en la misma LRU en bytes que los cuerpos, bajo
+        (key, pid): el protocolo de una región compite por el presupuesto
+        PROTOCOL_BODY_CACHE_BYTES en vez de sumarse a él.
+        """
+        slot = (key, pid)
+        with self._lock:
+            entry = self._lru.get(slot)
+            if entry is not None:
+                self._lru.move_to_end(slot)
+                self.hits += 1
+                PROTOCOL_BODIES.labels("hit").inc()
+                return entry[0]
+        return self._insert(slot, build(self[pid]))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.summaries)
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def __contains__(self, pid: object) -> bool:
+        return pid in self.summaries
+
+    def _resident(self, pid: str) -> Optional[RuntimeProtocol]:
+        body = self._pinned.get(pid)
+        if body is None:
+            entry = self._lru.get(pid)
+            body = entry[0] if entry is not None else None
+        return body
+
+    def items(self, language: Optional[str] = None) -> Iterator[Tuple[str, RuntimeProtocol]]:  # type: ignore[override]
+        """Cuerpos en orden de carga, leídos en streaming (no entran en la LRU)."""
+        for body in self.store.iter_protocols(language=language):
+            yield body.id, self._resident(body.id) or body
+
+    def values(self) -> Iterator[RuntimeProtocol]:  # type: ignore[override]
+        return (body for _, body in self.items())
+
+    # ---------- Resúmenes ----------
+    def summary(self, pid: str) -> Optional[ProtocolSummary]:
+        return self.summaries.get(pid)
+
+    def subset(self, pids: Iterable[str], language: Optional[str] = None) -> "TieredSubset":
+        return TieredSubset(self, pids, language)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lru = list(self._lru)
+        return {
+            "snapshot": self.snapshot, "protocols": len(self.summaries),
+            "pinned": sorted(self._pinned), "pinned_bytes": self._pinned_bytes,
+            "lru_entries": len(lru), "lru_derived": sum(1 for k in lru if isinstance(k, tuple)),
+            "lru_bytes": self._lru_bytes, "lru_max_bytes": self.max_bytes,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+        }
+
+
+class TieredSubset(Mapping):
+    """Vista de algunos ids (una partición de idioma) que comparte LRU y resúmenes."""
+
+    def __init__(self, parent: TieredProtocols, pids: Iterable[str], language: Optional[str] = None):
+        self.parent = parent
+        self.language = language
+        self.summaries: Dict[str, ProtocolSummary] = {pid: parent.summaries[pid] for pid in pids}
+
+    def __getitem__(self, pid: str) -> RuntimeProtocol:
+        if pid not in self.summaries:
+            raise KeyError(pid)
+        return self.parent[pid]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.summaries)
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def __contains__(self, pid: object) -> bool:
+        return pid in self.summaries
+
+    def items(self) -> Iterator[Tuple[str, RuntimeProtocol]]:  # type: ignore[override]
+        return ((pid, body) for pid, body in self.parent.items(self.language) if pid in self.summaries)
+
+    def values(self) -> Iterator[RuntimeProtocol]:  # type: ignore[override]
+        return (body for _, body in self.items())
+
+    def summary(self, pid: str) -> Optional[ProtocolSummary]:
+        return self.summaries.get(pid)
+
+
+def summaries_of(protocols: Mapping[str, Any]) -> Mapping[str, Any]:
+    """Resúmenes de un registro por niveles; con un dict normal, el propio dict (mismos atributos)."""
+    return getattr(protocols, "summaries", protocols)
+
+
+def by_language(protocols: Mapping[str, Any]) -> Dict[str, Mapping[str, Any]]:
+    """group_by_language sin cargar cuerpos: el idioma viene del resumen."""
+    from .language import group_by_language
+    if not isinstance(protocols, TieredProtocols):
+        return group_by_language(protocols)
+    return {lang: protocols.subset(members, lang) for lang, members in group_by_language(protocols.summaries).items()}
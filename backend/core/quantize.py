@@ -0,0 +1,190 @@
+# backend/core/quantize.py
+"""
+Almacenamiento cuantizado de embeddings con re-puntuación en float32.
+
+  int8 : cuantización escalar simétrica por fila (v ~= scale * codes), 4x menos memoria
+  pq   : product quantization, 1 byte por subvector de VECTOR_PQ_SUBDIM dimensiones
+         (256 centroides por subespacio, k-means en NumPy); 16-32x menos memoria
+
+La primera pasada puntúa todo el índice con los códigos (por bloques, sin
+descomprimir la matriz entera); los RESCORE_FACTOR * top_k mejores candidatos se
+re-puntúan con los vectores float32 originales. Por defecto éstos viven en un
+fichero mapeado en memoria (VECTOR_RESCORE_STORE=mmap): sólo las páginas de los
+candidatos llegan a RAM.
+"""
+from __future__ import annotations
+import os
+import tempfile
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()      # none | int8 | pq
+RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+RESCORE_STORE = os.getenv("VECTOR_RESCORE_STORE", "mmap").lower()    # mmap | memory | off
+PQ_SUBDIM = int(os.getenv("VECTOR_PQ_SUBDIM", "8"))
+PQ_TRAIN_SAMPLE = int(os.getenv("VECTOR_PQ_TRAIN_SAMPLE", "10000"))
+PQ_ITERATIONS = int(os.getenv("VECTOR_PQ_ITERATIONS", "10"))
+STORE_DIR = os.getenv("VECTOR_STORE_DIR") or None
+
+METHODS = ("int8", "pq")
+_BLOCK = 8192  # filas por bloque en la primera pasada (acota la memoria temporal)
+_INT8_BLOCK = 512  # bloque int8 -> float32 que cabe en caché (medido: ~2x más rápido que 8192)
+
+
+class FloatStore:
+    """Vectores float32 originales para re-puntuar candidatos (RAM o fichero mapeado)."""
+
+    def __init__(self, matrix: np.ndarray, mode: str = RESCORE_STORE, directory: Optional[str] = STORE_DIR):
+        self.mode = mode
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if mode == "mmap":
+            fd, path = tempfile.mkstemp(prefix="conrumbo-vectors-", suffix=".f32", dir=directory)
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(matrix.tobytes())
+            self._rows = np.memmap(path, dtype=np.float32, mode="r", shape=matrix.shape)
+            # El mapeo mantiene el fichero vivo; sin nombre no queda basura en disco
+            os.unlink(path)
+        else:
+            self._rows = matrix
+
+    def rows(self, idxs: np.ndarray) -> np.ndarray:
+        """Filas pedidas (mejor en orden creciente: lecturas secuenciales del mapeo)."""
+        return np.asarray(self._rows[idxs], dtype=np.float32)
+
+    @property
+    def resident_bytes(self) -> int:
+        """Bytes siempre en RAM (con mmap, sólo las páginas tocadas y reclamables)."""
+        return 0 if self.mode == "mmap" else int(self._rows.nbytes)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._rows.nbytes)
+
+
+class Int8Codes:
+    def __init__(self, matrix: np.ndarray):
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0.0] = 1.0
+        self.scales = scales.astype(np.float32)
+        self.codes = np.clip(np.rint(matrix / self.scales[:, None]), -127, 127).astype(np.int8)
+
+    def scores(self, q: np.ndarray) -> np.ndarray:
+        out = np.empty(self.codes.shape[0], dtype=np.float32)
+        buf = np.empty((min(_INT8_BLOCK, len(out)), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(out), _INT8_BLOCK):
+            block = self.codes[start:start + _INT8_BLOCK]
+            tmp = buf[:len(block)]
+            np.copyto(tmp, block)
+            out[start:start + len(block)] = tmp @ q
+        return out * self.scales
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+
+def _kmeans(x: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k).astype(np.float32)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Centroides vacíos: se resiembran con puntos al azar
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin ||x - c||^2 = argmin (||c||^2 - 2 x·c)
+    c_norm = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _BLOCK):
+        block = x[start:start + _BLOCK]
+        out[start:start + len(block)] = np.argmin(c_norm[None, :] - 2.0 * (block @ centroids.T), axis=1)
+    return out
+
+
+class PQCodes:
+    def __init__(self, matrix: np.ndarray, subdim: int = PQ_SUBDIM, train_sample: int = PQ_TRAIN_SAMPLE,
+                 iterations: int = PQ_ITERATIONS, seed: int = 0):
+        n, d = matrix.shape
+        self.dim = d
+        self.subdim = max(1, subdim)
+        # Se rellena con ceros hasta un múltiplo de subdim (no cambia el producto punto)
+        self.m = -(-d // self.subdim)
+        padded = self._pad(matrix)
+        rng = np.random.default_rng(seed)
+        train = padded if n <= train_sample else padded[rng.choice(n, size=train_sample, replace=False)]
+        k = min(256, len(train))
+        self.codebooks = np.empty((self.m, k, self.subdim), dtype=np.float32)
+        self.codes = np.empty((n, self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sl = slice(j * self.subdim, (j + 1) * self.subdim)
+            self.codebooks[j] = _kmeans(train[:, sl], k, iterations, rng)
+            self.codes[:, j] = _nearest(padded[:, sl], self.codebooks[j])
+
+    def _pad(self, x: np.ndarray) -> np.ndarray:
+        extra = self.m * self.subdim - x.shape[-1]
+        if extra == 0:
+            return np.asarray(x, dtype=np.float32)
+        return np.pad(np.asarray(x, dtype=np.float32), [(0, 0)] * (x.ndim - 1) + [(0, extra)])
+
+    def scores(self, q: np.ndarray) -> np.ndarray:
+        # Tabla por subespacio: producto del subvector de la consulta con cada centroide
+        lut = np.einsum("mkd,md->mk", self.codebooks, self._pad(q).reshape(self.m, self.subdim))
+        cols = np.arange(self.m)
+        out = np.empty(self.codes.shape[0], dtype=np.float32)
+        for start in range(0, len(out), _BLOCK):
+            block = self.codes[start:start + _BLOCK]
+            out[start:start + len(block)] = lut[cols, block].sum(axis=1)
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.codebooks.nbytes)
+
+
+class QuantizedIndex:
+    """Índice de producto interno sobre códigos int8/PQ con re-puntuación float32 de candidatos."""
+
+    def __init__(self, matrix: np.ndarray, method: str = QUANTIZATION, rescore: str = RESCORE_STORE,
+                 rescore_factor: int = RESCORE_FACTOR, **options: Any):
+        if method not in METHODS:
+            raise ValueError(f"Cuantización desconocida: {method} (usa {', '.join(METHODS)})")
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.method = method
+        self.ntotal, self.dim = matrix.shape
+        self.rescore_factor = max(1, rescore_factor)
+        self.codes: Any = Int8Codes(matrix) if method == "int8" else PQCodes(matrix, **options)
+        self.store: Optional[FloatStore] = None if rescore == "off" else FloatStore(matrix, rescore)
+
+    def search(self, q: np.ndarray, top_k: int, rescore: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """(índices, scores) de los top_k; con re-puntuación los scores son exactos."""
+        q = np.asarray(q, dtype=np.float32).ravel()
+        top_k = min(top_k, self.ntotal)
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        approx = self.codes.scores(q)
+        use_store = rescore and self.store is not None
+        n_cand = min(self.ntotal, top_k * self.rescore_factor) if use_store else top_k
+        cand = np.argpartition(-approx, n_cand - 1)[:n_cand] if n_cand < self.ntotal else np.arange(self.ntotal)
+        if use_store:
+            cand = np.sort(cand)
+            scores = self.store.rows(cand) @ q
+        else:
+            scores = approx[cand]
+        order = np.argsort(-scores)[:top_k]
+        return cand[order], scores[order]
+
+    def memory(self) -> Dict[str, int]:
+        return {
+            "float32_bytes": self.ntotal * self.dim * 4,
+            "codes_bytes": self.codes.nbytes,
+            "rescore_resident_bytes": self.store.resident_bytes if self.store else 0,
+            "rescore_mapped_bytes": self.store.nbytes if self.store and self.store.mode == "mmap" else 0,
+        }
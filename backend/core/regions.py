@@ -0,0 +1,352 @@
+# backend/core/regions.py
+"""
+Overlays por región/tenant sobre el corpus base.
+
+Un overlay (rag/regions/<region>.yaml) sólo declara lo que cambia:
+
+    region: mx
+    emergency_number: "911"
+    replace: {"112": "911"}            # sustituciones literales en todos los textos
+    safety:                            # textos de SafetyGuardrails ({emergency_number})
+      general_safety: "..."
+    protocols:
+      pa_rcp_adulto_v1:
+        emergency_action: "..."
+        immediate_action: "..."
+        medical_disclaimer: "..."
+        steps:
+          3: {instruction: "...", voice_cue: "..."}
+
+La vista de una región comparte con el base todo lo que no toca: cada
+protocolo se parchea la primera vez que se pide (RegionProtocols) y se guarda
+en una LRU acotada (REGION_CACHE_SIZE, o la LRU en bytes de los cuerpos con
+PROTOCOL_BACKEND=sqlite); los que no cambian son los mismos
+objetos del base y un protocolo parcheado sólo rehace los pasos afectados
+(RuntimeProtocol.replace). Crear una vista no recorre el corpus. Los índices
+del motor (léxico de intents, trigramas, vectores) son los del base: la
+búsqueda léxica sólo re-evalúa los candidatos; los vectores se comparten
+(cambiar un teléfono o matizar una instrucción no cambia qué protocolo es
+relevante).
+"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import yaml
+
+from .runtime_protocol import RuntimeProtocol, StringPool, step_payloads
+from .safety import SafetyGuardrails
+
+REGIONS_DIR = Path(os.getenv("CONRUMBO_REGIONS_DIR", str(Path(__file__).resolve().parents[1] / "rag" / "regions")))
+# Región por defecto de las peticiones que no indican ninguna ("" = corpus base)
+DEFAULT_REGION = os.getenv("CONRUMBO_REGION", "")
+# Protocolos parcheados que guarda cada vista (LRU); el resto se parchea al pedirlo
+REGION_CACHE_SIZE = int(os.getenv("REGION_CACHE_SIZE", "256"))
+BASE_EMERGENCY_NUMBER = "112"
+
+_STEP_FIELDS = ("instruction", "action", "voice_cue")
+_PROTOCOL_FIELDS = ("title", "emergency_action", "immediate_action", "medical_disclaimer", "steps")
+
+
+class RegionOverlay:
+    """Contenido de un fichero de overlay (validado al leerlo)."""
+
+    def __init__(self, doc: Dict[str, Any], source: str = ""):
+        self.region = str(doc.get("region") or Path(source).stem).lower()
+        self.name = doc.get("name") or self.region
+        self.emergency_number = str(doc.get("emergency_number") or BASE_EMERGENCY_NUMBER)
+        self.replace: Tuple[Tuple[str, str], ...] = tuple((str(k), str(v)) for k, v in (doc.get("replace") or {}).items())
+        self.safety: Dict[str, str] = {str(k): str(v) for k, v in (doc.get("safety") or {}).items()}
+        self.patches: Dict[str, Dict[str, Any]] = {}
+        for pid, patch in (doc.get("protocols") or {}).items():
+            unknown = set(patch or {}) - set(_PROTOCOL_FIELDS)
+            if unknown:
+                raise ValueError(f"{source}: {pid}: campos no soportados en overlay: {sorted(unknown)}")
+            steps = {}
+            for sid, fields in ((patch or {}).get("steps") or {}).items():
+                bad = set(fields or {}) - set(_STEP_FIELDS)
+                if bad:
+                    raise ValueError(f"{source}: {pid} paso {sid}: campos no soportados: {sorted(bad)}")
+                steps[int(sid)] = dict(fields)
+            self.patches[str(pid)] = {**(patch or {}), "steps": steps}
+
+    @classmethod
+    def from_file(cls, path: Path) -> "RegionOverlay":
+        return cls(yaml.safe_load(path.read_text(encoding="utf-8")) or {}, str(path))
+
+
+class RegionView:
+    """Corpus base + overlay con estructura compartida; cada protocolo se parchea al pedirlo."""
+
+    def __init__(self, base: Mapping[str, Any], overlay: Optional[RegionOverlay] = None,
+                 base_steps: Optional[Mapping[str, Any]] = None, cache_size: int = REGION_CACHE_SIZE):
+        self.overlay = overlay
+        self.region = overlay.region if overlay else ""
+        self.emergency_number = overlay.emergency_number if overlay else BASE_EMERGENCY_NUMBER
+        self.safety = SafetyGuardrails(self.emergency_number, overlay.safety if overlay else None)
+        self._base = base
+        self._base_steps = base_steps or {}
+        # pid -> (protocolo de la región, pasos renderizados o None si no cambia nada)
+        self._cache: "OrderedDict[str, Tuple[Any, Any]]" = OrderedDict()
+        self.cache_size = max(1, cache_size)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if overlay is not None:
+            missing = [pid for pid in overlay.patches if pid not in base]
+            if missing:
+                print(f"[regions] {self.region}: protocolos del overlay que no existen en el base: {sorted(missing)}")
+        # Sin copia del registro: los no parcheados son los objetos del base
+        self.protocols: Mapping[str, Any] = RegionProtocols(self) if overlay is not None else base
+
+    # ---------- Texto ----------
+    def localize(self, text: Optional[str]) -> Optional[str]:
+        """Aplica las sustituciones del overlay (p. ej. 112 -> 911) a un texto cualquiera."""
+        if not text or self.overlay is None:
+            return text
+        for old, new in self.overlay.replace:
+            text = text.replace(old, new)
+        return text
+
+    def _text(self, value: Optional[str], pool: StringPool) -> Optional[str]:
+        out = self.localize(value)
+        # Sin cambios: la misma cadena del base (compartida)
+        return value if out == value else pool.s(out)
+
+    def _texts(self, values: Optional[Tuple[str, ...]], pool: StringPool) -> Optional[Tuple[str, ...]]:
+        if values is None:
+            return None
+        out = tuple(self._text(v, pool) for v in values)
+        return values if all(a is b for a, b in zip(out, values)) else pool.obj(out)
+
+    def _patch(self, p: RuntimeProtocol, patch: Dict[str, Any], pool: StringPool) -> RuntimeProtocol:
+        """El protocolo con el overlay aplicado; el mismo objeto si no cambia nada."""
+        step_patches: Dict[int, Dict[str, Any]] = patch.get("steps") or {}
+        steps: List[Any] = []
+        for step in p.steps:
+            fields = step_patches.get(step.id, {})
+            changes = {}
+            for name in _STEP_FIELDS:
+                value = pool.s(fields[name]) if name in fields else self._text(getattr(step, name), pool)
+                if value is not getattr(step, name):
+                    changes[name] = value
+            for name in ("safety_notes", "exit_conditions"):
+                values = self._texts(getattr(step, name), pool)
+                if values is not getattr(step, name):
+                    changes[name] = values
+            steps.append(step.replace(**changes))
+
+        changes: Dict[str, Any] = {}
+        if any(a is not b for a, b in zip(steps, p.steps)):
+            changes["steps"] = tuple(steps)
+        for name in ("title", "emergency_action"):
+            value = pool.s(patch[name]) if name in patch else self._text(getattr(p, name), pool)
+            if value is not getattr(p, name):
+                changes[name] = value
+        for name in ("safety_alerts", "voice_cues"):
+            value = self._texts(getattr(p, name), pool)
+            if value is not getattr(p, name):
+                changes[name] = value
+        if p.triage is not None:
+            action = (pool.s(patch["immediate_action"]) if "immediate_action" in patch
+                      else self._text(p.triage.immediate_action, pool))
+            if action is not p.triage.immediate_action:
+                changes["triage"] = p.triage.replace(immediate_action=action)
+        disclaimer = (pool.s(patch["medical_disclaimer"]) if "medical_disclaimer" in patch
+                      else self._text(p.metadata.medical_disclaimer, pool))
+        if disclaimer is not p.metadata.medical_disclaimer:
+            changes["metadata"] = p.metadata.replace(medical_disclaimer=disclaimer)
+        return p.replace(**changes)
+
+    def _build(self, proto: Any) -> Tuple[Any, Any]:
+        if self.overlay is None or not isinstance(proto, RuntimeProtocol):
+            return proto, None
+        # Pool por protocolo: lo que se comparte es lo que no cambia (las cadenas del base)
+        new = self._patch(proto, self.overlay.patches.get(proto.id) or {}, StringPool())
+        if new is proto:
+            return proto, None
+        return new, (step_payloads(new), new.ui.to_dict() if new.ui else {}, list(new.voice_cues or []))
+
+    def _build_tiered(self, proto: Any) -> Optional[Tuple[Any, Any]]:
+        entry = self._build(proto)
+        return entry if entry[1] is not None else None
+
+    def _entry(self, pid: str) -> Tuple[Any, Any]:
+        derived = getattr(self._base, "derived", None)
+        if derived is not None:
+            # Registro por niveles: el parche vive en su LRU en bytes junto a los cuerpos;
+            # sin cambios no se guarda copia, el cuerpo ya está ahí
+            entry = derived(self.region, pid, self._build_tiered)
+            return entry if entry is not None else (self._base[pid], None)
+        with self._lock:
+            entry = self._cache.get(pid)
+            if entry is not None:
+                self._cache.move_to_end(pid)
+                self.hits += 1
+                return entry
+        # Fuera del lock: dos hilos pueden parchear el mismo; gana el primero
+        entry = self._build(self._base[pid])
+        with self._lock:
+            self.misses += 1
+            self._cache.setdefault(pid, entry)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return self._cache.get(pid, entry)
+
+    def protocol(self, pid: str) -> Any:
+        return self._entry(pid)[0]
+
+    def localize_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Copia de un resultado de triaje con la acción inmediata y los avisos de la región."""
+        if self.overlay is None:
+            return result
+        out = dict(result)
+        patch = self.overlay.patches.get(out.get("protocol_id") or "") or {}
+        if "immediate_action" in patch and out.get("immediate_action"):
+            out["immediate_action"] = patch["immediate_action"]
+        for key in ("immediate_action", "escalation_message", "message"):
+            if isinstance(out.get(key), str):
+                out[key] = self.localize(out[key])
+        return out
+
+    def title(self, pid: str, title: Optional[str]) -> Optional[str]:
+        """Título en la región sin parchear el protocolo (listados)."""
+        if self.overlay is None:
+            return title
+        patch = self.overlay.patches.get(pid) or {}
+        return patch["title"] if "title" in patch else self.localize(title)
+
+    def base_query(self, query_lower: str) -> str:
+        """La consulta con las sustituciones deshechas (911 -> 112): lo que hay que buscar en el índice base."""
+        if self.overlay is None:
+            return query_lower
+        for old, new in self.overlay.replace:
+            query_lower = query_lower.replace(new.lower(), old.lower())
+        return query_lower
+
+    # ---------- Acceso ----------
+    def steps_and_meta(self, pid: str) -> Any:
+        if self.overlay is None or pid not in self._base:
+            return self._base_steps.get(pid)
+        return self._entry(pid)[1] or self._base_steps.get(pid)
+
+    def lexical_filter(self, pids: List[str], query_lower: str, language: str,
+                       extra: Iterable[str] = ()) -> List[str]:
+        """
+        Resultados léxicos del índice base corregidos con el texto de la región.
+        `pids` son los aciertos de la consulta en el base; `extra`, candidatos
+        que sólo pueden acertar con el texto de la región (los de base_query).
+        Sólo se parchean los candidatos, no el corpus.
+        """
+        if self.overlay is None:
+            return pids
+        from .language import protocol_language
+        from .protocol_tiers import summaries_of
+        from .shards import lexical_text
+        summaries = summaries_of(self._base)
+        hits = set(pids)
+        out = []
+        for pid in dict.fromkeys([*pids, *extra, *self.overlay.patches]):
+            if pid not in hits and (pid not in summaries or protocol_language(summaries[pid]) != language):
+                continue
+            proto, steps = self._entry(pid)
+            if (query_lower in lexical_text(proto)) if steps is not None else (pid in hits):
+                out.append(pid)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._cache.values())
+        return {"region": self.region or "base", "emergency_number": self.emergency_number,
+                "overlay_protocols": len(self.overlay.patches) if self.overlay else 0,
+                "cached_protocols": len(entries), "cache_size": self.cache_size,
+                "patched_protocols": sum(1 for _, steps in entries if steps is not None),
+                "hits": self.hits, "misses": self.misses}
+
+
+class RegionProtocols(Mapping):
+    """Mapping id -> protocolo de la región: parchea al acceder (caché acotada de la vista)."""
+
+    def __init__(self, view: RegionView):
+        self.view = view
+        self.base = view._base
+
+    def __getitem__(self, pid: str) -> Any:
+        return self.view.protocol(pid)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.base)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def __contains__(self, pid: object) -> bool:
+        return pid in self.base
+
+    def items(self) -> Iterator[Tuple[str, Any]]:  # type: ignore[override]
+        """Recorrido completo (bundle offline): parchea en streaming sin llenar la caché."""
+        for pid, proto in self.base.items():
+            yield pid, self.view._build(proto)[0]
+
+    def values(self) -> Iterator[Any]:  # type: ignore[override]
+        return (proto for _, proto in self.items())
+
+
+class RegionRegistry:
+    """Overlays disponibles y vistas por región (se rehacen si cambia el registro base)."""
+
+    def __init__(self, directory: Path = REGIONS_DIR):
+        self.directory = directory
+        self._overlays: Optional[Dict[str, RegionOverlay]] = None
+        self._views: Dict[str, Tuple[int, RegionView]] = {}
+        # Sube con cada recarga de overlays (versión para cachés de respuestas)
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def overlays(self) -> Dict[str, RegionOverlay]:
+        if self._overlays is None:
+            found: Dict[str, RegionOverlay] = {}
+            for path in sorted(self.directory.glob("*.yaml")) if self.directory.exists() else ():
+                try:
+                    ov = RegionOverlay.from_file(path)
+                    found[ov.region] = ov
+                except Exception as e:
+                    print(f"[regions] Error en {path.name}: {e}")
+            self._overlays = found
+        return self._overlays
+
+    def reload(self) -> None:
+        with self._lock:
+            self._overlays = None
+            self._views.clear()
+            self.generation += 1
+        self.overlays()
+
+    def warm(self, base: Mapping[str, Any], base_steps: Optional[Mapping[str, Any]] = None) -> None:
+        """Lee los overlays y crea las vistas de todas las regiones (fuera del bucle de eventos)."""
+        for region in self.overlays():
+            self.view(region, base, base_steps)
+
+    def view(self, region: Optional[str], base: Mapping[str, Any],
+             base_steps: Optional[Mapping[str, Any]] = None) -> RegionView:
+        key = (region or DEFAULT_REGION or "").lower()
+        overlay = self.overlays().get(key) if key else None
+        key = overlay.region if overlay else ""
+        cached = self._views.get(key)
+        if cached is not None and cached[0] == id(base):
+            return cached[1]
+        with self._lock:
+            cached = self._views.get(key)
+            if cached is None or cached[0] != id(base):
+                cached = (id(base), RegionView(base, overlay, base_steps))
+                self._views[key] = cached
+        return cached[1]
+
+
+def resolve_region(context: Optional[Dict[str, Any]] = None, header: Optional[str] = None) -> str:
+    """Región de la petición: context.region -> cabecera X-Region -> CONRUMBO_REGION."""
+    if context and context.get("region"):
+        return str(context["region"]).strip().lower()
+    return (header or DEFAULT_REGION or "").strip().lower()
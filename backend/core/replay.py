@@ -0,0 +1,252 @@
+# backend/core/replay.py
+"""
+Reproducción determinista del tráfico capturado (core/capture.py).
+
+Las peticiones se envían en el orden de captura con sus cuerpos y cabeceras
+(ya anonimizados), contra la app en proceso (httpx.ASGITransport, motores
+calentados antes de empezar) o contra un servidor local:
+  --speed 1    ritmo original (los huecos entre peticiones se respetan)
+  --speed 4    4 veces más rápido
+  --speed 0    velocidad máxima (con --concurrency peticiones a la vez)
+
+El resultado (latencia y estado por petición + resumen por ruta) se guarda
+con --out; `compare` muestra la diferencia de latencias entre dos builds.
+
+Uso (desde backend/):
+    python -m core.replay run --out base.json
+    python -m core.replay run --target http://127.0.0.1:8000 --speed 1 --out base.json
+    python -m core.replay run --speed 0 --concurrency 16 --label rama-x --out nuevo.json
+    python -m core.replay compare base.json nuevo.json
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import gzip
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .capture import CAPTURE_DIR
+from .journal import GZIP_SUFFIX, OPEN_SUFFIX, SEGMENT_SUFFIX
+
+# Segmentos de ruta variables -> plantilla (para agrupar por ruta como /metrics)
+_ROUTE_PATTERNS = (
+    (re.compile(r"/protocol/[^/]+$"), "/protocol/{protocol_id}"),
+    (re.compile(r"/offline/(?!manifest$)[^/]+$"), "/offline/{filename}"),
+    (re.compile(r"/triage/stream/[^/]+$"), "/triage/stream/{session_id}"),
+)
+
+
+class Record:
+    """Una petición capturada."""
+
+    __slots__ = ("ts", "method", "path", "query", "body", "status", "latency_ms", "headers")
+
+    def __init__(self, ts: float, method: str, path: str, query: str, body: Optional[str], status: int,
+                 latency_ms: float, headers: Dict[str, str]):
+        self.ts, self.method, self.path, self.query, self.body = ts, method, path, query, body
+        self.status, self.latency_ms, self.headers = status, latency_ms, headers
+
+    @property
+    def route(self) -> str:
+        path = self.path
+        for pattern, template in _ROUTE_PATTERNS:
+            path = pattern.sub(template, path)
+        return f"{self.method} {path}"
+
+
+def load_records(directory: Path = CAPTURE_DIR, include_open: bool = False, limit: Optional[int] = None) -> List[Record]:
+    """Registros de todos los segmentos ordenados por marca de tiempo (orden estable)."""
+    paths = sorted(directory.glob(f"*{GZIP_SUFFIX}")) + sorted(directory.glob(f"*{SEGMENT_SUFFIX}"))
+    if include_open:
+        paths += sorted(directory.glob(f"*{OPEN_SUFFIX}"))
+    records: List[Record] = []
+    for path in paths:
+        opener = gzip.open if path.name.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    records.append(Record(*json.loads(line)))
+                except (ValueError, TypeError):
+                    continue  # línea truncada del segmento abierto
+    records.sort(key=lambda r: r.ts)
+    return records[:limit] if limit else records
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def summarize(results: List[List[Any]]) -> Dict[str, Dict[str, Any]]:
+    """Por ruta: n, media/p50/p90/p99 (ms), errores (5xx o fallo) y estados distintos de la captura."""
+    by_route: Dict[str, List[List[Any]]] = {}
+    for row in results:
+        by_route.setdefault(row[1], []).append(row)
+    out: Dict[str, Dict[str, Any]] = {}
+    for route, rows in sorted(by_route.items()):
+        lat = sorted(r[3] for r in rows)
+        out[route] = {
+            "n": len(rows), "mean_ms": round(sum(lat) / len(lat), 3),
+            "p50_ms": round(_percentile(lat, 50), 3), "p90_ms": round(_percentile(lat, 90), 3),
+            "p99_ms": round(_percentile(lat, 99), 3),
+            "errors": sum(1 for r in rows if r[2] >= 500 or r[2] == 0),
+            "status_mismatch": sum(1 for r in rows if r[2] != r[4]),
+        }
+    return out
+
+
+def _in_process_client(journal: bool):
+    # Sin captura (no se recaptura lo reproducido) y, salvo --journal, sin
+    # diario (no ensucia las métricas de sesión)
+    import httpx
+    import main
+    from . import conrumbo
+    from .capture import CAPTURE
+    from .journal import JOURNAL
+    CAPTURE.enabled = False
+    JOURNAL.enabled = JOURNAL.enabled and journal
+    conrumbo.load_protocols()
+    conrumbo._warm_up()
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://replay", timeout=60)
+
+
+async def replay(records: List[Record], client: Any, speed: float = 0.0, concurrency: int = 1) -> List[List[Any]]:
+    """Envía los registros; devuelve [índice, ruta, estado, latencia ms, estado capturado] por petición."""
+    results: List[Optional[List[Any]]] = [None] * len(records)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def send(i: int, rec: Record) -> None:
+        async with sem:
+            url = rec.path + (f"?{rec.query}" if rec.query else "")
+            headers = dict(rec.headers or {})
+            if rec.body is not None:
+                headers["content-type"] = "application/json"
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(rec.method, url, content=rec.body.encode("utf-8") if rec.body else None,
+                                         headers=headers)
+                status = r.status_code
+            except Exception:
+                status = 0
+            results[i] = [i, rec.route, status, round((time.perf_counter() - t0) * 1000.0, 3), rec.status]
+            # En proceso no hay red: cede el bucle entre peticiones
+            await asyncio.sleep(0)
+
+    if not records:
+        return []
+    tasks = []
+    start = time.perf_counter()
+    first_ts = records[0].ts
+    for i, rec in enumerate(records):
+        if speed > 0:
+            delay = (rec.ts - first_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(i, rec)))
+        if speed <= 0 and concurrency <= 1:
+            await tasks[-1]  # secuencial: orden y estado deterministas
+    await asyncio.gather(*tasks)
+    return [r for r in results if r is not None]
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Diferencias de latencia por ruta (nuevo - base), en ms y en %."""
+    rows: List[Dict[str, Any]] = []
+    for route in sorted(set(base["summary"]) | set(new["summary"])):
+        a, b = base["summary"].get(route), new["summary"].get(route)
+        if not a or not b:
+            rows.append({"route": route, "only_in": "base" if a else "new"})
+            continue
+        row: Dict[str, Any] = {"route": route, "n": (a["n"], b["n"])}
+        for key in ("mean_ms", "p50_ms", "p90_ms", "p99_ms"):
+            delta = b[key] - a[key]
+            row[key] = (a[key], b[key], round(delta, 3), round(100.0 * delta / a[key], 1) if a[key] else None)
+        row["errors"] = (a["errors"], b["errors"])
+        rows.append(row)
+    return rows
+
+
+def _run(args: argparse.Namespace) -> int:
+    records = load_records(args.dir, args.include_open, args.limit)
+    if not records:
+        print(f"[replay] Sin registros en {args.dir}")
+        return 1
+    if args.target == "inproc":
+        client = _in_process_client(args.journal)
+    else:
+        import httpx
+        client = httpx.AsyncClient(base_url=args.target, timeout=60,
+                                   limits=httpx.Limits(max_connections=max(1, args.concurrency)))
+
+    async def go() -> List[List[Any]]:
+        async with client:
+            return await replay(records, client, args.speed, args.concurrency)
+
+    t0 = time.perf_counter()
+    results = asyncio.run(go())
+    wall = time.perf_counter() - t0
+    summary = summarize(results)
+    report = {
+        "meta": {"label": args.label, "target": args.target, "speed": args.speed, "concurrency": args.concurrency,
+                 "records": len(records), "span_s": round(records[-1].ts - records[0].ts, 3),
+                 "wall_s": round(wall, 3)},
+        "summary": summary, "results": results,
+    }
+    if args.out:
+        args.out.write_text(json.dumps(report, ensure_ascii=False), encoding="utf-8")
+    print(f"[replay] {len(results)} peticiones en {wall:.2f}s ({args.target}, velocidad={args.speed or 'máx'})")
+    for route, s in summary.items():
+        print(f"  {route:<40} n={s['n']:<6} p50={s['p50_ms']:8.2f} p90={s['p90_ms']:8.2f} "
+              f"p99={s['p99_ms']:8.2f} ms  errores={s['errors']} estado≠={s['status_mismatch']}")
+    return 0
+
+
+def _compare(args: argparse.Namespace) -> int:
+    base = json.loads(args.base.read_text(encoding="utf-8"))
+    new = json.loads(args.new.read_text(encoding="utf-8"))
+    rows = compare(base, new)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return 0
+    print(f"[replay] {base['meta'].get('label') or args.base.name} -> {new['meta'].get('label') or args.new.name}")
+    for row in rows:
+        if "only_in" in row:
+            print(f"  {row['route']:<40} sólo en {row['only_in']}")
+            continue
+        cells = []
+        for key in ("p50_ms", "p90_ms", "p99_ms"):
+            a, b, delta, pct = row[key]
+            cells.append(f"{key[:-3]} {a:7.2f}->{b:7.2f} ({delta:+.2f} ms{'' if pct is None else f', {pct:+.1f}%'})")
+        print(f"  {row['route']:<40} " + "  ".join(cells))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run", help="reproduce la captura")
+    r.add_argument("--dir", type=Path, default=CAPTURE_DIR)
+    r.add_argument("--include-open", action="store_true", help="incluir el segmento activo")
+    r.add_argument("--target", default="inproc", help="'inproc' o URL base (http://127.0.0.1:8000)")
+    r.add_argument("--speed", type=float, default=0.0, help="1 = ritmo original, N = N veces más rápido, 0 = máximo")
+    r.add_argument("--concurrency", type=int, default=1, help="peticiones simultáneas máximas")
+    r.add_argument("--limit", type=int, help="sólo los primeros N registros")
+    r.add_argument("--label", default="", help="nombre del build (para compare)")
+    r.add_argument("--journal", action="store_true", help="no desactivar el diario de sesión en proceso")
+    r.add_argument("--out", type=Path)
+    c = sub.add_parser("compare", help="diferencias de latencia entre dos resultados")
+    c.add_argument("base", type=Path)
+    c.add_argument("new", type=Path)
+    c.add_argument("--json", action="store_true")
+    args = ap.parse_args(argv)
+    return _run(args) if args.command == "run" else _compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# backend/core/resilience.py
+from __future__ import annotations
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito está abierto: no se intenta la llamada al backend."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Se agotó el presupuesto de latencia de la petición."""
+
+
+class ExecutorSaturated(RuntimeError):
+    """El ejecutor acotado no admite más trabajo pendiente."""
+
+
+# -----------------------
+# Presupuesto de latencia
+# -----------------------
+
+class Deadline:
+    """Presupuesto de latencia absoluto (reloj monótono) que se reparte entre etapas."""
+
+    __slots__ = ("budget", "expires_at", "started_at")
+
+    def __init__(self, budget_seconds: float):
+        self.budget = max(0.0, float(budget_seconds))
+        self.started_at = time.perf_counter()
+        self.expires_at = self.started_at + self.budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.perf_counter())
+
+    def expired(self) -> bool:
+        return time.perf_counter() >= self.expires_at
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+# -----------------------
+# Circuit breaker
+# -----------------------
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico: closed -> open (tras N fallos seguidos) -> half_open
+    (tras reset_timeout, deja pasar una sonda) -> closed si la sonda funciona.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 on_state_change: Optional[Callable[[str, str], None]] = None):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.on_state_change = on_state_change
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            if self.on_state_change:
+                self.on_state_change(self.name, state)
+
+    @property
+    def is_open(self) -> bool:
+        """Consulta barata (no consume la sonda de half_open)."""
+        if self.state == "closed":
+            return False
+        if self.state == "open":
+            return (time.monotonic() - self.opened_at) < self.reset_timeout
+        return self._probe_in_flight
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if (time.monotonic() - self.opened_at) < self.reset_timeout:
+                    return False
+                self._transition("half_open")
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._transition("closed")
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition("open")
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"Circuito '{self.name}' abierto")
+        try:
+            out = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return out
+
+
+# -----------------------
+# Ejecutor acotado
+# -----------------------
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor con límite de trabajo pendiente: si está lleno se rechaza
+    al instante (ExecutorSaturated) en vez de encolar sin fin.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, name: str = "conrumbo"):
+        self.max_pending = max(1, int(max_pending))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix=name)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _fut) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """Ejecuta fn en el pool con timeout; al expirar cancela lo que aún no haya empezado."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ExecutorSaturated("Ejecutor saturado")
+            self._pending += 1
+        # Con el contexto de la petición: timing.record() (Server-Timing) sigue viendo su colector
+        cfut = self._pool.submit(contextvars.copy_context().run, fn, *args)
+        cfut.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cfut), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Un hilo en marcha no se puede interrumpir: su resultado se descarta
+            cfut.cancel()
+            raise DeadlineExceeded("Presupuesto de latencia agotado")
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
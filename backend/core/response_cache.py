@@ -0,0 +1,131 @@
+# backend/core/response_cache.py
+"""
+Caché de respuestas ya serializadas (bytes JSON listos para enviar).
+
+Quien llama construye la clave (en /search: consulta normalizada, idioma,
+región y top_k) y pasa la versión del registro: el snapshot del fichero
+SQLite o la generación de la carga en memoria, más la de los overlays de
+región. Cuando una recarga publica una versión nueva, la primera petición
+que la ve descarta en bloque las entradas anteriores; no hace falta
+invalidar a mano. Las escrituras de peticiones que empezaron con la versión
+anterior se ignoran.
+
+Límites (LRU; se expulsa primero la menos usada):
+  SEARCH_CACHE_MAX_BYTES     bytes de cuerpos retenidos (0 desactiva la caché)
+  SEARCH_CACHE_MAX_ENTRIES   número de entradas
+  SEARCH_CACHE_MAX_AGE_S     edad máxima de una entrada (0 = sin límite)
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from .metrics import RESPONSE_CACHE
+
+MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2048"))
+MAX_AGE_S = float(os.getenv("SEARCH_CACHE_MAX_AGE_S", "300"))
+
+
+class ResponseCache:
+    """LRU de cuerpos serializados acotada en bytes, entradas y edad, ligada a una versión del registro."""
+
+    __slots__ = ("name", "max_bytes", "max_entries", "max_age_s", "snapshot", "_entries", "_bytes", "_lock",
+                 "hits", "misses", "evictions", "expirations", "invalidations", "_counters")
+
+    def __init__(self, name: str, max_bytes: int = MAX_BYTES, max_entries: int = MAX_ENTRIES,
+                 max_age_s: float = MAX_AGE_S):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_age_s = max_age_s
+        self.snapshot: Optional[str] = None
+        # clave -> (cuerpo, instante de inserción)
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        self._counters = {r: RESPONSE_CACHE.labels(name, r)
+                          for r in ("hit", "miss", "evicted", "expired", "invalidated")}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.max_entries > 0
+
+    def get(self, snapshot: str, key: Hashable) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            if snapshot != self.snapshot:
+                self._invalidate(snapshot)
+            entry = self._entries.get(key)
+            if entry is not None and self.max_age_s > 0 and time.monotonic() - entry[1] > self.max_age_s:
+                self._drop(key)
+                self.expirations += 1
+                self._counters["expired"].inc()
+                entry = None
+            if entry is None:
+                self.misses += 1
+                self._counters["miss"].inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        self._counters["hit"].inc()
+        return entry[0]
+
+    def put(self, snapshot: str, key: Hashable, body: bytes) -> bool:
+        """Guarda el cuerpo si la versión sigue vigente y cabe; True si quedó en caché."""
+        if not self.enabled or len(body) > self.max_bytes:
+            return False
+        with self._lock:
+            if snapshot != self.snapshot:
+                # Petición empezada antes de la recarga: su resultado ya no vale
+                return False
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (body, time.monotonic())
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+                self.evictions += 1
+                self._counters["evicted"].inc()
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidate(None)
+
+    def _drop(self, key: Hashable) -> None:
+        body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def _invalidate(self, snapshot: Optional[str]) -> None:
+        if self._entries:
+            self.invalidations += len(self._entries)
+            self._counters["invalidated"].inc(len(self._entries))
+        self._entries.clear()
+        self._bytes = 0
+        self.snapshot = snapshot
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "snapshot": self.snapshot, "entries": len(self._entries), "bytes": self._bytes,
+            "max_bytes": self.max_bytes, "max_entries": self.max_entries, "max_age_s": self.max_age_s,
+            "hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hit_ratio, 4),
+            "evictions": self.evictions, "expirations": self.expirations, "invalidations": self.invalidations,
+        }
@@ -0,0 +1,337 @@
+# backend/core/runtime_protocol.py
+"""
+Representación de protocolos en tiempo de ejecución.
+
+Pydantic (core/protocol.py) sólo se usa para validar al cargar; después cada
+Protocol se compila a objetos inmutables con __slots__:
+  - cadenas internadas en un StringPool (textos repetidos entre protocolos
+    comparten un único objeto),
+  - UIs y listas idénticas deduplicadas,
+  - enums (category, priority, target_audience, edad) como enteros,
+  - grafo de pasos precompilado (core/step_graph.py) en `graph`.
+Los nombres de atributo coinciden con los del modelo pydantic para que el
+código existente (getattr(p, "steps"), p.triage.immediate_action, ...) siga valiendo.
+"""
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .protocol import Protocol
+
+# ---------- Enums codificados (orden = código; 0 = desconocido) ----------
+CATEGORIES: Tuple[str, ...] = (
+    "",
+    "parada_cardiorespiratoria", "obstruccion_via_aerea", "traumatismo_hemorragico", "traumatismo_termico",
+    "traumatismo_craneal", "intoxicacion", "shock_anafilactico", "crisis_convulsiva",
+    "emergencia_diabetica", "emergencia_cardiaca",
+)
+PRIORITIES: Tuple[str, ...] = ("", "critico", "urgente", "menos_urgente", "no_urgente")
+AUDIENCES: Tuple[str, ...] = ("", "adulto", "pediatrico", "neonatal", "todas_edades")
+EDADES: Tuple[str, ...] = ("", "adulto", "nino", "lactante")
+
+_CATEGORY_CODE = {v: i for i, v in enumerate(CATEGORIES)}
+_PRIORITY_CODE = {v: i for i, v in enumerate(PRIORITIES)}
+_AUDIENCE_CODE = {v: i for i, v in enumerate(AUDIENCES)}
+_EDAD_CODE = {v: i for i, v in enumerate(EDADES)}
+_EDAD_CODE.update({"niño": 2, "pediatrico": 2, "neonatal": 3, "bebé": 3, "bebe": 3})
+
+
+def _code(table: Dict[str, int], value: Optional[str]) -> int:
+    return table.get((value or "").strip().lower(), 0)
+
+
+class StringPool:
+    """Deduplica cadenas y tuplas: la misma instrucción en 100 protocolos ocupa memoria una vez."""
+
+    def __init__(self):
+        self._strings: Dict[str, str] = {}
+        self._objects: Dict[Any, Any] = {}
+
+    def s(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        return self._strings.setdefault(value, value)
+
+    def strs(self, values: Optional[Iterable[str]]) -> Tuple[str, ...]:
+        if not values:
+            return ()
+        return self.obj(tuple(self.s(v) for v in values if v is not None))
+
+    def obj(self, value: Any) -> Any:
+        """Dedup de objetos inmutables hashables (tuplas, UIs, ...)."""
+        return self._objects.setdefault(value, value)
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+
+# ---------- Base inmutable ----------
+class _Frozen:
+    __slots__ = ()
+
+    def __init__(self, *values: Any):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} es inmutable")
+
+    def replace(self, **changes: Any) -> Any:
+        """Copia con algunos campos cambiados; el resto se comparte (mismos objetos)."""
+        if not changes:
+            return self
+        return type(self)(*(changes[n] if n in changes else getattr(self, n) for n in self.__slots__))
+
+    def _key(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, n) for n in self.__slots__)
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash((type(self).__name__,) + self._key())
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{n}={getattr(self, n)!r}" for n in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class RuntimeStepUI(_Frozen):
+    __slots__ = ("timer", "timer_duration", "illustration", "next_button", "metronome_bpm")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {n: getattr(self, n) for n in self.__slots__}
+
+    # Compatibilidad con el modelo pydantic
+    model_dump = to_dict
+
+
+class RuntimeCondition(_Frozen):
+    __slots__ = ("condition", "next_step")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"condition": self.condition, "next_step": self.next_step}
+
+
+class RuntimeStep(_Frozen):
+    __slots__ = ("id", "action", "instruction", "voice_cue", "ui", "next_conditions",
+                 "next_step", "loop_condition", "exit_conditions", "critical", "safety_notes", "next_step_logic")
+
+    def jump(self, key: str) -> Any:
+        """Destino de next_step_logic[key] (if_continue, if_exit, ...) o None."""
+        for k, v in self.next_step_logic or ():
+            if k == key:
+                return v
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "action": self.action, "instruction": self.instruction, "voice_cue": self.voice_cue,
+            "ui": self.ui.to_dict(),
+            "next_conditions": [c.to_dict() for c in self.next_conditions] if self.next_conditions is not None else None,
+            "next_step": self.next_step, "loop_condition": self.loop_condition,
+            "exit_conditions": list(self.exit_conditions) if self.exit_conditions is not None else None,
+            "critical": self.critical,
+            "safety_notes": list(self.safety_notes) if self.safety_notes is not None else None,
+            "next_step_logic": dict(self.next_step_logic) if self.next_step_logic is not None else None,
+        }
+
+
+class RuntimeTriage(_Frozen):
+    __slots__ = ("red_flags", "immediate_action")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"red_flags": list(self.red_flags), "immediate_action": self.immediate_action}
+
+
+class RuntimeTriggers(_Frozen):
+    # conditions como tupla de (clave, valores) para poder deduplicar/hashear
+    __slots__ = ("intents", "conditions")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"intents": list(self.intents), "conditions": {k: list(v) for k, v in self.conditions}}
+
+
+class RuntimeExitCriteria(_Frozen):
+    __slots__ = ("success", "emergency")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"success": list(self.success), "emergency": list(self.emergency)}
+
+
+class RuntimeMetadata(_Frozen):
+    __slots__ = ("edad_code", "entorno", "materiales", "riesgo", "tiempo_estimado", "language", "medical_disclaimer")
+
+    @property
+    def edad(self) -> str:
+        return EDADES[self.edad_code] or "adulto"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"edad": self.edad, "entorno": list(self.entorno), "materiales": list(self.materiales),
+                "riesgo": self.riesgo, "tiempo_estimado": self.tiempo_estimado,
+                "language": self.language, "medical_disclaimer": self.medical_disclaimer}
+
+
+class _Coded:
+    """category/priority/target_audience decodificados (RuntimeProtocol y ProtocolSummary)."""
+    __slots__ = ()
+
+    @property
+    def category(self) -> str:
+        return CATEGORIES[self.category_code]
+
+    @property
+    def priority(self) -> str:
+        return PRIORITIES[self.priority_code]
+
+    @property
+    def target_audience(self) -> Optional[str]:
+        return AUDIENCES[self.audience_code] or None
+
+
+class RuntimeProtocol(_Coded, _Frozen):
+    __slots__ = ("id", "title", "version", "category_code", "priority_code", "audience_code", "sources",
+                 "metadata", "triggers", "safety_alerts", "triage", "steps", "exit_criteria", "emergency_action",
+                 "voice_cues", "ui", "graph")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Misma forma que Protocol.model_dump() (más category/priority)."""
+        return {
+            "id": self.id, "title": self.title, "version": self.version,
+            "category": self.category or None, "priority": self.priority or None,
+            "target_audience": self.target_audience, "sources": list(self.sources),
+            "metadata": self.metadata.to_dict(),
+            "triggers": self.triggers.to_dict() if self.triggers else None,
+            "safety_alerts": list(self.safety_alerts),
+            "triage": self.triage.to_dict() if self.triage else None,
+            "steps": [s.to_dict() for s in self.steps],
+            "exit_criteria": self.exit_criteria.to_dict() if self.exit_criteria else None,
+            "emergency_action": self.emergency_action,
+            "voice_cues": list(self.voice_cues) if self.voice_cues is not None else None,
+            "ui": self.ui.to_dict() if self.ui else None,
+        }
+
+    model_dump = to_dict
+
+
+class ProtocolSummary(_Coded, _Frozen):
+    """
+    Nivel residente del registro por niveles: lo que necesitan /protocols, el
+    triaje y la búsqueda (metadatos, intents, acción inmediata), sin pasos.
+    """
+    __slots__ = ("id", "title", "version", "category_code", "priority_code", "audience_code",
+                 "metadata", "triggers", "triage", "emergency_action", "total_steps")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "title": self.title, "version": self.version,
+            "category": self.category or None, "priority": self.priority or None,
+            "target_audience": self.target_audience, "metadata": self.metadata.to_dict(),
+            "triggers": self.triggers.to_dict() if self.triggers else None,
+            "triage": self.triage.to_dict() if self.triage else None,
+            "emergency_action": self.emergency_action, "total_steps": self.total_steps,
+        }
+
+
+# ---------- Compilación ----------
+def _compile_ui(ui: Any, pool: StringPool) -> Optional[RuntimeStepUI]:
+    if ui is None:
+        return None
+    return pool.obj(RuntimeStepUI(
+        bool(ui.timer), ui.timer_duration, pool.s(ui.illustration), bool(ui.next_button), ui.metronome_bpm,
+    ))
+
+
+def _compile_step(step: Any, pool: StringPool) -> RuntimeStep:
+    conds = None
+    if step.next_conditions is not None:
+        conds = pool.obj(tuple(pool.obj(RuntimeCondition(pool.s(c.condition), c.next_step))
+                               for c in step.next_conditions))
+    return RuntimeStep(
+        step.id, pool.s(step.action), pool.s(step.instruction), pool.s(step.voice_cue),
+        _compile_ui(step.ui, pool), conds, step.next_step, pool.s(step.loop_condition),
+        pool.strs(step.exit_conditions) if step.exit_conditions is not None else None,
+        bool(step.critical),
+        pool.strs(step.safety_notes) if step.safety_notes is not None else None,
+        pool.obj(tuple((pool.s(k), pool.s(v) if isinstance(v, str) else v)
+                       for k, v in step.next_step_logic.items())) if step.next_step_logic is not None else None,
+    )
+
+
+def compile_protocol(p: Protocol, pool: Optional[StringPool] = None) -> RuntimeProtocol:
+    """Protocol (pydantic, validado) -> RuntimeProtocol (inmutable, compacto)."""
+    pool = pool if pool is not None else StringPool()
+    md = p.metadata
+    metadata = pool.obj(RuntimeMetadata(
+        _code(_EDAD_CODE, md.edad), pool.strs(md.entorno), pool.strs(md.materiales),
+        pool.s(md.riesgo), pool.s(md.tiempo_estimado), pool.s(md.language), pool.s(md.medical_disclaimer),
+    ))
+    triggers = None
+    if p.triggers is not None:
+        triggers = pool.obj(RuntimeTriggers(
+            pool.strs(p.triggers.intents),
+            pool.obj(tuple((pool.s(k), pool.strs(v)) for k, v in p.triggers.conditions.items())),
+        ))
+    triage = None
+    if p.triage is not None:
+        triage = pool.obj(RuntimeTriage(pool.strs(p.triage.red_flags), pool.s(p.triage.immediate_action)))
+    exit_criteria = None
+    if p.exit_criteria is not None:
+        exit_criteria = pool.obj(RuntimeExitCriteria(pool.strs(p.exit_criteria.success),
+                                                     pool.strs(p.exit_criteria.emergency)))
+    return RuntimeProtocol(
+        pool.s(p.id), pool.s(p.title), pool.s(p.version),
+        _code(_CATEGORY_CODE, p.category), _code(_PRIORITY_CODE, p.priority), _code(_AUDIENCE_CODE, p.target_audience),
+        pool.strs(p.sources), metadata, triggers, pool.strs(p.safety_alerts), triage,
+        tuple(_compile_step(s, pool) for s in p.steps),
+        exit_criteria, pool.s(p.emergency_action),
+        pool.strs(p.voice_cues) if p.voice_cues is not None else None,
+        _compile_ui(p.ui, pool),
+        pool.obj(p.step_graph),
+    )
+
+
+def compile_protocols(protocols: Dict[str, Protocol], pool: Optional[StringPool] = None) -> Dict[str, RuntimeProtocol]:
+    """Compila un dict de protocolos compartiendo un único StringPool."""
+    pool = pool if pool is not None else StringPool()
+    return {pid: compile_protocol(p, pool) for pid, p in protocols.items()}
+
+
+def summarize(p: RuntimeProtocol) -> ProtocolSummary:
+    """Resumen de un protocolo compilado (comparte sus objetos)."""
+    return ProtocolSummary(p.id, p.title, p.version, p.category_code, p.priority_code, p.audience_code,
+                           p.metadata, p.triggers, p.triage, p.emergency_action, len(p.steps))
+
+
+def compile_summary(d: Dict[str, Any], pool: Optional[StringPool] = None) -> ProtocolSummary:
+    """ProtocolSummary.to_dict() (ya validado al construir el registro) -> ProtocolSummary, sin pydantic."""
+    pool = pool if pool is not None else StringPool()
+    md = d.get("metadata") or {}
+    metadata = pool.obj(RuntimeMetadata(
+        _code(_EDAD_CODE, md.get("edad")), pool.strs(md.get("entorno")), pool.strs(md.get("materiales")),
+        pool.s(md.get("riesgo")), pool.s(md.get("tiempo_estimado")), pool.s(md.get("language")),
+        pool.s(md.get("medical_disclaimer")),
+    ))
+    tr = d.get("triggers")
+    triggers = None if tr is None else pool.obj(RuntimeTriggers(
+        pool.strs(tr.get("intents")),
+        pool.obj(tuple((pool.s(k), pool.strs(v)) for k, v in (tr.get("conditions") or {}).items())),
+    ))
+    tg = d.get("triage")
+    triage = None if tg is None else pool.obj(RuntimeTriage(pool.strs(tg.get("red_flags")),
+                                                            pool.s(tg.get("immediate_action"))))
+    return ProtocolSummary(
+        pool.s(d["id"]), pool.s(d.get("title")), pool.s(d.get("version")),
+        _code(_CATEGORY_CODE, d.get("category")), _code(_PRIORITY_CODE, d.get("priority")),
+        _code(_AUDIENCE_CODE, d.get("target_audience")),
+        metadata, triggers, triage, pool.s(d.get("emergency_action")), int(d.get("total_steps") or 0),
+    )
+
+
+def step_payloads(p: RuntimeProtocol) -> List[Dict[str, Any]]:
+    """Pasos normalizados para la API (id, instruction, voice_cue, ui)."""
+    return [{
+        "id": s.id,
+        "instruction": s.instruction or s.action or "",
+        "voice_cue": s.voice_cue,
+        "ui": s.ui.to_dict() if s.ui else {},
+    } for s in p.steps]
@@ -1,7 +1,7 @@
 # backend/core/safety.py
 from __future__ import annotations
 import re
-from typing import List, Optional, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any, Tuple
 
 
 class SafetyGuardrails:
@@ -14,7 +14,7 @@ class SafetyGuardrails:
       (acepta dict con posibles campos: query, intent, user_response, etc.).
     """
 
-    def __init__(self, emergency_number: str = "112"):
+    def __init__(self, emergency_number: str = "112", responses: Optional[Dict[str, str]] = None):
         self.emergency_number = emergency_number
 
         # Patrones diagnósticos (no permitidos)
@@ -69,6 +69,9 @@ class SafetyGuardrails:
                 f"Ante cualquier duda, consulta con un médico o llama al {self.emergency_number}."
             ),
         }
+        # Textos propios de una región (core/regions.py); admiten {emergency_number}
+        for key, text in (responses or {}).items():
+            self.safety_responses[key] = text.format(emergency_number=self.emergency_number)
 
     # ---------- API de alto nivel (compatibilidad con conrumbo.py) ----------
     def check(self, payload: Dict[str, Any]) -> Dict[str, Any]:
@@ -171,6 +174,30 @@ class SafetyGuardrails:
             "escalation_message": None,
         }
 
+    def emergency_matches(self, text: str, skip: Iterable[int] = ()) -> List[Tuple[int, str]]:
+        """(índice de patrón, fragmento) de cada patrón de emergencia presente en el texto."""
+        q = (text or "").lower()
+        skip = set(skip)
+        out: List[Tuple[int, str]] = []
+        for i, pat in enumerate(self._emergency_patterns):
+            if i in skip:
+                continue
+            m = pat.search(q)
+            if m:
+                out.append((i, m.group(0)))
+        return out
+
+    def is_diagnostic(self, text: str) -> bool:
+        q = (text or "").lower()
+        return any(pat.search(q) for pat in self._diagnostic_patterns)
+
+    def pattern_sources(self) -> Dict[str, List[str]]:
+        """Fuente de los patrones (compatibles con RegExp de JS) para el índice offline."""
+        return {
+            "emergency": [p.pattern for p in self._emergency_patterns],
+            "diagnostic": [p.pattern for p in self._diagnostic_patterns],
+        }
+
     def validate_protocol_response(self, response: str, protocol_type: str) -> Dict[str, Any]:
         """
         Valida que una respuesta de protocolo incluya las advertencias de seguridad necesarias.
@@ -293,9 +320,9 @@ class SafetyGuardrails:
             "emergency_call": f"Recuerda llamar al {self.emergency_number} si la situación empeora o no mejora.",
             "training": "Es recomendable recibir entrenamiento en primeros auxilios.",
             "professional": "Esta guía no sustituye la atención médica profesional.",
-            "consciousness": "Si la persona pierde la conciencia, llama al 112 inmediatamente.",
-            "severe_bleeding": "Si el sangrado es intenso o no se controla, llama al 112.",
+            "consciousness": f"Si la persona pierde la conciencia, llama al {self.emergency_number} inmediatamente.",
+            "severe_bleeding": f"Si el sangrado es intenso o no se controla, llama al {self.emergency_number}.",
             "severe_burns": "Para quemaduras graves o extensas, busca atención médica inmediata.",
-            "immediate": "En caso de anafilaxia, actúa inmediatamente y llama al 112.",
+            "immediate": f"En caso de anafilaxia, actúa inmediatamente y llama al {self.emergency_number}.",
         }
         return [suggestions[k] for k in missing if k in suggestions]
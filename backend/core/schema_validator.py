@@ -0,0 +1,240 @@
+# backend/core/schema_validator.py
+"""
+Validador de protocolos generado a partir de rag/schema.yaml.
+
+El esquema se compila UNA vez a código Python (una función plana con los
+checks desenrollados: tipos, required, pattern, enum, longitudes, rangos,
+items, $ref) más las reglas cruzadas de `validation_rules`. El resultado es
+`validate(doc) -> List[str]` con todas las violaciones (no para en la primera).
+"""
+from __future__ import annotations
+import datetime
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+SCHEMA_PATH = Path(__file__).resolve().parents[1] / "rag" / "schema.yaml"
+
+_TYPE_CHECKS = {
+    "string": "isinstance({x}, str)",
+    "integer": "(isinstance({x}, int) and not isinstance({x}, bool))",
+    "number": "(isinstance({x}, (int, float)) and not isinstance({x}, bool))",
+    "boolean": "isinstance({x}, bool)",
+    "array": "isinstance({x}, list)",
+    "object": "isinstance({x}, dict)",
+    "null": "({x} is None)",
+}
+_DATE_RE = r"^\d{4}-\d{2}-\d{2}$"
+
+# Reglas cruzadas conocidas (nombre en validation_rules -> código por paso o global)
+_STEP_RULES = {
+    "timer_consistency": (
+        "if _ui.get('timer') is True and _ui.get('timer_duration') is None:\n"
+        "    errors.append(f'steps[{_i}].ui: timer=true requiere timer_duration (timer_consistency)')"
+    ),
+    "metronome_consistency": (
+        "if _ui.get('metronome') is True and _ui.get('metronome_bpm') is None:\n"
+        "    errors.append(f'steps[{_i}].ui: metronome=true requiere metronome_bpm (metronome_consistency)')"
+    ),
+    "counter_consistency": (
+        "if _ui.get('counter') is True and _ui.get('counter_target') is None:\n"
+        "    errors.append(f'steps[{_i}].ui: counter=true requiere counter_target (counter_consistency)')"
+    ),
+    "critical_step_requirements": (
+        "if _s.get('critical') is True and not (_alerts or _s.get('safety_notes')):\n"
+        "    errors.append(f'steps[{_i}]: paso crítico sin safety_alerts ni safety_notes (critical_step_requirements)')"
+    ),
+}
+_GLOBAL_RULES = {
+    "step_sequence": (
+        "_ids = [s.get('id') for s in _steps]\n"
+        "if _ids != list(range(1, len(_ids) + 1)):\n"
+        "    errors.append(f'steps: ids no consecutivos desde 1: {_ids} (step_sequence)')"
+    ),
+}
+
+
+class _Codegen:
+    def __init__(self, definitions: Dict[str, Any]):
+        self.definitions = definitions
+        self.lines: List[str] = []
+        self.consts: Dict[str, Any] = {}
+        self._n = 0
+
+    def var(self, prefix: str = "v") -> str:
+        self._n += 1
+        return f"{prefix}{self._n}"
+
+    def const(self, value: Any) -> str:
+        name = f"_C{len(self.consts)}"
+        self.consts[name] = value
+        return name
+
+    def emit(self, indent: int, line: str) -> None:
+        for ln in line.split("\n"):
+            self.lines.append("    " * indent + ln)
+
+    def resolve(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        ref = schema.get("$ref")
+        if ref:
+            name = ref.rsplit("/", 1)[-1]
+            return {**self.definitions[name], **{k: v for k, v in schema.items() if k != "$ref"}}
+        return schema
+
+    def err(self, indent: int, path: str, msg: str) -> None:
+        self.emit(indent, f"errors.append(f{(path + ': ' + msg)!r})")
+
+    def node(self, schema: Dict[str, Any], x: str, path: str, indent: int) -> None:
+        schema = self.resolve(schema)
+        types = schema.get("type")
+        if isinstance(types, str):
+            types = [types]
+        fmt = schema.get("format")
+
+        if types:
+            checks = [_TYPE_CHECKS[t].format(x=x) for t in types if t in _TYPE_CHECKS]
+            if fmt == "date":
+                checks.append(f"isinstance({x}, _date)")
+            self.emit(indent, f"if not ({' or '.join(checks)}):")
+            self.err(indent + 1, path, f"tipo inválido (esperado {'/'.join(types)}), recibido {{type({x}).__name__}}")
+            self.emit(indent, "else:")
+            indent += 1
+            if "null" in types:
+                self.emit(indent, f"if {x} is not None:")
+                indent += 1
+        self.emit(indent, "pass")
+
+        if "enum" in schema:
+            c = self.const(frozenset(schema["enum"]))
+            self.emit(indent, f"if {x} not in {c}:")
+            self.err(indent + 1, path, f"valor {{{x}!r}} fuera de enum {sorted(schema['enum'])}")
+
+        if not types or "string" in types:
+            guard = f"isinstance({x}, str)"
+            if "minLength" in schema:
+                self.emit(indent, f"if {guard} and len({x}) < {int(schema['minLength'])}:")
+                self.err(indent + 1, path, f"longitud {{len({x})}} < minLength {schema['minLength']}")
+            if "maxLength" in schema:
+                self.emit(indent, f"if {guard} and len({x}) > {int(schema['maxLength'])}:")
+                self.err(indent + 1, path, f"longitud {{len({x})}} > maxLength {schema['maxLength']}")
+            if "pattern" in schema:
+                c = self.const(re.compile(schema["pattern"]))
+                self.emit(indent, f"if {guard} and not {c}.search({x}):")
+                self.err(indent + 1, path, f"{{{x}!r}} no cumple el patrón {schema['pattern']}")
+            if fmt == "date":
+                c = self.const(re.compile(_DATE_RE))
+                self.emit(indent, f"if {guard} and not {c}.match({x}):")
+                self.err(indent + 1, path, f"{{{x}!r}} no es una fecha AAAA-MM-DD")
+
+        num_guard = f"(isinstance({x}, (int, float)) and not isinstance({x}, bool))"
+        if "minimum" in schema:
+            self.emit(indent, f"if {num_guard} and {x} < {schema['minimum']!r}:")
+            self.err(indent + 1, path, f"{{{x}}} < minimum {schema['minimum']}")
+        if "maximum" in schema:
+            self.emit(indent, f"if {num_guard} and {x} > {schema['maximum']!r}:")
+            self.err(indent + 1, path, f"{{{x}}} > maximum {schema['maximum']}")
+
+        if "minItems" in schema or "items" in schema:
+            self.emit(indent, f"if isinstance({x}, list):")
+            inner = indent + 1
+            self.emit(inner, "pass")
+            if "minItems" in schema:
+                self.emit(inner, f"if len({x}) < {int(schema['minItems'])}:")
+                self.err(inner + 1, path, f"{{len({x})}} elementos < minItems {schema['minItems']}")
+            if "items" in schema:
+                i, v = self.var("i"), self.var("e")
+                self.emit(inner, f"for {i}, {v} in enumerate({x}):")
+                self.node(schema["items"], v, f"{path}[{{{i}}}]", inner + 1)
+
+        props = schema.get("properties") or {}
+        required = schema.get("required") or []
+        addl = schema.get("additionalProperties")
+        if props or required or isinstance(addl, dict):
+            self.emit(indent, f"if isinstance({x}, dict):")
+            inner = indent + 1
+            self.emit(inner, "pass")
+            for key in required:
+                self.emit(inner, f"if {key!r} not in {x}:")
+                self.err(inner + 1, path, f"falta el campo requerido '{key}'")
+            for key, sub in props.items():
+                v = self.var()
+                self.emit(inner, f"{v} = {x}.get({key!r}, _MISSING)")
+                self.emit(inner, f"if {v} is not _MISSING:")
+                self.node(sub, v, f"{path}.{key}" if path else key, inner + 1)
+            if isinstance(addl, dict):
+                k, v = self.var("k"), self.var()
+                known = self.const(frozenset(props))
+                self.emit(inner, f"for {k}, {v} in {x}.items():")
+                self.emit(inner + 1, f"if {k} in {known}:")
+                self.emit(inner + 2, "continue")
+                self.node(addl, v, f"{path}.{{{k}}}", inner + 1)
+
+
+class CompiledValidator:
+    """Función de validación generada + su código fuente (útil para depurar el esquema)."""
+
+    def __init__(self, fn: Callable[[Any], List[str]], source: str, rules: Tuple[str, ...]):
+        self._fn = fn
+        self.source = source
+        self.rules = rules
+
+    def __call__(self, doc: Any) -> List[str]:
+        return self._fn(doc)
+
+
+def compile_schema(schema_doc: Dict[str, Any]) -> CompiledValidator:
+    """Genera y compila la función `validate(doc)` para el esquema dado."""
+    root = schema_doc.get("protocol_schema") or {}
+    gen = _Codegen(schema_doc.get("definitions") or {})
+    gen.emit(0, "def validate(doc):")
+    gen.emit(1, "errors = []")
+    gen.emit(1, "if not isinstance(doc, dict):")
+    gen.emit(2, "return ['documento: se esperaba un objeto YAML']")
+    gen.node(root, "doc", "", 1)
+
+    rule_names = tuple((schema_doc.get("validation_rules") or {}).keys())
+    unknown = [r for r in rule_names if r not in _STEP_RULES and r not in _GLOBAL_RULES]
+    if unknown:
+        print(f"[schema] Reglas sin implementación (se ignoran): {unknown}")
+    step_rules = [r for r in rule_names if r in _STEP_RULES]
+    global_rules = [r for r in rule_names if r in _GLOBAL_RULES]
+    if step_rules or global_rules:
+        gen.emit(1, "_steps = doc.get('steps')")
+        gen.emit(1, "_steps = [s for s in _steps if isinstance(s, dict)] if isinstance(_steps, list) else []")
+        gen.emit(1, "_alerts = doc.get('safety_alerts')")
+        for r in global_rules:
+            gen.emit(1, _GLOBAL_RULES[r])
+        if step_rules:
+            gen.emit(1, "for _i, _s in enumerate(_steps):")
+            gen.emit(2, "_ui = _s.get('ui') if isinstance(_s.get('ui'), dict) else {}")
+            for r in step_rules:
+                gen.emit(2, _STEP_RULES[r])
+    gen.emit(1, "return errors")
+
+    source = "\n".join(gen.lines) + "\n"
+    namespace: Dict[str, Any] = {"_MISSING": object(), "_date": datetime.date, **gen.consts}
+    exec(compile(source, "<conrumbo-schema>", "exec"), namespace)
+    return CompiledValidator(namespace["validate"], source, rule_names)
+
+
+_VALIDATOR: Optional[CompiledValidator] = None
+_VALIDATOR_LOCK = threading.Lock()
+
+
+def get_validator(schema_path: Optional[Path] = None) -> CompiledValidator:
+    """Validador compilado del esquema por defecto (una vez por proceso)."""
+    global _VALIDATOR
+    if schema_path is not None:
+        return compile_schema(yaml.safe_load(Path(schema_path).read_text(encoding="utf-8")))
+    if _VALIDATOR is None:
+        with _VALIDATOR_LOCK:
+            if _VALIDATOR is None:
+                _VALIDATOR = compile_schema(yaml.safe_load(SCHEMA_PATH.read_text(encoding="utf-8")))
+    return _VALIDATOR
+
+
+def validate_protocol_dict(doc: Any) -> List[str]:
+    return get_validator()(doc)
@@ -1,164 +1,228 @@
 # backend/core/search.py
 from __future__ import annotations
-import os
+import importlib.util
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Mapping, Optional, Tuple, Any
 
 import numpy as np
-import yaml
 
-# FAISS opcional (fallback a NumPy si no está disponible)
-try:
-    import faiss  # type: ignore
-    HAVE_FAISS = True
-except Exception:
-    faiss = None  # type: ignore
-    HAVE_FAISS = False
+# FAISS opcional (fallback a NumPy si no está disponible); se importa al construir el índice
+HAVE_FAISS = importlib.util.find_spec("faiss") is not None
+
+
+def _import_faiss():
+    global HAVE_FAISS
+    try:
+        import faiss  # type: ignore
+        return faiss
+    except Exception:
+        HAVE_FAISS = False
+        return None
 
 from .embeddings import EmbeddingGenerator
-from .protocol import Protocol, SearchResult, load_all_protocols
+from .fusion import FusionConfig, Ranking, fuse
+from .metrics import stage
+from .protocol import SearchResult, load_all_protocols
+from .runtime_protocol import RuntimeProtocol, compile_protocols
+from .language import DEFAULT_LANGUAGE, resolve_language
+from .protocol_tiers import TieredProtocols, by_language, summaries_of
+from .shards import LanguageShard, protocol_text
+
+
+# Relevancia de una coincidencia de intent tras corregir erratas (exacta = 1.0)
+FUZZY_SCORE = 0.9
 
 
 class RAGSearchEngine:
-    def __init__(self, protocols_dir: Optional[str] = None):
+    def __init__(self, protocols_dir: Optional[str] = None, protocols: Optional[Dict[str, RuntimeProtocol]] = None,
+                 build_index: bool = True):
         # backend/core/search.py -> subir a backend/ y entrar a rag/protocols
         self.protocols_dir = Path(protocols_dir) if protocols_dir else Path(__file__).resolve().parents[1] / "rag" / "protocols"
         self.embedding_generator = EmbeddingGenerator()
 
-        # Datos
-        self.protocols: Dict[str, Protocol] = {}
-        self.protocol_ids: List[str] = []
-
-        # Índices
-        self.index = None                    # FAISS
-        self._embeddings: Optional[np.ndarray] = None  # Fallback NumPy (embeddings normalizados)
-
-        # Intents
-        self.exact_match_intents: Dict[str, List[str]] = {}
-
-        # Inicialización
-        self._load_protocols()
+        # Datos (todos los idiomas; get_protocol no depende del idioma). Puede ser
+        # un TieredProtocols: cuerpos bajo demanda, resúmenes siempre residentes
+        self.protocols: Mapping[str, RuntimeProtocol] = {}
+
+        # Particiones por idioma: léxico + índice léxico + índice vectorial + caché.
+        # Se crean bajo demanda (shard()); el índice vectorial sólo tras build_index()
+        self.shards: Dict[str, LanguageShard] = {}
+        self._by_language: Dict[str, Dict[str, RuntimeProtocol]] = {}
+        self._shard_lock = threading.Lock()
+        self._vectors_enabled = False
+        # Fusión de intent + léxico + vector (SEARCH_FUSION, core/fusion.py)
+        self.fusion = FusionConfig.from_env()
+
+        # Inicialización (el índice semántico puede diferirse con build_index=False:
+        # mientras tanto search() sólo sirve coincidencias exactas de intents)
+        if protocols is not None:
+            self.protocols = protocols
+        else:
+            self._load_protocols()
+        self._by_language = by_language(self.protocols)
+        self.shard(DEFAULT_LANGUAGE)
+        if build_index:
+            self._build_index()
+
+    @property
+    def index_ready(self) -> bool:
+        shard = self.shards.get(self._shard_language(DEFAULT_LANGUAGE))
+        return shard is not None and shard.vectors_ready
+
+    @property
+    def languages(self) -> List[str]:
+        return sorted(self._by_language)
+
+    @property
+    def summaries(self) -> Mapping[str, Any]:
+        """Metadatos, intents y triaje de cada protocolo sin forzar la carga de cuerpos."""
+        return summaries_of(self.protocols)
+
+    def summary(self, protocol_id: str) -> Optional[Any]:
+        return self.summaries.get(protocol_id)
+
+    def build_index(self) -> None:
+        """Construye el índice semántico (pensado para el calentamiento en segundo plano)."""
         self._build_index()
-        self._build_intent_mapping()
 
     # -------------------------
     # Carga de protocolos
     # -------------------------
     def _load_protocols(self) -> None:
-        """Carga todos los protocolos (Pydantic Protocol) desde YAML."""
+        """Carga todos los protocolos desde YAML (validados con pydantic, compilados a RuntimeProtocol)."""
         if not self.protocols_dir.exists():
             print(f"[RAG] Directorio de protocolos no encontrado: {self.protocols_dir}")
             self.protocols = {}
             return
 
-        self.protocols = load_all_protocols(self.protocols_dir)  # Dict[str, Protocol]
+        self.protocols = compile_protocols(load_all_protocols(self.protocols_dir))
         print(f"[RAG] Protocolos cargados: {len(self.protocols)}")
 
+    # -------------------------
+    # Particiones por idioma
+    # -------------------------
+    def _shard_language(self, language: str) -> str:
+        # Un idioma sin protocolos cae al idioma por defecto (mejor un protocolo en
+        # español que ninguno en una emergencia)
+        if language in self._by_language:
+            return language
+        if DEFAULT_LANGUAGE in self._by_language or not self._by_language:
+            return DEFAULT_LANGUAGE
+        return next(iter(sorted(self._by_language)))
+
+    def shard(self, language: Optional[str] = None) -> LanguageShard:
+        """Partición del idioma pedido; se construye (y se indexa si procede) la primera vez."""
+        lang = self._shard_language(language or DEFAULT_LANGUAGE)
+        shard = self.shards.get(lang)
+        if shard is not None:
+            return shard
+        with self._shard_lock:
+            shard = self.shards.get(lang)
+            if shard is None:
+                # Con registro por niveles /search léxico lo sirve el fichero SQLite (FTS5)
+                shard = LanguageShard(lang, self._by_language.get(lang, {}),
+                                      lexical_index=not isinstance(self.protocols, TieredProtocols))
+                if self._vectors_enabled:
+                    shard.build_vectors(self.embedding_generator, self._faiss())
+                self.shards[lang] = shard
+        return shard
+
     # -------------------------
     # Construcción de índice
     # -------------------------
-    def _text_from_protocol(self, p: Protocol) -> str:
+    def _text_from_protocol(self, p: RuntimeProtocol) -> str:
         """Concatena campos útiles del protocolo para embedding."""
-        parts: List[str] = [p.title or ""]
-
-        # steps: pueden tener .instruction y/o .voice_cue
-        for s in (p.steps or []):
-            instr = getattr(s, "instruction", None) or getattr(s, "action", None) or ""
-            if instr:
-                parts.append(instr)
-            vcue = getattr(s, "voice_cue", None) or ""
-            if vcue:
-                parts.append(vcue)
+        return protocol_text(p)
 
-        # triage
-        if p.triage:
-            parts.extend([t for t in (p.triage.red_flags or []) if t])
-            if p.triage.immediate_action:
-                parts.append(p.triage.immediate_action)
-
-        # voice_cues top-level
-        vcl = getattr(p, "voice_cues", None) or []
-        parts.extend([v for v in vcl if v])
-
-        return " ".join(parts)
+    @staticmethod
+    def _faiss():
+        return _import_faiss() if HAVE_FAISS else None
 
     def _build_index(self) -> None:
-        """Construye el índice de búsqueda (FAISS o fallback NumPy)."""
+        """Índices vectoriales (FAISS o fallback NumPy) de las particiones ya abiertas; el resto al abrirse."""
         if not self.protocols:
             print("[RAG] No hay protocolos cargados para indexar")
             return
-
-        texts: List[str] = []
-        self.protocol_ids = []
-        for pid, proto in self.protocols.items():
-            texts.append(self._text_from_protocol(proto))
-            self.protocol_ids.append(pid)
-
-        # Embeddings
-        embeds = self.embedding_generator.generate_embeddings_batch(texts)
-        if not embeds:
-            print("[RAG] Error generando embeddings")
-            return
-
-        emb = np.asarray(embeds, dtype=np.float32)
-        # Normalizar L2 para usar producto punto como coseno
-        norms = np.linalg.norm(emb, axis=1, keepdims=True)
-        norms[norms == 0.0] = 1.0
-        emb = emb / norms
-
-        if HAVE_FAISS:
-            dim = emb.shape[1]
-            self.index = faiss.IndexFlatIP(dim)
-            self.index.add(emb)
-            self._embeddings = None
-            print(f"[RAG] Índice FAISS construido con {emb.shape[0]} protocolos (dim={dim})")
-        else:
-            self._embeddings = emb
-            self.index = None
-            print(f"[RAG] FAISS no disponible. Usando fallback NumPy con {emb.shape[0]} protocolos.")
-
-    def _build_intent_mapping(self) -> None:
-        """Mapeo de intents exactos a protocolos."""
-        self.exact_match_intents = {
-            "rcp": ["pa_rcp_adulto_v1", "pa_rcp_nino_v1", "pa_rcp_lactante_v1"],
-            "parada cardiorespiratoria": ["pa_rcp_adulto_v1", "pa_rcp_nino_v1"],
-            "no respira": ["pa_rcp_adulto_v1", "pa_rcp_nino_v1"],
-            "atragantamiento": ["pa_asfixia_adulto_v1", "pa_asfixia_nino_v1"],
-            "se está ahogando": ["pa_asfixia_adulto_v1", "pa_asfixia_nino_v1"],
-            "asfixia": ["pa_asfixia_adulto_v1", "pa_asfixia_nino_v1"],
-            "hemorragia": ["pa_hemorragias_v1"],
-            "sangrado": ["pa_hemorragias_v1"],
-            "herida": ["pa_hemorragias_v1"],
-            "quemadura": ["pa_quemaduras_v1"],
-            "quemado": ["pa_quemaduras_v1"],
-            "anafilaxia": ["pa_anafilaxia_v1"],
-            "alergia severa": ["pa_anafilaxia_v1"],
-            "convulsiones": ["pa_convulsiones_v1"],
-            "convulsión": ["pa_convulsiones_v1"],
-            "ictus": ["pa_ictus_fast_v1"],
-            "derrame cerebral": ["pa_ictus_fast_v1"],
-            "dolor torácico": ["pa_dolor_toracico_v1"],
-            "dolor en el pecho": ["pa_dolor_toracico_v1"],
-        }
+        self._vectors_enabled = True
+        faiss = self._faiss()
+        if faiss is None:
+            print("[RAG] FAISS no disponible. Usando fallback NumPy.")
+        with self._shard_lock:
+            shards = list(self.shards.values())
+        for shard in shards:
+            if not shard.vectors_ready:
+                shard.build_vectors(self.embedding_generator, faiss)
 
     # -------------------------
     # Búsqueda pública
     # -------------------------
-    def search(self, query: str, context: Optional[Dict[str, str]] = None, top_k: int = 3) -> List[SearchResult]:
-        """Búsqueda híbrida: exact-match + semántica."""
+    def search(self, query: str, context: Optional[Dict[str, str]] = None, top_k: int = 3,
+               fusion: Optional[FusionConfig] = None) -> List[SearchResult]:
+        """Búsqueda híbrida en la partición del idioma de la petición (intent + léxico + semántica)."""
+        fusion = fusion or self.fusion
+        shard = self.shard(resolve_language(context))
+        edad = (context or {}).get("edad") or ""
+        key = ("search", (query or "").strip().lower(), edad.lower(), top_k, fusion.key)
+        # Sin índice vectorial el resultado es parcial: no se cachea
+        return list(shard.cached(key, lambda: self._search(shard, query, context, top_k, fusion)[0],
+                                 cacheable=shard.vectors_ready))
+
+    def search_trace(self, query: str, context: Optional[Dict[str, str]] = None, top_k: int = 3,
+                     fusion: Optional[FusionConfig] = None) -> Tuple[List[SearchResult], List[str]]:
+        """Como search() pero sin caché y con los retrievers ejecutados (core/search_eval.py)."""
+        return self._search(self.shard(resolve_language(context)), query, context, top_k, fusion or self.fusion)
+
+    def _search(self, shard: LanguageShard, query: str, context: Optional[Dict[str, str]],
+                top_k: int, fusion: FusionConfig) -> Tuple[List[SearchResult], List[str]]:
+        if fusion.method == "cascade":
+            return self._cascade(shard, query, context, top_k)
+
+        depth = max(top_k, fusion.depth)
+        stop = fusion.stop_hits(top_k)
+        rankings: Dict[str, Ranking] = {}
+        confident: set = set()
+        ran: List[str] = []
+        for retriever in fusion.retrievers:
+            if stop is not None and len(confident) >= stop:
+                break
+            ran.append(retriever)
+            if retriever == "intent":
+                exact = self._exact_in_shard(shard, query, context)
+                confident.update(exact)
+                hits = exact or self._exact_in_shard(shard, query, context, fuzzy=True)
+                score = 1.0 if exact else FUZZY_SCORE
+                rankings[retriever] = [(pid, score) for pid in hits[:depth]]
+            elif retriever == "lexical":
+                with stage("lexical_rank"):
+                    hits = shard.lexical_rank(query, depth)
+                confident.update(pid for pid, _, coverage in hits if coverage >= fusion.lexical_confident)
+                rankings[retriever] = [(pid, score) for pid, score, _ in hits]
+            else:
+                rankings[retriever] = self._vector_hits(query, depth, shard)
+
+        results: List[SearchResult] = []
+        for pid, score in fuse({r: hits for r, hits in rankings.items() if hits}, fusion):
+            proto = self.protocols.get(pid)
+            if proto:
+                results.append(SearchResult(protocol_id=pid, title=proto.title, relevance_score=score,
+                                            snippet=self._generate_snippet(proto, query)))
+                if len(results) == top_k:
+                    break
+        return results, ran
+
+    def _cascade(self, shard: LanguageShard, query: str, context: Optional[Dict[str, str]],
+                 top_k: int) -> Tuple[List[SearchResult], List[str]]:
+        """SEARCH_FUSION=cascade: exactos con score fijo y semántica sólo para completar top_k."""
         results: List[SearchResult] = []
+        ran = ["intent"]
 
-        # 1) Exact-match por intents
-        query_lower = (query or "").lower()
-        exact_matches: List[str] = []
-        for intent, pids in self.exact_match_intents.items():
-            if intent in query_lower:
-                exact_matches.extend(pids)
-
-        # Filtrar por edad si viene en contexto
-        if context and "edad" in context and exact_matches:
-            edad = context["edad"]
-            exact_matches = [pid for pid in exact_matches if self._matches_age(pid, edad)]
+        # 1) Exact-match por intents; si no hay, con erratas corregidas (antes que embeddings)
+        exact_matches = self._exact_in_shard(shard, query, context)
+        score = 1.0
+        if not exact_matches:
+            exact_matches = self._exact_in_shard(shard, query, context, fuzzy=True)
+            score = FUZZY_SCORE
 
         # Añadir exactos con score alto
         for pid in exact_matches[:top_k]:
@@ -167,29 +231,80 @@ class RAGSearchEngine:
                 results.append(SearchResult(
                     protocol_id=pid,
                     title=proto.title,
-                    relevance_score=1.0,
+                    relevance_score=score,
                     snippet=self._generate_snippet(proto, query)
                 ))
 
         # 2) Semántica si faltan resultados
         remaining = top_k - len(results)
         if remaining > 0:
-            sem = self._semantic_search(query, remaining)
+            ran.append("vector")
+            sem = self._semantic_search(query, remaining, shard)
             exist = {r.protocol_id for r in results}
             for r in sem:
                 if r.protocol_id not in exist:
                     results.append(r)
 
-        return results[:top_k]
+        return results[:top_k], ran
 
-    def _semantic_search(self, query: str, top_k: int) -> List[SearchResult]:
-        """Búsqueda semántica con FAISS o fallback NumPy."""
-        if top_k <= 0:
-            return []
-        if self.index is None and self._embeddings is None:
+    def exact_matches(self, query: str, context: Optional[Dict[str, str]] = None) -> List[str]:
+        """Ids de protocolo cuyos intents aparecen literalmente en la consulta (sin embeddings)."""
+        return self._exact_in_shard(self.shard(resolve_language(context)), query, context)
+
+    def fuzzy_matches(self, query: str, context: Optional[Dict[str, str]] = None) -> List[str]:
+        """Como exact_matches pero tolerando erratas (distancia de edición 1-2) en la consulta."""
+        return self._exact_in_shard(self.shard(resolve_language(context)), query, context, fuzzy=True)
+
+    def _exact_in_shard(self, shard: LanguageShard, query: str, context: Optional[Dict[str, str]],
+                        fuzzy: bool = False) -> List[str]:
+        if fuzzy:
+            with stage("fuzzy_match"):
+                exact = shard.fuzzy_matches((query or "").lower())
+        else:
+            with stage("intent_match"):
+                exact = shard.exact_matches((query or "").lower())
+
+        # Filtrar por edad si viene en contexto
+        if context and context.get("edad") and exact:
+            edad = context["edad"]
+            exact = [pid for pid in exact if self._matches_age(pid, edad)]
+        return exact
+
+    def lexical_search(self, query: str, context: Optional[Dict[str, Any]] = None,
+                       accept_language: Optional[str] = None) -> Tuple[str, List[str]]:
+        """(idioma, ids) cuyo título/pasos contienen la consulta; usa el índice léxico de la partición."""
+        shard = self.shard(resolve_language(context, accept_language))
+        q = (query or "").lower().strip()
+        return shard.language, list(shard.cached(("lexical", q), lambda: tuple(shard.lexical_search(q))))
+
+    def correct_query(self, query: str, context: Optional[Dict[str, Any]] = None,
+                      accept_language: Optional[str] = None) -> Optional[str]:
+        """Consulta con las erratas corregidas contra el léxico del idioma ("hemoragia"); None si no cambia."""
+        shard = self.shard(resolve_language(context, accept_language))
+        with stage("fuzzy_match"):
+            return shard.fuzzy.correct((query or "").lower().strip(), shard.known_words)
+
+    def _semantic_search(self, query: str, top_k: int, shard: Optional[LanguageShard] = None) -> List[SearchResult]:
+        """Búsqueda semántica con FAISS o fallback NumPy dentro de una partición."""
+        results: List[SearchResult] = []
+        for pid, score in self._vector_hits(query, top_k, shard or self.shard()):
+            proto = self.protocols.get(pid)
+            if proto:
+                results.append(SearchResult(
+                    protocol_id=pid,
+                    title=proto.title,
+                    relevance_score=score,
+                    snippet=self._generate_snippet(proto, query)
+                ))
+        return results
+
+    def _vector_hits(self, query: str, top_k: int, shard: LanguageShard) -> Ranking:
+        """(id, coseno) de los top_k vecinos de la consulta; vacío sin índice vectorial."""
+        if top_k <= 0 or not shard.vectors_ready:
             return []
 
-        q_emb = self.embedding_generator.generate_embedding(query)
+        with stage("embedding"):
+            q_emb = self.embedding_generator.generate_embedding(query)
         if not q_emb:
             return []
 
@@ -199,38 +314,15 @@ class RAGSearchEngine:
             return []
         q = q / q_norm
 
-        if HAVE_FAISS and self.index is not None:
-            q_vec = q.reshape(1, -1).astype(np.float32)
-            scores, indices = self.index.search(q_vec, top_k)
-            idxs = indices[0]
-            scs = scores[0]
-        else:
-            # Fallback: producto punto con todos los embeddings normalizados
-            emb = self._embeddings  # (N, D)
-            sims = emb @ q.reshape(-1, 1)  # (N,1)
-            scs = sims.ravel()
-            idxs = np.argsort(-scs)[:top_k]
-
-        results: List[SearchResult] = []
-        for score, idx in zip(scs[:top_k], idxs[:top_k]):
-            if 0 <= int(idx) < len(self.protocol_ids):
-                pid = self.protocol_ids[int(idx)]
-                proto = self.protocols.get(pid)
-                if proto:
-                    results.append(SearchResult(
-                        protocol_id=pid,
-                        title=proto.title,
-                        relevance_score=float(score),
-                        snippet=self._generate_snippet(proto, query)
-                    ))
-        return results
+        with stage("vector_search"):
+            return shard.vector_search(q, top_k)
 
     # -------------------------
     # Utilidades
     # -------------------------
     def _matches_age(self, protocol_id: str, edad: str) -> bool:
         """Verifica si un protocolo coincide con la edad especificada."""
-        proto = self.protocols.get(protocol_id)
+        proto = self.summary(protocol_id)
         if not proto or not proto.metadata or not proto.metadata.edad:
             return True
         protocol_edad = (proto.metadata.edad or "").lower()
@@ -244,7 +336,7 @@ class RAGSearchEngine:
             return "lactante" in protocol_edad
         return True
 
-    def _generate_snippet(self, protocol: Protocol, query: str) -> str:
+    def _generate_snippet(self, protocol: RuntimeProtocol, query: str) -> str:
         """Snippet simple y útil."""
         if protocol.triage and protocol.triage.immediate_action:
             return protocol.triage.immediate_action
@@ -253,5 +345,5 @@ class RAGSearchEngine:
             return getattr(first, "instruction", None) or getattr(first, "action", None) or protocol.title
         return protocol.title
 
-    def get_protocol(self, protocol_id: str) -> Optional[Protocol]:
+    def get_protocol(self, protocol_id: str) -> Optional[RuntimeProtocol]:
         return self.protocols.get(protocol_id)
@@ -0,0 +1,137 @@
+# backend/core/search_eval.py
+"""
+Evaluación offline de la búsqueda: relevancia y coste por configuración de fusión.
+
+Lee un conjunto de consultas etiquetadas (YAML: queries: [{query, relevant,
+context?}]) y, para cada configuración (core/fusion.py), informa de:
+  recall@k   fracción de los protocolos relevantes dentro de los k primeros
+  mrr        media de 1 / posición del primer relevante (0 si no está en k)
+  p50 / p95  latencia por consulta (mediana de --repeat ejecuciones, sin caché)
+  vector     fracción de consultas que llegan a pedir el embedding
+y recomienda la configuración más rápida que no pierde relevancia frente a
+la mejor (con --tolerance de margen).
+
+Con el embedding local (sin OPENAI_API_KEY) los vectores no tienen semántica:
+la comparación sólo es representativa con el backend de embeddings real.
+
+Uso (desde backend/):
+    python -m core.search_eval
+    python -m core.search_eval rag/eval/search_queries.yaml --k 3 --per-query
+    python -m core.search_eval --configs cascade rrf weighted rrf:sc=off rrf:retrievers=intent+lexical
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import yaml
+
+from .fusion import FusionConfig
+
+DEFAULT_QUERIES = Path(__file__).resolve().parents[1] / "rag" / "eval" / "search_queries.yaml"
+DEFAULT_CONFIGS = ("cascade", "rrf", "rrf:sc=1", "rrf:sc=off", "weighted", "weighted:sc=1",
+                   "rrf:retrievers=intent+lexical")
+
+
+def load_queries(path: Path) -> List[Dict[str, Any]]:
+    data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    queries = data.get("queries", data) if isinstance(data, dict) else data
+    out = []
+    for i, q in enumerate(queries):
+        if not q.get("query") or not q.get("relevant"):
+            raise ValueError(f"{path}: consulta {i} sin query o relevant")
+        out.append({"query": q["query"], "relevant": list(q["relevant"]), "context": q.get("context") or {}})
+    return out
+
+
+def evaluate(engine: Any, queries: Sequence[Dict[str, Any]], config: FusionConfig, k: int,
+             repeat: int = 5) -> Dict[str, Any]:
+    """Métricas de una configuración; rows trae el detalle por consulta."""
+    rows = []
+    for q in queries:
+        engine.search_trace(q["query"], q["context"], k, config)  # calentamiento (shard, embedding)
+        times = []
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            results, ran = engine.search_trace(q["query"], q["context"], k, config)
+            times.append(time.perf_counter() - t0)
+        ids = [r.protocol_id for r in results][:k]
+        relevant = set(q["relevant"])
+        first = next((i for i, pid in enumerate(ids, 1) if pid in relevant), None)
+        rows.append({
+            "query": q["query"], "results": ids, "rank": first,
+            "recall": len(relevant & set(ids)) / len(relevant), "rr": 1.0 / first if first else 0.0,
+            "ms": statistics.median(times) * 1000.0, "retrievers": ran,
+        })
+    ms = sorted(r["ms"] for r in rows)
+    return {
+        "config": str(config), "queries": len(rows),
+        f"recall@{k}": statistics.fmean(r["recall"] for r in rows),
+        "mrr": statistics.fmean(r["rr"] for r in rows),
+        "p50_ms": statistics.median(ms), "p95_ms": ms[int(0.95 * (len(ms) - 1))],
+        "mean_ms": statistics.fmean(ms),
+        "vector_rate": sum("vector" in r["retrievers"] for r in rows) / len(rows),
+        "rows": rows,
+    }
+
+
+def recommend(reports: Sequence[Dict[str, Any]], k: int, tolerance: float = 0.0) -> Optional[Dict[str, Any]]:
+    """La más rápida (media) cuyo recall@k y MRR no quedan por debajo de la mejor - tolerance."""
+    if not reports:
+        return None
+    best_recall = max(r[f"recall@{k}"] for r in reports)
+    best_mrr = max(r["mrr"] for r in reports)
+    ok = [r for r in reports if r[f"recall@{k}"] >= best_recall - tolerance - 1e-9
+          and r["mrr"] >= best_mrr - tolerance - 1e-9]
+    return min(ok, key=lambda r: r["mean_ms"]) if ok else None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .search import RAGSearchEngine
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("queries", nargs="?", type=Path, default=DEFAULT_QUERIES, help="YAML de consultas etiquetadas")
+    ap.add_argument("--configs", nargs="+", default=list(DEFAULT_CONFIGS), help="especificaciones de fusión")
+    ap.add_argument("--k", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=5, help="ejecuciones por consulta (se toma la mediana)")
+    ap.add_argument("--tolerance", type=float, default=0.0, help="pérdida de recall/MRR admitida al recomendar")
+    ap.add_argument("--protocols", type=Path, default=None, help="directorio de protocolos (por defecto rag/protocols)")
+    ap.add_argument("--per-query", action="store_true", help="detalle por consulta")
+    ap.add_argument("--json", action="store_true", help="salida JSON")
+    args = ap.parse_args(argv)
+
+    queries = load_queries(args.queries)
+    configs = [FusionConfig.parse(spec) for spec in args.configs]
+    engine = RAGSearchEngine(protocols_dir=str(args.protocols) if args.protocols else None)
+    reports = [evaluate(engine, queries, c, args.k, args.repeat) for c in configs]
+    pick = recommend(reports, args.k, args.tolerance)
+
+    if args.json:
+        print(json.dumps({"k": args.k, "reports": reports, "recommended": pick["config"] if pick else None},
+                         ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"{len(queries)} consultas, k={args.k}, embeddings={engine.embedding_generator.mode}")
+    print(f"  {'configuración':<34} {'recall@' + str(args.k):>9} {'mrr':>6} {'p50 ms':>8} {'p95 ms':>8} {'vector':>7}")
+    for r in reports:
+        print(f"  {r['config']:<34} {r[f'recall@{args.k}']:9.3f} {r['mrr']:6.3f} {r['p50_ms']:8.3f} "
+              f"{r['p95_ms']:8.3f} {r['vector_rate']:7.0%}")
+    if args.per_query:
+        for r in reports:
+            print(f"\n{r['config']}")
+            for row in r["rows"]:
+                mark = "-" if row["rank"] is None else row["rank"]
+                print(f"  {row['ms']:8.3f} ms  rango {mark}  {'+'.join(row['retrievers']):<20} "
+                      f"{row['query']!r} -> {', '.join(row['results'])}")
+    if pick:
+        print(f"\nRecomendada: {pick['config']} (la más rápida sin perder recall@{args.k} ni MRR"
+              f"{f' más de {args.tolerance:g}' if args.tolerance else ''})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+# backend/core/shards.py
+"""
+Particiones de búsqueda por idioma (metadata.language: es | en | fr | de).
+
+Cada LanguageShard tiene su propio léxico de intents, índice léxico (trigramas),
+ranking BM25 por palabras, índice vectorial y caché LRU. RAGSearchEngine crea cada partición la primera vez
+que una petición la pide: añadir un paquete de idioma no ralentiza ni mezcla
+resultados en los demás.
+"""
+from __future__ import annotations
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .fuzzy import DeletionIndex, fold
+from .language import LEXICAL_STOPWORDS
+from .metrics import INDEX_BUILD_SECONDS, INDEX_BYTES, INDEX_DIMS, INDEX_SIZE, SHARD_CACHE
+from .quantize import QUANTIZATION, QuantizedIndex
+from .protocol_tiers import summaries_of
+from .runtime_protocol import RuntimeProtocol
+
+SHARD_CACHE_SIZE = int(os.getenv("SEARCH_SHARD_CACHE_SIZE", "1024"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+")
+
+# Léxicos de intents incorporados por idioma (frase -> ids). Se completan con
+# triggers.intents de los protocolos de cada partición y se filtran a lo cargado.
+INTENT_LEXICONS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "es": {
+        "rcp": ("pa_rcp_adulto_v1", "pa_rcp_nino_v1", "pa_rcp_lactante_v1"),
+        "parada cardiorespiratoria": ("pa_rcp_adulto_v1", "pa_rcp_nino_v1"),
+        "no respira": ("pa_rcp_adulto_v1", "pa_rcp_nino_v1"),
+        "atragantamiento": ("pa_asfixia_adulto_v1", "pa_asfixia_nino_v1"),
+        "se está ahogando": ("pa_asfixia_adulto_v1", "pa_asfixia_nino_v1"),
+        "asfixia": ("pa_asfixia_adulto_v1", "pa_asfixia_nino_v1"),
+        "hemorragia": ("pa_hemorragias_v1",),
+        "sangrado": ("pa_hemorragias_v1",),
+        "herida": ("pa_hemorragias_v1",),
+        "quemadura": ("pa_quemaduras_v1",),
+        "quemado": ("pa_quemaduras_v1",),
+        "anafilaxia": ("pa_anafilaxia_v1",),
+        "alergia severa": ("pa_anafilaxia_v1",),
+        "convulsiones": ("pa_convulsiones_v1",),
+        "convulsión": ("pa_convulsiones_v1",),
+        "ictus": ("pa_ictus_fast_v1",),
+        "derrame cerebral": ("pa_ictus_fast_v1",),
+        "dolor torácico": ("pa_dolor_toracico_v1",),
+        "dolor en el pecho": ("pa_dolor_toracico_v1",),
+    },
+}
+
+
+def protocol_text(p: RuntimeProtocol) -> str:
+    """Concatena campos útiles del protocolo para embedding."""
+    parts: List[str] = [p.title or ""]
+    for s in (p.steps or []):
+        instr = getattr(s, "instruction", None) or getattr(s, "action", None) or ""
+        if instr:
+            parts.append(instr)
+        vcue = getattr(s, "voice_cue", None) or ""
+        if vcue:
+            parts.append(vcue)
+    if p.triage:
+        parts.extend([t for t in (p.triage.red_flags or []) if t])
+        if p.triage.immediate_action:
+            parts.append(p.triage.immediate_action)
+    parts.extend([v for v in (getattr(p, "voice_cues", None) or []) if v])
+    return " ".join(parts)
+
+
+def lexical_text(p: RuntimeProtocol) -> str:
+    """Texto de /search: título + instrucciones de los pasos, en minúsculas."""
+    parts = [(p.title or "").lower()]
+    for s in p.steps or ():
+        txt = s.instruction or s.action or ""
+        if txt:
+            parts.append(txt.lower())
+    return " ".join(parts)
+
+
+def lexical_terms(text: str, language: str) -> List[str]:
+    """Palabras plegadas (sin tildes) de más de una letra, sin palabras vacías del idioma."""
+    stop = LEXICAL_STOPWORDS.get(language, ())
+    return [w for w in (fold(t) for t in _WORD_RE.findall((text or "").lower())) if len(w) > 1 and w not in stop]
+
+
+def _trigrams(text: str) -> Iterable[str]:
+    return (text[i:i + 3] for i in range(len(text) - 2))
+
+
+class LanguageShard:
+    """Léxico, índice léxico, índice vectorial y caché de un idioma."""
+
+    def __init__(self, language: str, protocols: Mapping[str, RuntimeProtocol], cache_size: int = SHARD_CACHE_SIZE,
+                 lexical_index: bool = True):
+        self.language = language
+        # dict o TieredSubset (core/protocol_tiers.py): un único recorrido de los cuerpos
+        self.protocols = protocols
+        self.intents = self._build_lexicon()
+        # Vecindario de borrados de las palabras del léxico (erratas a distancia 1-2);
+        # las palabras que ya aparecen en el corpus del idioma no se corrigen
+        self.fuzzy = DeletionIndex(w for phrase in self.intents for w in phrase.split())
+        words: set = set()
+        # Índice léxico: trigrama -> ids; el substring se verifica sobre el texto
+        self.lexical_index = lexical_index
+        self.haystacks: Dict[str, str] = {}
+        # BM25: palabra -> ((id, frecuencia), ...) y longitud de cada documento (mismo texto que los embeddings)
+        terms: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        for pid, p in protocols.items():
+            text = protocol_text(p)
+            words.update(fold(w) for w in _WORD_RE.findall(text.lower()))
+            if lexical_index:
+                self.haystacks[pid] = lexical_text(p)
+                doc = lexical_terms(text, language)
+                self.doc_len[pid] = len(doc)
+                for w in doc:
+                    tf = terms.setdefault(w, {})
+                    tf[pid] = tf.get(pid, 0) + 1
+        self.known_words: FrozenSet[str] = frozenset(words)
+        self.term_postings: Dict[str, Tuple[Tuple[str, int], ...]] = {w: tuple(tf.items()) for w, tf in terms.items()}
+        self.avg_doc_len = sum(self.doc_len.values()) / len(self.doc_len) if self.doc_len else 0.0
+
+        postings: Dict[str, set] = {}
+        for pid, text in self.haystacks.items():
+            for tri in set(_trigrams(text)):
+                postings.setdefault(tri, set()).add(pid)
+        self.postings: Dict[str, FrozenSet[str]] = {t: frozenset(v) for t, v in postings.items()}
+
+        # Índice vectorial (se construye con build_vectors)
+        self.protocol_ids: List[str] = []
+        self.index = None
+        self._embeddings: Optional[np.ndarray] = None
+        self._quantized: Optional[QuantizedIndex] = None
+
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __len__(self) -> int:
+        return len(self.protocols)
+
+    # ---------- Léxico de intents ----------
+    def _build_lexicon(self) -> Dict[str, Tuple[str, ...]]:
+        lexicon: Dict[str, List[str]] = {}
+        for phrase, pids in INTENT_LEXICONS.get(self.language, {}).items():
+            lexicon.setdefault(phrase, []).extend(pids)
+        for pid, p in summaries_of(self.protocols).items():
+            for intent in (p.triggers.intents if p.triggers else ()):
+                phrase = intent.replace("_", " ").strip().lower()
+                if phrase and pid not in lexicon.setdefault(phrase, []):
+                    lexicon[phrase].append(pid)
+        # Sólo ids de esta partición: otro idioma nunca aparece aquí
+        out = {}
+        for phrase, pids in lexicon.items():
+            present = tuple(dict.fromkeys(pid for pid in pids if pid in self.protocols))
+            if present:
+                out[phrase] = present
+        return out
+
+    def exact_matches(self, query_lower: str) -> List[str]:
+        exact: List[str] = []
+        for phrase, pids in self.intents.items():
+            if phrase in query_lower:
+                exact.extend(pid for pid in pids if pid not in exact)
+        return exact
+
+    def fuzzy_matches(self, query_lower: str) -> List[str]:
+        """Como exact_matches, tras corregir erratas de la consulta contra el léxico."""
+        corrected = self.fuzzy.correct(query_lower, self.known_words)
+        return self.exact_matches(corrected) if corrected else []
+
+    # ---------- Índice léxico ----------
+    def lexical_search(self, query_lower: str) -> List[str]:
+        """Ids cuyo título/pasos contienen la consulta literal (mismo criterio que el /search original)."""
+        if not self.lexical_index:
+            # Sin índice en memoria: recorrido de los cuerpos (el camino normal es el FTS5 del fichero)
+            return [pid for pid, p in self.protocols.items() if query_lower in lexical_text(p)]
+        if len(query_lower) < 3:
+            candidates: Iterable[str] = self.haystacks.keys()
+        else:
+            sets = []
+            for tri in set(_trigrams(query_lower)):
+                posting = self.postings.get(tri)
+                if not posting:
+                    return []
+                sets.append(posting)
+            sets.sort(key=len)
+            candidates = frozenset.intersection(*sets)
+        return [pid for pid in self.haystacks if pid in candidates and query_lower in self.haystacks[pid]]
+
+    def lexical_rank(self, query: str, k: int) -> List[Tuple[str, float, float]]:
+        """
+        (id, BM25, cobertura) de los k mejores por palabras de la consulta. La
+        cobertura es la fracción del IDF de la consulta presente en el protocolo
+        (1.0 = están todas las palabras): es la confianza del retriever léxico.
+        Sin índice léxico en memoria (registro por niveles) no hay ranking.
+        """
+        query_terms = list(dict.fromkeys(lexical_terms(query, self.language)))
+        if not query_terms or not self.doc_len:
+            return []
+        n = len(self.doc_len)
+        idf = {w: math.log(1.0 + (n - len(self.term_postings.get(w, ())) + 0.5)
+                           / (len(self.term_postings.get(w, ())) + 0.5)) for w in query_terms}
+        total = sum(idf.values())
+        scores: Dict[str, float] = {}
+        covered: Dict[str, float] = {}
+        for w in query_terms:
+            for pid, tf in self.term_postings.get(w, ()):
+                norm = 1.0 - BM25_B + BM25_B * self.doc_len[pid] / self.avg_doc_len
+                scores[pid] = scores.get(pid, 0.0) + idf[w] * tf * (BM25_K1 + 1.0) / (tf + BM25_K1 * norm)
+                covered[pid] = covered.get(pid, 0.0) + idf[w]
+        best = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [(pid, score, covered[pid] / total) for pid, score in best]
+
+    # ---------- Índice vectorial ----------
+    @property
+    def vectors_ready(self) -> bool:
+        return self.index is not None or self._embeddings is not None or self._quantized is not None
+
+    def build_vectors(self, embedding_generator: Any, faiss: Any = None, quantization: str = QUANTIZATION) -> None:
+        if not self.protocols:
+            return
+        t0 = time.perf_counter()
+        ids: List[str] = []
+        texts: List[str] = []
+        for pid, p in self.protocols.items():
+            ids.append(pid)
+            texts.append(protocol_text(p))
+        embeds = embedding_generator.generate_embeddings_batch(texts)
+        if not embeds:
+            print(f"[RAG] Error generando embeddings ({self.language})")
+            return
+        emb = np.asarray(embeds, dtype=np.float32)
+        # Normalizar L2 para usar producto punto como coseno
+        norms = np.linalg.norm(emb, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        emb = emb / norms
+
+        if quantization in ("int8", "pq"):
+            quantized = QuantizedIndex(emb, quantization)
+            self.protocol_ids, self.index, self._embeddings, self._quantized = ids, None, None, quantized
+            mem = quantized.memory()
+            INDEX_BYTES.labels(self.language, "codes").set(mem["codes_bytes"])
+            INDEX_BYTES.labels(self.language, "float32").set(mem["rescore_resident_bytes"])
+            print(f"[RAG] Índice {quantization} [{self.language}] con {emb.shape[0]} protocolos "
+                  f"({mem['codes_bytes'] / 1024:.1f} KiB vs {mem['float32_bytes'] / 1024:.1f} KiB float32)")
+        elif faiss is not None:
+            index = faiss.IndexFlatIP(emb.shape[1])
+            index.add(emb)
+            self.protocol_ids, self.index, self._embeddings, self._quantized = ids, index, None, None
+            INDEX_BYTES.labels(self.language, "float32").set(emb.nbytes)
+            print(f"[RAG] Índice FAISS [{self.language}] con {emb.shape[0]} protocolos (dim={emb.shape[1]})")
+        else:
+            self.protocol_ids, self.index, self._embeddings, self._quantized = ids, None, emb, None
+            INDEX_BYTES.labels(self.language, "float32").set(emb.nbytes)
+            print(f"[RAG] Índice NumPy [{self.language}] con {emb.shape[0]} protocolos.")
+        INDEX_SIZE.labels(self.language).set(emb.shape[0])
+        INDEX_DIMS.set(emb.shape[1])
+        INDEX_BUILD_SECONDS.labels(self.language).set(time.perf_counter() - t0)
+
+    def vector_search(self, q: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """(id, score) de los top_k vecinos de q (ya normalizado)."""
+        if self.index is not None:
+            scores, indices = self.index.search(q.reshape(1, -1).astype(np.float32), top_k)
+            pairs = zip(indices[0], scores[0])
+        elif self._embeddings is not None:
+            sims = (self._embeddings @ q).ravel()
+            idxs = np.argsort(-sims)[:top_k]
+            pairs = zip(idxs, sims[idxs])
+        elif self._quantized is not None:
+            pairs = zip(*self._quantized.search(q, top_k))
+        else:
+            return []
+        return [(self.protocol_ids[int(i)], float(s)) for i, s in pairs if 0 <= int(i) < len(self.protocol_ids)]
+
+    # ---------- Caché ----------
+    def cached(self, key: Tuple, compute: Callable[[], Any], cacheable: bool = True) -> Any:
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                SHARD_CACHE.labels(self.language, "hit").inc()
+                return self._cache[key]
+        self.cache_misses += 1
+        SHARD_CACHE.labels(self.language, "miss").inc()
+        value = compute()
+        if cacheable and self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[key] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "protocols": len(self.protocols), "intents": len(self.intents), "fuzzy_terms": len(self.fuzzy),
+            "trigrams": len(self.postings), "bm25_terms": len(self.term_postings),
+            "vectors": len(self.protocol_ids) if self.vectors_ready else 0,
+            "quantization": self._quantized.method if self._quantized is not None else "none",
+            "cache_entries": len(self._cache), "cache_hits": self.cache_hits, "cache_misses": self.cache_misses,
+        }
@@ -0,0 +1,345 @@
+# backend/core/step_graph.py
+"""
+Grafo de pasos de un protocolo, compilado al cargar.
+
+Aristas de cada paso (en este orden):
+  next_step_logic   if_continue, if_exit, if_emergency, if_<rama>: ...
+  next_conditions   [{condition, next_step}]
+  next_step         salto explícito
+  (por defecto)     el paso siguiente si no hay if_continue ni next_step,
+                    como hace StepsPlayer; tras el último, fin del protocolo
+
+Destinos: un entero es el id de un paso (no su índice). Los textos son
+terminales: repeat_cycle (el propio paso), protocolo_completo / if_exit (FIN),
+llamadas al 112 y medidas de emergencia o if_emergency (EMERGENCIA) y el
+resto (rcp_protocol, recovery_position, ...) derivación a otro protocolo.
+
+Se precalcula por paso (tuplas indexadas por índice de paso, -1 = nunca):
+  reachable       alcanzable desde el primer paso
+  dist_critical   saltos hasta el paso crítico más cercano (0 si lo es)
+  dist_emergency  saltos hasta una rama de emergencia explícita
+  dist_exit       saltos hasta cualquier salida (fin, emergencia, derivación)
+  escalation      por señal de escalada (SIGNALS), a dónde ir (ver _escalation)
+
+Señales de escalada: el fragmento que disparó el patrón de emergencia
+(core/safety.py) se clasifica con classify_signal en inconsciencia, sangrado
+masivo o emergencia genérica, y cada una sólo sigue las ramas explícitas que
+la atienden (if_unconscious -> rcp_protocol, if_massive_bleeding -> presión
+directa + 112). Sin rama para la señal se sigue el flujo normal (el paso
+siguiente) con la alerta de emergencia; nunca se salta a un paso crítico no
+relacionado ni se repite el paso que el usuario acaba de responder.
+
+Un grafo con destinos inexistentes, ids repetidos, pasos inalcanzables o
+ciclos sin salida se rechaza al cargar (StepGraphError), no junto al paciente.
+
+Uso (desde backend/):
+    python -m core.step_graph rag/protocols
+    python -m core.step_graph rag/protocols --json
+"""
+from __future__ import annotations
+import argparse
+import json
+import re
+import sys
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Terminales (destinos negativos)
+EXIT = -1
+EMERGENCY = -2
+HANDOFF = -3
+TERMINALS = {EXIT: "exit", EMERGENCY: "emergency", HANDOFF: "handoff"}
+
+_REPEAT = {"repeat_cycle", "repeat", "repetir", "repetir_ciclo"}
+_EXIT = {"protocolo_completo", "protocol_complete", "complete", "fin", "end"}
+_EMERGENCY_HINTS = ("112", "911", "emergency", "emergencia")
+
+# (clave, destino, etiqueta): destino >= 0 es un índice de paso; etiqueta = texto original
+Edge = Tuple[str, int, Optional[str]]
+# (destino, rama, etiqueta): destino = índice del paso a servir, HANDOFF (etiqueta =
+# protocolo de destino) o None = sin rama, flujo normal; rama = clave usada o ""
+Escalation = Tuple[Optional[int], str, Optional[str]]
+
+# Señal -> (patrón sobre el fragmento de emergencia, ramas que la atienden,
+# prefijos de las ramas de los pasos que la tratan). En orden de prioridad;
+# la última es la genérica.
+SIGNALS: Tuple[Tuple[str, Optional["re.Pattern[str]"], Tuple[str, ...], Tuple[str, ...]], ...] = (
+    ("unconscious", re.compile(r"no\s+respira|inconsciente|sin\s+pulso|parada|colapso", re.I),
+     ("if_unconscious", "if_not_breathing", "if_no_pulse", "if_cardiac_arrest"), ()),
+    ("massive_bleeding", re.compile(r"sangrado|hemorragia", re.I),
+     ("if_massive_bleeding", "if_severe_bleeding", "if_bleeding_continues"), ("if_bleeding_",)),
+    ("emergency", None, ("if_emergency",), ()),
+)
+SIGNAL_NAMES = tuple(name for name, _, _, _ in SIGNALS)
+_STAY: Escalation = (None, "", None)
+
+
+def classify_signal(fragments: Iterable[str]) -> str:
+    """Fragmentos que dispararon patrones de emergencia -> señal más prioritaria."""
+    text = " ".join(fragments)
+    for name, pattern, _, _ in SIGNALS:
+        if pattern is None or pattern.search(text):
+            return name
+    return SIGNAL_NAMES[-1]
+
+
+class StepGraphError(ValueError):
+    """Grafo de pasos inválido; `problems` trae todos los fallos."""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__("grafo de pasos inválido: " + "; ".join(problems[:5]))
+
+
+def _pairs(logic: Any) -> Iterable[Tuple[str, Any]]:
+    # dict (pydantic) o tupla de pares (RuntimeStep)
+    return logic.items() if isinstance(logic, dict) else (logic or ())
+
+
+def _classify(key: str, target: Any, index: int, ids: Dict[Any, int]) -> Tuple[Optional[int], Optional[str]]:
+    """Destino -> (índice o terminal, etiqueta); índice None si el id no existe."""
+    if isinstance(target, int) and not isinstance(target, bool):
+        return ids.get(target), None
+    label = str(target).strip()
+    low = label.lower()
+    if low in _REPEAT:
+        return index, label
+    if key == "if_emergency" or any(h in low for h in _EMERGENCY_HINTS):
+        return EMERGENCY, label
+    if key == "if_exit" or low in _EXIT:
+        return EXIT, label
+    return HANDOFF, label
+
+
+def _bfs(adj: Sequence[Sequence[int]], sources: Iterable[int], size: int) -> List[int]:
+    dist = [-1] * size
+    queue = deque()
+    for s in sources:
+        if dist[s] < 0:
+            dist[s] = 0
+            queue.append(s)
+    while queue:
+        u = queue.popleft()
+        for v in adj[u]:
+            if dist[v] < 0:
+                dist[v] = dist[u] + 1
+                queue.append(v)
+    return dist
+
+
+class StepGraph:
+    """Grafo compilado de un protocolo (inmutable; comparable y hashable para el StringPool)."""
+
+    __slots__ = ("edges", "critical", "reachable", "dist_critical", "dist_emergency", "dist_exit", "escalation")
+
+    def __init__(self, edges: Tuple[Tuple[Edge, ...], ...], critical: Tuple[bool, ...], reachable: Tuple[bool, ...],
+                 dist_critical: Tuple[int, ...], dist_emergency: Tuple[int, ...], dist_exit: Tuple[int, ...],
+                 escalation: Tuple[Optional[int], ...]):
+        for name, value in zip(self.__slots__, (edges, critical, reachable, dist_critical, dist_emergency,
+                                                dist_exit, escalation)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("StepGraph es inmutable")
+
+    def _key(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, n) for n in self.__slots__)
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def escalate(self, index: int, signal: str) -> Escalation:
+        """Destino precalculado de la señal `signal` recibida en el paso `index` (ver _escalation)."""
+        if not 0 <= index < len(self.escalation) or signal not in SIGNAL_NAMES:
+            return _STAY
+        return self.escalation[index][SIGNAL_NAMES.index(signal)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        def dest(t: int) -> Any:
+            return TERMINALS.get(t, t)
+
+        return {
+            "steps": [{
+                "index": i, "critical": self.critical[i], "reachable": self.reachable[i],
+                "dist_critical": self.dist_critical[i], "dist_emergency": self.dist_emergency[i],
+                "dist_exit": self.dist_exit[i],
+                "escalation": {name: {"to": "next" if to is None else dest(to), "key": key,
+                                      **({"label": lb} if lb else {})}
+                               for name, (to, key, lb) in zip(SIGNAL_NAMES, self.escalation[i])},
+                "edges": [{"key": k, "to": dest(t), **({"label": lb} if lb else {})} for k, t, lb in self.edges[i]],
+            } for i in range(len(self.edges))],
+        }
+
+
+def _edges(steps: Sequence[Any], ids: Dict[Any, int], problems: List[str]) -> List[Tuple[Edge, ...]]:
+    out: List[Tuple[Edge, ...]] = []
+    last = len(steps) - 1
+    for i, step in enumerate(steps):
+        sid = getattr(step, "id", i)
+        raw: List[Tuple[str, Any]] = list(_pairs(getattr(step, "next_step_logic", None)))
+        for cond in getattr(step, "next_conditions", None) or ():
+            raw.append((f"cond:{getattr(cond, 'condition', '')}", getattr(cond, "next_step", None)))
+        explicit = getattr(step, "next_step", None)
+        if explicit is not None:
+            raw.append(("next_step", explicit))
+        edges: List[Edge] = []
+        for key, target in raw:
+            if target is None:
+                continue
+            dest, label = _classify(key, target, i, ids)
+            if dest is None:
+                problems.append(f"paso {sid}: {key} -> {target!r} no existe")
+                continue
+            edges.append((key, dest, label))
+        if not any(k in ("if_continue", "next_step") for k, _ in raw):
+            edges.append(("default", i + 1 if i < last else EXIT, None))
+        out.append(tuple(edges))
+    return out
+
+
+def _escalation(i: int, signal: int, edges: Sequence[Tuple[Edge, ...]], forward: Sequence[Sequence[int]],
+                backward: Sequence[Sequence[int]], size: int) -> Escalation:
+    """
+    Señal SIGNALS[signal] recibida en el paso i (la alerta de emergencia se da siempre):
+    1. rama del paso para la señal (o su if_emergency): a un paso -> ese paso; a una
+       derivación -> ese protocolo; a 112/emergencia -> se sigue con la maniobra: el
+       paso más cercano hacia delante que trata la señal (del aviso al 112 a la
+       presión directa) o, si no hay, el flujo normal
+    2. rama de la señal en otro paso, el más cercano hacia delante y luego hacia
+       atrás: su derivación si la tiene, si no ese paso (el que trata la señal)
+    3. nada (None): se sigue el flujo normal, al paso siguiente
+    """
+    _, _, keys, prefixes = SIGNALS[signal]
+    n = len(edges)
+
+    def own(j: int, generic: bool) -> Optional[Edge]:
+        wanted = keys + (SIGNALS[-1][2] if generic else ())
+        return next((e for e in edges[j] if e[0] in wanted), None)
+
+    def treats(j: int) -> bool:
+        return any(k in keys or k.startswith(prefixes) for k, _, _ in edges[j]) if prefixes else False
+
+    def nearest(pred: Any, directions: Sequence[Sequence[Sequence[int]]]) -> Optional[int]:
+        for adj in directions:
+            dist = _bfs(adj, [i], size)
+            best = min(((dist[j], j) for j in range(n) if dist[j] > 0 and pred(j)), default=None)
+            if best is not None:
+                return best[1]
+        return None
+
+    edge = own(i, generic=True)
+    if edge is not None:
+        key, to, label = edge
+        if to == HANDOFF:
+            return HANDOFF, key, label
+        if to >= 0:
+            # Rama explícita, aunque repita el propio paso
+            return to, key, None
+        # 112 / emergencia (o fin): alerta y seguir con la maniobra que trata la señal
+        return nearest(treats, (forward,)), key, None
+    j = nearest(lambda j: own(j, generic=False) is not None, (forward, backward))
+    if j is None:
+        return _STAY
+    key, to, label = own(j, generic=False)
+    if to == HANDOFF:
+        return HANDOFF, key, label
+    return j, key, None
+
+
+def compile_step_graph(steps: Sequence[Any]) -> StepGraph:
+    """Pasos (pydantic o RuntimeStep) -> StepGraph; StepGraphError si el grafo no es válido."""
+    problems: List[str] = []
+    ids: Dict[Any, int] = {}
+    for i, step in enumerate(steps):
+        sid = getattr(step, "id", i)
+        if sid in ids:
+            problems.append(f"paso {sid}: id repetido")
+        ids.setdefault(sid, i)
+    edges = _edges(steps, ids, problems)
+
+    # Nodos 0..n-1 = pasos; n, n+1, n+2 = terminales EXIT, EMERGENCY, HANDOFF
+    n = len(steps)
+    size = n + 3
+
+    def node(t: int) -> int:
+        return t if t >= 0 else n - 1 - t
+
+    forward: List[List[int]] = [[] for _ in range(size)]
+    backward: List[List[int]] = [[] for _ in range(size)]
+    for i, out in enumerate(edges):
+        for _, t, _ in out:
+            if node(t) not in forward[i]:
+                forward[i].append(node(t))
+                backward[node(t)].append(i)
+
+    critical = tuple(bool(getattr(s, "critical", False)) for s in steps)
+    reachable = _bfs(forward, [0], size)[:n] if n else []
+    dist_critical = _bfs(backward, [i for i in range(n) if critical[i]], size)[:n]
+    dist_emergency = _bfs(backward, [node(EMERGENCY)], size)[:n]
+    dist_exit = _bfs(backward, [node(t) for t in TERMINALS], size)[:n]
+
+    for i in range(n):
+        sid = getattr(steps[i], "id", i)
+        if reachable[i] < 0:
+            problems.append(f"paso {sid}: inalcanzable desde el primer paso")
+        elif dist_exit[i] < 0:
+            in_cycle = _bfs(forward, forward[i], size)[i] >= 0
+            problems.append(f"paso {sid}: {'ciclo' if in_cycle else 'camino'} sin salida")
+    if problems:
+        raise StepGraphError(problems)
+
+    return StepGraph(
+        tuple(edges), critical, tuple(d >= 0 for d in reachable),
+        tuple(dist_critical), tuple(dist_emergency), tuple(dist_exit),
+        tuple(tuple(_escalation(i, k, edges, forward, backward, size) for k in range(len(SIGNALS)))
+              for i in range(n)),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .protocol import iter_protocols
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("directory", type=Path, help="directorio con *.yaml")
+    ap.add_argument("--json", action="store_true", help="salida JSON (grafo completo)")
+    args = ap.parse_args(argv)
+
+    report: Dict[str, Any] = {}
+    bad = 0
+    for name, proto, err in iter_protocols(args.directory, workers=1):
+        if proto is None:
+            bad += 1
+            report[name] = {"error": err}
+            if not args.json:
+                print(f"{name}: {err}")
+            continue
+        graph = compile_step_graph(proto.steps)
+        report[proto.id] = graph.to_dict()
+        if args.json:
+            continue
+        print(f"{proto.id}")
+        ids = [s.id for s in proto.steps]
+
+        def show(t: Any) -> str:
+            return "-" if t is None else f"paso {ids[t]}" if isinstance(t, int) else t
+
+        for row, sid in zip(graph.to_dict()["steps"], ids):
+            edges = " ".join(f"{e['key']}->{e.get('label') or show(e['to'])}" for e in row["edges"])
+            esc = " ".join(f"{name}->{e.get('label') or show(e['to'])}" for name, e in row["escalation"].items())
+            print(f"  {sid:>3} {'C' if row['critical'] else ' '} crit={row['dist_critical']:>2} "
+                  f"emerg={row['dist_emergency']:>2} salida={row['dist_exit']:>2} {edges}")
+            print(f"      escalada: {esc}")
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
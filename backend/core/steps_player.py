@@ -2,8 +2,12 @@
 from __future__ import annotations
 from typing import Dict, List, Optional, Any
 
-from .protocol import Protocol, NextStepRequest as FlowNextStepRequest, NextStepResponse as FlowNextStepResponse
+from .capture import scrub_text
+from .journal import COMPLETE, EMERGENCY_EXIT, FEEDBACK, JOURNAL, RESET, STEP
+from .protocol import NextStepRequest as FlowNextStepRequest, NextStepResponse as FlowNextStepResponse
+from .runtime_protocol import RuntimeProtocol as Protocol
 from .search import RAGSearchEngine
+from .step_graph import HANDOFF, classify_signal
 
 
 class StepsPlayer:
@@ -46,18 +50,21 @@ class StepsPlayer:
 
         if user_feedback:
             sess["user_responses"].append({"step": step_idx, "feedback": user_feedback})
+            JOURNAL.record(JOURNAL.pseudonym(session_id), flow_id, step_idx, FEEDBACK, scrub_text(user_feedback)[:200])
 
         # --- Determinar siguiente paso ---
         next_step_idx = self._determine_next_step(protocol, step_idx, user_feedback)
 
         if next_step_idx is None or next_step_idx >= len(protocol.steps or []):
             # Protocolo completado o fin por emergencia
+            JOURNAL.record(JOURNAL.pseudonym(session_id), flow_id, step_idx, EMERGENCY_EXIT if next_step_idx is None else COMPLETE)
             return self._handle_protocol_completion(protocol, sess)
 
         # --- Paso actual ---
         current_step = protocol.steps[next_step_idx]
         sess["current_step"] = next_step_idx
         sess["step_history"].append(next_step_idx)
+        JOURNAL.record(JOURNAL.pseudonym(session_id), flow_id, next_step_idx, STEP)
 
         # --- Seguridad / alertas ---
         safety_alert = self._check_safety_criteria(protocol, current_step, user_feedback)
@@ -92,9 +99,18 @@ class StepsPlayer:
 
         current_step = steps[current_step_idx]
 
-        # Salida por emergencia en feedback
-        if user_feedback and self._check_emergency_exit(user_feedback, protocol):
-            return None  # Terminar protocolo por emergencia
+        # Escalada por emergencia en feedback: destino precalculado en el grafo de
+        # pasos para la señal (rama explícita que la atiende)
+        hits = self._emergency_hits(user_feedback) if user_feedback else []
+        if hits:
+            graph = getattr(protocol, "graph", None)
+            to = graph.escalate(current_step_idx, classify_signal(hits))[0] if graph is not None else None
+            if to is not None and to != HANDOFF:
+                return to
+            # Sin rama (o derivación, que el cliente recibe en /next_step): paso siguiente
+            # normal sin pasar del último; la alerta la añade _check_safety_criteria
+            nxt = getattr(current_step, "next_step", None)
+            return min(nxt if nxt is not None else current_step_idx + 1, len(steps) - 1)
 
         # Condiciones de transición (si el YAML rico las define)
         next_conditions = getattr(current_step, "next_conditions", None)
@@ -137,17 +153,20 @@ class StepsPlayer:
 
         return condition_lower and condition_lower in feedback_lower
 
-    def _check_emergency_exit(self, user_feedback: str, protocol: Protocol) -> bool:
-        """Verifica si el feedback indica una situación de emergencia."""
+    def _emergency_hits(self, user_feedback: str) -> List[str]:
+        """Palabras de emergencia presentes en el feedback (vacío si no hay)."""
         emergency_keywords = [
             "inconsciente", "no respira", "cianosis", "azul", "morado",
             "convulsiones", "sangrado intenso", "shock", "colapso",
         ]
         feedback_lower = (user_feedback or "").lower()
-        return any(k in feedback_lower for k in emergency_keywords)
+        return [k for k in emergency_keywords if k in feedback_lower]
 
     def _check_safety_criteria(self, protocol: Protocol, current_step: Any, user_feedback: Optional[str]) -> Optional[str]:
         """Verifica criterios de seguridad y genera alertas si es necesario."""
+        if user_feedback and self._emergency_hits(user_feedback):
+            return f"EMERGENCIA DETECTADA: {getattr(protocol, 'emergency_action', None) or 'Llama al 112'}"
+
         # Red flags del protocolo (si existen)
         if user_feedback and getattr(protocol, "triage", None) and getattr(protocol.triage, "red_flags", None):
             feedback_lower = user_feedback.lower()
@@ -224,7 +243,8 @@ class StepsPlayer:
     def reset_session(self, session_id: str = "default") -> None:
         """Reinicia una sesión activa."""
         if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
+            sess = self.active_sessions.pop(session_id)
+            JOURNAL.record(JOURNAL.pseudonym(session_id), sess.get("protocol_id"), sess.get("current_step", 0), RESET)
 
     def get_session_status(self, session_id: str = "default") -> Optional[Dict[str, Any]]:
         """Obtiene el estado de una sesión activa."""
@@ -0,0 +1,120 @@
+# backend/core/timing.py
+from __future__ import annotations
+import asyncio
+import functools
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+# Desactivable por entorno (p.ej. si un proxy no acepta cabeceras extra)
+SERVER_TIMING_ENABLED = os.getenv("CONRUMBO_SERVER_TIMING", "1") not in {"0", "false", "no"}
+
+# Lista (nombre, segundos) de la petición en curso; None fuera de una petición
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("conrumbo_timings", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    """Anota la duración de una etapa para la cabecera Server-Timing (no-op fuera de petición)."""
+    sink = _timings.get()
+    if sink is not None:
+        sink.append((name, seconds))
+
+
+def current_timings() -> Dict[str, float]:
+    """Duraciones acumuladas por etapa de la petición en curso."""
+    out: Dict[str, float] = {}
+    for name, secs in _timings.get() or ():
+        out[name] = out.get(name, 0.0) + secs
+    return out
+
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={secs * 1000.0:.3f}" for name, secs in timings.items())
+
+
+# -----------------------
+# Ruta cronometrada
+# -----------------------
+
+def _wrap_endpoint(call: Callable) -> Callable:
+    if getattr(call, "__conrumbo_timed__", False):
+        return call
+
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                record("handler", time.perf_counter() - t0)
+    else:
+        @functools.wraps(call)
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                record("handler", time.perf_counter() - t0)
+
+    timed.__conrumbo_timed__ = True  # type: ignore[attr-defined]
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute que separa el tiempo del endpoint ("handler") del resto del manejador
+    de FastAPI (lectura/validación del cuerpo + jsonable_encoder + render JSON = "serialize").
+    """
+
+    def get_route_handler(self):
+        self.dependant.call = _wrap_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            t0 = time.perf_counter()
+            response = await handler(request)
+            total = time.perf_counter() - t0
+            handler_secs = current_timings().get("handler", 0.0)
+            record("serialize", max(0.0, total - handler_secs))
+            return response
+
+        return timed_handler
+
+
+# -----------------------
+# Middleware ASGI
+# -----------------------
+
+class ServerTimingMiddleware:
+    """Añade `Server-Timing` con las etapas registradas durante la petición (en ms)."""
+
+    def __init__(self, app, enabled: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        sink: List[Tuple[str, float]] = []
+        token = _timings.set(sink)
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                timings = current_timings()
+                timings["total"] = time.perf_counter() - t0
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", format_server_timing(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
@@ -0,0 +1,253 @@
+# backend/core/transcript.py
+"""
+Triaje incremental sobre transcripciones de voz en streaming.
+
+El cliente envía trozos (parciales o finales) de la transcripción de una
+sesión. Por sesión se guarda el estado del emparejador:
+  - la posición del autómata Aho-Corasick (un entero) tras el texto confirmado,
+  - las alertas de seguridad acumuladas (una emergencia detectada no se olvida),
+  - los candidatos de protocolo con su puntuación.
+Un trozo parcial se escanea desde la posición confirmada sin modificarla
+(el reconocedor lo reescribirá); uno final la avanza. Así cada palabra se
+procesa una vez y el protocolo se conoce antes de que el usuario termine.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .language import DEFAULT_LANGUAGE
+
+SESSION_TTL_S = float(os.getenv("TRANSCRIPT_SESSION_TTL_S", "900"))
+MAX_SESSIONS = int(os.getenv("TRANSCRIPT_MAX_SESSIONS", "10000"))
+# Ventana de texto confirmado que se re-evalúa con los patrones de seguridad
+# (cubren frases como "sangrado ... no para" que cruzan trozos)
+SAFETY_WINDOW_CHARS = int(os.getenv("TRANSCRIPT_SAFETY_WINDOW", "160"))
+# Peso de un protocolo aceptado por el triaje léxico de un trozo final sin frases
+# (como una frase de dos palabras: una palabra suelta posterior no lo desbanca)
+ACCEPTED_WEIGHT = 2.0
+
+
+class PhraseAutomaton:
+    """Aho-Corasick sobre frases en minúsculas; el estado es un entero reanudable."""
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for phrase in phrases:
+            self._add(phrase)
+        self._link()
+
+    def _add(self, phrase: str) -> None:
+        state = 0
+        for ch in phrase:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + (len(self.phrases),)
+        self.phrases.append(phrase)
+
+    def _link(self) -> None:
+        queue: Deque[int] = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def feed(self, state: int, text: str) -> Tuple[int, List[int]]:
+        """Avanza desde `state` con `text`; devuelve (nuevo estado, índices de frases encontradas)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: List[int] = []
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.extend(out[state])
+        return state, hits
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+
+class TranscriptSession:
+    __slots__ = ("session_id", "language", "edad", "state", "automaton", "committed", "words", "safety_hits",
+                 "diagnostic", "scores", "last_seq", "created", "last_seen", "first_match_ms")
+
+    def __init__(self, session_id: str, language: str, edad: str):
+        self.session_id = session_id
+        self.language = language
+        self.edad = edad
+        self.state = 0                         # posición del autómata tras el texto confirmado
+        self.automaton: Any = None             # autómata al que se refiere `state`
+        self.committed = ""                    # cola del texto confirmado (ventana de seguridad)
+        self.words = 0
+        self.safety_hits: Dict[int, str] = {}  # patrón de emergencia -> fragmento que lo disparó
+        self.diagnostic = False
+        self.scores: Dict[str, float] = {}     # protocolo -> puntuación confirmada
+        self.last_seq = -1
+        self.created = self.last_seen = time.monotonic()
+        self.first_match_ms: Optional[float] = None
+
+
+class TranscriptTriage:
+    """Sesiones de triaje incremental (acotadas por número y TTL)."""
+
+    def __init__(self, ttl_s: float = SESSION_TTL_S, max_sessions: int = MAX_SESSIONS):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, TranscriptSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Un autómata por (motor, idioma): se rehace solo si el motor cambia (recarga)
+        self._automata: Dict[Tuple[int, str], Tuple[PhraseAutomaton, List[Tuple[str, ...]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    # ---------- Sesiones ----------
+    def session(self, session_id: str, language: str, edad: str) -> TranscriptSession:
+        now = time.monotonic()
+        with self._lock:
+            sess = self._sessions.get(session_id)
+            if sess is None or sess.language != language:
+                sess = TranscriptSession(session_id, language, edad)
+                self._sessions[session_id] = sess
+            self._sessions.move_to_end(session_id)
+            sess.last_seen = now
+            if edad:
+                sess.edad = edad
+            # Evicción: caducadas primero, después las menos recientes
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_seen > self.ttl_s or len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                else:
+                    break
+        return sess
+
+    def accept(self, session_id: str, protocol_id: str, weight: float = ACCEPTED_WEIGHT) -> None:
+        """Suma a la sesión un protocolo resuelto fuera del autómata (triaje léxico del trozo)."""
+        with self._lock:
+            sess = self._sessions.get(session_id)
+            if sess is not None:
+                sess.scores[protocol_id] = sess.scores.get(protocol_id, 0.0) + weight
+
+    def reset(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    # ---------- Autómata por idioma ----------
+    def _automaton(self, rag: Any, language: str) -> Tuple[PhraseAutomaton, List[Tuple[str, ...]]]:
+        key = (id(rag), language)
+        cached = self._automata.get(key)
+        if cached is None:
+            shard = rag.shard(language)
+            phrases = sorted(shard.intents)
+            cached = (PhraseAutomaton(phrases), [shard.intents[p] for p in phrases])
+            # Sólo el motor vigente: los autómatas de motores anteriores se descartan
+            self._automata = {k: v for k, v in self._automata.items() if k[0] == id(rag)}
+            self._automata[key] = cached
+        return cached
+
+    # ---------- Trozo de transcripción ----------
+    def feed(self, rag: Any, triage_engine: Any, safety: Any, session_id: str, text: str,
+             is_final: bool = False, seq: Optional[int] = None, language: str = DEFAULT_LANGUAGE,
+             edad: str = "") -> Dict[str, Any]:
+        sess = self.session(session_id, language, edad)
+        chunk = " ".join((text or "").lower().split())
+        # Trozos concurrentes de la misma sesión (reintentos del cliente) no se pisan el estado
+        with self._lock:
+            if seq is not None:
+                if seq <= sess.last_seq and is_final:
+                    # Reenvío de un final ya confirmado: no contar dos veces
+                    return self._result(sess, dict(sess.scores), [], rag, triage_engine, duplicate=True)
+                if is_final:
+                    sess.last_seq = seq
+
+            scores = dict(sess.scores)
+            matched: List[str] = []
+            state = sess.state
+            if rag is not None and chunk:
+                automaton, targets = self._automaton(rag, sess.language)
+                if sess.automaton is not automaton:
+                    # Recarga de protocolos: la posición anterior no vale en el autómata nuevo
+                    sess.automaton, sess.state = automaton, 0
+                # Separador con lo confirmado para no unir palabras entre trozos
+                state, hits = automaton.feed(sess.state, (" " if sess.committed else "") + chunk)
+                for idx in hits:
+                    phrase = automaton.phrases[idx]
+                    matched.append(phrase)
+                    # Frases más largas = más específicas; la edad se resuelve al final
+                    for pid in targets[idx]:
+                        scores[pid] = scores.get(pid, 0.0) + len(phrase.split())
+
+            # Seguridad sobre la cola confirmada + el trozo (patrones que cruzan trozos)
+            window = (sess.committed + " " + chunk).strip()
+            new_safety: Dict[int, str] = {}
+            diagnostic = sess.diagnostic
+            if safety is not None and chunk:
+                new_safety = dict(safety.emergency_matches(window, skip=sess.safety_hits))
+                diagnostic = diagnostic or safety.is_diagnostic(window)
+
+            if is_final and chunk:
+                sess.state = state
+                sess.committed = window[-SAFETY_WINDOW_CHARS:]
+                sess.words += len(chunk.split())
+                sess.scores = scores
+                sess.safety_hits.update(new_safety)
+                sess.diagnostic = diagnostic
+            # Una emergencia oída en un parcial se comunica ya (y se guarda: no se des-escala)
+            elif new_safety:
+                sess.safety_hits.update(new_safety)
+            return self._result(sess, scores, matched, rag, triage_engine,
+                                interim_words=0 if is_final else len(chunk.split()), diagnostic=diagnostic)
+
+    def _result(self, sess: TranscriptSession, scores: Dict[str, float], matched: List[str], rag: Any,
+                triage_engine: Any, duplicate: bool = False, interim_words: int = 0,
+                diagnostic: bool = False) -> Dict[str, Any]:
+        protocol_id = None
+        candidates: List[Dict[str, Any]] = []
+        if scores:
+            ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+            candidates = [{"protocol_id": pid, "score": sc} for pid, sc in ranked[:3]]
+            protocol_id = ranked[0][0]
+            if triage_engine is not None:
+                protocol_id = triage_engine.resolve_age_variant(protocol_id, sess.edad or "adulto") or protocol_id
+        if protocol_id and sess.first_match_ms is None:
+            sess.first_match_ms = round((time.monotonic() - sess.created) * 1000.0, 1)
+
+        escalate = bool(sess.safety_hits)
+        immediate_action = None
+        if protocol_id and triage_engine is not None:
+            immediate_action = triage_engine.immediate_action(protocol_id, "lexical")
+        return {
+            "session_id": sess.session_id,
+            "language": sess.language,
+            "protocol_id": protocol_id,
+            "candidates": candidates,
+            "matched_phrases": matched,
+            "immediate_action": immediate_action,
+            "escalate_to_emergency": escalate,
+            "safety_hits": sorted(sess.safety_hits.values()),
+            "diagnostic": diagnostic or sess.diagnostic,
+            # Listo para mostrar la primera instrucción
+            "ready": bool(protocol_id) or escalate,
+            "words": sess.words + interim_words,
+            "first_match_ms": sess.first_match_ms,
+            "duplicate": duplicate,
+        }
@@ -1,9 +1,95 @@
 # backend/core/triage.py
 from __future__ import annotations
-from typing import Dict, List, Optional, Tuple, Any
+import itertools
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Any, TYPE_CHECKING
 
 from .protocol import TriageRequest, TriageResponse
-from .search import RAGSearchEngine
+from .runtime_protocol import RuntimeProtocol
+from .fuzzy import DeletionIndex
+from .language import DEFAULT_LANGUAGE, resolve_language
+
+if TYPE_CHECKING:
+    from .search import RAGSearchEngine
+
+# Tamaño máximo de la tabla memo de resoluciones de protocolo
+MEMO_SIZE = int(os.getenv("TRIAGE_MEMO_SIZE", "4096"))
+
+# Último recurso si nada casa (sólo se devuelve si está cargado)
+DEFAULT_PROTOCOL = "pa_general_v1"
+
+# Acción inmediata cuando el YAML no trae triage.immediate_action (la comparten
+# el triaje y el índice offline, core/offline_bundle.py)
+DEFAULT_IMMEDIATE_ACTIONS: Dict[str, str] = {
+    "pa_rcp_adulto_v1": "Si no respira o no tiene pulso, iniciar RCP inmediatamente y llamar al 112",
+    "pa_asfixia_adulto_v1": "Si no puede toser o hablar, realizar maniobra de Heimlich y llamar al 112",
+    "pa_hemorragias_v1": "Aplicar presión directa sobre la herida y elevar la extremidad si es posible",
+    "pa_quemaduras_v1": "Enfriar con agua fría durante 10-20 minutos, no aplicar cremas",
+    "pa_anafilaxia_v1": "Usar autoinyector de epinefrina si está disponible y llamar al 112 inmediatamente",
+    "pa_convulsiones_v1": "Proteger la cabeza, no introducir objetos en la boca, cronometrar la duración",
+    "pa_ictus_fast_v1": "Evaluar FAST (cara, brazos, habla, tiempo) y llamar al 112 inmediatamente",
+    "pa_dolor_toracico_v1": "Sentar al paciente, aflojar ropa ajustada y llamar al 112",
+}
+FALLBACK_IMMEDIATE_ACTION = "Seguir las instrucciones del protocolo y llamar al 112 si es necesario"
+
+
+def immediate_action_for(protocol_id: Optional[str], protocol: Any = None) -> Optional[str]:
+    """triage.immediate_action del protocolo o, si no lo trae, la acción por defecto de su id (o None)."""
+    triage = getattr(protocol, "triage", None)
+    action = getattr(triage, "immediate_action", None) if triage is not None else None
+    return action or DEFAULT_IMMEDIATE_ACTIONS.get(protocol_id or "")
+
+
+# ---------- Normalización de edad ----------
+_EDAD_CANONICA: Dict[str, str] = {
+    "adulto": "adulto", "adult": "adulto", "mayor": "adulto",
+    "niño": "nino", "nino": "nino", "child": "nino", "pediatrico": "nino", "pediátrico": "nino",
+    "lactante": "lactante", "bebé": "lactante", "bebe": "lactante", "infant": "lactante", "neonatal": "lactante",
+}
+_AUDIENCIA_EDADES: Dict[str, Tuple[str, ...]] = {
+    "adulto": ("adulto",),
+    "pediatrico": ("nino",),
+    "neonatal": ("lactante",),
+    "todas_edades": ("adulto", "nino", "lactante"),
+}
+_AGE_TOKEN_RE = re.compile(r"^(?P<head>.+?)_(?P<age>adulto|nino|niño|lactante|pediatrico)_(?P<tail>v\d+)$")
+
+
+def canonical_age(edad: Optional[str]) -> str:
+    return _EDAD_CANONICA.get((edad or "").strip().lower(), "adulto")
+
+
+def protocol_base_and_ages(pid: str, protocol: Any = None) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Familia (id sin token de edad) y edades que cubre un protocolo:
+      pa_rcp_adulto_v1 -> ("pa_rcp_v1", ("adulto",))
+      pa_hemorragias_v1 (todas_edades) -> ("pa_hemorragias_v1", ("adulto", "nino", "lactante"))
+    """
+    m = _AGE_TOKEN_RE.match(pid)
+    base = f"{m.group('head')}_{m.group('tail')}" if m else pid
+    audience = (getattr(protocol, "target_audience", None) or "").lower()
+    if audience in _AUDIENCIA_EDADES:
+        return base, _AUDIENCIA_EDADES[audience]
+    if m:
+        return base, (canonical_age(m.group("age")),)
+    meta = getattr(protocol, "metadata", None)
+    return base, (canonical_age(getattr(meta, "edad", None)),)
+
+
+def build_age_variant_index(protocols: Dict[str, RuntimeProtocol]) -> Dict[str, Dict[str, str]]:
+    """Índice familia -> {edad: protocol_id} a partir de los protocolos cargados."""
+    index: Dict[str, Dict[str, str]] = {}
+    for pid in sorted(protocols):
+        base, ages = protocol_base_and_ages(pid, protocols[pid])
+        variants = index.setdefault(base, {})
+        for age in ages:
+            # Una variante específica de edad gana a una de "todas_edades"
+            if age not in variants or len(ages) == 1:
+                variants[age] = pid
+    return index
 
 
 class TriageEngine:
@@ -19,6 +105,8 @@ class TriageEngine:
             "dolor_toracico": ["opresivo", "irradiado", "intenso"],
             "signos_ictus": ["parálisis facial", "debilidad brazo", "habla alterada"],
         }
+        self._moderate_sangrado = frozenset({"moderado", "visible"})
+        self._risky_lugar = frozenset({"via_publica", "lugar_aislado"})
 
         # Mapeo de intents a protocolos
         self.intent_protocol_mapping: Dict[str, str] = {
@@ -36,157 +124,247 @@ class TriageEngine:
             "dolor_toracico": "pa_dolor_toracico_v1",
         }
 
+        # Vecindario de borrados de los intents del mapeo (erratas en intent)
+        self._intent_fuzzy = DeletionIndex(self.intent_protocol_mapping)
+
+        # Tablas precalculadas: variantes por edad y riesgo por combinación de códigos
+        self.age_variants = build_age_variant_index(getattr(rag_engine, "summaries", None) or {})
+        self._risk_table = self._build_risk_table()
+        self._memo: "OrderedDict[Tuple, Tuple[Optional[str], str]]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self.memo_hits = 0
+        self.memo_misses = 0
+
     # ---------- API de alto nivel para conrumbo.py ----------
-    def run(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+    def run(self, payload: Dict[str, Any], semantic: bool = True) -> Dict[str, Any]:
         """
-        Puente para conrumbo.py: recibe un dict (p.ej. req.model_dump()),
-        construye TriageRequest y devuelve un resultado tipo:
+        Puente para conrumbo.py: recibe un dict (p.ej. req.model_dump()) y devuelve:
         {
-          "protocol_id": str, "confidence": float, "risk_level": str,
-          "immediate_action": Optional[str], "escalate_to_emergency": bool
+          "protocol_id": Optional[str], "confidence": float, "risk_level": str,
+          "immediate_action": Optional[str], "escalate_to_emergency": bool,
+          "matched_by": "intent" | "lexical" | "fuzzy" | "rag" | "default"
         }
+        Con semantic=False nunca llama a embeddings (ruta léxica, sin red).
+        Las entradas categóricas se reducen a una clave compacta: el riesgo sale de una
+        tabla precalculada y la resolución de protocolo de una tabla memo acotada.
         """
-        # Normaliza campos y defaults seguros
-        intent = (payload.get("intent") or payload.get("query") or "").strip().lower()
-        edad = (payload.get("edad") or "adulto").strip().lower()
-        estado_conciencia = (payload.get("estado_conciencia") or "desconocido").strip().lower()
-        respiracion = (payload.get("respiracion") or None)
-        respiracion = respiracion.strip().lower() if isinstance(respiracion, str) else respiracion
-        sangrado = (payload.get("sangrado") or None)
-        sangrado = sangrado.strip().lower() if isinstance(sangrado, str) else sangrado
-        lugar = (payload.get("lugar") or None)
-        lugar = lugar.strip().lower() if isinstance(lugar, str) else lugar
-        hay_ayuda = payload.get("hay_ayuda")
-        if isinstance(hay_ayuda, str):
-            hay_ayuda = hay_ayuda.strip().lower()
-        dispone_dea = payload.get("dispone_DEA")
-        if isinstance(dispone_dea, str):
-            dispone_dea = dispone_dea.strip().lower()
-
-        req = TriageRequest(
-            intent=intent or "desconocido",
-            edad=edad or "adulto",
-            estado_conciencia=estado_conciencia or "desconocido",
-            respiracion=respiracion,
-            sangrado=sangrado,
-            lugar=lugar,
-            hay_ayuda=str(hay_ayuda) if isinstance(hay_ayuda, bool) else hay_ayuda,
-            dispone_DEA=str(dispone_dea) if isinstance(dispone_dea, bool) else dispone_dea,
-        )
-
-        triage = self.evaluate_triage(req)
+        key = self.decision_key(payload)
+        intent, query, edad, risk_codes = key
+        risk_level, recommendations = self._risk_table[risk_codes]
+        protocol_id, matched_by = self._resolve_memo(intent, query, edad, semantic, request_language(payload))
 
         # Confianza heurística
-        confidence = 0.9 if intent in self.intent_protocol_mapping else 0.7
-        if triage.next_flow in (None, "", "pa_general_v1"):
+        confidence = 0.9 if intent in self.intent_protocol_mapping else (0.6 if matched_by == "fuzzy" else 0.7)
+        if protocol_id in (None, "", DEFAULT_PROTOCOL):
             confidence = 0.5
 
         return {
-            "protocol_id": triage.next_flow,
+            "protocol_id": protocol_id,
             "confidence": confidence,
-            "risk_level": triage.risk,
-            "immediate_action": triage.immediate_action,
-            "escalate_to_emergency": (triage.risk == "alto"),
+            "risk_level": risk_level,
+            "immediate_action": self.immediate_action(protocol_id, matched_by, intent),
+            "escalate_to_emergency": (risk_level == "alto"),
+            "matched_by": matched_by,
         }
 
+    def decision_key(self, payload: Dict[str, Any]) -> Tuple[str, str, str, Tuple[int, int, int, int, int]]:
+        """
+        Clave compacta: (intent, query extra, edad canónica, códigos de riesgo).
+        Los códigos sólo distinguen lo que la evaluación de riesgo usa:
+          conciencia/respiración: 1 = alto riesgo; sangrado: 2 = alto, 1 = moderado;
+          lugar: 1 = riesgoso; ayuda: 1 = no hay ayuda.
+        """
+        raw_intent = _norm(payload.get("intent"))
+        raw_query = _norm(payload.get("query"))
+        intent = raw_intent or raw_query
+        # La query sólo cuenta si aporta algo más que el intent
+        query = raw_query if raw_intent and raw_query != raw_intent else ""
+        return (
+            intent,
+            query,
+            canonical_age(payload.get("edad")),
+            self._risk_codes(
+                _norm(payload.get("estado_conciencia")), _norm(payload.get("respiracion")),
+                _norm(payload.get("sangrado")), _norm(payload.get("lugar")), payload.get("hay_ayuda"),
+            ),
+        )
+
     # ---------- Lógica principal ----------
-    def evaluate_triage(self, request: TriageRequest) -> TriageResponse:
+    def evaluate_triage(self, request: TriageRequest, semantic: bool = True,
+                        query: Optional[str] = None) -> Tuple[TriageResponse, str]:
         """Evalúa el triaje y determina el nivel de riesgo y protocolo a seguir."""
         risk_level, recommendations = self._assess_risk(request)
-        protocol_id = self._determine_protocol(request)
-        immediate_action = self._get_immediate_action(protocol_id, request)
+        protocol_id, matched_by = self._determine_protocol(request, semantic=semantic, query=query)
+        immediate_action = self.immediate_action(protocol_id, matched_by, _norm(request.intent))
 
         return TriageResponse(
             risk=risk_level,
             recommend=recommendations,
-            next_flow=protocol_id,
+            next_flow=protocol_id or "",
             immediate_action=immediate_action,
-        )
+        ), matched_by
 
     # ---------- Helpers internos ----------
-    def _assess_risk(self, request: TriageRequest) -> Tuple[str, List[str]]:
-        """Evalúa nivel de riesgo basado en criterios de entrada."""
+    def _risk_codes(self, conciencia: str, respiracion: str, sangrado: str, lugar: str,
+                    hay_ayuda: Any) -> Tuple[int, int, int, int, int]:
+        if isinstance(hay_ayuda, bool):
+            sin_ayuda = not hay_ayuda
+        else:
+            sin_ayuda = _norm(hay_ayuda) in {"no", "false"}
+        return (
+            int(conciencia in self.high_risk_criteria["estado_conciencia"]),
+            int(respiracion in self.high_risk_criteria["respiracion"]),
+            2 if sangrado in self.high_risk_criteria["sangrado"] else int(sangrado in self._moderate_sangrado),
+            int(lugar in self._risky_lugar),
+            int(sin_ayuda),
+        )
+
+    def _build_risk_table(self) -> Dict[Tuple[int, int, int, int, int], Tuple[str, List[str]]]:
+        """Tabla completa (2*2*3*2*2 = 48 entradas) de nivel de riesgo y recomendaciones."""
+        table: Dict[Tuple[int, int, int, int, int], Tuple[str, List[str]]] = {}
+        for codes in itertools.product((0, 1), (0, 1), (0, 1, 2), (0, 1), (0, 1)):
+            table[codes] = self._risk_from_codes(codes)
+        return table
+
+    @staticmethod
+    def _risk_from_codes(codes: Tuple[int, int, int, int, int]) -> Tuple[str, List[str]]:
+        conciencia, respiracion, sangrado, lugar, sin_ayuda = codes
         recommendations: List[str] = []
-        high_risk_flags: List[str] = []
-
-        # Estado de conciencia
-        est = (request.estado_conciencia or "").lower()
-        if est in self.high_risk_criteria["estado_conciencia"]:
-            high_risk_flags.append("estado_conciencia")
-
-        # Respiración
-        if request.respiracion:
-            resp = (request.respiracion or "").lower()
-            if resp in self.high_risk_criteria["respiracion"]:
-                high_risk_flags.append("respiracion")
-
-        # Sangrado
-        if request.sangrado:
-            sang = (request.sangrado or "").lower()
-            if sang in self.high_risk_criteria["sangrado"]:
-                high_risk_flags.append("sangrado")
-
-        # Nivel de riesgo y recomendaciones
-        if high_risk_flags:
-            risk_level = "alto"
+        if conciencia or respiracion or sangrado == 2:
             recommendations.append("llamar_112")
-            if "respiracion" in high_risk_flags or "estado_conciencia" in high_risk_flags:
+            if respiracion or conciencia:
                 recommendations.append("iniciar_rcp_si_necesario")
-            if "sangrado" in high_risk_flags:
+            if sangrado == 2:
                 recommendations.append("control_hemorragia")
-        elif self._has_moderate_risk_factors(request):
-            risk_level = "moderado"
-            recommendations += ["seguir_protocolo", "considerar_112_si_empeora"]
-        else:
-            risk_level = "bajo"
-            recommendations.append("seguir_protocolo")
+            return "alto", recommendations
+        if sangrado == 1 or lugar or sin_ayuda:
+            return "moderado", ["seguir_protocolo", "considerar_112_si_empeora"]
+        return "bajo", ["seguir_protocolo"]
 
-        return risk_level, recommendations
+    def _assess_risk(self, request: TriageRequest) -> Tuple[str, List[str]]:
+        """Evalúa nivel de riesgo basado en criterios de entrada."""
+        codes = self._risk_codes(
+            _norm(request.estado_conciencia), _norm(request.respiracion), _norm(request.sangrado),
+            _norm(request.lugar), request.hay_ayuda,
+        )
+        risk_level, recommendations = self._risk_table[codes]
+        return risk_level, list(recommendations)
 
-    def _has_moderate_risk_factors(self, request: TriageRequest) -> bool:
-        """Verifica factores de riesgo moderado."""
-        sangrado_moderado = (request.sangrado or "").lower() in {"moderado", "visible"}
-        lugar_riesgoso = (request.lugar or "").lower() in {"via_publica", "lugar_aislado"}
-        hay_ayuda_no = (request.hay_ayuda or "").lower() == "no"
-        return any([sangrado_moderado, lugar_riesgoso, hay_ayuda_no])
+    def _resolve_memo(self, intent: str, query: str, edad: str, semantic: bool,
+                      language: str = DEFAULT_LANGUAGE) -> Tuple[Optional[str], str]:
+        mkey = (intent, query, edad, semantic, language)
+        with self._memo_lock:
+            hit = self._memo.get(mkey)
+            if hit is not None:
+                self._memo.move_to_end(mkey)
+                self.memo_hits += 1
+                return hit
+        self.memo_misses += 1
+        embedder = self.rag_engine.embedding_generator
+        fallbacks = embedder.fallbacks
+        resolved = self._resolve(intent, query, edad, semantic, language)
+        if resolved[1] in ("rag", "default") and embedder.fallbacks != fallbacks:
+            # La búsqueda semántica usó el embedding local de emergencia: no se fija en la memo
+            return resolved
+        with self._memo_lock:
+            self._memo[mkey] = resolved
+            if len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return resolved
 
-    def _determine_protocol(self, request: TriageRequest) -> str:
-        """Determina el protocolo apropiado por intent/edad; si no, usa RAG como fallback."""
-        intent = (request.intent or "").lower().strip()
+    def lexical_match(self, text: str, edad: Optional[str] = None,
+                      language: str = DEFAULT_LANGUAGE) -> Optional[str]:
+        """Ruta léxica (sin embeddings): intents del mapeo o del léxico del idioma contenidos en el texto."""
+        t = (text or "").lower().strip()
+        if not t:
+            return None
+        for intent, pid in self.intent_protocol_mapping.items():
+            if intent in t:
+                return pid
+        exact = self.rag_engine.exact_matches(t, {"edad": edad or "", "language": language})
+        return exact[0] if exact else None
+
+    def fuzzy_match(self, text: str, edad: Optional[str] = None,
+                    language: str = DEFAULT_LANGUAGE) -> Optional[str]:
+        """Ruta tolerante a erratas: intent con distancia de edición 1-2 o léxico del idioma corregido."""
+        t = (text or "").lower().strip()
+        if not t:
+            return None
+        hit = self._intent_fuzzy.lookup(t)
+        if hit is not None:
+            return self.intent_protocol_mapping[hit[0]]
+        fuzzy = self.rag_engine.fuzzy_matches(t, {"edad": edad or "", "language": language})
+        return fuzzy[0] if fuzzy else None
+
+    def _resolve(self, intent: str, query: str, edad: str, semantic: bool,
+                 language: str = DEFAULT_LANGUAGE) -> Tuple[Optional[str], str]:
         base_protocol = self.intent_protocol_mapping.get(intent)
+        matched_by = "intent"
 
         if not base_protocol:
+            base_protocol = (self.lexical_match(intent, edad, language)
+                             or (self.lexical_match(query, edad, language) if query else None))
+            matched_by = "lexical"
+
+        if not base_protocol:
+            # Erratas ("hemoragia", "atragantamineto") antes de pagar embeddings
+            base_protocol = (self.fuzzy_match(intent, edad, language)
+                             or (self.fuzzy_match(query, edad, language) if query else None))
+            matched_by = "fuzzy"
+
+        if base_protocol:
+            # Intent reconocido: variante por edad validada contra lo cargado.
+            # Si la familia no está cargada se devuelve None (la acción inmediata sigue valiendo).
+            return self.resolve_age_variant(base_protocol, edad), matched_by
+
+        if semantic:
             # Fallback: búsqueda RAG (usa intent como query)
-            results = self.rag_engine.search(query=intent, context={"edad": request.edad}, top_k=1)
+            results = self.rag_engine.search(query=intent, context={"edad": edad, "language": language}, top_k=1)
             if results:
-                return results[0].protocol_id
-            # Último recurso
-            return "pa_general_v1"
-
-        # Adaptar por edad
-        edad = (request.edad or "").lower()
-        if "adulto" in base_protocol:
-            if edad in {"niño", "nino"}:
-                base_protocol = base_protocol.replace("_adulto_", "_nino_")
-            elif edad == "lactante":
-                base_protocol = base_protocol.replace("_adulto_", "_lactante_")
-
-        return base_protocol
-
-    def _get_immediate_action(self, protocol_id: str, request: TriageRequest) -> Optional[str]:
-        """Obtiene acción inmediata del protocolo (o default)."""
-        protocol = self.rag_engine.get_protocol(protocol_id)
-        if protocol and getattr(protocol, "triage", None) and getattr(protocol.triage, "immediate_action", None):
-            return protocol.triage.immediate_action
-
-        defaults = {
-            "pa_rcp_adulto_v1": "Si no respira o no tiene pulso, iniciar RCP inmediatamente y llamar al 112",
-            "pa_asfixia_adulto_v1": "Si no puede toser o hablar, realizar maniobra de Heimlich y llamar al 112",
-            "pa_hemorragias_v1": "Aplicar presión directa sobre la herida y elevar la extremidad si es posible",
-            "pa_quemaduras_v1": "Enfriar con agua fría durante 10-20 minutos, no aplicar cremas",
-            "pa_anafilaxia_v1": "Usar autoinyector de epinefrina si está disponible y llamar al 112 inmediatamente",
-            "pa_convulsiones_v1": "Proteger la cabeza, no introducir objetos en la boca, cronometrar la duración",
-            "pa_ictus_fast_v1": "Evaluar FAST (cara, brazos, habla, tiempo) y llamar al 112 inmediatamente",
-            "pa_dolor_toracico_v1": "Sentar al paciente, aflojar ropa ajustada y llamar al 112",
-        }
-        return defaults.get(protocol_id, "Seguir las instrucciones del protocolo y llamar al 112 si es necesario")
+                return results[0].protocol_id, "rag"
+        # Último recurso
+        return (DEFAULT_PROTOCOL if DEFAULT_PROTOCOL in self.rag_engine.protocols else None), "default"
+
+    def resolve_age_variant(self, protocol_id: str, edad: str) -> Optional[str]:
+        """
+        Variante del protocolo para la edad pedida, siempre un id cargado:
+        edad pedida -> adulto -> cualquier variante de la familia -> None.
+        """
+        base, _ = protocol_base_and_ages(protocol_id, self.rag_engine.summary(protocol_id))
+        variants = self.age_variants.get(base)
+        if not variants:
+            return protocol_id if protocol_id in self.rag_engine.protocols else None
+        return variants.get(canonical_age(edad)) or variants.get("adulto") or next(iter(variants.values()))
+
+    def _determine_protocol(self, request: TriageRequest, semantic: bool = True,
+                            query: Optional[str] = None) -> Tuple[Optional[str], str]:
+        """Determina el protocolo apropiado por intent/edad; si no, usa RAG como fallback."""
+        intent = _norm(request.intent)
+        q = _norm(query)
+        return self._resolve_memo(intent, q if q != intent else "", canonical_age(request.edad), semantic)
+
+    def immediate_action(self, protocol_id: Optional[str], matched_by: str = "", intent: str = "") -> Optional[str]:
+        """Acción inmediata del protocolo (o la de su intent, o la genérica)."""
+        protocol = self.rag_engine.summary(protocol_id) if protocol_id else None
+        action = immediate_action_for(protocol_id, protocol)
+        if action:
+            return action
+        # Si el protocolo mapeado no está cargado, la acción del intent sigue siendo válida
+        mapped = self.intent_protocol_mapping.get(intent) if matched_by == "intent" else None
+        return immediate_action_for(mapped) or FALLBACK_IMMEDIATE_ACTION
+
+
+def request_language(payload: Dict[str, Any]) -> str:
+    """Idioma de una petición de triaje: payload.language o context.language/idioma."""
+    ctx = dict(payload.get("context") or {})
+    if payload.get("language"):
+        ctx["language"] = payload["language"]
+    return resolve_language(ctx)
+
+
+def _norm(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value).strip().lower()
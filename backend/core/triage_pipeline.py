@@ -0,0 +1,94 @@
+# backend/core/triage_pipeline.py
+from __future__ import annotations
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from .metrics import TRIAGE_SERVED
+from .resilience import (
+    BoundedExecutor, CircuitOpenError, Deadline, DeadlineExceeded, ExecutorSaturated,
+)
+
+# Presupuesto por defecto y techo (ms) para una petición de triaje
+DEFAULT_BUDGET_MS = int(os.getenv("TRIAGE_BUDGET_MS", "1500"))
+MAX_BUDGET_MS = int(os.getenv("TRIAGE_MAX_BUDGET_MS", "5000"))
+TRIAGE_WORKERS = int(os.getenv("TRIAGE_WORKERS", "4"))
+TRIAGE_MAX_PENDING = int(os.getenv("TRIAGE_MAX_PENDING", "32"))
+
+GENERIC_IMMEDIATE_ACTION = "Llama al 112 y sigue las indicaciones del operador"
+
+
+class TriagePipeline:
+    """
+    Triaje con presupuesto de latencia:
+      1. Ruta léxica en línea (intents exactos; microsegundos, sin red).
+      2. Si no basta, ruta completa (RAG/embeddings) en un ejecutor acotado con
+         timeout = presupuesto restante, protegida por el circuit breaker de embeddings.
+      3. Si el presupuesto, el breaker o el ejecutor fallan: resultado léxico con la
+         `triage.immediate_action` del protocolo (o la acción genérica de llamar al 112).
+    """
+
+    def __init__(self, workers: int = TRIAGE_WORKERS, max_pending: int = TRIAGE_MAX_PENDING):
+        self.executor = BoundedExecutor(workers, max_pending, name="conrumbo-triage")
+
+    @staticmethod
+    def budget_seconds(budget_ms: Optional[int]) -> float:
+        ms = DEFAULT_BUDGET_MS if budget_ms is None else int(budget_ms)
+        return max(1, min(ms, MAX_BUDGET_MS)) / 1000.0
+
+    async def run(self, engine: Any, payload: Dict[str, Any],
+                  budget_ms: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Devuelve (resultado_triaje, info_pipeline) con info_pipeline['served_by']."""
+        deadline = Deadline(self.budget_seconds(budget_ms))
+
+        lexical = engine.run(payload, semantic=False)
+        if lexical.get("matched_by") != "default":
+            return self._done(lexical, "lexical", deadline)
+
+        breaker = self._breaker(engine)
+        if breaker is not None and breaker.is_open:
+            return self._done(self._degrade(engine, lexical), "degraded_breaker", deadline)
+
+        try:
+            full = await self.executor.run(engine.run, payload, timeout=deadline.remaining())
+            if breaker is not None and breaker.state != "closed":
+                breaker.record_success()
+            return self._done(full, "full", deadline)
+        except DeadlineExceeded:
+            # Un backend lento cuenta como fallo para el breaker
+            if breaker is not None:
+                breaker.record_failure()
+            path = "degraded_timeout"
+        except ExecutorSaturated:
+            path = "degraded_overload"
+        except CircuitOpenError:
+            path = "degraded_breaker"
+        except Exception as e:
+            print(f"[triage] Error en ruta completa, degradando: {e}")
+            path = "degraded_error"
+        return self._done(self._degrade(engine, lexical), path, deadline)
+
+    # ---------- helpers ----------
+    @staticmethod
+    def _breaker(engine: Any):
+        rag = getattr(engine, "rag_engine", None)
+        gen = getattr(rag, "embedding_generator", None)
+        return getattr(gen, "breaker", None)
+
+    @staticmethod
+    def _degrade(engine: Any, lexical: Dict[str, Any]) -> Dict[str, Any]:
+        out = dict(lexical)
+        if not out.get("immediate_action"):
+            out["immediate_action"] = GENERIC_IMMEDIATE_ACTION
+        out["confidence"] = min(float(out.get("confidence") or 0.0), 0.5)
+        return out
+
+    @staticmethod
+    def _done(result: Dict[str, Any], path: str, deadline: Deadline) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        TRIAGE_SERVED.labels(path).inc()
+        info = {
+            "served_by": path,
+            "degraded": path.startswith("degraded"),
+            "budget_ms": round(deadline.budget * 1000.0, 1),
+            "elapsed_ms": round(deadline.elapsed() * 1000.0, 3),
+        }
+        return result, info
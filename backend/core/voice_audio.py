@@ -0,0 +1,375 @@
+# backend/core/voice_audio.py
+"""
+Audio pre-renderizado de las indicaciones de voz (voice_cue e instruction).
+
+Cada texto se sintetiza una sola vez, se comprime y se guarda con el hash de
+su contenido como nombre:
+    sha256(sintetizador | códec | idioma | texto)[:24].<ext>
+Un cambio de texto, de voz o de códec da otro nombre, así que los ficheros son
+inmutables (Cache-Control immutable en /voice/{fichero}) y al actualizar los
+protocolos sólo se renderizan los textos nuevos; --prune borra los huérfanos.
+
+Sintetizadores (VOICE_SYNTH):
+  espeak       espeak-ng / espeak local (sin red)
+  command      VOICE_SYNTH_CMD: lee el texto por stdin y escribe un WAV en
+               {out}; {lang} es el idioma (piper, pico2wave, say, ...)
+  placeholder  tonos deterministas, sin motor de voz (sólo pruebas del pipeline:
+               VoiceCatalog no sirve un manifiesto de placeholder)
+  auto         espeak si está instalado, si no command con VOICE_SYNTH_CMD;
+               sin ninguno, error (nunca tonos de relleno)
+Códecs (VOICE_AUDIO_CODEC): opus y mp3 con ffmpeg; wav (PCM 16 kHz mono)
+como reserva sin dependencias. auto = opus si hay ffmpeg.
+
+El manifiesto (voice-manifest.json) lista texto -> fichero; lo leen la API
+(/next_step, /voice) y el índice offline, que referencia el audio de cada paso.
+
+Uso (desde backend/):
+    python -m core.voice_audio build
+    python -m core.voice_audio build --synth placeholder --codec wav --prune
+    python -m core.voice_audio info
+"""
+from __future__ import annotations
+import abc
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+MANIFEST_FORMAT = 1
+MANIFEST_NAME = "voice-manifest.json"
+VOICE_DIR = Path(os.getenv("VOICE_AUDIO_DIR", str(Path(__file__).resolve().parents[1] / "var" / "voice")))
+VOICE_SYNTH = os.getenv("VOICE_SYNTH", "auto").lower()
+VOICE_SYNTH_CMD = os.getenv("VOICE_SYNTH_CMD", "")
+VOICE_CODEC = os.getenv("VOICE_AUDIO_CODEC", "auto").lower()
+SAMPLE_RATE = 16000
+
+FILENAME_RE = re.compile(r"^[0-9a-f]{24}\.(ogg|mp3|wav)$")
+MEDIA_TYPES = {"ogg": "audio/ogg", "mp3": "audio/mpeg", "wav": "audio/wav"}
+# Sintetizador de relleno: sus manifiestos no se publican (VoiceCatalog)
+PLACEHOLDER_PREFIX = "placeholder:"
+# Voces de espeak por idioma del protocolo
+_ESPEAK_VOICES = {"es": "es", "en": "en", "fr": "fr", "de": "de"}
+
+
+# ---------- Sintetizadores: texto -> WAV ----------
+class Synthesizer(abc.ABC):
+    """Interfaz: `id` identifica voz y versión (entra en el hash del fichero)."""
+
+    id = "base"
+
+    @abc.abstractmethod
+    def synthesize(self, text: str, language: str) -> bytes:
+        """Texto -> WAV."""
+
+
+class EspeakSynth(Synthesizer):
+    def __init__(self, binary: str):
+        self.binary = binary
+        version = subprocess.run([binary, "--version"], capture_output=True, text=True).stdout.strip()
+        self.id = f"espeak:{version or Path(binary).name}"
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        voice = _ESPEAK_VOICES.get(language, language)
+        return subprocess.run([self.binary, "-v", voice, "-s", "150", "--stdout", text],
+                              capture_output=True, check=True).stdout
+
+
+class CommandSynth(Synthesizer):
+    def __init__(self, template: str):
+        if "{out}" not in template:
+            raise ValueError("VOICE_SYNTH_CMD debe incluir {out}")
+        self.template = template
+        self.id = f"command:{template}"
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        with tempfile.TemporaryDirectory() as tmp:
+            out = Path(tmp) / "cue.wav"
+            cmd = [part.format(out=str(out), lang=language) for part in shlex.split(self.template)]
+            subprocess.run(cmd, input=text.encode("utf-8"), capture_output=True, check=True)
+            return out.read_bytes()
+
+
+class PlaceholderSynth(Synthesizer):
+    """Un tono corto por palabra: duración realista, sin motor de voz."""
+
+    id = PLACEHOLDER_PREFIX + "1"
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        import numpy as np
+        chunks = []
+        gap = np.zeros(int(SAMPLE_RATE * 0.06), dtype=np.float32)
+        for word in text.split():
+            seconds = min(0.5, 0.05 + 0.035 * len(word))
+            t = np.arange(int(SAMPLE_RATE * seconds), dtype=np.float32) / SAMPLE_RATE
+            freq = 180.0 + (sum(map(ord, word)) % 12) * 15.0
+            env = np.minimum(1.0, np.minimum(t, t[::-1]) * 40.0)
+            chunks += [0.3 * env * np.sin(2 * np.pi * freq * t), gap]
+        pcm = np.concatenate(chunks) if chunks else gap
+        return _wav_bytes((pcm * 32767).astype("<i2").tobytes(), SAMPLE_RATE)
+
+
+def get_synthesizer(name: str = VOICE_SYNTH) -> Synthesizer:
+    if name in ("auto", "espeak"):
+        binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if binary:
+            return EspeakSynth(binary)
+        if name == "espeak":
+            raise RuntimeError("espeak-ng / espeak no está instalado")
+    if name == "command" or (name == "auto" and VOICE_SYNTH_CMD):
+        return CommandSynth(VOICE_SYNTH_CMD)
+    if name == "auto":
+        raise RuntimeError("Sin motor de voz: instale espeak-ng, defina VOICE_SYNTH_CMD "
+                           "o use --synth placeholder explícitamente (sólo pruebas)")
+    if name == "placeholder":
+        return PlaceholderSynth()
+    raise ValueError(f"Sintetizador desconocido: {name}")
+
+
+# ---------- Códecs: WAV -> audio comprimido ----------
+def _wav_bytes(frames: bytes, rate: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(frames)
+    return buf.getvalue()
+
+
+def _to_pcm16_mono(wav: bytes, rate: int = SAMPLE_RATE) -> bytes:
+    """Cualquier WAV PCM -> WAV 16 bits, mono, `rate` Hz (remuestreo lineal)."""
+    import numpy as np
+    with wave.open(io.BytesIO(wav), "rb") as w:
+        channels, width, src_rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        raw = w.readframes(w.getnframes())
+    if width == 1:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        x = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"WAV de {width * 8} bits no soportado")
+    if channels > 1:
+        x = x.reshape(-1, channels).mean(axis=1)
+    if src_rate != rate and len(x):
+        n = max(1, int(round(len(x) * rate / src_rate)))
+        x = np.interp(np.linspace(0, len(x) - 1, n), np.arange(len(x)), x)
+    return _wav_bytes((np.clip(x, -1.0, 1.0) * 32767).astype("<i2").tobytes(), rate)
+
+
+class Encoder:
+    def __init__(self, codec: str):
+        self.ffmpeg = shutil.which("ffmpeg")
+        if codec == "auto":
+            codec = "opus" if self.ffmpeg else "wav"
+        if codec not in ("opus", "mp3", "wav"):
+            raise ValueError(f"Códec desconocido: {codec}")
+        if codec != "wav" and not self.ffmpeg:
+            raise RuntimeError(f"El códec {codec} necesita ffmpeg")
+        self.codec = codec
+        self.ext = {"opus": "ogg", "mp3": "mp3", "wav": "wav"}[codec]
+        self.media_type = MEDIA_TYPES[self.ext]
+
+    def encode(self, wav: bytes) -> bytes:
+        wav = _to_pcm16_mono(wav)
+        if self.codec == "wav":
+            return wav
+        args = (["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"] if self.codec == "opus"
+                else ["-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3"])
+        # Sin metadatos: mismo texto -> mismos bytes
+        return subprocess.run([self.ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-map_metadata",
+                               "-1", "-fflags", "+bitexact", *args, "pipe:1"],
+                              input=wav, capture_output=True, check=True).stdout
+
+
+# ---------- Textos del corpus ----------
+def cue_key(text: str, language: str, synth_id: str, codec: str) -> str:
+    return hashlib.sha256(f"{synth_id}|{codec}|{language}|{text}".encode("utf-8")).hexdigest()[:24]
+
+
+def voice_texts(*corpora: Mapping[str, Any]) -> Dict[str, str]:
+    """Texto -> idioma de cada voice_cue e instruction (y voice_cues de protocolo)."""
+    from .language import protocol_language
+    from .runtime_protocol import step_payloads
+    out: Dict[str, str] = {}
+    for protocols in corpora:
+        for p in protocols.values():
+            lang = protocol_language(p)
+            for step in step_payloads(p):
+                for text in (step["voice_cue"], step["instruction"]):
+                    if text and text.strip():
+                        out.setdefault(text, lang)
+            for text in p.voice_cues or ():
+                if text and text.strip():
+                    out.setdefault(text, lang)
+    return out
+
+
+def read_manifest(out_dir: Path = VOICE_DIR) -> Dict[str, Any]:
+    try:
+        return json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def render_catalog(texts: Dict[str, str], out_dir: Path = VOICE_DIR, synth: Optional[Synthesizer] = None,
+                   encoder: Optional[Encoder] = None, workers: int = 4, prune: bool = False) -> Dict[str, Any]:
+    """Renderiza sólo los textos sin fichero; escribe el manifiesto al final (os.replace)."""
+    synth = synth or get_synthesizer()
+    encoder = encoder or Encoder(VOICE_CODEC)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    cues: Dict[str, Dict[str, Any]] = {}
+    todo: List[Tuple[str, str, str]] = []
+    for text, lang in sorted(texts.items()):
+        filename = f"{cue_key(text, lang, synth.id, encoder.codec)}.{encoder.ext}"
+        cues[text] = {"file": filename, "language": lang}
+        if not (out_dir / filename).exists():
+            todo.append((text, lang, filename))
+
+    def render(item: Tuple[str, str, str]) -> Optional[str]:
+        text, lang, filename = item
+        try:
+            data = encoder.encode(synth.synthesize(text, lang))
+        except Exception as e:
+            return f"{filename}: {e}"
+        tmp = out_dir / f".{filename}.tmp"
+        tmp.write_bytes(data)
+        os.replace(tmp, out_dir / filename)
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        failures = [err for err in pool.map(render, todo) if err]
+    for err in failures:
+        print(f"[voice] Error renderizando {err}")
+    for text in list(cues):
+        path = out_dir / cues[text]["file"]
+        if path.exists():
+            cues[text]["bytes"] = path.stat().st_size
+        else:
+            del cues[text]
+
+    manifest = {"format": MANIFEST_FORMAT, "synth": synth.id, "codec": encoder.codec,
+                "media_type": encoder.media_type, "cues": cues}
+    tmp = out_dir / f".{MANIFEST_NAME}.tmp"
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, sort_keys=True, indent=1), encoding="utf-8")
+    os.replace(tmp, out_dir / MANIFEST_NAME)
+
+    pruned = 0
+    if prune:
+        live = {c["file"] for c in cues.values()}
+        for path in out_dir.iterdir():
+            if FILENAME_RE.match(path.name) and path.name not in live:
+                path.unlink()
+                pruned += 1
+    return {"texts": len(texts), "rendered": len(todo) - len(failures), "reused": len(texts) - len(todo),
+            "failed": len(failures), "pruned": pruned, "bytes": sum(c["bytes"] for c in cues.values()),
+            "seconds": round(time.perf_counter() - t0, 3), "synth": synth.id, "codec": encoder.codec}
+
+
+# ---------- Catálogo (lectura, para la API y el índice offline) ----------
+class VoiceCatalog:
+    """Texto -> fichero de audio según el manifiesto; vacío si no se ha renderizado nada."""
+
+    def __init__(self, directory: Path = VOICE_DIR):
+        self.directory = directory
+        self.reload()
+
+    def reload(self) -> None:
+        manifest = read_manifest(self.directory)
+        if str(manifest.get("synth", "")).startswith(PLACEHOLDER_PREFIX):
+            # Tonos de relleno: el cliente los preferiría a su propia síntesis
+            print(f"[voice] Manifiesto de {manifest['synth']} en {self.directory}: no se publica")
+            manifest = {}
+        # Cambia con cualquier re-renderizado: invalida los índices offline que lo referencian
+        self.version = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        self.media_type = manifest.get("media_type")
+        self.codec = manifest.get("codec")
+        self.files: Dict[str, str] = {text: c["file"] for text, c in (manifest.get("cues") or {}).items()}
+        self.sizes: Dict[str, int] = {c["file"]: c.get("bytes", 0) for c in (manifest.get("cues") or {}).values()}
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def lookup(self, text: Optional[str]) -> Optional[str]:
+        return self.files.get(text) if text else None
+
+    def path(self, filename: str) -> Optional[Path]:
+        """Ruta de un fichero del catálogo (nombre validado: nada fuera del directorio)."""
+        if not FILENAME_RE.match(filename) or filename not in self.sizes:
+            return None
+        path = self.directory / filename
+        return path if path.is_file() else None
+
+    def step_audio(self, step: Dict[str, Any]) -> Dict[str, str]:
+        """{voice_cue|instruction: fichero} de un paso renderizado (step_payloads)."""
+        out = {}
+        for field in ("voice_cue", "instruction"):
+            filename = self.lookup(step.get(field))
+            if filename:
+                out[field] = filename
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"directory": str(self.directory), "cues": len(self.files), "codec": self.codec,
+                "bytes": sum(self.sizes.values())}
+
+
+def _corpus(protocols_dir: Path, regions: bool) -> List[Mapping[str, Any]]:
+    from .offline_bundle import _load_runtime
+    base = _load_runtime(protocols_dir)
+    corpora: List[Mapping[str, Any]] = [base]
+    if regions:
+        from .regions import RegionRegistry
+        registry = RegionRegistry()
+        for region in sorted(registry.overlays()):
+            corpora.append(registry.view(region, base).protocols)
+    return corpora
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="renderiza los textos nuevos del corpus")
+    b.add_argument("--protocols", type=Path, default=Path(__file__).resolve().parents[1] / "rag" / "protocols")
+    b.add_argument("--out", type=Path, default=VOICE_DIR)
+    b.add_argument("--synth", default=VOICE_SYNTH, help="auto | espeak | command | placeholder")
+    b.add_argument("--codec", default=VOICE_CODEC, help="auto | opus | mp3 | wav")
+    b.add_argument("--workers", type=int, default=4)
+    b.add_argument("--no-regions", action="store_true", help="sin los textos de los overlays regionales")
+    b.add_argument("--prune", action="store_true", help="borrar audio que ya no usa ningún texto")
+    i = sub.add_parser("info", help="resumen del catálogo")
+    i.add_argument("--out", type=Path, default=VOICE_DIR)
+    args = ap.parse_args(argv)
+
+    if args.command == "info":
+        print(json.dumps(VoiceCatalog(args.out).stats(), indent=2))
+        return 0
+    try:
+        synth = get_synthesizer(args.synth)
+    except (RuntimeError, ValueError) as e:
+        print(f"[voice] {e}")
+        return 2
+    texts = voice_texts(*_corpus(args.protocols, not args.no_regions))
+    stats = render_catalog(texts, args.out, synth, Encoder(args.codec), args.workers, args.prune)
+    print(f"[voice] {stats['texts']} textos: {stats['rendered']} renderizados, {stats['reused']} reutilizados, "
+          f"{stats['failed']} con error, {stats['pruned']} borrados ({stats['bytes'] / 1024:.1f} KiB, "
+          f"{stats['codec']}, {stats['synth']}) en {stats['seconds']:.2f}s")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
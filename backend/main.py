@@ -4,11 +4,36 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from core.conrumbo import router as conrumbo_router
+from core.admission import AdmissionMiddleware
+from core.capture import CAPTURE, CaptureMiddleware
+from core.conrumbo import router as conrumbo_router, start_warmup
+from core.debug import router as debug_router
+from core.journal import JOURNAL
+from core.metrics import MetricsMiddleware
+from core.profiler import ProfilerMiddleware
+from core.timing import ServerTimingMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Motores e índice en segundo plano: /live y la ruta degradada responden ya
+    start_warmup()
+    yield
+    # Vuelca los eventos pendientes del diario y publica el segmento activo
+    JOURNAL.close()
+    CAPTURE.close()
 
-app = FastAPI(title="ConRumbo API", version="1.0.0")
+app = FastAPI(title="ConRumbo API", version="1.0.0", lifespan=lifespan)
+
+# Prioridad de admisión: emergencias antes que navegación (dentro de CORS para
+# que los 503 con Retry-After lleguen al navegador con sus cabeceras)
+app.add_middleware(AdmissionMiddleware)
+# Captura muestreada para core/replay.py (TRAFFIC_CAPTURE=1); fuera de la
+# admisión para registrar también las peticiones rechazadas
+app.add_middleware(CaptureMiddleware)
 
 # Habilitar CORS para todas las rutas
 app.add_middleware(
@@ -19,8 +44,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latencia por ruta para /api/conrumbo/metrics
+app.add_middleware(MetricsMiddleware)
+# Desglose por etapas (cabecera Server-Timing) y perfilado bajo demanda
+app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(ProfilerMiddleware)
+
 # Registrar rutas
 app.include_router(conrumbo_router, prefix="/api/conrumbo")
+app.include_router(debug_router, prefix="/api/conrumbo/debug")
 
 @app.get("/")
 async def root():
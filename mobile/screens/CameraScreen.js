@@ -12,6 +12,7 @@ import { Camera } from 'expo-camera';
 import { SafeAreaView } from 'react-native-safe-area-context';
 
 const { width, height } = Dimensions.get('window');
+const API_URL = process.env.EXPO_PUBLIC_API_URL || 'http://localhost:8000';
 
 const CameraScreen = ({ navigation }) => {
   const [hasPermission, setHasPermission] = useState(null);
@@ -34,14 +35,13 @@ const CameraScreen = ({ navigation }) => {
     setIsAnalyzing(true);
     
     try {
-      // Tomar foto
+      // Tomar foto (el servidor la reduce a la entrada del modelo: basta calidad media)
       const photo = await cameraRef.current.takePictureAsync({
-        quality: 0.7,
-        base64: false,
+        quality: 0.5,
+        base64: true,
       });
 
-      // Simular análisis de IA (en una implementación real, esto se enviaría a un servicio de ML)
-      await simulateInjuryDetection(photo);
+      await detectInjuries(photo);
       
     } catch (error) {
       console.error('Error analizando imagen:', error);
@@ -51,32 +51,35 @@ const CameraScreen = ({ navigation }) => {
     }
   };
 
-  const simulateInjuryDetection = async (photo) => {
-    // Simular tiempo de procesamiento
-    await new Promise(resolve => setTimeout(resolve, 2000));
-
-    // Simular detección de lesiones
-    const mockDetections = [
-      {
-        type: 'hemorragia',
-        confidence: 0.85,
-        location: { x: 0.3, y: 0.4 },
-        severity: 'moderada',
-        protocol: 'pa_hemorragias_v1'
-      },
-      {
-        type: 'contusion',
-        confidence: 0.72,
-        location: { x: 0.6, y: 0.3 },
-        severity: 'leve',
-        protocol: 'pa_contusiones_v1'
-      }
-    ];
+  const detectInjuries = async (photo) => {
+    const response = await fetch(`${API_URL}/api/conrumbo/analyze_image`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ image: photo.base64 }),
+    });
+    if (response.status === 503) {
+      Alert.alert('Servicio ocupado', 'Inténtalo de nuevo en unos segundos. Si es grave, llama al 112.');
+      return;
+    }
+    if (!response.ok) {
+      throw new Error(`analyze_image ${response.status}`);
+    }
+    const { result } = await response.json();
+    if (result.reference_model) {
+      // Modelo de referencia del servidor (sin validez clínica): no se presentan sus detecciones como lesiones
+      resetDetection();
+      Alert.alert(
+        'Análisis no disponible',
+        'El análisis de imagen está en modo de prueba. Describe la situación o busca el protocolo manualmente. Si es grave, llama al 112.'
+      );
+      return;
+    }
+    const detections = result.detections;
 
-    setDetectedInjuries(mockDetections);
+    setDetectedInjuries(detections);
     
     // Crear puntos de overlay
-    const points = mockDetections.map((detection, index) => ({
+    const points = detections.map((detection, index) => ({
       id: index,
       x: detection.location.x * width,
       y: detection.location.y * height * 0.7, // Ajustar por la UI
@@ -87,8 +90,8 @@ const CameraScreen = ({ navigation }) => {
     setOverlayPoints(points);
 
     // Mostrar resultados
-    if (mockDetections.length > 0) {
-      const injuryTypes = mockDetections.map(d => d.type).join(', ');
+    if (detections.length > 0) {
+      const injuryTypes = detections.map(d => d.type).join(', ');
       Alert.alert(
         'Lesiones Detectadas',
         `Se detectaron: ${injuryTypes}\n\n¿Deseas ver el protocolo recomendado?`,
@@ -97,10 +100,11 @@ const CameraScreen = ({ navigation }) => {
           { 
             text: 'Ver Protocolo', 
             onPress: () => {
-              const primaryInjury = mockDetections[0];
+              const primaryInjury = detections.find(d => d.protocol) || detections[0];
               navigation.navigate('Protocol', { 
+                protocolId: primaryInjury.protocol,
                 protocolType: primaryInjury.type,
-                detectedInjuries: mockDetections 
+                detectedInjuries: detections 
               });
             }
           },
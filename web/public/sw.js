@@ -1,4 +1,11 @@
 const CACHE_NAME = 'conrumbo-v1';
+// Índice offline (core/offline_bundle.py): el fichero lleva el hash del
+// contenido y nunca cambia; el manifiesto dice cuál es el vigente
+const OFFLINE_CACHE = 'conrumbo-offline';
+const OFFLINE_MANIFEST = '/offline/manifest.json';
+const OFFLINE_INDEX_RE = /\/offline\/conrumbo-index\.[0-9a-f]+\.json$/;
+// Audio pre-renderizado (core/voice_audio.py): nombre = hash del contenido, inmutable
+const VOICE_RE = /\/voice\/[0-9a-f]{24}\.(ogg|mp3|wav)$/;
 const CRITICAL_PROTOCOLS = [
   '/api/conrumbo/protocol/pa_rcp_adulto_v1',
   '/api/conrumbo/protocol/pa_asfixia_adulto_v1',
@@ -12,14 +19,77 @@ const STATIC_ASSETS = [
   '/manifest.json'
 ];
 
+// Precarga del índice offline vigente; borra las versiones anteriores
+const precacheOfflineIndex = async () => {
+  try {
+    const response = await fetch(OFFLINE_MANIFEST, { cache: 'no-cache' });
+    if (!response.ok) return;
+    const manifest = await response.clone().json();
+    const indexUrl = `/offline/${manifest.file}`;
+    const cache = await caches.open(OFFLINE_CACHE);
+    if (!(await cache.match(indexUrl))) {
+      await cache.add(indexUrl);
+    }
+    await cache.put(OFFLINE_MANIFEST, response);
+    // Audio que referencia el índice: sólo se descarga el que falta
+    const bundle = await (await cache.match(indexUrl)).json();
+    const voiceUrls = new Set();
+    if (bundle.voice) {
+      const base = new URL(bundle.voice.base, new URL(indexUrl, self.location.origin));
+      Object.keys(bundle.voice.files).forEach((file) => voiceUrls.add(new URL(file, base).href));
+      for (const url of voiceUrls) {
+        if (!(await cache.match(url))) {
+          await cache.add(url);
+        }
+      }
+    }
+    const keys = await cache.keys();
+    await Promise.all(keys
+      .filter((req) => {
+        const path = new URL(req.url).pathname;
+        return (OFFLINE_INDEX_RE.test(path) && !req.url.endsWith(indexUrl))
+          || (VOICE_RE.test(path) && !voiceUrls.has(req.url));
+      })
+      .map((req) => cache.delete(req)));
+  } catch (error) {
+    console.log('Índice offline no disponible:', error);
+  }
+};
+
+// Respuesta 206 a partir del fichero completo en caché (los <audio> piden rangos)
+const rangeResponse = async (response, rangeHeader) => {
+  const match = /^bytes=(\d*)-(\d*)$/.exec(rangeHeader || '');
+  if (!match) return response;
+  const body = await response.arrayBuffer();
+  const size = body.byteLength;
+  let start = match[1] === '' ? size - Number(match[2]) : Number(match[1]);
+  let end = match[1] !== '' && match[2] !== '' ? Number(match[2]) : size - 1;
+  start = Math.max(0, start);
+  end = Math.min(end, size - 1);
+  if (start > end) {
+    return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${size}` } });
+  }
+  return new Response(body.slice(start, end + 1), {
+    status: 206,
+    headers: {
+      'Content-Type': response.headers.get('Content-Type') || 'application/octet-stream',
+      'Content-Range': `bytes ${start}-${end}/${size}`,
+      'Accept-Ranges': 'bytes',
+    },
+  });
+};
+
 // Instalar Service Worker
 self.addEventListener('install', (event) => {
   event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then((cache) => {
-        console.log('Cache abierto');
-        return cache.addAll(STATIC_ASSETS);
-      })
+    Promise.all([
+      caches.open(CACHE_NAME)
+        .then((cache) => {
+          console.log('Cache abierto');
+          return cache.addAll(STATIC_ASSETS);
+        }),
+      precacheOfflineIndex()
+    ])
   );
 });
 
@@ -29,7 +99,7 @@ self.addEventListener('activate', (event) => {
     caches.keys().then((cacheNames) => {
       return Promise.all(
         cacheNames.map((cacheName) => {
-          if (cacheName !== CACHE_NAME) {
+          if (cacheName !== CACHE_NAME && cacheName !== OFFLINE_CACHE) {
             console.log('Eliminando cache antiguo:', cacheName);
             return caches.delete(cacheName);
           }
@@ -44,6 +114,50 @@ self.addEventListener('fetch', (event) => {
   const { request } = event;
   const url = new URL(request.url);
 
+  // Índice offline: inmutable (Cache First); el manifiesto, Network First
+  if (OFFLINE_INDEX_RE.test(url.pathname)) {
+    event.respondWith(
+      caches.open(OFFLINE_CACHE).then((cache) =>
+        cache.match(request).then((cached) => cached || fetch(request).then((response) => {
+          if (response.status === 200) {
+            cache.put(request, response.clone());
+          }
+          return response;
+        }))
+      )
+    );
+    return;
+  }
+  // Audio de las indicaciones: Cache First (sin rango en la petición de red para poder cachearlo entero)
+  if (VOICE_RE.test(url.pathname)) {
+    const range = request.headers.get('range');
+    event.respondWith(
+      caches.open(OFFLINE_CACHE).then((cache) =>
+        cache.match(url.href).then((cached) => cached || fetch(url.href).then((response) => {
+          if (response.status === 200) {
+            cache.put(url.href, response.clone());
+          }
+          return response;
+        })).then((response) => (range && response.status === 200 ? rangeResponse(response, range) : response))
+      )
+    );
+    return;
+  }
+  if (url.pathname === OFFLINE_MANIFEST) {
+    event.respondWith(
+      fetch(request)
+        .then((response) => {
+          if (response.status === 200) {
+            // Nueva versión publicada: precargarla para la próxima vez sin red
+            event.waitUntil(precacheOfflineIndex());
+          }
+          return response;
+        })
+        .catch(() => caches.open(OFFLINE_CACHE).then((cache) => cache.match(OFFLINE_MANIFEST)))
+    );
+    return;
+  }
+
   // Estrategia para protocolos críticos: Cache First
   if (CRITICAL_PROTOCOLS.some(protocol => url.pathname.includes(protocol))) {
     event.respondWith(
@@ -15,6 +15,7 @@ import { Card, CardContent, CardHeader, CardTitle } from './components/ui/card';
 import { useAppStore, useTriageStore, useProtocolStore } from './lib/stores';
 import { useSpeech } from './lib/speech';
 import { offlineApiClient } from './lib/api';
+import { offlineIndex } from './lib/offlineIndex';
 
 // Páginas principales
 const HomePage = () => {
@@ -178,19 +179,24 @@ const HomePage = () => {
 };
 
 const ProtocolPage = () => {
-  const { activeProtocol, currentStep, setCurrentStep } = useProtocolStore();
+  const { activeProtocol, currentStep, setCurrentStep, setActiveProtocol } = useProtocolStore();
   const { speak } = useSpeech();
   const [stepResponse, setStepResponse] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
+  // Última respuesta de /next_step: audio pre-renderizado del paso que sirvió
+  const [served, setServed] = useState(null);
 
   useEffect(() => {
     if (activeProtocol && activeProtocol.steps && activeProtocol.steps.length > 0) {
       const step = activeProtocol.steps[currentStep];
       if (step && step.voice_cue) {
-        speak(step.voice_cue);
+        // Audio de /next_step o, sin él, el del índice offline; si no carga, síntesis
+        const fromServer = served && served.protocolId === activeProtocol.id && served.index === currentStep
+          ? served.audio?.voice_cue : null;
+        speak(step.voice_cue, { audioUrl: fromServer || offlineIndex.stepAudioUrl(step) });
       }
     }
-  }, [currentStep, activeProtocol]);
+  }, [currentStep, activeProtocol, served]);
 
   const handleNextStep = async () => {
     if (!activeProtocol || !activeProtocol.steps) return;
@@ -198,26 +204,33 @@ const ProtocolPage = () => {
     setIsLoading(true);
     
     try {
-      const nextStepData = {
-        flow_id: activeProtocol.id,
-        step_idx: currentStep,
-        user_feedback: stepResponse
-      };
+      const response = await offlineApiClient.getNextStep({
+        protocol_id: activeProtocol.id,
+        current_step: currentStep + 1,
+        user_response: stepResponse,
+      });
+      const result = response.result || {};
+
+      if (result.escalate_to_emergency && result.escalation_message) {
+        await speak(result.escalation_message, { priority: 'urgent' });
+      }
 
-      const response = await offlineApiClient.getNextStep(nextStepData);
-      
-      if (response.is_final) {
-        await speak(response.say);
+      if (!result.step) {
+        await speak(result.message || 'Protocolo completado');
         alert('Protocolo completado. Recuerda llamar al 112 si es necesario.');
         window.location.hash = '#/';
-      } else {
-        setCurrentStep(currentStep + 1);
-        setStepResponse(null);
-        
-        if (response.safety_alert) {
-          await speak(response.safety_alert, { priority: 'urgent' });
-        }
+        return;
+      }
+
+      // Derivación (p.ej. atragantamiento -> RCP): el paso ya es del otro protocolo
+      const protocolId = result.protocol_id || activeProtocol.id;
+      if (protocolId !== activeProtocol.id) {
+        const next = await offlineApiClient.getProtocol(protocolId);
+        setActiveProtocol(next.protocol || next);
       }
+      setCurrentStep(result.step_number - 1);
+      setServed({ protocolId, index: result.step_number - 1, audio: result.audio || null });
+      setStepResponse(null);
       
     } catch (error) {
       console.error('Error obteniendo siguiente paso:', error);
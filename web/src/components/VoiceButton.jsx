@@ -5,6 +5,7 @@ import { useSpeech } from '../lib/speech';
 
 const VoiceButton = ({ 
   onTranscript = null,
+  onTranscriptChunk = null, // ({ transcript, isFinal, seq }) para /triage/stream
   onSpeechStart = null,
   onSpeechEnd = null,
   className = '',
@@ -37,6 +38,15 @@ const VoiceButton = ({
     return () => window.removeEventListener('speechResult', handleSpeechResult);
   }, [onTranscript]);
 
+  useEffect(() => {
+    // Trozos parciales y finales (triaje incremental)
+    if (!onTranscriptChunk) return undefined;
+    const handleSpeechChunk = (event) => onTranscriptChunk(event.detail);
+
+    window.addEventListener('speechChunk', handleSpeechChunk);
+    return () => window.removeEventListener('speechChunk', handleSpeechChunk);
+  }, [onTranscriptChunk]);
+
   useEffect(() => {
     if (isSpeaking && onSpeechStart) {
       onSpeechStart();
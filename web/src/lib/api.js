@@ -1,3 +1,5 @@
+import { offlineIndex } from './offlineIndex';
+
 const API_BASE_URL = 'http://localhost:8000/api/conrumbo';
 
 class ApiClient {
@@ -39,6 +41,20 @@ class ApiClient {
     });
   }
 
+  // Triaje incremental por voz: { session_id, text, is_final, seq, edad, language }
+  async triageStream(chunk) {
+    return this.request('/triage/stream', {
+      method: 'POST',
+      body: JSON.stringify(chunk),
+    });
+  }
+
+  async resetTriageStream(sessionId) {
+    return this.request(`/triage/stream/${encodeURIComponent(sessionId)}`, {
+      method: 'DELETE',
+    });
+  }
+
   // Protocolos
   async getNextStep(stepData) {
     return this.request('/next_step', {
@@ -198,6 +214,12 @@ export class OfflineApiClient extends ApiClient {
         };
       }
       
+      // Sin cache: búsqueda/triaje sobre el índice offline precacheado
+      const fromIndex = await this.fromOfflineIndex(endpoint, options).catch(() => null);
+      if (fromIndex) {
+        return fromIndex;
+      }
+
       // Si no hay cache, usar fallbacks para protocolos críticos
       if (endpoint.includes('/protocol/')) {
         return this.getOfflineProtocolFallback(endpoint);
@@ -207,6 +229,30 @@ export class OfflineApiClient extends ApiClient {
     }
   }
 
+  async fromOfflineIndex(endpoint, options = {}) {
+    const index = await offlineIndex.load();
+    const body = options.body ? JSON.parse(options.body) : {};
+    const language = (body.language || body.context?.language || 'es').slice(0, 2);
+    const meta = { _offline: true, _index_version: index.version };
+
+    if (endpoint === '/search') {
+      return { success: true, language, results: index.search(body.query, language), ...meta };
+    }
+    if (endpoint === '/triage') {
+      const result = index.triage({ ...body, language });
+      return { success: true, result, ...meta };
+    }
+    if (endpoint === '/next_step') {
+      const result = index.nextStep(body.protocol_id, body.current_step);
+      return result ? { success: true, result, ...meta } : null;
+    }
+    if (endpoint.startsWith('/protocol/')) {
+      const protocol = index.getProtocol(decodeURIComponent(endpoint.split('/').pop()));
+      return protocol ? { success: true, protocol, ...meta } : null;
+    }
+    return null;
+  }
+
   getOfflineProtocolFallback(endpoint) {
     const protocolId = endpoint.split('/').pop();
     
@@ -0,0 +1,185 @@
+// Índice offline (backend/core/offline_bundle.py): búsqueda y triaje en el
+// dispositivo cuando no hay conexión. El service worker precachea el fichero;
+// aquí se descarga una vez y se consulta en memoria.
+
+const OFFLINE_BASE = '/offline';
+
+const fold = (text) => (text || '')
+  .toLowerCase()
+  .normalize('NFD')
+  .replace(/[\u0300-\u036f]/g, '');
+
+const tokenize = (text) => (fold(text).match(/[\p{L}\p{N}_]+/gu) || []).filter((w) => w.length > 1);
+
+const EDAD_CANONICA = {
+  adulto: 'adulto', adult: 'adulto', mayor: 'adulto',
+  niño: 'nino', nino: 'nino', child: 'nino', pediatrico: 'nino', pediátrico: 'nino',
+  lactante: 'lactante', bebé: 'lactante', bebe: 'lactante', infant: 'lactante', neonatal: 'lactante',
+};
+
+class OfflineIndex {
+  constructor(baseUrl = OFFLINE_BASE) {
+    this.baseUrl = baseUrl;
+    this.bundle = null;
+    this.version = null;
+    this._loading = null;
+  }
+
+  get ready() {
+    return this.bundle !== null;
+  }
+
+  // Carga el manifiesto y el artefacto vigente (de la caché del SW si no hay red)
+  async load() {
+    if (this.bundle) return this;
+    if (!this._loading) {
+      this._loading = (async () => {
+        const manifest = await (await fetch(`${this.baseUrl}/manifest.json`)).json();
+        const response = await fetch(`${this.baseUrl}/${manifest.file}`);
+        if (!response.ok) throw new Error(`Índice offline no disponible (${response.status})`);
+        this._prepare(await response.json());
+        this.version = manifest.version;
+        return this;
+      })().catch((error) => {
+        this._loading = null;
+        throw error;
+      });
+    }
+    return this._loading;
+  }
+
+  _prepare(bundle) {
+    this.bundle = bundle;
+    this.byId = new Map(bundle.protocols.map((p, i) => [p.id, i]));
+    // Texto de /search: título + instrucciones, en minúsculas
+    this.haystacks = bundle.protocols.map((p) => [p.title || '', ...p.steps.map((s) => s.instruction || '')]
+      .filter(Boolean).join(' ').toLowerCase());
+    this.families = new Map();
+    Object.values(bundle.age_variants || {}).forEach((variants) => {
+      Object.values(variants).forEach((idx) => this.families.set(idx, variants));
+    });
+    this.emergency = bundle.safety_patterns.emergency.map((p) => new RegExp(p, 'iu'));
+    this.diagnostic = bundle.safety_patterns.diagnostic.map((p) => new RegExp(p, 'iu'));
+  }
+
+  _shard(language) {
+    const { languages } = this.bundle;
+    return languages[language] || languages.es || Object.values(languages)[0] || { protocols: [], index: {}, intents: {} };
+  }
+
+  getProtocol(protocolId) {
+    const idx = this.byId.get(protocolId);
+    return idx === undefined ? null : this.bundle.protocols[idx];
+  }
+
+  // Mismo criterio que POST /search: la consulta literal en título/pasos
+  search(query, language = 'es') {
+    const q = (query || '').toLowerCase().trim();
+    if (!q) return [];
+    const shard = this._shard(language);
+    let candidates = shard.protocols;
+    const tokens = tokenize(q);
+    // Las palabras completas acotan los candidatos con el índice invertido
+    tokens.slice(0, -1).forEach((tok) => {
+      const posting = new Set(shard.index[tok] || []);
+      candidates = candidates.filter((idx) => posting.has(idx));
+    });
+    return candidates
+      .filter((idx) => this.haystacks[idx].includes(q))
+      .map((idx) => ({ protocol_id: this.bundle.protocols[idx].id, title: this.bundle.protocols[idx].title, relevance: 1.0 }));
+  }
+
+  _resolveAge(idx, edad) {
+    const variants = this.families.get(idx);
+    if (!variants) return idx;
+    const age = EDAD_CANONICA[(edad || '').trim().toLowerCase()] || 'adulto';
+    return variants[age] ?? variants.adulto ?? Object.values(variants)[0];
+  }
+
+  // Triaje en el dispositivo: seguridad -> intents -> palabras del índice
+  triage({ query = '', intent = '', edad = 'adulto', language = 'es' } = {}) {
+    const text = `${intent || ''} ${query || ''}`.trim();
+    const lower = text.toLowerCase();
+    const escalate = this.emergency.some((re) => re.test(lower));
+    if (!escalate && this.diagnostic.some((re) => re.test(lower))) {
+      return { allowed: false, violation_type: 'diagnostic', protocol_id: null, escalate_to_emergency: false, _offline: true };
+    }
+
+    const shard = this._shard(language);
+    const folded = fold(text);
+    let best = null;
+    let matchedBy = 'default';
+    Object.entries(shard.intents).forEach(([phrase, idxs]) => {
+      // La frase más larga es la más específica
+      if (folded.includes(fold(phrase)) && (!best || phrase.length > best.phrase.length)) {
+        best = { phrase, idx: idxs[0] };
+      }
+    });
+    if (best) {
+      matchedBy = 'intent';
+    } else {
+      // Peso IDF; las palabras de más de la mitad de los protocolos no deciden
+      const n = shard.protocols.length;
+      const scores = new Map();
+      tokenize(text).forEach((tok) => {
+        const posting = shard.index[tok] || [];
+        if (n > 2 && posting.length * 2 > n) return;
+        const idf = Math.log((n + 1) / (posting.length || 1));
+        posting.forEach((idx) => scores.set(idx, (scores.get(idx) || 0) + idf));
+      });
+      const ranked = [...scores.entries()].sort((a, b) => b[1] - a[1] || a[0] - b[0]);
+      if (ranked.length) {
+        best = { idx: ranked[0][0] };
+        matchedBy = 'lexical';
+      }
+    }
+
+    const protocol = best ? this.bundle.protocols[this._resolveAge(best.idx, edad)] : null;
+    return {
+      protocol_id: protocol ? protocol.id : null,
+      confidence: matchedBy === 'intent' ? 0.9 : matchedBy === 'lexical' ? 0.5 : 0.0,
+      matched_by: matchedBy,
+      immediate_action: protocol ? protocol.immediate_action : null,
+      escalate_to_emergency: escalate,
+      escalation_message: escalate
+        ? `EMERGENCIA DETECTADA: Llamar al ${this.bundle.emergency_number} inmediatamente`
+        : null,
+      _offline: true,
+    };
+  }
+
+  // Resultado con el formato de POST /next_step
+  nextStep(protocolId, currentStep) {
+    const protocol = this.getProtocol(protocolId);
+    if (!protocol) return null;
+    const total = protocol.steps.length;
+    if (currentStep < 0 || currentStep >= total) {
+      return { step: null, step_number: total, total_steps: total, is_final: true, message: 'Protocolo completado' };
+    }
+    const step = protocol.steps[currentStep];
+    return {
+      step: step.instruction || '',
+      step_number: currentStep + 1,
+      total_steps: total,
+      is_final: currentStep + 1 >= total,
+      ui: { ...protocol.ui, ...step.ui },
+      voice_cues: [...(step.voice_cue ? [step.voice_cue] : []), ...protocol.voice_cues],
+      ...(step.audio ? { audio: this._audioUrls(step.audio) } : {}),
+    };
+  }
+
+  // URL del audio pre-renderizado de un paso de getProtocol() (o null)
+  stepAudioUrl(step, field = 'voice_cue') {
+    const file = step?.audio?.[field];
+    return file && this.bundle?.voice ? this._audioUrls({ [field]: file })[field] : null;
+  }
+
+  // Audio pre-renderizado del paso: {voice_cue|instruction: fichero} -> URLs
+  _audioUrls(audio) {
+    const base = new URL(this.bundle.voice.base, new URL(`${this.baseUrl}/`, window.location.origin));
+    return Object.fromEntries(Object.entries(audio).map(([field, file]) => [field, new URL(file, base).pathname]));
+  }
+}
+
+export const offlineIndex = new OfflineIndex();
+export default OfflineIndex;
@@ -6,6 +6,7 @@ class SpeechManager {
     this.recognition = null;
     this.isInitialized = false;
     this.currentUtterance = null;
+    this.currentAudio = null;
     this.recognitionTimeout = null;
     
     this.init();
@@ -39,7 +40,8 @@ class SpeechManager {
     if (!this.recognition) return;
 
     this.recognition.continuous = false;
-    this.recognition.interimResults = false;
+    // Resultados parciales: se envían a /triage/stream para triaje incremental
+    this.recognition.interimResults = true;
     this.recognition.lang = 'es-ES';
     this.recognition.maxAlternatives = 1;
 
@@ -50,14 +52,25 @@ class SpeechManager {
     };
 
     this.recognition.onresult = (event) => {
-      const transcript = event.results[0][0].transcript;
-      console.log('Transcripción:', transcript);
-      useVoiceStore.getState().setLastTranscript(transcript);
-      
-      // Disparar evento personalizado con la transcripción
-      window.dispatchEvent(new CustomEvent('speechResult', { 
-        detail: { transcript } 
-      }));
+      for (let i = event.resultIndex; i < event.results.length; i++) {
+        const result = event.results[i];
+        const transcript = result[0].transcript;
+        const isFinal = result.isFinal;
+
+        // Trozo (parcial o final) para el triaje incremental
+        window.dispatchEvent(new CustomEvent('speechChunk', {
+          detail: { transcript, isFinal, seq: i }
+        }));
+
+        if (!isFinal) continue;
+        console.log('Transcripción:', transcript);
+        useVoiceStore.getState().setLastTranscript(transcript);
+
+        // Disparar evento personalizado con la transcripción
+        window.dispatchEvent(new CustomEvent('speechResult', {
+          detail: { transcript }
+        }));
+      }
     };
 
     this.recognition.onerror = (event) => {
@@ -105,7 +118,16 @@ class SpeechManager {
     }
   }
 
+  // Audio pre-renderizado (options.audioUrl, de /next_step o del índice offline);
+  // si no carga o no se puede reproducir, síntesis en el dispositivo
   speak(text, options = {}) {
+    if (options.audioUrl && useVoiceStore.getState().voiceEnabled) {
+      return this.playAudio(options.audioUrl)
+        .catch((error) => {
+          console.warn('Audio pre-renderizado no disponible, usando síntesis:', error);
+          return this.speak(text, { ...options, audioUrl: null });
+        });
+    }
     if (!this.synthesis || !this.isInitialized) {
       console.warn('Síntesis de voz no disponible');
       return Promise.reject(new Error('Síntesis de voz no disponible'));
@@ -159,7 +181,33 @@ class SpeechManager {
     });
   }
 
+  playAudio(url) {
+    const voiceStore = useVoiceStore.getState();
+    this.stopSpeaking();
+    return new Promise((resolve, reject) => {
+      const audio = new Audio(url);
+      this.currentAudio = audio;
+      audio.onended = () => {
+        voiceStore.setSpeaking(false);
+        this.currentAudio = null;
+        resolve();
+      };
+      audio.onerror = () => {
+        voiceStore.setSpeaking(false);
+        this.currentAudio = null;
+        reject(new Error(`No se pudo reproducir ${url}`));
+      };
+      voiceStore.setSpeaking(true);
+      audio.play().catch(audio.onerror);
+    });
+  }
+
   stopSpeaking() {
+    if (this.currentAudio) {
+      this.currentAudio.pause();
+      this.currentAudio = null;
+      useVoiceStore.getState().setSpeaking(false);
+    }
     if (this.synthesis) {
       this.synthesis.cancel();
       useVoiceStore.getState().setSpeaking(false);